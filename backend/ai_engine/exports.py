@@ -0,0 +1,211 @@
+"""
+Exports of ``AITrainingData`` for offline training.
+
+``export_training_data()`` reads the rows of every shard in id order with
+``.iterator()``, hands them to a writer ``BATCH_SIZE`` rows at a time, and
+sets ``is_used_for_training`` on each written batch with one ``update()``
+over its id range. Memory use does not depend on the number of rows. Two
+writers are available:
+
+- ``jsonl``: gzip-compressed JSON Lines, one object per row, with
+  ``data_content`` and ``user_profile_snapshot`` as nested objects;
+- ``parquet``: one zstd-compressed row group per batch, with the JSON
+  blobs as JSON strings. It needs ``pyarrow``.
+
+Each export is recorded as a ``TrainingDataExport`` with the highest id
+exported per shard. An incremental export (the default) starts after the
+watermarks of the last completed export, so every row is exported once.
+An export that stops halfway does not move the watermarks; its rows are
+exported again next time. Rows added while an export runs wait for the next
+one.
+
+``python manage.py export_training_data`` writes a file, and
+``POST /api/ai/training/export/`` (staff only) streams the same bytes as
+the response. Configured through ``settings.AI_TRAINING_EXPORT``.
+"""
+import itertools
+import json
+import zlib
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+
+from fitness_project.db.sharding import get_shards
+from fitness_project.renderers import dumps
+from .models import AITrainingData, TrainingDataExport
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+DEFAULTS = {
+    'BATCH_SIZE': 5000,
+    'COMPRESSION_LEVEL': 6,
+}
+
+COLUMNS = ('shard', 'id', 'user_id', 'data_type', 'data_content', 'user_profile_snapshot', 'ai_request_id',
+           'data_quality_score', 'created_at')
+
+_FIELDS = ('pk', 'user_id', 'data_type', 'data_content', 'user_profile_snapshot', 'ai_request_id_id',
+           'data_quality_score', 'created_at')
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'AI_TRAINING_EXPORT', {})}
+
+
+class JSONLinesWriter:
+    """gzip-compressed JSON Lines"""
+
+    format = 'jsonl'
+    extension = 'jsonl.gz'
+    content_type = 'application/gzip'
+    available = True
+
+    def __init__(self, sink):
+        self.sink = sink
+        # wbits=31 writes a gzip header and trailer
+        self._compressor = zlib.compressobj(get_config()['COMPRESSION_LEVEL'], zlib.DEFLATED, 31)
+
+    def write(self, shard, rows):
+        lines = b''.join(
+            dumps({
+                'shard': shard, 'id': pk, 'user_id': user_id, 'data_type': data_type,
+                'data_content': content, 'user_profile_snapshot': snapshot, 'ai_request_id': request_id,
+                'data_quality_score': float(score) if score is not None else None, 'created_at': created_at,
+            }) + b'\n'
+            for pk, user_id, data_type, content, snapshot, request_id, score, created_at in rows
+        )
+        self.sink.write(self._compressor.compress(lines))
+
+    def close(self):
+        self.sink.write(self._compressor.flush())
+
+
+class ParquetWriter:
+    """Parquet, one row group per batch"""
+
+    format = 'parquet'
+    extension = 'parquet'
+    content_type = 'application/vnd.apache.parquet'
+    available = pyarrow is not None
+
+    def __init__(self, sink):
+        self.schema = pyarrow.schema([
+            ('shard', pyarrow.string()),
+            ('id', pyarrow.int64()),
+            ('user_id', pyarrow.int64()),
+            ('data_type', pyarrow.string()),
+            ('data_content', pyarrow.string()),
+            ('user_profile_snapshot', pyarrow.string()),
+            ('ai_request_id', pyarrow.int64()),
+            ('data_quality_score', pyarrow.float64()),
+            ('created_at', pyarrow.timestamp('us', tz='UTC')),
+        ])
+        self._writer = pyarrow.parquet.ParquetWriter(sink, self.schema, compression='zstd')
+
+    def write(self, shard, rows):
+        pks, user_ids, data_types, contents, snapshots, request_ids, scores, created = zip(*rows)
+        self._writer.write_table(pyarrow.Table.from_pydict({
+            'shard': [shard] * len(pks),
+            'id': pks,
+            'user_id': user_ids,
+            'data_type': data_types,
+            'data_content': [json.dumps(content) for content in contents],
+            'user_profile_snapshot': [json.dumps(snapshot) for snapshot in snapshots],
+            'ai_request_id': request_ids,
+            'data_quality_score': [float(score) if score is not None else None for score in scores],
+            'created_at': created,
+        }, schema=self.schema))
+
+    def close(self):
+        self._writer.close()
+
+
+WRITERS = {writer.format: writer for writer in (JSONLinesWriter, ParquetWriter)}
+
+
+def get_writer(name):
+    """The writer class for format ``name``; ValueError if it is unknown or unavailable"""
+    writer = WRITERS.get(name)
+    if writer is None:
+        raise ValueError(f"Unknown export format {name!r}; choose from {', '.join(WRITERS)}")
+    if not writer.available:
+        raise ValueError(f'The {name} export format needs pyarrow, which is not installed')
+    return writer
+
+
+def last_watermarks():
+    """The watermarks of the last completed export, or none"""
+    export = TrainingDataExport.objects.filter(completed_at__isnull=False).order_by('-pk').first()
+    return export.watermarks if export is not None else {}
+
+
+def export_training_data(writer, incremental=True, mark=True, created_by=None):
+    """Write training rows to ``writer`` batch by batch, yielding after each batch.
+
+    Closes the writer and completes the ``TrainingDataExport`` record at the
+    end; returns the record (as the generator's return value).
+    """
+    batch_size = get_config()['BATCH_SIZE']
+    since = last_watermarks() if incremental else {}
+    export = TrainingDataExport.objects.create(format=writer.format, incremental=incremental,
+                                               created_by=created_by)
+    watermarks = dict(since)
+
+    for alias in get_shards():
+        rows = AITrainingData.objects.using(alias).filter(pk__gt=since.get(alias, 0))
+        # Fixed at the start, so rows added meanwhile are left for the next export
+        high = rows.aggregate(high=Max('pk'))['high']
+        if high is None:
+            continue
+        batches = rows.filter(pk__lte=high).order_by('pk').values_list(*_FIELDS).iterator(chunk_size=batch_size)
+        while True:
+            batch = list(itertools.islice(batches, batch_size))
+            if not batch:
+                break
+            writer.write(alias, batch)
+            if mark:
+                AITrainingData.objects.using(alias).filter(
+                    pk__gte=batch[0][0], pk__lte=batch[-1][0],
+                ).update(is_used_for_training=True)
+            export.rows += len(batch)
+            yield export.rows
+        watermarks[alias] = high
+
+    writer.close()
+    export.watermarks = watermarks
+    export.completed_at = timezone.now()
+    export.save(update_fields=['rows', 'watermarks', 'completed_at'])
+    return export
+
+
+class StreamSink:
+    """File-like sink collecting writes, drained into a streaming response"""
+
+    def __init__(self):
+        self._chunks = []
+        self.closed = False
+        self._position = 0
+
+    def write(self, data):
+        if data:
+            self._chunks.append(bytes(data))
+            self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return chunks
@@ -0,0 +1,174 @@
+"""
+What the job queue runs for each ``AIRequest.request_type``.
+
+A handler is called with the claimed ``AIRequest`` and fills in its results:
+``ai_response`` and, when they apply, ``generated_plan``, ``tokens_used``
+and ``cost``. The queue saves them with the status and timings. Raising
+``PermanentError`` fails the request straight away; any other exception is
+retried with backoff.
+
+``AI_QUEUE['HANDLERS']`` maps request types to the dotted paths of their
+handlers, e.g. a function calling a hosted model. ``workout_plan`` has a
+built-in rule-based generator and ``recommendation`` runs the batch
+recommendation engine for the user, so both work without one; other
+request types fail until a handler is configured.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from fitness_project.db.sharding import shard_for_user
+from workouts.models import Exercise, WorkoutDay, WorkoutExercise, WorkoutPlan
+from .recommendations import recommend_users
+
+
+class PermanentError(Exception):
+    """A request that would fail the same way again; it is not retried"""
+
+
+LEVELS = ['beginner', 'intermediate', 'advanced']
+
+# Fitness level -> training days of the week as (name, muscle groups)
+SPLITS = {
+    'beginner': [
+        ('Full Body A', ['legs', 'chest', 'back', 'core']),
+        ('Full Body B', ['legs', 'shoulders', 'back', 'core']),
+        ('Full Body C', ['full_body', 'chest', 'arms', 'cardio']),
+    ],
+    'intermediate': [
+        ('Upper Body', ['chest', 'back', 'shoulders', 'arms']),
+        ('Lower Body', ['legs', 'core']),
+        ('Upper Body', ['back', 'chest', 'arms', 'shoulders']),
+        ('Lower Body & Conditioning', ['legs', 'cardio', 'core']),
+    ],
+    'advanced': [
+        ('Chest & Triceps', ['chest', 'arms']),
+        ('Back & Biceps', ['back', 'arms']),
+        ('Legs', ['legs', 'core']),
+        ('Shoulders & Core', ['shoulders', 'core']),
+        ('Full Body & Conditioning', ['full_body', 'cardio']),
+    ],
+}
+
+# Fitness goal -> (sets, reps, rest seconds)
+REP_SCHEMES = {
+    'lose_weight': (3, 15, 45),
+    'maintain': (3, 10, 90),
+    'gain_weight': (4, 8, 120),
+}
+
+EXERCISES_PER_GROUP = 2
+
+PROFILE_FIELDS = ('gender', 'age', 'height', 'weight', 'fitness_level', 'fitness_goal', 'specific_goal')
+
+
+def user_context(user):
+    """The profile fields a request is answered for, unless its ``user_context`` overrides them"""
+    return {field: getattr(user, field) for field in PROFILE_FIELDS}
+
+
+def _profile(ai_request):
+    """Fitness level and goals, from the request's context first, then the user"""
+    context = {**user_context(ai_request.user), **(ai_request.user_context or {})}
+    level = context.get('fitness_level')
+    return {
+        'fitness_level': level if level in LEVELS else 'beginner',
+        'fitness_goal': context.get('fitness_goal') or 'maintain',
+        'specific_goal': context.get('specific_goal') or '',
+    }
+
+
+def _exercises_by_group(level):
+    allowed = LEVELS[:LEVELS.index(level) + 1]
+    groups = {}
+    for exercise in Exercise.objects.filter(difficulty_level__in=allowed).order_by('pk'):
+        groups.setdefault(exercise.muscle_group, []).append(exercise)
+    return groups
+
+
+def _training_days(count):
+    """Day numbers of ``count`` training days spread over a week"""
+    return [round(index * 7 / count) + 1 for index in range(count)]
+
+
+def generate_workout_plan(ai_request):
+    """Build a weekly plan from the exercise catalog for the user's level and goal"""
+    profile = _profile(ai_request)
+    level = profile['fitness_level']
+    sets, reps, rest_time = REP_SCHEMES.get(profile['fitness_goal'], REP_SCHEMES['maintain'])
+    split = SPLITS[level]
+    groups = _exercises_by_group(level)
+    if not groups:
+        raise PermanentError('The exercise catalog is empty')
+
+    training = dict(zip(_training_days(len(split)), split))
+    days = []
+    with transaction.atomic():
+        plan = WorkoutPlan.objects.create(
+            name=f"{level.title()} {profile['fitness_goal'].replace('_', ' ').title()} Plan",
+            description=ai_request.prompt,
+            difficulty=level,
+            specific_goal=profile['specific_goal'],
+            min_fitness_level=level,
+            is_ai_generated=True,
+            ai_prompt_used=ai_request.prompt,
+            created_by=ai_request.user,
+            is_public=False,
+        )
+        for day_number in range(1, 8):
+            if day_number not in training:
+                WorkoutDay.objects.create(plan=plan, name=f'Day {day_number}: Rest', day_number=day_number,
+                                          is_rest_day=True)
+                continue
+            name, muscle_groups = training[day_number]
+            day = WorkoutDay.objects.create(plan=plan, name=f'Day {day_number}: {name}', day_number=day_number,
+                                            focus_area=', '.join(muscle_groups))
+            # Rotate through each group's exercises so repeated groups vary
+            chosen = []
+            for group in muscle_groups:
+                candidates = groups.get(group, [])
+                for offset in range(min(EXERCISES_PER_GROUP, len(candidates))):
+                    exercise = candidates[(day_number + offset) % len(candidates)]
+                    if exercise not in chosen:
+                        chosen.append(exercise)
+            # create() rather than bulk_create(), so sync and cache invalidation see the rows
+            for order, exercise in enumerate(chosen):
+                WorkoutExercise.objects.create(workout_day=day, exercise=exercise, sets=sets, reps=reps,
+                                               rest_time=rest_time, order=order)
+            days.append({'day_number': day_number, 'name': day.name, 'exercises': [e.name for e in chosen]})
+
+    ai_request.generated_plan = plan
+    ai_request.tokens_used = 0
+    ai_request.cost = Decimal('0')
+    ai_request.ai_response = {'generator': 'rules', 'plan_id': plan.pk, **profile, 'days': days}
+
+
+def generate_recommendations(ai_request):
+    """Score the recommendation engine's candidates for the user now, instead of at the next batch run"""
+    created = recommend_users(shard_for_user(ai_request.user_id), [ai_request.user_id])
+    ai_request.tokens_used = 0
+    ai_request.cost = Decimal('0')
+    ai_request.ai_response = {
+        'generator': 'rules',
+        'recommendations': [
+            {'id': obj.pk, 'title': obj.title, 'relevance_score': float(obj.relevance_score)} for obj in created
+        ],
+    }
+
+
+BUILTIN_HANDLERS = {
+    'workout_plan': generate_workout_plan,
+    'recommendation': generate_recommendations,
+}
+
+
+def get_handler(request_type, handlers=None):
+    """The handler for ``request_type``; ``handlers`` is ``AI_QUEUE['HANDLERS']``"""
+    path = (handlers or {}).get(request_type)
+    if path:
+        return import_string(path)
+    try:
+        return BUILTIN_HANDLERS[request_type]
+    except KeyError:
+        raise PermanentError(f'No handler is configured for {request_type!r} requests')
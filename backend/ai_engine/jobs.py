@@ -0,0 +1,233 @@
+"""
+Database-backed job queue for ``AIRequest``.
+
+A request is a job: it is created ``pending`` and ``python manage.py
+ai_worker`` runs it off the web thread, so a long generation never holds an
+HTTP worker. The lifecycle is:
+
+- ``claim()`` picks the pending requests that are due (``available_at``),
+  highest ``priority`` first, and takes each with a single
+  ``UPDATE … WHERE status = 'pending'``. Only one worker's update matches,
+  so a request is never run twice. The same statement checks the user's
+  ``processing`` count against ``AI_QUEUE['USER_CONCURRENCY']``, so one
+  user cannot occupy every worker.
+- ``run()`` reuses a cached result of an identical request
+  (``ai_engine.results``) or calls the request type's handler
+  (``ai_engine.handlers``), and records the results with
+  ``processing_time`` and ``completed_at``. Handler runs are counted for the
+  model version that serves them (``ai_engine.usage``).
+- A failed attempt goes back to ``pending`` with an exponential backoff in
+  ``available_at``. After ``MAX_ATTEMPTS`` it is moved to ``dead`` (the
+  dead-letter state) with the last error; ``PermanentError`` fails it at once.
+- A claimed request holds a lease that its worker renews. ``reap()`` puts
+  requests whose lease expired (their worker died) back in the queue.
+
+``AIRequest`` is sharded, so every function works on one shard alias and
+the worker polls each of them. Configured through ``settings.AI_QUEUE``.
+"""
+import logging
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, RowNumber
+from django.db.models.expressions import Window
+from django.utils import timezone
+
+from fitness_project.db.sharding import user_shard
+from . import results, usage
+from .handlers import PermanentError, get_handler
+from .models import AIRequest
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # Workers per ai_worker process, and whether they are threads or processes
+    'CONCURRENCY': 4,
+    'POOL': 'thread',
+    # Seconds between polls of an idle queue
+    'POLL_INTERVAL': 2.0,
+    # Requests of one user processed at the same time, over all workers
+    'USER_CONCURRENCY': 1,
+    'MAX_ATTEMPTS': 3,
+    # Retry n waits RETRY_BACKOFF * 2 ** (n - 1) seconds, with jitter, up to RETRY_BACKOFF_MAX
+    'RETRY_BACKOFF': 30,
+    'RETRY_BACKOFF_MAX': 3600,
+    # A claimed request returns to the queue if its worker stops renewing it
+    'LEASE_SECONDS': 300,
+    # Request type -> priority; higher runs first
+    'PRIORITIES': {},
+    # Request type -> dotted path of its handler, replacing the built-in one
+    'HANDLERS': {},
+}
+
+MAX_PROCESSING_TIME = Decimal('999.999')
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'AI_QUEUE', {})}
+
+
+def priority_for(request_type):
+    return get_config()['PRIORITIES'].get(request_type, 0)
+
+
+def retry_delay(attempts, config=None):
+    """Seconds to wait before retrying a request that has failed ``attempts`` times"""
+    config = config or get_config()
+    delay = min(config['RETRY_BACKOFF'] * 2 ** (attempts - 1), config['RETRY_BACKOFF_MAX'])
+    # Up to 10% jitter, so requests that failed together do not retry together
+    return delay * random.uniform(1, 1.1)
+
+
+def _processing_count():
+    """The number of requests of the row's user being processed, as a subquery"""
+    running = (
+        AIRequest.objects.filter(user=OuterRef('user'), status='processing')
+        .order_by().values('user').annotate(count=Count('pk')).values('count')
+    )
+    return Coalesce(Subquery(running), Value(0))
+
+
+def claim(alias, worker_id, limit):
+    """Claim up to ``limit`` due requests on shard ``alias`` for ``worker_id``; returns their ids"""
+    config = get_config()
+    per_user = config['USER_CONCURRENCY']
+    queue = AIRequest.objects.using(alias)
+    now = timezone.now()
+
+    # Each user's next requests, no more than their free slots
+    candidates = (
+        queue.filter(status='pending', available_at__lte=now)
+        .alias(running=_processing_count())
+        .annotate(rank=Window(RowNumber(), partition_by=[F('user_id')],
+                              order_by=[F('priority').desc(), F('available_at').asc(), F('pk').asc()]))
+        .filter(rank__lte=per_user - F('running'))
+        .order_by('-priority', 'available_at', 'pk')
+        .values_list('pk', flat=True)[:limit]
+    )
+
+    claimed = []
+    lease_expires_at = now + timedelta(seconds=config['LEASE_SECONDS'])
+    for pk in list(candidates):
+        # Matches only if no other worker took it first and the user still has a free slot
+        taken = (
+            queue.filter(pk=pk, status='pending')
+            .alias(running=_processing_count()).filter(running__lt=per_user)
+            .update(status='processing', attempts=F('attempts') + 1, claimed_by=worker_id,
+                    lease_expires_at=lease_expires_at, updated_at=now)
+        )
+        if taken:
+            claimed.append(pk)
+    return claimed
+
+
+def renew(alias, worker_id, pks):
+    """Extend the leases ``worker_id`` holds on requests ``pks``"""
+    if not pks:
+        return 0
+    lease_expires_at = timezone.now() + timedelta(seconds=get_config()['LEASE_SECONDS'])
+    return AIRequest.objects.using(alias).filter(
+        pk__in=pks, status='processing', claimed_by=worker_id,
+    ).update(lease_expires_at=lease_expires_at)
+
+
+def reap(alias):
+    """Return requests whose lease expired to the queue, or to ``dead`` when out of attempts"""
+    config = get_config()
+    now = timezone.now()
+    expired = AIRequest.objects.using(alias).filter(status='processing', lease_expires_at__lt=now)
+    released = dict(claimed_by='', lease_expires_at=None, updated_at=now)
+    dead = expired.filter(attempts__gte=config['MAX_ATTEMPTS']).update(
+        status='dead', error_message='The worker processing this request stopped', **released,
+    )
+    requeued = expired.update(status='pending', available_at=now, **released)
+    if dead or requeued:
+        logger.warning('Reaped expired AI requests on %s: %d requeued, %d dead', alias, requeued, dead)
+    return requeued, dead
+
+
+def _finish(alias, pk, worker_id, **fields):
+    now = timezone.now()
+    updated = AIRequest.objects.using(alias).filter(pk=pk, status='processing', claimed_by=worker_id).update(
+        claimed_by='', lease_expires_at=None, updated_at=now, **fields,
+    )
+    if not updated:
+        # Reaped while it ran; whoever holds it now records the outcome
+        logger.warning('AI request %s on %s lost its claim before finishing', pk, alias)
+    return updated
+
+
+def run(alias, pk, worker_id):
+    """Process claimed request ``pk`` on shard ``alias`` and record the outcome; returns its new status"""
+    close_old_connections()
+    try:
+        try:
+            # No select_related('user'): users stay on default while the request may be on another shard
+            job = AIRequest.objects.using(alias).get(pk=pk, status='processing', claimed_by=worker_id)
+        except AIRequest.DoesNotExist:
+            return None
+
+        config = get_config()
+        started = time.perf_counter()
+        try:
+            with user_shard(job.user_id):
+                cached = results.lookup(job)
+                if not cached:
+                    _handle(job, get_handler(job.request_type, config['HANDLERS']))
+                    results.store(job)
+        except Exception as exc:
+            elapsed = time.perf_counter() - started
+            return _failed(alias, job, worker_id, exc, elapsed, config)
+        elapsed = time.perf_counter() - started
+
+        _finish(
+            alias, pk, worker_id,
+            status='completed', error_message='', completed_at=timezone.now(),
+            processing_time=_seconds(elapsed), ai_response=job.ai_response,
+            generated_plan_id=job.generated_plan_id, tokens_used=job.tokens_used, cost=job.cost,
+        )
+        logger.info('AI request %s (%s) completed in %.3fs%s', pk, job.request_type, elapsed,
+                    ' from the result cache' if cached else '')
+        return 'completed'
+    finally:
+        close_old_connections()
+
+
+def _handle(job, handler):
+    started = time.perf_counter()
+    try:
+        handler(job)
+    except Exception:
+        usage.counters.record_request(job.request_type, False, time.perf_counter() - started)
+        raise
+    usage.counters.record_request(job.request_type, True, time.perf_counter() - started)
+
+
+def _failed(alias, job, worker_id, exc, elapsed, config):
+    error = f'{type(exc).__name__}: {exc}'
+    fields = dict(error_message=error, processing_time=_seconds(elapsed))
+    if isinstance(exc, PermanentError):
+        outcome = 'failed'
+    elif job.attempts >= config['MAX_ATTEMPTS']:
+        outcome = 'dead'
+    else:
+        outcome = 'pending'
+        fields['available_at'] = timezone.now() + timedelta(seconds=retry_delay(job.attempts, config))
+
+    _finish(alias, job.pk, worker_id, status=outcome, **fields)
+    if outcome == 'pending':
+        logger.warning('AI request %s attempt %d failed, retrying at %s: %s',
+                       job.pk, job.attempts, fields['available_at'].isoformat(), error)
+    else:
+        logger.error('AI request %s %s after %d attempt(s): %s', job.pk, outcome, job.attempts, error,
+                     exc_info=not isinstance(exc, PermanentError))
+    return outcome
+
+
+def _seconds(elapsed):
+    return min(Decimal(elapsed).quantize(Decimal('0.001')), MAX_PROCESSING_TIME)
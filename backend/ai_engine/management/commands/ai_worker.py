@@ -0,0 +1,94 @@
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+
+from ai_engine import jobs, usage, worker
+from fitness_project.db.sharding import get_shards
+
+
+class Command(BaseCommand):
+    help = 'Process pending AI requests on a pool of threads or processes'
+
+    def add_arguments(self, parser):
+        config = jobs.get_config()
+        parser.add_argument('--concurrency', type=int, default=config['CONCURRENCY'],
+                            help='Requests processed at the same time')
+        parser.add_argument('--pool', choices=['thread', 'process'], default=config['POOL'],
+                            help='Run requests on threads or on separate processes')
+        parser.add_argument('--poll-interval', type=float, default=config['POLL_INTERVAL'],
+                            help='Seconds between polls of an idle queue')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once no request is due instead of waiting for more')
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        poll_interval = options['poll_interval']
+        worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        renew_interval = jobs.get_config()['LEASE_SECONDS'] / 3
+        shards = get_shards()
+
+        if options['pool'] == 'process':
+            # spawn rather than fork: children must not share the parent's database connections
+            executor = ProcessPoolExecutor(concurrency, mp_context=multiprocessing.get_context('spawn'),
+                                           initializer=worker.init_process)
+            run = worker.run
+        else:
+            executor = ThreadPoolExecutor(concurrency, thread_name_prefix='ai-worker')
+            run = jobs.run
+
+        stopping = threading.Event()
+
+        def stop(signum, frame):
+            self.stdout.write('Stopping after the requests in progress...')
+            stopping.set()
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+        self.stdout.write(f"AI worker {worker_id}: {concurrency} {options['pool']} worker(s) on {len(shards)} shard(s)")
+
+        running = {}  # future -> (alias, pk)
+        processed = 0
+        last_renewal = 0
+        start = 0
+        try:
+            while True:
+                if time.monotonic() - last_renewal >= renew_interval:
+                    for alias in shards:
+                        jobs.renew(alias, worker_id, [pk for shard, pk in running.values() if shard == alias])
+                        jobs.reap(alias)
+                    last_renewal = time.monotonic()
+
+                if not stopping.is_set():
+                    # Start from a different shard each round so none is starved
+                    start = (start + 1) % len(shards)
+                    for alias in shards[start:] + shards[:start]:
+                        free = concurrency - len(running)
+                        if not free:
+                            break
+                        for pk in jobs.claim(alias, worker_id, free):
+                            running[executor.submit(run, alias, pk, worker_id)] = (alias, pk)
+
+                if not running:
+                    if options['once'] or stopping.is_set():
+                        break
+                    stopping.wait(poll_interval)
+                    continue
+
+                done, _ = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    alias, pk = running.pop(future)
+                    processed += 1
+                    if future.exception() is not None:
+                        # run() records handler errors itself; this is the queue failing,
+                        # and the request's lease returns it to the queue
+                        self.stderr.write(f'AI request {pk} on {alias} crashed: {future.exception()!r}')
+        finally:
+            executor.shutdown(wait=True)
+            usage.counters.flush()
+        self.stdout.write(self.style.SUCCESS(f'AI worker {worker_id} stopped after {processed} request(s)'))
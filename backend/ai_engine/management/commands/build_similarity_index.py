@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ai_engine import similarity
+
+
+class Command(BaseCommand):
+    help = 'Bring the "users like me" similarity index up to date'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Rebuild every row and the normalization statistics')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            index, changes = similarity.refresh(full=options['full'])
+        except similarity.IndexUnavailable as exc:
+            raise CommandError(str(exc))
+        kind = 'Built' if changes['full'] else 'Refreshed'
+        detail = '' if changes['full'] else f": {changes['updated']} updated, {changes['removed']} removed"
+        self.stdout.write(self.style.SUCCESS(
+            f"{kind} the similarity index of {len(index)} user(s){detail}"
+            f"{' with a ball tree' if index.tree is not None else ''} in {time.perf_counter() - started:.2f}s"
+        ))
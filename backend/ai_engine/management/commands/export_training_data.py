@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ai_engine import exports
+
+
+class Command(BaseCommand):
+    help = 'Export AITrainingData to a compressed JSON Lines or Parquet file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(exports.WRITERS), default='jsonl')
+        parser.add_argument('--output', help='File to write (default: training-<timestamp>.<extension>)')
+        parser.add_argument('--full', action='store_true',
+                            help='Export every row, not only those added since the last export')
+        parser.add_argument('--no-mark', action='store_true',
+                            help='Leave is_used_for_training unchanged')
+
+    def handle(self, *args, **options):
+        try:
+            writer_class = exports.get_writer(options['format'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        output = options['output'] or f"training-{timezone.now():%Y%m%d-%H%M%S}.{writer_class.extension}"
+
+        with open(output, 'wb') as sink:
+            rows = exports.export_training_data(
+                writer_class(sink), incremental=not options['full'], mark=not options['no_mark'],
+            )
+            try:
+                while True:
+                    count = next(rows)
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f'  {count} rows')
+            except StopIteration as done:
+                export = done.value
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {export.rows} row(s) to {output}; watermarks {export.watermarks}"
+        ))
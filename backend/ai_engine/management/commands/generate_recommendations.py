@@ -0,0 +1,57 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from ai_engine import recommendations, worker
+from fitness_project.db.sharding import get_shards, shard_for_user
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Score recommendations for every user and save the relevant ones'
+
+    def add_arguments(self, parser):
+        config = recommendations.get_config()
+        parser.add_argument('--incremental', action='store_true',
+                            help='Only users with activity since their last recommendations')
+        parser.add_argument('--processes', type=int, default=config['PROCESSES'],
+                            help='Score chunks of users on this many processes')
+        parser.add_argument('--chunk-size', type=int, default=config['CHUNK_SIZE'],
+                            help='Users scored and written together')
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Only this user id (repeatable)')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        shards = get_shards()
+        user_ids = options['users'] or list(User.objects.order_by('pk').values_list('pk', flat=True))
+        by_shard = {}
+        for user_id in user_ids:
+            by_shard.setdefault(shard_for_user(user_id, shards), []).append(user_id)
+
+        size = max(1, options['chunk_size'])
+        chunks = [
+            (alias, ids[start:start + size])
+            for alias, ids in by_shard.items()
+            for start in range(0, len(ids), size)
+        ]
+        incremental = [options['incremental']] * len(chunks)
+        aliases = [alias for alias, _ in chunks]
+        id_lists = [ids for _, ids in chunks]
+
+        if options['processes'] > 1 and len(chunks) > 1:
+            # spawn rather than fork: children must not share the parent's database connections
+            with ProcessPoolExecutor(options['processes'], mp_context=multiprocessing.get_context('spawn'),
+                                     initializer=worker.init_process) as executor:
+                results = list(executor.map(worker.recommend, aliases, id_lists, incremental))
+        else:
+            results = list(map(recommendations.recommend_chunk, aliases, id_lists, incremental))
+
+        scored = sum(users for users, _ in results)
+        saved = sum(rows for _, rows in results)
+        self.stdout.write(self.style.SUCCESS(
+            f'Scored {scored} of {len(user_ids)} user(s) in {len(chunks)} chunk(s) and saved {saved} '
+            f'recommendation(s) in {time.perf_counter() - started:.2f}s'
+        ))
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:46
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('ai_engine', '0003_job_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrainingDataExport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('format', models.CharField(choices=[('jsonl', 'Compressed JSON Lines'), ('parquet', 'Parquet')], max_length=20)),
+                ('incremental', models.BooleanField(default=True)),
+                ('rows', models.PositiveIntegerField(default=0)),
+                ('watermarks', models.JSONField(default=dict)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='training_exports', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'ai_training_exports',
+                'ordering': ['-started_at'],
+            },
+        ),
+    ]
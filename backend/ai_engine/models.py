@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from users.models import User
 from workouts.models import WorkoutPlan
 
@@ -16,6 +17,7 @@ class AIRequest(models.Model):
         ('processing', 'Processing'),
         ('completed', 'Completed'),
         ('failed', 'Failed'),
+        ('dead', 'Dead Letter'),  # retries exhausted
     ]
     
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ai_requests')
@@ -40,6 +42,13 @@ class AIRequest(models.Model):
     # Error handling
     error_message = models.TextField(blank=True)
     
+    # Job queue (see ai_engine.jobs)
+    priority = models.PositiveSmallIntegerField(default=0)  # higher runs first
+    attempts = models.PositiveSmallIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)  # not claimed before this, e.g. retry backoff
+    claimed_by = models.CharField(max_length=100, blank=True)  # worker id while processing
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     completed_at = models.DateTimeField(null=True, blank=True)
@@ -50,6 +59,9 @@ class AIRequest(models.Model):
     class Meta:
         db_table = 'ai_requests'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', '-priority', 'available_at'], name='ai_request_queue'),
+        ]
 
 class AIRecommendation(models.Model):
     """AI-generated workout recommendations"""
@@ -130,6 +142,30 @@ class AITrainingData(models.Model):
         db_table = 'ai_training_data'
         ordering = ['-created_at']
 
+class TrainingDataExport(models.Model):
+    """An export of AITrainingData for offline training (see ai_engine.exports)"""
+    FORMAT_CHOICES = [
+        ('jsonl', 'Compressed JSON Lines'),
+        ('parquet', 'Parquet'),
+    ]
+    
+    format = models.CharField(max_length=20, choices=FORMAT_CHOICES)
+    incremental = models.BooleanField(default=True)
+    rows = models.PositiveIntegerField(default=0)
+    # Shard alias -> highest AITrainingData id exported; the next incremental export starts after it
+    watermarks = models.JSONField(default=dict)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='training_exports')
+    
+    started_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)  # unset if the export did not finish
+    
+    def __str__(self):
+        return f"{self.format} export of {self.rows} rows - {self.started_at}"
+    
+    class Meta:
+        db_table = 'ai_training_exports'
+        ordering = ['-started_at']
+
 class AIModelVersion(models.Model):
     """Track different versions of AI models used"""
     MODEL_TYPE_CHOICES = [
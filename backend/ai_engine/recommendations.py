@@ -0,0 +1,364 @@
+"""
+Batch recommendation engine.
+
+``python manage.py generate_recommendations`` scores every recommendation
+in ``CANDIDATES`` for each user and saves the best ``PER_USER`` of those
+scoring at least ``MIN_SCORE`` as ``AIRecommendation`` rows with their
+``relevance_score`` and a ``priority`` derived from it.
+
+Each user is described by a row of ``FEATURES``, computed over the last
+``WINDOW_DAYS`` days, each scaled to about 0-1:
+
+- ``sessions_week`` and ``weekly_average``: completed workouts in the last
+  7 days, and per week over the window;
+- ``days_inactive``: days since the last completed workout (up to 14);
+- ``volume_change``: ``ExerciseSet`` volume (reps x weight) of the last 7
+  days against the 7 before;
+- ``off_goal_trend``: the ``ProgressEntry`` weight trend in kg/week, signed
+  so that moving away from the user's fitness goal is positive;
+- ``low_rating``: how low the workouts were rated.
+
+The rows of a batch form a matrix ``X`` and the candidates' weights a
+matrix ``W``, so all scores are one ``sigmoid(X @ W)``: with NumPy when it
+is installed, in pure Python otherwise, with the same results. Each score is
+then scaled by the user's feedback on earlier recommendations of the same
+type (helpful +1, neutral 0, not helpful -1, averaged), by up to
+``FEEDBACK_WEIGHT``. A recommendation the user read, applied or rated
+within the window is not suggested again, and of two ``CONFLICTS`` (rest
+more, train more) only the higher-scoring one is.
+
+A run replaces the engine's earlier recommendations of a user unless they
+were read, applied or rated. ``--incremental`` only scores users with
+activity (workouts, sessions, sets, progress entries, feedback) newer than
+their latest engine recommendation. Users are scored in chunks of
+``CHUNK_SIZE`` per shard, optionally on a process pool. New rows are written
+with ``bulk_create()``, so the sync change log is updated explicitly.
+Configured through ``settings.AI_RECOMMENDATIONS``.
+"""
+import math
+from collections import namedtuple
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, ExpressionWrapper, F, FloatField, Max, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from progress.models import CompletedWorkout, ProgressEntry
+from sync.changes import record_changes
+from users.models import User
+from workouts.models import ExerciseSet, WorkoutSession
+from .models import AIRecommendation
+
+try:
+    import numpy as np
+except ImportError:  # pure-Python fallback
+    np = None
+
+DEFAULTS = {
+    'WINDOW_DAYS': 28,
+    'MIN_SCORE': 0.5,
+    'PER_USER': 3,
+    'FEEDBACK_WEIGHT': 0.3,
+    'CHUNK_SIZE': 500,
+    'PROCESSES': 1,
+}
+
+FEATURES = ('bias', 'active', 'sessions_week', 'weekly_average', 'days_inactive', 'volume_change',
+            'off_goal_trend', 'low_rating', 'gaining_goal')
+
+Candidate = namedtuple('Candidate', 'recommendation_type title description reasoning weights')
+
+# Weights are logits per feature; 'bias' is the score of a user with all features at 0
+CANDIDATES = [
+    Candidate(
+        'recovery', 'Take a recovery day',
+        'Swap your next session for mobility work, a light walk or full rest.',
+        'You completed {sessions_week} workouts in the last 7 days and your training volume changed by '
+        '{volume_change:+.0%} on the week before.',
+        {'bias': -4.0, 'sessions_week': 5.0, 'volume_change': 2.5, 'low_rating': 1.5},
+    ),
+    Candidate(
+        'lifestyle', 'Plan your next workout',
+        'Pick a day and time for a short session this week; a 20-minute workout counts.',
+        'It has been {days_inactive} since your last completed workout.',
+        {'bias': -3.0, 'days_inactive': 5.0},
+    ),
+    Candidate(
+        'workout_plan', 'Add one more training day',
+        'Add a short session to your week, for example a full-body workout on a rest day.',
+        'You averaged {weekly_average:.1f} workouts per week over the last {window_days} days.',
+        {'bias': 0.5, 'active': 1.5, 'sessions_week': -3.0, 'weekly_average': -7.0, 'days_inactive': -3.0},
+    ),
+    Candidate(
+        'exercise', 'Increase the load on your main lifts',
+        'Add 2.5-5% weight or one rep per set to your main exercises this week.',
+        'You train {weekly_average:.1f} times per week but your training volume changed by only '
+        '{volume_change:+.0%}.',
+        {'bias': -3.0, 'weekly_average': 7.0, 'volume_change': -4.0, 'low_rating': -1.0},
+    ),
+    Candidate(
+        'nutrition', 'Review your calorie intake',
+        'Track what you eat for a few days and adjust your calories towards your goal.',
+        'Your weight changed by {weight_trend:+.1f} kg per week, away from your goal to {fitness_goal}.',
+        {'bias': -2.5, 'off_goal_trend': 5.0},
+    ),
+    Candidate(
+        'nutrition', 'Eat enough protein to build muscle',
+        'Aim for about 1.6 g of protein per kg of body weight, spread over your meals.',
+        'You are training to gain weight and completed {weekly_average:.1f} workouts per week.',
+        {'bias': -5.0, 'gaining_goal': 4.0, 'weekly_average': 4.0},
+    ),
+]
+
+TITLES = [candidate.title for candidate in CANDIDATES]
+
+# Titles never suggested together; the higher-scoring one is kept
+CONFLICTS = [
+    {'Take a recovery day', 'Add one more training day'},
+]
+
+FEEDBACK_VALUES = {'helpful': 1, 'neutral': 0, 'not_helpful': -1}
+
+# Goal -> sign of a weight trend that moves away from it
+GOAL_DIRECTIONS = {'lose_weight': 1, 'gain_weight': -1}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'AI_RECOMMENDATIONS', {})}
+
+
+def _clip(value, low=-1.0, high=1.0):
+    return max(low, min(high, value))
+
+
+def _weight_trend(points):
+    """Least-squares slope of ``(date, weight)`` points in kg per week, or 0 with fewer than two dates"""
+    if len({day for day, _ in points}) < 2:
+        return 0.0
+    first = points[0][0]
+    xs = [(day - first).days for day, _ in points]
+    ys = [float(weight) for _, weight in points]
+    mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / sum((x - mean_x) ** 2 for x in xs)
+    return slope * 7
+
+
+def user_stats(alias, user_ids, now, window_days):
+    """Raw activity figures of ``user_ids`` on shard ``alias``"""
+    today = now.date()
+    window_start = today - timedelta(days=window_days)
+    week_ago = now - timedelta(days=7)
+    stats = {
+        user_id: {'fitness_goal': goal or 'maintain', 'window_days': window_days, 'workouts_week': 0,
+                  'workouts_window': 0, 'ratings': [], 'last_workout': None, 'volume_week': 0.0,
+                  'volume_previous': 0.0, 'weights': []}
+        for user_id, goal in User.objects.filter(pk__in=user_ids).values_list('pk', 'fitness_goal')
+    }
+
+    workouts = CompletedWorkout.objects.using(alias).filter(user_id__in=stats, date__gte=window_start)
+    for user_id, day, rating in workouts.values_list('user_id', 'date', 'rating'):
+        figures = stats[user_id]
+        figures['workouts_window'] += 1
+        figures['workouts_week'] += day > today - timedelta(days=7)
+        if rating:
+            figures['ratings'].append(rating)
+    last_workouts = (
+        CompletedWorkout.objects.using(alias).filter(user_id__in=stats)
+        .values('user_id').annotate(last=Max('date')).values_list('user_id', 'last')
+    )
+    for user_id, last in last_workouts:
+        stats[user_id]['last_workout'] = last
+
+    volume = ExpressionWrapper(Coalesce(F('weight_used'), Value(Decimal(1))) * F('reps_completed'),
+                               output_field=FloatField())
+    volumes = (
+        ExerciseSet.objects.using(alias)
+        .filter(session__user_id__in=stats, session__completed_at__gte=week_ago - timedelta(days=7))
+        .values('session__user_id')
+        .annotate(
+            week=Sum(Case(When(session__completed_at__gte=week_ago, then=volume), default=Value(0.0))),
+            previous=Sum(Case(When(session__completed_at__lt=week_ago, then=volume), default=Value(0.0))),
+        )
+        .values_list('session__user_id', 'week', 'previous')
+    )
+    for user_id, week, previous in volumes:
+        stats[user_id]['volume_week'] = float(week or 0)
+        stats[user_id]['volume_previous'] = float(previous or 0)
+
+    weights = (
+        ProgressEntry.objects.using(alias)
+        .filter(user_id__in=stats, date__gte=window_start, weight__isnull=False)
+        .order_by('user_id', 'date').values_list('user_id', 'date', 'weight')
+    )
+    for user_id, day, weight in weights:
+        stats[user_id]['weights'].append((day, weight))
+
+    for figures in stats.values():
+        last = figures.pop('last_workout')
+        figures['days_inactive'] = (today - last).days if last else None
+        figures['weight_trend'] = _weight_trend(figures.pop('weights'))
+    return stats
+
+
+def features(figures):
+    """The ``FEATURES`` row of one user's ``user_stats()``"""
+    previous = figures['volume_previous']
+    volume_change = _clip((figures['volume_week'] - previous) / previous) if previous else 0.0
+    ratings = figures['ratings']
+    days_inactive = figures['days_inactive']
+    trend = figures['weight_trend']
+    direction = GOAL_DIRECTIONS.get(figures['fitness_goal'])
+    row = {
+        'bias': 1.0,
+        'active': float(figures['workouts_window'] > 0),
+        'sessions_week': min(figures['workouts_week'] / 7, 1.0),
+        'weekly_average': min(figures['workouts_window'] * 7 / figures['window_days'] / 7, 1.0),
+        'days_inactive': min(days_inactive / 14, 1.0) if days_inactive is not None else 1.0,
+        'volume_change': volume_change,
+        # 1 kg/week away from the goal (or either way when maintaining) counts fully
+        'off_goal_trend': _clip(trend * direction) if direction else min(abs(trend), 1.0),
+        'low_rating': (5 - sum(ratings) / len(ratings)) / 4 if ratings else 0.0,
+        'gaining_goal': float(figures['fitness_goal'] == 'gain_weight'),
+    }
+    return [row[name] for name in FEATURES]
+
+
+_WEIGHTS = [[candidate.weights.get(name, 0.0) for candidate in CANDIDATES] for name in FEATURES]
+
+
+def score(matrix):
+    """``sigmoid(X @ W)``: one list of candidate scores per feature row"""
+    if not matrix:
+        return []
+    if np is not None:
+        logits = np.asarray(matrix, dtype=float) @ np.asarray(_WEIGHTS)
+        return (1 / (1 + np.exp(-logits))).tolist()
+    columns = list(zip(*_WEIGHTS))
+    return [
+        [1 / (1 + math.exp(-sum(x * w for x, w in zip(row, column)))) for column in columns]
+        for row in matrix
+    ]
+
+
+def history(alias, user_ids, since):
+    """What users did with earlier recommendations.
+
+    Returns the mean feedback per user and recommendation type, from -1 (not
+    helpful) to 1 (helpful), and the ``(user, title)`` pairs read, applied or
+    rated since ``since``, which are not suggested again yet.
+    """
+    rows = (
+        AIRecommendation.objects.using(alias)
+        .filter(Q(user_feedback__isnull=False) | Q(is_read=True) | Q(is_applied=True), user_id__in=user_ids)
+        .values_list('user_id', 'recommendation_type', 'title', 'user_feedback', 'created_at')
+    )
+    totals, kept = {}, set()
+    for user_id, recommendation_type, title, value, created_at in rows:
+        if created_at >= since:
+            kept.add((user_id, title))
+        if value is not None:
+            total = totals.setdefault((user_id, recommendation_type), [0, 0])
+            total[0] += FEEDBACK_VALUES.get(value, 0)
+            total[1] += 1
+    return {key: value / count for key, (value, count) in totals.items()}, kept
+
+
+def priority(relevance):
+    if relevance >= 0.85:
+        return 'high'
+    if relevance >= 0.65:
+        return 'medium'
+    return 'low'
+
+
+def _reasoning(candidate, figures):
+    days = figures['days_inactive']
+    return candidate.reasoning.format(**{
+        **figures,
+        'sessions_week': figures['workouts_week'],
+        'weekly_average': figures['workouts_window'] * 7 / figures['window_days'],
+        'volume_change': (figures['volume_week'] - figures['volume_previous']) / figures['volume_previous']
+        if figures['volume_previous'] else 0.0,
+        'days_inactive': f'{days} days' if days is not None else 'a while',
+        'fitness_goal': figures['fitness_goal'].replace('_', ' '),
+    })
+
+
+def recommend_users(alias, user_ids, now=None):
+    """Score and save recommendations for ``user_ids``, all on shard ``alias``; returns the new rows"""
+    config = get_config()
+    now = now or timezone.now()
+    stats = user_stats(alias, user_ids, now, config['WINDOW_DAYS'])
+    user_ids = list(stats)
+    scores = score([features(stats[user_id]) for user_id in user_ids])
+    ratings, kept = history(alias, user_ids, now - timedelta(days=config['WINDOW_DAYS']))
+
+    recommendations = []
+    for user_id, user_scores in zip(user_ids, scores):
+        ranked = []
+        for candidate, value in zip(CANDIDATES, user_scores):
+            if (user_id, candidate.title) in kept:
+                continue
+            adjustment = 1 + config['FEEDBACK_WEIGHT'] * ratings.get((user_id, candidate.recommendation_type), 0)
+            relevance = _clip(value * adjustment, 0.0, 1.0)
+            if relevance >= config['MIN_SCORE']:
+                ranked.append((relevance, candidate))
+        ranked.sort(key=lambda item: item[0], reverse=True)
+        chosen = []
+        for relevance, candidate in ranked:
+            if not any({candidate.title, other.title} in CONFLICTS for _, other in chosen):
+                chosen.append((relevance, candidate))
+        for relevance, candidate in chosen[:config['PER_USER']]:
+            relevance = Decimal(relevance).quantize(Decimal('0.01'))
+            recommendations.append(AIRecommendation(
+                user_id=user_id, title=candidate.title, description=candidate.description,
+                reasoning=_reasoning(candidate, stats[user_id]),
+                recommendation_type=candidate.recommendation_type,
+                priority=priority(relevance), relevance_score=relevance,
+            ))
+
+    with transaction.atomic(using=alias):
+        # The engine's earlier suggestions the user has not acted on
+        stale = AIRecommendation.objects.using(alias).filter(
+            user_id__in=user_ids, title__in=TITLES, is_read=False, is_applied=False, user_feedback__isnull=True,
+        )
+        stale_ids = list(stale.values_list('user_id', 'pk'))
+        # Nothing references recommendations; deletion signals are replaced by record_changes()
+        stale._raw_delete(alias)
+        created = AIRecommendation.objects.using(alias).bulk_create(recommendations)
+
+    record_changes('recommendations', stale_ids, deleted=True)
+    record_changes('recommendations', [(obj.user_id, obj.pk) for obj in created])
+    return created
+
+
+def users_with_new_activity(alias, user_ids):
+    """Those of ``user_ids`` with activity on shard ``alias`` newer than their latest engine recommendation"""
+    last_run = dict(
+        AIRecommendation.objects.using(alias).filter(user_id__in=user_ids, title__in=TITLES)
+        .values('user_id').annotate(at=Max('created_at')).values_list('user_id', 'at')
+    )
+    activity = [
+        (CompletedWorkout.objects.filter(user_id__in=user_ids), 'user_id', 'updated_at'),
+        (WorkoutSession.objects.filter(user_id__in=user_ids), 'user_id', 'updated_at'),
+        (ExerciseSet.objects.filter(session__user_id__in=user_ids), 'session__user_id', 'created_at'),
+        (ProgressEntry.objects.filter(user_id__in=user_ids), 'user_id', 'updated_at'),
+        (AIRecommendation.objects.filter(user_id__in=user_ids, user_feedback__isnull=False), 'user_id', 'updated_at'),
+    ]
+    active = set()
+    for queryset, owner, timestamp in activity:
+        latest = queryset.using(alias).values(owner).annotate(at=Max(timestamp)).values_list(owner, 'at')
+        active.update(user_id for user_id, at in latest if user_id not in last_run or at > last_run[user_id])
+    return [user_id for user_id in user_ids if user_id in active]
+
+
+def recommend_chunk(alias, user_ids, incremental=False):
+    """``recommend_users()`` for one chunk of a run; returns (users scored, recommendations saved)"""
+    if incremental:
+        user_ids = users_with_new_activity(alias, user_ids)
+    if not user_ids:
+        return 0, 0
+    return len(user_ids), len(recommend_users(alias, user_ids))
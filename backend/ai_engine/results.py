@@ -0,0 +1,203 @@
+"""
+Result cache shared by identical AI requests.
+
+Many users in the same profile bucket (say beginner, lose_weight, female,
+3 months) send practically the same request. ``lookup()`` keys a request by
+a hash of its ``request_type``, its normalized prompt (case, punctuation
+and spacing ignored) and its bucketed context: the user's profile
+(``handlers.user_context()``) overlaid with the request's ``user_context``,
+with numbers rounded down to ``BUCKETS`` steps, e.g. ages 30-34 alike.
+
+The job queue looks a request up before running its handler. A hit copies
+the earlier ``ai_response`` and, for a generated plan, a snapshot of the
+plan taken when it was generated, cloned for the new user. The hit costs
+nothing, so it records ``tokens_used`` and ``cost`` of 0 and adds what the
+original cost to the savings. After a miss, ``store()`` saves the result
+for ``TIMEOUT`` seconds. Only ``REQUEST_TYPES`` whose output depends on
+nothing but the prompt and profile are cached; ``progress_analysis`` reads
+the user's history and is not.
+
+``stats()`` reports hits, misses, hit rate and the tokens and cost saved,
+and ``GET /api/ai/result-cache/stats/`` (staff only) serves them. Entries and
+counters live in the ``ALIAS`` cache; as with idempotency keys, use a shared
+cache (FileCache, RespCache) so that all workers share results.
+Configured through ``settings.AI_RESULT_CACHE``.
+"""
+import hashlib
+import json
+import logging
+import math
+import re
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from workouts.models import WorkoutDay, WorkoutExercise, WorkoutPlan
+from .handlers import user_context
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ALIAS': 'default',
+    'TIMEOUT': 7 * 24 * 60 * 60,
+    'REQUEST_TYPES': ['workout_plan', 'exercise_suggestion'],
+    # Context number -> bucket width; other numbers must match exactly
+    'BUCKETS': {'age': 5, 'height': 5, 'weight': 5},
+}
+
+PLAN_FIELDS = ('name', 'description', 'difficulty', 'duration', 'specific_goal', 'target_gender',
+               'min_fitness_level', 'is_ai_generated')
+DAY_FIELDS = ('name', 'day_number', 'is_rest_day', 'focus_area', 'notes')
+EXERCISE_FIELDS = ('exercise_id', 'sets', 'reps', 'rest_time', 'weight', 'duration', 'order', 'notes')
+
+# Counters, kept in the cache so every worker adds to the same totals
+COUNTERS = ('hits', 'misses', 'saved_tokens', 'saved_cost_micros')
+
+_WORDS = re.compile(r'\w+')
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'AI_RESULT_CACHE', {})}
+
+
+def get_result_cache():
+    return caches[get_config()['ALIAS']]
+
+
+def normalize_prompt(prompt):
+    return ' '.join(_WORDS.findall(prompt.casefold()))
+
+
+def bucket(value, buckets, name=None):
+    """``value`` with strings normalized and numbers in ``buckets`` rounded down to their step"""
+    if isinstance(value, dict):
+        return {key: bucket(item, buckets, key) for key, item in value.items()}
+    if isinstance(value, list):
+        return [bucket(item, buckets) for item in value]
+    if isinstance(value, str):
+        value = value.strip().casefold()
+        if name not in buckets:
+            return value
+        try:
+            value = float(value)
+        except ValueError:
+            return value
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool) and name in buckets:
+        step = buckets[name]
+        return math.floor(float(value) / step) * step
+    return value
+
+
+def cache_key(ai_request, config=None):
+    """The hash identifying ``ai_request``'s result, or None if its type is not cached"""
+    config = config or get_config()
+    if ai_request.request_type not in config['REQUEST_TYPES']:
+        return None
+    context = {**user_context(ai_request.user), **(ai_request.user_context or {})}
+    canonical = json.dumps(
+        [ai_request.request_type, normalize_prompt(ai_request.prompt), bucket(context, config['BUCKETS'])],
+        sort_keys=True, separators=(',', ':'), default=str,
+    )
+    return 'ai:result:' + hashlib.blake2b(canonical.encode(), digest_size=20).hexdigest()
+
+
+def _snapshot(plan):
+    """What it takes to recreate ``plan`` for another user, independent of later edits"""
+    days = plan.schedule.prefetch_related('exercises').order_by('day_number')
+    return {
+        **{field: getattr(plan, field) for field in PLAN_FIELDS},
+        'days': [
+            {
+                **{field: getattr(day, field) for field in DAY_FIELDS},
+                'exercises': [{field: getattr(item, field) for field in EXERCISE_FIELDS}
+                              for item in day.exercises.all()],
+            }
+            for day in days
+        ],
+    }
+
+
+def _clone(snapshot, ai_request):
+    fields = {key: value for key, value in snapshot.items() if key != 'days'}
+    with transaction.atomic():
+        plan = WorkoutPlan.objects.create(**fields, ai_prompt_used=ai_request.prompt,
+                                          created_by=ai_request.user, is_public=False)
+        # create() rather than bulk_create(), so sync and cache invalidation see the rows
+        for day_fields in snapshot['days']:
+            day = WorkoutDay.objects.create(
+                plan=plan, **{key: value for key, value in day_fields.items() if key != 'exercises'},
+            )
+            for item in day_fields['exercises']:
+                WorkoutExercise.objects.create(workout_day=day, **item)
+    return plan
+
+
+def _incr(cache, name, amount=1):
+    key = f'ai:result-stats:{name}'
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        # Evicted in between; the counters are best effort
+        cache.set(key, amount, None)
+
+
+def lookup(ai_request):
+    """Fill ``ai_request`` in from a cached result; returns whether there was one"""
+    config = get_config()
+    key = cache_key(ai_request, config)
+    if key is None:
+        return False
+    cache = get_result_cache()
+    entry = cache.get(key)
+    if entry is None:
+        _incr(cache, 'misses')
+        return False
+
+    ai_response = dict(entry['ai_response'] or {})
+    ai_request.generated_plan = None
+    if entry['plan'] is not None:
+        ai_request.generated_plan = _clone(entry['plan'], ai_request)
+        if 'plan_id' in ai_response:
+            ai_response['plan_id'] = ai_request.generated_plan.pk
+    ai_request.ai_response = ai_response
+    ai_request.tokens_used = 0
+    ai_request.cost = Decimal('0')
+
+    _incr(cache, 'hits')
+    _incr(cache, 'saved_tokens', entry['tokens_used'] or 0)
+    _incr(cache, 'saved_cost_micros', int((entry['cost'] or 0) * 1_000_000))
+    logger.info('AI request %s served from the result cache of request %s', ai_request.pk, entry['request_id'])
+    return True
+
+
+def store(ai_request):
+    """Cache the result ``ai_request``'s handler just produced"""
+    config = get_config()
+    key = cache_key(ai_request, config)
+    if key is None:
+        return
+    plan = ai_request.generated_plan
+    get_result_cache().set(key, {
+        'request_id': ai_request.pk,
+        'ai_response': ai_request.ai_response,
+        'plan': _snapshot(plan) if plan is not None else None,
+        'tokens_used': ai_request.tokens_used,
+        'cost': ai_request.cost,
+    }, config['TIMEOUT'])
+
+
+def stats():
+    cache = get_result_cache()
+    values = cache.get_many([f'ai:result-stats:{name}' for name in COUNTERS])
+    counts = {name: values.get(f'ai:result-stats:{name}', 0) for name in COUNTERS}
+    lookups = counts['hits'] + counts['misses']
+    return {
+        'hits': counts['hits'],
+        'misses': counts['misses'],
+        'hit_rate': counts['hits'] / lookups if lookups else None,
+        'saved_tokens': counts['saved_tokens'],
+        'saved_cost': counts['saved_cost_micros'] / 1_000_000,
+    }
@@ -1,25 +1,36 @@
 from rest_framework import serializers
+from fitness_project.fieldsets import FieldsetMixin
+from workouts.serializers import WorkoutPlanSerializer
 from .models import AIRequest, AIRecommendation, AITrainingData, AIModelVersion
 
-class AIRequestSerializer(serializers.ModelSerializer):
+class AIRequestSerializer(FieldsetMixin, serializers.ModelSerializer):
+    expandable_fields = {'generated_plan': WorkoutPlanSerializer}
+
     class Meta:
         model = AIRequest
-        fields = '__all__'
-        read_only_fields = ['id', 'created_at', 'updated_at', 'user']
+        exclude = ['claimed_by', 'lease_expires_at']
+        # Set by the job queue (ai_engine.jobs), not by clients
+        read_only_fields = [
+            'id', 'created_at', 'updated_at', 'user', 'status', 'priority', 'attempts', 'available_at',
+            'ai_response', 'generated_plan', 'tokens_used', 'processing_time', 'cost', 'error_message',
+            'completed_at',
+        ]
 
-class AIRecommendationSerializer(serializers.ModelSerializer):
+class AIRecommendationSerializer(FieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = AIRecommendation
         fields = '__all__'
         read_only_fields = ['id', 'created_at', 'updated_at', 'user']
 
-class AITrainingDataSerializer(serializers.ModelSerializer):
+class AITrainingDataSerializer(FieldsetMixin, serializers.ModelSerializer):
+    expandable_fields = {'ai_request_id': AIRequestSerializer}
+
     class Meta:
         model = AITrainingData
         fields = '__all__'
         read_only_fields = ['id', 'created_at', 'user']
 
-class AIModelVersionSerializer(serializers.ModelSerializer):
+class AIModelVersionSerializer(FieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = AIModelVersion
         fields = '__all__'
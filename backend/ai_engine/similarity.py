@@ -0,0 +1,528 @@
+"""
+Nearest-neighbour index of users by body and goals.
+
+Every active user is described by a row of ``FEATURES``:
+
+- the profile's age, height and weight, fitness level (0, 0.5 or 1), and
+  one-hot gender and fitness goal;
+- ``BodyComposition`` and ``BodyMeasurements`` values;
+- how far each ``GoalMeasurements`` target is from the current value, e.g.
+  ``weight_to_goal = target_weight - weight``.
+
+Numeric columns are standardized with the mean and standard deviation of all
+users; an unknown value counts as the mean. Users with fewer than
+``MIN_FEATURES`` known numeric values are not indexed. The rows are packed
+into one contiguous float32 matrix, and ``SimilarityIndex.neighbours()``
+finds the ``k`` users nearest to a user (Euclidean distance) with one
+matrix-vector product over all rows. From ``BALL_TREE_MIN_USERS`` rows a
+ball tree is built as well. Its rows are stored in tree order, so each leaf
+is a slice of the matrix, and a query only reads the leaves that can hold a
+nearer neighbour.
+
+``python manage.py build_similarity_index`` refreshes the index
+incrementally: it only recomputes the rows of users whose profile, body
+composition, measurements or goals changed since the last refresh, and
+removes users that were deleted or deactivated. The mean and deviation stay
+fixed between full builds. A full build happens with ``--full``, when the
+features change, and when more than ``REBUILD_FRACTION`` of the users
+changed. Each refresh is saved as a new version of ``.npy`` files under
+``PATH``. ``get_index()`` loads them memory-mapped, so a worker starts
+without reading the matrix, and processes share its pages. Workers switch
+to a newer version within ``RELOAD_INTERVAL`` seconds.
+
+Nothing refreshes the index by itself: saving a profile or a measurement
+does not touch it, and ``changed_users()`` only picks the change up on the
+next run of the command. Until then the index is stale. A user missing
+from it is still looked up from the database at query time, but the rows of
+everyone else stay as they were at ``meta['refreshed_at']``. Run the
+command on a schedule (cron, a systemd timer) a few minutes apart.
+
+``similar_plans()`` ranks the public plans that the nearest users completed
+sessions of, and ``GET /api/ai/similar-plans/`` serves them. Needs NumPy.
+Configured through ``settings.AI_SIMILARITY``.
+"""
+import heapq
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from fitness_project.db.sharding import get_shards, shard_for_user
+from users.models import BodyComposition, BodyMeasurements, GoalMeasurements, User
+from workouts.models import WorkoutDay, WorkoutPlan, WorkoutSession
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'PATH': os.path.join(settings.BASE_DIR, 'similarity_index'),
+    # Neighbours whose plans similar_plans() considers
+    'NEIGHBOURS': 20,
+    'MIN_FEATURES': 3,
+    'BALL_TREE_MIN_USERS': 100_000,
+    'LEAF_SIZE': 64,
+    'REBUILD_FRACTION': 0.2,
+    # Seconds between checks for a newer saved index
+    'RELOAD_INTERVAL': 30,
+    # Saved versions kept besides the current one, for processes still reading them
+    'KEEP_VERSIONS': 1,
+}
+
+PROFILE = ('age', 'height', 'weight')
+COMPOSITION = ('body_fat', 'muscle_mass', 'bmi', 'bmr', 'visceral_fat', 'muscle_rate')
+MEASUREMENTS = ('chest', 'neck', 'waist', 'left_arm', 'right_arm', 'left_thigh', 'right_thigh', 'shoulders',
+                'hips', 'calves')
+# GoalMeasurements field -> the current value it is a target for
+GOALS = {'target_weight': 'weight', 'chest': 'chest', 'waist': 'waist', 'hips': 'hips', 'left_arm': 'left_arm',
+         'left_thigh': 'left_thigh'}
+LEVELS = {'beginner': 0.0, 'intermediate': 0.5, 'advanced': 1.0}
+GENDERS = [value for value, _ in User.GENDER_CHOICES]
+FITNESS_GOALS = [value for value, _ in User.FITNESS_GOAL_CHOICES]
+
+NUMERIC = (*PROFILE, *COMPOSITION, *MEASUREMENTS, *(f'{current}_to_goal' for current in GOALS.values()))
+CATEGORICAL = ('fitness_level', *(f'gender_{value}' for value in GENDERS),
+               *(f'fitness_goal_{value}' for value in FITNESS_GOALS))
+FEATURES = (*NUMERIC, *CATEGORICAL)
+
+# Changes made while a refresh reads are caught by the next one
+WATERMARK_OVERLAP = timedelta(minutes=1)
+
+# Users per IN (...) query
+_CHUNK = 500
+
+_TREE_ARRAYS = ('start', 'end', 'left', 'right', 'centroids', 'radii')
+
+
+class IndexUnavailable(Exception):
+    """NumPy is not installed or no index has been built"""
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'AI_SIMILARITY', {})}
+
+
+def _number(value):
+    return float(value) if value is not None else None
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), _CHUNK):
+        yield ids[start:start + _CHUNK]
+
+
+def user_features(user_ids=None):
+    """Raw ``FEATURES`` rows (None where unknown) of active users, all of them or ``user_ids``"""
+    rows = {}
+    for ids in _chunks(user_ids) if user_ids is not None else [None]:
+        users = User.objects.filter(is_active=True)
+        if ids is not None:
+            users = users.filter(pk__in=ids)
+        for pk, age, height, weight, gender, level, goal in users.values_list(
+                'pk', *PROFILE, 'gender', 'fitness_level', 'fitness_goal'):
+            row = dict.fromkeys(FEATURES)
+            row.update(age=_number(age), height=_number(height), weight=_number(weight),
+                       fitness_level=LEVELS.get(level, 0.0))
+            row.update({f'gender_{value}': float(gender == value) for value in GENDERS})
+            row.update({f'fitness_goal_{value}': float(goal == value) for value in FITNESS_GOALS})
+            rows[pk] = row
+
+        owners = {'user__is_active': True} if ids is None else {'user_id__in': ids}
+        for user_id, *values in BodyComposition.objects.filter(**owners).values_list('user_id', *COMPOSITION):
+            if user_id in rows:
+                rows[user_id].update(zip(COMPOSITION, map(_number, values)))
+        for user_id, *values in BodyMeasurements.objects.filter(**owners).values_list('user_id', *MEASUREMENTS):
+            if user_id in rows:
+                rows[user_id].update(zip(MEASUREMENTS, map(_number, values)))
+        for user_id, *values in GoalMeasurements.objects.filter(**owners).values_list('user_id', *GOALS):
+            row = rows.get(user_id)
+            if row is None:
+                continue
+            for current, target in zip(GOALS.values(), map(_number, values)):
+                if target is not None and row[current] is not None:
+                    row[f'{current}_to_goal'] = target - row[current]
+
+    return {pk: [row[name] for name in FEATURES] for pk, row in rows.items()}
+
+
+def changed_users(since):
+    """Ids of users whose profile or body data changed at or after ``since``"""
+    changed = set(User.objects.filter(updated_at__gte=since).values_list('pk', flat=True))
+    for model in (BodyComposition, BodyMeasurements, GoalMeasurements):
+        changed.update(model.objects.filter(updated_at__gte=since).values_list('user_id', flat=True))
+    return changed
+
+
+def _raw_matrix(rows):
+    return np.array([[np.nan if value is None else value for value in row] for row in rows],
+                    dtype=np.float64).reshape(len(rows), len(FEATURES))
+
+
+def _qualifying(raw, min_features):
+    """Mask of the rows with at least ``min_features`` known numeric values"""
+    return (~np.isnan(raw[:, :len(NUMERIC)])).sum(axis=1) >= min_features
+
+
+def _statistics(raw):
+    """Per-column mean and scale; categorical columns are used as they are"""
+    mean = np.zeros(len(FEATURES))
+    scale = np.ones(len(FEATURES))
+    numeric = raw[:, :len(NUMERIC)]
+    known = ~np.isnan(numeric)
+    counts = known.sum(axis=0)
+    filled = np.where(known, numeric, 0.0)
+    column_mean = np.divide(filled.sum(axis=0), counts, out=np.zeros(len(NUMERIC)), where=counts > 0)
+    deviation = np.where(known, numeric - column_mean, 0.0)
+    column_std = np.sqrt(np.divide((deviation ** 2).sum(axis=0), counts, out=np.zeros(len(NUMERIC)),
+                                   where=counts > 0))
+    mean[:len(NUMERIC)] = column_mean
+    scale[:len(NUMERIC)] = np.where(column_std > 0, column_std, 1.0)
+    return mean, scale
+
+
+def _normalize(raw, mean, scale):
+    # Unknown values count as the mean
+    return np.ascontiguousarray(np.nan_to_num((raw - mean) / scale, nan=0.0), dtype=np.float32)
+
+
+class BallTree:
+    """Ball tree over the rows of a matrix, stored as flat arrays.
+
+    Node ``i`` covers rows ``start[i]:end[i]`` of the matrix in tree order;
+    ``left[i]`` and ``right[i]`` are its children, -1 for a leaf, and every
+    row of the node lies within ``radii[i]`` of ``centroids[i]``.
+    """
+
+    def __init__(self, start, end, left, right, centroids, radii):
+        self.start, self.end, self.left, self.right = start, end, left, right
+        self.centroids, self.radii = centroids, radii
+
+    @classmethod
+    def build(cls, matrix, leaf_size):
+        """The tree of ``matrix`` and the order its rows must be stored in"""
+        order = np.arange(len(matrix))
+        nodes = []
+        pending = [(0, len(matrix), None, None)]  # start, end, parent, is left child
+        while pending:
+            start, end, parent, is_left = pending.pop()
+            points = matrix[order[start:end]]
+            centroid = points.mean(axis=0)
+            radius = float(np.sqrt(((points - centroid) ** 2).sum(axis=1)).max())
+            node = len(nodes)
+            nodes.append([start, end, -1, -1, centroid, radius])
+            if parent is not None:
+                nodes[parent][2 if is_left else 3] = node
+            if end - start <= leaf_size:
+                continue
+            # Split at the median of the dimension with the widest spread
+            dimension = int(np.ptp(points, axis=0).argmax())
+            middle = (end - start) // 2
+            order[start:end] = order[start:end][np.argpartition(points[:, dimension], middle)]
+            pending.append((start + middle, end, node, False))
+            pending.append((start, start + middle, node, True))
+
+        start, end, left, right, centroids, radii = zip(*nodes)
+        tree = cls(np.array(start, dtype=np.int64), np.array(end, dtype=np.int64),
+                   np.array(left, dtype=np.int64), np.array(right, dtype=np.int64),
+                   np.array(centroids, dtype=np.float32), np.array(radii, dtype=np.float32))
+        return tree, order
+
+    def query(self, matrix, vector, k):
+        """Rows of the ``k`` nearest rows of ``matrix`` and their distances, nearest first"""
+        best_distances = np.empty(0, dtype=np.float32)
+        best_rows = np.empty(0, dtype=np.int64)
+        worst = np.inf
+        # Nodes by the least distance any of their rows can have
+        queue = [(self._bound(0, vector), 0)]
+        while queue:
+            bound, node = heapq.heappop(queue)
+            if bound >= worst:
+                break
+            if self.left[node] < 0:
+                start, end = int(self.start[node]), int(self.end[node])
+                distances = np.sqrt(((matrix[start:end] - vector) ** 2).sum(axis=1))
+                best_distances = np.concatenate([best_distances, distances])
+                best_rows = np.concatenate([best_rows, np.arange(start, end)])
+                if len(best_distances) > k:
+                    keep = np.argpartition(best_distances, k - 1)[:k]
+                    best_distances, best_rows = best_distances[keep], best_rows[keep]
+                if len(best_distances) == k:
+                    worst = float(best_distances.max())
+                continue
+            for child in (self.left[node], self.right[node]):
+                child_bound = self._bound(child, vector)
+                if child_bound < worst:
+                    heapq.heappush(queue, (child_bound, int(child)))
+        order = np.argsort(best_distances)
+        return best_rows[order], best_distances[order]
+
+    def _bound(self, node, vector):
+        return max(0.0, float(np.sqrt(((self.centroids[node] - vector) ** 2).sum())) - float(self.radii[node]))
+
+
+class SimilarityIndex:
+    """Normalized user vectors with their ids, and the statistics that normalize them"""
+
+    def __init__(self, user_ids, matrix, mean, scale, tree=None, meta=None, squared_norms=None):
+        self.user_ids = user_ids
+        self.matrix = matrix
+        self.mean = mean
+        self.scale = scale
+        self.tree = tree
+        self.meta = meta or {}
+        # Brute-force queries need every row's squared norm; a tree query does not
+        if tree is None and squared_norms is None:
+            squared_norms = (matrix.astype(np.float64) ** 2).sum(axis=1)
+        self.squared_norms = squared_norms
+        self._positions = None
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    @classmethod
+    def from_rows(cls, user_ids, matrix, mean, scale, config, meta):
+        """An index of ``matrix``, with a ball tree when it is large enough"""
+        tree = None
+        if len(user_ids) >= config['BALL_TREE_MIN_USERS']:
+            tree, order = BallTree.build(matrix, config['LEAF_SIZE'])
+            user_ids, matrix = user_ids[order], np.ascontiguousarray(matrix[order])
+        return cls(user_ids, matrix, mean, scale, tree, meta)
+
+    def position(self, user_id):
+        if self._positions is None:
+            self._positions = {int(pk): row for row, pk in enumerate(self.user_ids)}
+        return self._positions.get(user_id)
+
+    def vector(self, user_id):
+        """``user_id``'s normalized row, from the index or the database; None if they do not qualify"""
+        row = self.position(user_id)
+        if row is not None:
+            return np.array(self.matrix[row])
+        raw = user_features([user_id]).get(user_id)
+        if raw is None:
+            return None
+        raw = _raw_matrix([raw])
+        if not _qualifying(raw, self.meta.get('min_features', 0))[0]:
+            return None
+        return _normalize(raw, self.mean, self.scale)[0]
+
+    def query(self, vector, k):
+        """The ``k`` users nearest to ``vector`` as ``(user id, distance)``, nearest first"""
+        k = min(k, len(self))
+        if k <= 0:
+            return []
+        vector = np.asarray(vector, dtype=np.float32)
+        if self.tree is not None:
+            rows, distances = self.tree.query(self.matrix, vector, k)
+        else:
+            # |m - v|^2 = |m|^2 - 2 m.v + |v|^2 for every row at once
+            squared = self.squared_norms - 2 * (self.matrix @ vector) + float(vector @ vector)
+            rows = np.argpartition(squared, k - 1)[:k]
+            rows = rows[np.argsort(squared[rows])]
+            distances = np.sqrt(np.maximum(squared[rows], 0))
+        return [(int(self.user_ids[row]), float(distance)) for row, distance in zip(rows, distances)]
+
+    def neighbours(self, user_id, k):
+        """The ``k`` users most like ``user_id``, not counting them"""
+        vector = self.vector(user_id)
+        if vector is None:
+            return []
+        return [(pk, distance) for pk, distance in self.query(vector, k + 1) if pk != user_id][:k]
+
+    def save(self, path):
+        """Write the index as a new version under ``path`` and make it current; returns the version"""
+        os.makedirs(path, exist_ok=True)
+        version = f'v{time.time_ns()}'
+        staging = tempfile.mkdtemp(prefix='.tmp-', dir=path)
+        arrays = {'user_ids': self.user_ids, 'matrix': self.matrix, 'mean': self.mean, 'scale': self.scale}
+        if self.tree is not None:
+            arrays.update({f'tree_{name}': getattr(self.tree, name) for name in _TREE_ARRAYS})
+        else:
+            arrays['squared_norms'] = self.squared_norms
+        for name, array in arrays.items():
+            np.save(os.path.join(staging, f'{name}.npy'), np.ascontiguousarray(array))
+        with open(os.path.join(staging, 'meta.json'), 'w') as meta:
+            json.dump({**self.meta, 'version': version, 'features': list(FEATURES), 'users': len(self)}, meta)
+        os.rename(staging, os.path.join(path, version))
+
+        # Readers follow CURRENT; replacing it is atomic
+        fd, pointer = tempfile.mkstemp(prefix='.tmp-', dir=path)
+        with os.fdopen(fd, 'w') as current:
+            current.write(version)
+        os.replace(pointer, os.path.join(path, 'CURRENT'))
+        _prune(path, version, get_config()['KEEP_VERSIONS'])
+        return version
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """The current saved index, memory-mapped; None if there is none or its features are outdated"""
+        try:
+            with open(os.path.join(path, 'CURRENT')) as current:
+                directory = os.path.join(path, current.read().strip())
+            with open(os.path.join(directory, 'meta.json')) as meta:
+                meta = json.load(meta)
+        except FileNotFoundError:
+            return None
+        if meta.get('features') != list(FEATURES):
+            return None
+
+        def array(name):
+            return np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode)
+
+        if os.path.exists(os.path.join(directory, 'tree_start.npy')):
+            tree = BallTree(*(array(f'tree_{name}') for name in _TREE_ARRAYS))
+            return cls(array('user_ids'), array('matrix'), array('mean'), array('scale'), tree, meta)
+        return cls(array('user_ids'), array('matrix'), array('mean'), array('scale'), None, meta,
+                   array('squared_norms'))
+
+
+def _prune(path, current, keep):
+    versions = sorted((name for name in os.listdir(path) if name.startswith('v') and name != current),
+                      key=lambda name: int(name[1:]), reverse=True)
+    for name in versions[keep:]:
+        # Open memory maps stay valid after their files are removed
+        shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+
+def build(config=None, now=None):
+    """A new index of all active users, with fresh statistics"""
+    config = config or get_config()
+    now = now or timezone.now()
+    rows = user_features()
+    user_ids = np.fromiter(rows, dtype=np.int64, count=len(rows))
+    raw = _raw_matrix(list(rows.values()))
+    qualifying = _qualifying(raw, config['MIN_FEATURES'])
+    user_ids, raw = user_ids[qualifying], raw[qualifying]
+    mean, scale = _statistics(raw)
+    meta = {'built_at': now.isoformat(), 'refreshed_at': now.isoformat(), 'min_features': config['MIN_FEATURES']}
+    return SimilarityIndex.from_rows(user_ids, _normalize(raw, mean, scale), mean, scale, config, meta)
+
+
+def refresh(full=False):
+    """Bring the saved index up to date and save it; returns (index, {'full', 'updated', 'removed'})"""
+    if np is None:
+        raise IndexUnavailable('The similarity index needs NumPy, which is not installed')
+    config = get_config()
+    started = timezone.now()
+    current = None if full else SimilarityIndex.load(config['PATH'])
+
+    changed = set()
+    if current is not None:
+        since = datetime.fromisoformat(current.meta['refreshed_at']) - WATERMARK_OVERLAP
+        changed = changed_users(since)
+        if len(changed) > config['REBUILD_FRACTION'] * max(len(current), 1):
+            current = None
+
+    if current is None:
+        index = build(config, started)
+        index.save(config['PATH'])
+        return index, {'full': True, 'updated': len(index), 'removed': 0}
+
+    active = set(User.objects.filter(is_active=True).values_list('pk', flat=True))
+    rows = user_features(changed & active)
+    user_ids = np.fromiter(rows, dtype=np.int64, count=len(rows))
+    raw = _raw_matrix(list(rows.values()))
+    qualifying = _qualifying(raw, current.meta['min_features'])
+    user_ids, matrix = user_ids[qualifying], _normalize(raw[qualifying], current.mean, current.scale)
+
+    # Rows of changed users are replaced; those of deleted or deactivated users dropped
+    kept = np.array([int(pk) in active and int(pk) not in changed for pk in current.user_ids], dtype=bool)
+    removed = int((~kept).sum()) - int(np.isin(current.user_ids[~kept], user_ids).sum())
+    meta = {**current.meta, 'refreshed_at': started.isoformat()}
+    index = SimilarityIndex.from_rows(
+        np.concatenate([current.user_ids[kept], user_ids]),
+        np.ascontiguousarray(np.concatenate([current.matrix[kept], matrix])),
+        current.mean, current.scale, config, meta,
+    )
+    index.save(config['PATH'])
+    return index, {'full': False, 'updated': len(user_ids), 'removed': removed}
+
+
+_loaded = {'index': None, 'version': None, 'checked_at': None}
+_load_lock = threading.Lock()
+
+
+def get_index():
+    """The current saved index, memory-mapped and shared by the process's threads"""
+    if np is None:
+        raise IndexUnavailable('The similarity index needs NumPy, which is not installed')
+    config = get_config()
+    now = time.monotonic()
+    with _load_lock:
+        checked_at = _loaded['checked_at']
+        if checked_at is None or now - checked_at > config['RELOAD_INTERVAL']:
+            _loaded['checked_at'] = now
+            try:
+                with open(os.path.join(config['PATH'], 'CURRENT')) as current:
+                    version = current.read().strip()
+            except FileNotFoundError:
+                version = None
+            if version != _loaded['version']:
+                _loaded['index'] = SimilarityIndex.load(config['PATH']) if version else None
+                _loaded['version'] = version
+        index = _loaded['index']
+    if index is None:
+        raise IndexUnavailable('No similarity index has been built; run `manage.py build_similarity_index`')
+    return index
+
+
+def similar_plans(user, limit=10, k=None):
+    """Public plans the users most like ``user`` completed sessions of, best supported first.
+
+    Each neighbour adds ``1 / (1 + distance)`` to every plan they completed a
+    session of, once per plan; plans ``user`` trained on themselves are left
+    out.
+    """
+    index = get_index()
+    neighbours = index.neighbours(user.pk, k or get_config()['NEIGHBOURS'])
+    if not neighbours:
+        return []
+    weights = dict(neighbours)
+
+    by_shard = {}
+    for user_id in [user.pk, *weights]:
+        by_shard.setdefault(shard_for_user(user_id, get_shards()), []).append(user_id)
+    sessions = set()
+    for alias, user_ids in by_shard.items():
+        sessions.update(
+            WorkoutSession.objects.using(alias)
+            .filter(user_id__in=user_ids, status='completed', workout_day__isnull=False)
+            .values_list('user_id', 'workout_day_id')
+        )
+    # Workout days and plans stay on default
+    plan_of = dict(WorkoutDay.objects.filter(pk__in={day for _, day in sessions}).values_list('pk', 'plan_id'))
+
+    own = {plan_of.get(day) for user_id, day in sessions if user_id == user.pk}
+    support = {}
+    for user_id, day in sessions:
+        plan_id = plan_of.get(day)
+        if user_id != user.pk and plan_id not in own:
+            support.setdefault(plan_id, {})[user_id] = weights[user_id]
+    plans = WorkoutPlan.objects.filter(pk__in=support, is_public=True).in_bulk()
+
+    ranked = sorted(
+        (
+            {
+                'plan_id': plan.pk,
+                'name': plan.name,
+                'difficulty': plan.difficulty,
+                'duration': plan.duration,
+                'similar_users': len(support[plan.pk]),
+                'score': round(sum(1 / (1 + distance) for distance in support[plan.pk].values()), 4),
+            }
+            for plan in plans.values()
+        ),
+        key=lambda item: (-item['score'], item['plan_id']),
+    )
+    return ranked[:limit]
@@ -1,3 +1,588 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import threading
+import math
+import os
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import DatabaseError, connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from progress.models import CompletedWorkout
+from rest_framework_simplejwt.tokens import RefreshToken
+from users.models import User
+from workouts.models import Exercise, WorkoutDay, WorkoutExercise, WorkoutPlan, WorkoutSession
+
+from . import exports, jobs, recommendations, results, similarity, usage
+from .handlers import PermanentError
+from .models import AIModelVersion, AIRecommendation, AIRequest, AITrainingData
+
+
+def fail(job):
+    raise RuntimeError('model unavailable')
+
+
+def reject(job):
+    raise PermanentError('prompt not supported')
+
+
+def queue_settings(**overrides):
+    return override_settings(AI_QUEUE={
+        'HANDLERS': {'progress_analysis': 'ai_engine.tests.fail', 'recommendation': 'ai_engine.tests.reject'},
+        **overrides,
+    })
+
+
+@queue_settings()
+class JobQueueTests(TransactionTestCase):
+    def make_user(self, name):
+        return User.objects.create_user(username=name, email=f'{name}@example.com', password='correct horse battery')
+
+    def make_request(self, user, request_type='progress_analysis', priority=0):
+        return AIRequest.objects.create(user=user, request_type=request_type, prompt='How am I doing?',
+                                        priority=priority)
+
+    def test_concurrent_workers_claim_each_request_once(self):
+        requests = [self.make_request(self.make_user(f'user{n}')).pk for n in range(8)]
+        claims = {}
+        start = threading.Barrier(4)
+
+        def work(worker_id):
+            try:
+                start.wait()
+                claims[worker_id] = jobs.claim('default', worker_id, 8)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=work, args=(f'worker{n}',)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+
+        claimed = [pk for pks in claims.values() for pk in pks]
+        self.assertCountEqual(claimed, requests)
+        for worker_id, pks in claims.items():
+            for job in AIRequest.objects.filter(pk__in=pks):
+                self.assertEqual((job.status, job.claimed_by, job.attempts), ('processing', worker_id, 1))
+
+    def test_claim_respects_per_user_concurrency(self):
+        busy, other = self.make_user('busy'), self.make_user('other')
+        low = self.make_request(busy)
+        high = self.make_request(busy, priority=5)
+        self.make_request(busy)
+        single = self.make_request(other)
+
+        self.assertEqual(jobs.claim('default', 'worker', 10), [high.pk, single.pk])
+        # Both users are at their limit until a request finishes
+        self.assertEqual(jobs.claim('default', 'worker', 10), [])
+        with queue_settings(USER_CONCURRENCY=2):
+            self.assertEqual(jobs.claim('default', 'worker', 10), [low.pk])
+
+    def test_failed_attempt_is_retried_with_backoff(self):
+        job = self.make_request(self.make_user('retry'))
+        jobs.claim('default', 'worker', 1)
+        before = timezone.now()
+        with self.assertLogs('ai_engine.jobs', 'WARNING'):
+            self.assertEqual(jobs.run('default', job.pk, 'worker'), 'pending')
+
+        job.refresh_from_db()
+        self.assertEqual((job.attempts, job.claimed_by), (1, ''))
+        self.assertEqual(job.error_message, 'RuntimeError: model unavailable')
+        # RETRY_BACKOFF seconds plus up to 10% jitter
+        self.assertGreaterEqual(job.available_at, before + timedelta(seconds=30))
+        self.assertLessEqual(job.available_at, timezone.now() + timedelta(seconds=33))
+        self.assertEqual(jobs.claim('default', 'worker', 1), [])
+
+    def test_backoff_doubles_up_to_its_maximum(self):
+        config = jobs.get_config()
+        for attempts, delay in ((1, 30), (2, 60), (3, 120), (20, 3600)):
+            self.assertTrue(delay <= jobs.retry_delay(attempts, config) <= delay * 1.1, attempts)
+
+    def test_request_is_dead_lettered_after_max_attempts(self):
+        job = self.make_request(self.make_user('doomed'))
+        outcomes = []
+        with self.assertLogs('ai_engine.jobs', 'WARNING'):
+            for _ in range(3):
+                AIRequest.objects.filter(pk=job.pk).update(available_at=timezone.now())
+                self.assertEqual(jobs.claim('default', 'worker', 1), [job.pk])
+                outcomes.append(jobs.run('default', job.pk, 'worker'))
+        self.assertEqual(outcomes, ['pending', 'pending', 'dead'])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('dead', 3))
+
+    def test_permanent_error_fails_at_once(self):
+        job = self.make_request(self.make_user('rejected'), request_type='recommendation')
+        jobs.claim('default', 'worker', 1)
+        with self.assertLogs('ai_engine.jobs', 'ERROR'):
+            self.assertEqual(jobs.run('default', job.pk, 'worker'), 'failed')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 1))
+
+    def test_reap_requeues_expired_leases(self):
+        user = self.make_user('orphaned')
+        job = self.make_request(user)
+        spent = self.make_request(user)
+        jobs.claim('default', 'dead-worker', 1)
+        AIRequest.objects.filter(pk=spent.pk).update(status='processing', attempts=3, claimed_by='dead-worker')
+        AIRequest.objects.filter(pk__in=[job.pk, spent.pk]).update(
+            lease_expires_at=timezone.now() - timedelta(seconds=1),
+        )
+        # A renewed lease is not reaped
+        other = self.make_request(self.make_user('alive'))
+        jobs.claim('default', 'live-worker', 1)
+        jobs.renew('default', 'live-worker', [other.pk])
+
+        with self.assertLogs('ai_engine.jobs', 'WARNING'):
+            self.assertEqual(jobs.reap('default'), (1, 1))
+        job.refresh_from_db()
+        spent.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((job.status, job.claimed_by, job.lease_expires_at), ('pending', '', None))
+        self.assertEqual(spent.status, 'dead')
+        self.assertEqual(other.status, 'processing')
+        # The dead worker can no longer finish it
+        self.assertIsNone(jobs.run('default', job.pk, 'dead-worker'))
+
+
+class ResultCacheTests(TestCase):
+    def setUp(self):
+        results.get_result_cache().clear()
+
+    def make_user(self, name, age):
+        return User.objects.create_user(username=name, email=f'{name}@example.com', password='correct horse battery',
+                                        age=age, weight=Decimal('71.50'), gender='female',
+                                        fitness_level='beginner', fitness_goal='lose_weight')
+
+    def make_request(self, user, prompt='Build me a 3-day plan', request_type='workout_plan'):
+        return AIRequest.objects.create(user=user, request_type=request_type, prompt=prompt)
+
+    def generate(self, ai_request):
+        """What a handler would do: a plan with one day and exercise"""
+        exercise = Exercise.objects.create(name='Squat', description='Squat down', muscle_group='legs')
+        plan = WorkoutPlan.objects.create(name='Starter', description='Three days', created_by=ai_request.user,
+                                          is_ai_generated=True)
+        day = WorkoutDay.objects.create(plan=plan, name='Legs', day_number=1)
+        WorkoutExercise.objects.create(workout_day=day, exercise=exercise, sets=3, reps=10, order=1)
+        ai_request.generated_plan = plan
+        ai_request.ai_response = {'plan_id': plan.pk, 'summary': 'Three full-body days'}
+        ai_request.tokens_used = 1200
+        ai_request.cost = Decimal('0.0240')
+
+    def test_identical_request_is_served_from_the_cache(self):
+        first = self.make_request(self.make_user('ana', age=31))
+        self.assertFalse(results.lookup(first))
+        self.generate(first)
+        results.store(first)
+
+        # Same bucket (ages 30-34) and the same prompt up to case and punctuation
+        second = self.make_request(self.make_user('bea', age=33), prompt='build me a 3-day plan!')
+        self.assertTrue(results.lookup(second))
+        plan = second.generated_plan
+        self.assertNotEqual(plan.pk, first.generated_plan.pk)
+        self.assertEqual((plan.created_by, plan.name, plan.is_public), (second.user, 'Starter', False))
+        self.assertEqual(
+            list(WorkoutExercise.objects.filter(workout_day__plan=plan).values_list('exercise__name', 'sets', 'reps')),
+            [('Squat', 3, 10)],
+        )
+        self.assertEqual(second.ai_response, {'plan_id': plan.pk, 'summary': 'Three full-body days'})
+        self.assertEqual((second.tokens_used, second.cost), (0, Decimal('0')))
+        self.assertEqual(results.stats(), {'hits': 1, 'misses': 1, 'hit_rate': 0.5, 'saved_tokens': 1200,
+                                           'saved_cost': 0.024})
+
+    def test_other_profiles_and_prompts_miss(self):
+        stored = self.make_request(self.make_user('cai', age=31))
+        self.generate(stored)
+        results.store(stored)
+
+        self.assertFalse(results.lookup(self.make_request(self.make_user('dev', age=36))))
+        self.assertFalse(results.lookup(self.make_request(stored.user, prompt='Build me a 5-day plan')))
+        self.assertFalse(results.lookup(self.make_request(stored.user, request_type='progress_analysis')))
+        # Uncached request types are not counted
+        self.assertEqual(results.stats()['misses'], 2)
+
+
+@mock.patch.object(usage.UsageCounters, '_start_flusher')
+class UsageCounterTests(TestCase):
+    def setUp(self):
+        self.version = AIModelVersion.objects.create(
+            model_type='workout_generator', version='1.0', model_name='rules',
+            total_requests=10, successful_requests=9, average_response_time=Decimal('2.000'),
+        )
+
+    def usage(self):
+        self.version.refresh_from_db()
+        return self.version.total_requests, self.version.successful_requests, self.version.average_response_time
+
+    def test_flush_adds_to_the_stored_counts_in_one_update(self, start_flusher):
+        counters = usage.UsageCounters()
+        counters.record(self.version.pk, True, 4.0)
+        counters.record(self.version.pk, False, 2.0)
+        with self.assertNumQueries(1):
+            self.assertEqual(counters.flush(), 1)
+        # (2.000 * 10 + 6.0) / 12
+        self.assertEqual(self.usage(), (12, 10, Decimal('2.167')))
+        self.assertEqual(counters.flush(), 0)
+
+    def test_flushes_of_several_processes_add_up(self, start_flusher):
+        first, second = usage.UsageCounters(), usage.UsageCounters()
+        first.record(self.version.pk, True, 1.0)
+        second.record(self.version.pk, True, 3.0)
+        second.record(self.version.pk, True, 3.0)
+        first.flush()
+        second.flush()
+        # (2.000 * 10 + 1.0 + 6.0) / 13
+        self.assertEqual(self.usage(), (13, 12, Decimal('2.077')))
+
+    def test_first_flush_sets_the_mean(self, start_flusher):
+        AIModelVersion.objects.filter(pk=self.version.pk).update(
+            total_requests=0, successful_requests=0, average_response_time=None,
+        )
+        counters = usage.UsageCounters()
+        counters.record(self.version.pk, True, 0.5)
+        counters.record(self.version.pk, True, 1.0)
+        counters.flush()
+        self.assertEqual(self.usage(), (2, 2, Decimal('0.750')))
+
+    def test_failed_flush_keeps_the_sums_for_the_next(self, start_flusher):
+        counters = usage.UsageCounters()
+        counters.record(self.version.pk, True, 2.0)
+        with mock.patch.object(usage.AIModelVersion.objects, 'filter', side_effect=DatabaseError('locked')), \
+                self.assertLogs('ai_engine.usage', 'ERROR'):
+            self.assertEqual(counters.flush(), 0)
+        counters.record(self.version.pk, False, 2.0)
+        counters.flush()
+        self.assertEqual(self.usage(), (12, 10, Decimal('2.000')))
+
+    def test_request_types_count_for_their_active_model(self, start_flusher):
+        AIModelVersion.objects.create(model_type='workout_generator', version='0.9', model_name='rules',
+                                      is_active=False)
+        counters = usage.UsageCounters()
+        counters.record_request('workout_plan', True, 1.0)
+        counters.record_request('progress_analysis', True, 1.0)
+        self.assertEqual(counters._sums, {self.version.pk: [1, 1, 1.0]})
+
+
+class TrainingExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='eli', email='eli@example.com', password='correct horse battery')
+
+    def add_rows(self, count):
+        return [
+            AITrainingData.objects.create(user=self.user, data_type='user_feedback', data_content={'rating': n}).pk
+            for n in range(count)
+        ]
+
+    def export(self, **kwargs):
+        sink = io.BytesIO()
+        generator = exports.export_training_data(exports.JSONLinesWriter(sink), **kwargs)
+        try:
+            while True:
+                next(generator)
+        except StopIteration as stop:
+            record = stop.value
+        return record, [json.loads(line)['id'] for line in gzip.decompress(sink.getvalue()).splitlines()]
+
+    def test_incremental_exports_continue_after_the_last_watermark(self):
+        first = self.add_rows(3)
+        record, exported = self.export()
+        self.assertEqual(exported, first)
+        self.assertEqual((record.rows, record.watermarks), (3, {'default': first[-1]}))
+        self.assertFalse(AITrainingData.objects.filter(is_used_for_training=False).exists())
+
+        second = self.add_rows(2)
+        record, exported = self.export()
+        self.assertEqual(exported, second)
+        self.assertEqual(record.watermarks, {'default': second[-1]})
+        # Nothing new: an empty export keeps the watermark
+        record, exported = self.export()
+        self.assertEqual((exported, record.watermarks), ([], {'default': second[-1]}))
+        # A full export starts over
+        _, exported = self.export(incremental=False, mark=False)
+        self.assertEqual(exported, first + second)
+
+    @override_settings(AI_TRAINING_EXPORT={'BATCH_SIZE': 2})
+    def test_unfinished_export_does_not_move_the_watermarks(self):
+        rows = self.add_rows(5)
+        generator = exports.export_training_data(exports.JSONLinesWriter(io.BytesIO()))
+        self.assertEqual(next(generator), 2)
+        generator.close()
+        self.assertEqual(exports.last_watermarks(), {})
+
+        _, exported = self.export()
+        self.assertEqual(exported, rows)
+        self.assertEqual(exports.last_watermarks(), {'default': rows[-1]})
+
+
+def figures(**overrides):
+    return {'fitness_goal': 'maintain', 'window_days': 28, 'workouts_week': 0, 'workouts_window': 0, 'ratings': [],
+            'volume_week': 0.0, 'volume_previous': 0.0, 'days_inactive': None, 'weight_trend': 0.0, **overrides}
+
+
+def scores(**overrides):
+    row = recommendations.score([recommendations.features(figures(**overrides))])[0]
+    return {candidate.title: value for candidate, value in zip(recommendations.CANDIDATES, row)}
+
+
+class RecommendationScoreTests(SimpleTestCase):
+    def row(self, **overrides):
+        return dict(zip(recommendations.FEATURES, recommendations.features(figures(**overrides))))
+
+    def test_features(self):
+        row = self.row(workouts_week=4, workouts_window=8, ratings=[3, 5], volume_week=300.0, volume_previous=100.0,
+                       days_inactive=2, weight_trend=-2.0)
+        self.assertEqual(row['active'], 1.0)
+        self.assertAlmostEqual(row['sessions_week'], 4 / 7)
+        self.assertAlmostEqual(row['weekly_average'], 2 / 7)
+        self.assertAlmostEqual(row['days_inactive'], 2 / 14)
+        # Clipped to 1, as is a trend past 1 kg/week
+        self.assertEqual(row['volume_change'], 1.0)
+        self.assertEqual(row['off_goal_trend'], 1.0)
+        self.assertEqual(row['low_rating'], 0.25)
+        self.assertEqual(row['gaining_goal'], 0.0)
+
+        idle = self.row()
+        self.assertEqual((idle['active'], idle['days_inactive'], idle['volume_change'], idle['low_rating']),
+                         (0.0, 1.0, 0.0, 0.0))
+        # Only moving away from the goal counts
+        self.assertEqual(self.row(fitness_goal='lose_weight', weight_trend=0.5)['off_goal_trend'], 0.5)
+        self.assertEqual(self.row(fitness_goal='gain_weight', weight_trend=0.5)['off_goal_trend'], -0.5)
+        self.assertEqual(self.row(fitness_goal='gain_weight')['gaining_goal'], 1.0)
+
+    def test_score_is_a_sigmoid_of_the_weighted_features(self):
+        rows = [recommendations.features(figures()), recommendations.features(figures(workouts_week=3,
+                                                                                      workouts_window=5))]
+        with mock.patch.object(recommendations, 'np', None):
+            result = recommendations.score(rows)
+        for row, row_scores in zip(rows, result):
+            for candidate, value in zip(recommendations.CANDIDATES, row_scores):
+                logit = sum(x * candidate.weights.get(name, 0.0) for name, x in zip(recommendations.FEATURES, row))
+                self.assertAlmostEqual(value, 1 / (1 + math.exp(-logit)))
+        self.assertEqual(recommendations.score([]), [])
+
+    @skipUnless(recommendations.np, 'NumPy is not installed')
+    def test_numpy_and_pure_python_agree(self):
+        rows = [recommendations.features(figures(workouts_week=week, workouts_window=week * 3, days_inactive=1,
+                                                 volume_week=120.0, volume_previous=100.0, ratings=[4]))
+                for week in range(7)]
+        fast = recommendations.score(rows)
+        with mock.patch.object(recommendations, 'np', None):
+            slow = recommendations.score(rows)
+        for fast_row, slow_row in zip(fast, slow):
+            for fast_value, slow_value in zip(fast_row, slow_row):
+                self.assertAlmostEqual(fast_value, slow_value)
+
+    def test_more_training_days_are_suggested_to_light_weeks_only(self):
+        threshold = recommendations.DEFAULTS['MIN_SCORE']
+        light = scores(workouts_week=1, workouts_window=4, days_inactive=1)
+        self.assertGreater(light['Add one more training day'], threshold)
+        self.assertLess(light['Take a recovery day'], threshold)
+        # A hard week after a quiet month: rest, not another day
+        busy = scores(workouts_week=4, workouts_window=4, days_inactive=1, volume_week=200.0, volume_previous=100.0)
+        self.assertGreater(busy['Take a recovery day'], threshold)
+        self.assertLess(busy['Add one more training day'], threshold)
+
+
+class RecommendationRunTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='ash', email='ash@example.com', password='correct horse battery')
+        self.idle = User.objects.create_user(username='jo', email='jo@example.com', password='correct horse battery')
+
+    def work_out(self, user, days_ago=0):
+        CompletedWorkout(user=user, workout_name='Run', date=timezone.now().date() - timedelta(days=days_ago),
+                         duration=30).save()
+
+    def titles(self, user):
+        return sorted(AIRecommendation.objects.filter(user=user).values_list('title', flat=True))
+
+    def test_conflicting_candidates_keep_the_higher_score(self):
+        titles = [candidate.title for candidate in recommendations.CANDIDATES]
+        values = [0.0] * len(titles)
+        values[titles.index('Take a recovery day')] = 0.9
+        values[titles.index('Add one more training day')] = 0.95
+        values[titles.index('Increase the load on your main lifts')] = 0.7
+        with mock.patch.object(recommendations, 'score', return_value=[values]):
+            recommendations.recommend_users('default', [self.user.pk])
+        self.assertEqual(self.titles(self.user), ['Add one more training day', 'Increase the load on your main lifts'])
+
+    def test_run_replaces_recommendations_the_user_did_not_act_on(self):
+        self.work_out(self.user)
+        manual = AIRecommendation.objects.create(user=self.user, title='Stretch daily', description='Stretch',
+                                                 reasoning='Coach', recommendation_type='lifestyle')
+        first = recommendations.recommend_users('default', [self.user.pk])
+        self.assertEqual([obj.title for obj in first], ['Add one more training day'])
+        self.assertEqual(first[0].priority, 'medium')
+
+        second = recommendations.recommend_users('default', [self.user.pk])
+        self.assertFalse(AIRecommendation.objects.filter(pk=first[0].pk).exists())
+        self.assertEqual(self.titles(self.user), ['Add one more training day', 'Stretch daily'])
+
+        # Read: kept, and not suggested again within the window
+        AIRecommendation.objects.filter(pk=second[0].pk).update(is_read=True)
+        self.assertEqual(recommendations.recommend_users('default', [self.user.pk]), [])
+        self.assertEqual(set(AIRecommendation.objects.values_list('pk', flat=True)), {manual.pk, second[0].pk})
+
+    def test_incremental_run_only_scores_users_with_new_activity(self):
+        call_command('generate_recommendations', stdout=io.StringIO())
+        self.assertEqual(self.titles(self.idle), ['Plan your next workout'])
+        AIRecommendation.objects.update(created_at=timezone.now() - timedelta(minutes=5))
+
+        out = io.StringIO()
+        call_command('generate_recommendations', '--incremental', stdout=out)
+        self.assertIn('Scored 0 of 2 user(s)', out.getvalue())
+
+        self.work_out(self.idle)
+        out = io.StringIO()
+        call_command('generate_recommendations', '--incremental', stdout=out)
+        self.assertIn('Scored 1 of 2 user(s)', out.getvalue())
+        self.assertEqual(self.titles(self.idle), ['Add one more training day'])
+        # The other user's recommendations are untouched
+        self.assertTrue(AIRecommendation.objects.filter(user=self.user, created_at__lt=timezone.now()
+                                                        - timedelta(minutes=1)).exists())
+
+
+np = similarity.np
+
+
+class SimilarityTestMixin:
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = directory.name
+        settings = override_settings(AI_SIMILARITY={'PATH': self.path, 'MIN_FEATURES': 3, 'RELOAD_INTERVAL': 0,
+                                                    'REBUILD_FRACTION': 0.5, 'KEEP_VERSIONS': 1})
+        settings.enable()
+        self.addCleanup(settings.disable)
+        loaded = mock.patch.dict(similarity._loaded, {'index': None, 'version': None, 'checked_at': None})
+        loaded.start()
+        self.addCleanup(loaded.stop)
+
+
+@skipUnless(np, 'NumPy is not installed')
+class SimilarityIndexTests(SimilarityTestMixin, SimpleTestCase):
+    def make_index(self, rows=500, ball_tree=False):
+        matrix = np.random.default_rng(7).normal(size=(rows, 6)).astype(np.float32)
+        user_ids = np.arange(1, rows + 1, dtype=np.int64)
+        config = {'BALL_TREE_MIN_USERS': 1 if ball_tree else rows + 1, 'LEAF_SIZE': 8}
+        return similarity.SimilarityIndex.from_rows(user_ids, matrix, np.zeros(6), np.ones(6), config,
+                                                    {'min_features': 3, 'refreshed_at': '2026-01-05T00:00:00'})
+
+    def assertSameNeighbours(self, first, second):
+        self.assertEqual([pk for pk, _ in first], [pk for pk, _ in second])
+        for (_, expected), (_, actual) in zip(first, second):
+            self.assertAlmostEqual(expected, actual, places=4)
+
+    def test_ball_tree_matches_brute_force(self):
+        brute, tree = self.make_index(), self.make_index(ball_tree=True)
+        self.assertIsNone(brute.tree)
+        self.assertIsNotNone(tree.tree)
+        for vector in np.random.default_rng(11).normal(size=(20, 6)):
+            self.assertSameNeighbours(brute.query(vector, 10), tree.query(vector, 10))
+        self.assertSameNeighbours(brute.neighbours(42, 5), tree.neighbours(42, 5))
+        self.assertNotIn(42, [pk for pk, _ in tree.neighbours(42, 5)])
+        self.assertEqual(len(brute.query(np.zeros(6), 1000)), 500)
+
+    def test_saved_index_loads_memory_mapped(self):
+        for ball_tree in (False, True):
+            index = self.make_index(ball_tree=ball_tree)
+            version = index.save(self.path)
+            loaded = similarity.SimilarityIndex.load(self.path)
+            self.assertIsInstance(loaded.matrix, np.memmap)
+            self.assertEqual(loaded.meta['version'], version)
+            self.assertEqual(loaded.tree is not None, ball_tree)
+            np.testing.assert_array_equal(loaded.user_ids, index.user_ids)
+            self.assertSameNeighbours(index.neighbours(7, 10), loaded.neighbours(7, 10))
+
+    def test_old_versions_are_pruned(self):
+        index = self.make_index(rows=20)
+        versions = [index.save(self.path) for _ in range(3)]
+        kept = sorted(name for name in os.listdir(self.path) if name.startswith('v'))
+        # The current version and KEEP_VERSIONS before it
+        self.assertEqual(kept, sorted(versions[1:]))
+        with open(os.path.join(self.path, 'CURRENT')) as current:
+            self.assertEqual(current.read(), versions[-1])
+        self.assertEqual(similarity.get_index().meta['version'], versions[-1])
+
+    def test_index_with_other_features_is_not_loaded(self):
+        version = self.make_index(rows=20).save(self.path)
+        with open(os.path.join(self.path, version, 'meta.json'), 'w') as meta:
+            json.dump({'features': ['age']}, meta)
+        self.assertIsNone(similarity.SimilarityIndex.load(self.path))
+        with self.assertRaises(similarity.IndexUnavailable):
+            similarity.get_index()
+
+
+class SimilarPlansTests(SimilarityTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.me = self.make_user('me', 30, 180, 80)
+        self.near = [self.make_user('near1', 31, 181, 81), self.make_user('near2', 29, 179, 79)]
+        self.far = self.make_user('far', 60, 150, 120)
+        # Too little known about them to be indexed
+        self.unknown = self.make_user('unknown', None, None, 70)
+
+    def make_user(self, name, age, height, weight):
+        return User.objects.create_user(username=name, email=f'{name}@example.com', password='correct horse battery',
+                                        age=age, height=height, weight=weight)
+
+    def make_plan(self, name, users, is_public=True):
+        plan = WorkoutPlan.objects.create(name=name, description=name, is_public=is_public, created_by=self.far)
+        day = WorkoutDay.objects.create(plan=plan, name='Day 1', day_number=1)
+        for user in users:
+            WorkoutSession(user=user, workout_day=day, status='completed').save()
+        return plan
+
+    def test_unavailable_without_an_index(self):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.me).access_token}',
+                   'HTTP_HOST': 'localhost'}
+        self.assertEqual(self.client.get('/api/ai/similar-plans/', **headers).status_code, 503)
+
+    @skipUnless(np, 'NumPy is not installed')
+    def test_refresh_only_recomputes_changed_users(self):
+        index, changes = similarity.refresh()
+        self.assertEqual((changes['full'], len(index)), (True, 4))
+        self.assertIsNone(index.position(self.unknown.pk))
+        User.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        index, _ = similarity.refresh(full=True)
+
+        self.near[0].weight = 95
+        self.near[0].save()
+        User.objects.filter(pk=self.far.pk).update(is_active=False)
+        refreshed, changes = similarity.refresh()
+        self.assertEqual(changes, {'full': False, 'updated': 1, 'removed': 1})
+        self.assertEqual(sorted(int(pk) for pk in refreshed.user_ids),
+                         sorted([self.me.pk, self.near[0].pk, self.near[1].pk]))
+        # Rows are normalized with the statistics of the last full build
+        np.testing.assert_array_equal(refreshed.mean, index.mean)
+        raw = similarity._raw_matrix([similarity.user_features([self.near[0].pk])[self.near[0].pk]])
+        np.testing.assert_allclose(refreshed.vector(self.near[0].pk), similarity._normalize(raw, index.mean,
+                                                                                            index.scale)[0])
+        np.testing.assert_array_equal(refreshed.vector(self.me.pk), index.vector(self.me.pk))
+
+    @skipUnless(np, 'NumPy is not installed')
+    def test_plans_are_ranked_by_the_support_of_similar_users(self):
+        shared = self.make_plan('Shared', self.near)
+        distant = self.make_plan('Distant', [self.far])
+        self.make_plan('Private', self.near, is_public=False)
+        self.make_plan('Own', [self.me, self.near[0]])
+        similarity.refresh(full=True)
+
+        ranked = similarity.similar_plans(self.me, k=3)
+        self.assertEqual([plan['plan_id'] for plan in ranked], [shared.pk, distant.pk])
+        self.assertEqual([plan['similar_users'] for plan in ranked], [2, 1])
+        self.assertGreater(ranked[0]['score'], ranked[1]['score'])
+        # Only the nearest neighbour's plans
+        self.assertEqual([plan['plan_id'] for plan in similarity.similar_plans(self.me, k=1)], [shared.pk])
+
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.me).access_token}',
+                   'HTTP_HOST': 'localhost'}
+        data = self.client.get('/api/ai/similar-plans/?limit=1', **headers).json()
+        self.assertEqual([plan['plan_id'] for plan in data['results']], [shared.pk])
+        self.assertEqual(data['index_refreshed_at'], similarity.get_index().meta['refreshed_at'])
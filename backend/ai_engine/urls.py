@@ -15,8 +15,15 @@ urlpatterns = [
     # AI Training Data
     path('training/', views.AITrainingDataListCreateView.as_view(), name='aitrainingdata-list-create'),
     path('training/<int:pk>/', views.AITrainingDataRetrieveUpdateDestroyView.as_view(), name='aitrainingdata-detail'),
+    path('training/export/', views.export_training_data, name='aitrainingdata-export'),
 
     # AI Model Versions
     path('models/', views.AIModelVersionListCreateView.as_view(), name='aimodelversion-list-create'),
     path('models/<int:pk>/', views.AIModelVersionRetrieveUpdateDestroyView.as_view(), name='aimodelversion-detail'),
+
+    # Result cache
+    path('result-cache/stats/', views.result_cache_stats, name='ai-result-cache-stats'),
+
+    # Similar users
+    path('similar-plans/', views.similar_plans, name='ai-similar-plans'),
 ] 
\ No newline at end of file
@@ -0,0 +1,164 @@
+"""
+Buffered usage counters for ``AIModelVersion``.
+
+Every processed request adds to its model version's ``total_requests``,
+``successful_requests`` and ``average_response_time``. Writing them per
+request would make all AI traffic read and rewrite one hot row. Instead,
+``record()`` adds to per-process sums in memory. Every ``FLUSH_INTERVAL``
+seconds, and when the process exits, ``flush()`` writes them with one
+``UPDATE`` per version, built from ``F()`` expressions::
+
+    total_requests = total_requests + n,
+    successful_requests = successful_requests + ok,
+    average_response_time = (average_response_time * total_requests + seconds) / (total_requests + n)
+
+The database applies these to the current row, so concurrent flushes from
+several processes add up and none overwrites another. The mean is weighted
+by the old and new counts, as if every response time had been averaged at
+once. A flush that fails puts its sums back for the next one.
+
+The job queue records each handler run for the active version of the
+request type's model (``MODEL_TYPES``); results served from the result
+cache do not use a model and are not counted. Configured through
+``settings.AI_USAGE``.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, FloatField, Value, When
+
+from .models import AIModelVersion
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # Seconds between flushes of a process's counters
+    'FLUSH_INTERVAL': 10,
+}
+
+# Request type -> AIModelVersion.model_type that serves it
+MODEL_TYPES = {
+    'workout_plan': 'workout_generator',
+    'recommendation': 'recommendation_engine',
+    'exercise_suggestion': 'recommendation_engine',
+    'progress_analysis': 'progress_analyzer',
+}
+
+MAX_RESPONSE_TIME = Decimal('999.999')
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'AI_USAGE', {})}
+
+
+class UsageCounters:
+    """Per-process sums of requests, successes and response times by model version"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sums = {}  # version id -> [requests, successes, seconds]
+        self._active = {}  # model type -> (version id or None, looked up at)
+        self._flusher = None
+        self._pid = None
+
+    def record(self, version_id, success, seconds):
+        with self._lock:
+            sums = self._sums.setdefault(version_id, [0, 0, 0.0])
+            sums[0] += 1
+            sums[1] += int(success)
+            sums[2] += seconds
+        self._start_flusher()
+
+    def record_request(self, request_type, success, seconds):
+        """Count a handler run of ``request_type`` for its model type's active version, if there is one"""
+        model_type = MODEL_TYPES.get(request_type)
+        version_id = self.active_version(model_type) if model_type else None
+        if version_id is not None:
+            self.record(version_id, success, seconds)
+
+    def active_version(self, model_type):
+        """The newest active version of ``model_type``, looked up at most once per flush interval"""
+        now = time.monotonic()
+        version_id, looked_up_at = self._active.get(model_type, (None, None))
+        if looked_up_at is None or now - looked_up_at > get_config()['FLUSH_INTERVAL']:
+            version_id = (
+                AIModelVersion.objects.filter(model_type=model_type, is_active=True)
+                .order_by('-created_at').values_list('pk', flat=True).first()
+            )
+            self._active[model_type] = (version_id, now)
+        return version_id
+
+    def flush(self):
+        """Write the buffered sums to the database; returns the number of versions updated"""
+        with self._lock:
+            pending, self._sums = self._sums, {}
+        flushed = 0
+        for version_id, (requests, successes, seconds) in pending.items():
+            try:
+                AIModelVersion.objects.filter(pk=version_id).update(
+                    total_requests=F('total_requests') + requests,
+                    successful_requests=F('successful_requests') + successes,
+                    average_response_time=_running_mean(requests, seconds),
+                )
+            except DatabaseError:
+                logger.exception('Could not flush usage of AI model version %s; keeping it for the next flush',
+                                 version_id)
+                self._restore(version_id, requests, successes, seconds)
+            else:
+                flushed += 1
+        return flushed
+
+    def _restore(self, version_id, requests, successes, seconds):
+        with self._lock:
+            sums = self._sums.setdefault(version_id, [0, 0, 0.0])
+            sums[0] += requests
+            sums[1] += successes
+            sums[2] += seconds
+
+    def _start_flusher(self):
+        # Once per process; a forked child starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._flusher = threading.Thread(target=self._flush_periodically, name='ai-usage-flush', daemon=True)
+            self._flusher.start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(get_config()['FLUSH_INTERVAL'])
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Flushing AI model usage failed')
+
+
+def _running_mean(requests, seconds):
+    """The stored mean combined with ``requests`` new response times summing to ``seconds``"""
+    output = DecimalField(max_digits=6, decimal_places=3)
+    new_mean = min(Decimal(seconds / requests).quantize(Decimal('0.001')), MAX_RESPONSE_TIME)
+    # A float term keeps SQLite from dividing integers: it stores whole decimals as integers
+    combined = ExpressionWrapper(
+        (F('average_response_time') * F('total_requests') + Value(float(seconds), output_field=FloatField()))
+        / (F('total_requests') + Value(requests)),
+        output_field=output,
+    )
+    # Without a stored mean (or without requests behind it) the new one stands alone
+    return Case(
+        When(average_response_time__isnull=True, then=Value(new_mean)),
+        When(total_requests=0, then=Value(new_mean)),
+        default=combined,
+        output_field=output,
+    )
+
+
+counters = UsageCounters()
+atexit.register(counters.flush)
@@ -1,12 +1,19 @@
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
-from rest_framework import generics, permissions
+from django.utils import timezone
+from rest_framework import generics, permissions, status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+from fitness_project.fieldsets import FieldsetViewMixin
+from . import exports, results, similarity
+from .jobs import priority_for
 from .models import AIRequest, AIRecommendation, AITrainingData, AIModelVersion
 from .serializers import AIRequestSerializer, AIRecommendationSerializer, AITrainingDataSerializer, AIModelVersionSerializer
 
 # Create your views here.
 
 # --- AIRequest CRUD ---
-class AIRequestListCreateView(generics.ListCreateAPIView):
+class AIRequestListCreateView(FieldsetViewMixin, generics.ListCreateAPIView):
     serializer_class = AIRequestSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -14,9 +21,11 @@ class AIRequestListCreateView(generics.ListCreateAPIView):
         return AIRequest.objects.filter(user=self.request.user)
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        # Saved as pending; `manage.py ai_worker` processes it off the web thread
+        serializer.save(user=self.request.user,
+                        priority=priority_for(serializer.validated_data['request_type']))
 
-class AIRequestRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class AIRequestRetrieveUpdateDestroyView(FieldsetViewMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = AIRequestSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -42,7 +51,7 @@ class AIRecommendationRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAP
         return AIRecommendation.objects.filter(user=self.request.user)
 
 # --- AITrainingData CRUD ---
-class AITrainingDataListCreateView(generics.ListCreateAPIView):
+class AITrainingDataListCreateView(FieldsetViewMixin, generics.ListCreateAPIView):
     serializer_class = AITrainingDataSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -52,13 +61,35 @@ class AITrainingDataListCreateView(generics.ListCreateAPIView):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class AITrainingDataRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class AITrainingDataRetrieveUpdateDestroyView(FieldsetViewMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = AITrainingDataSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         return AITrainingData.objects.filter(user=self.request.user)
 
+@api_view(['POST'])
+@permission_classes([permissions.IsAdminUser])
+def export_training_data(request):
+    """Stream training rows added since the last export (all with ``full``) as a file"""
+    try:
+        writer_class = exports.get_writer(request.data.get('format', 'jsonl'))
+    except ValueError as exc:
+        return Response({'format': [str(exc)]}, status=status.HTTP_400_BAD_REQUEST)
+    incremental = not request.data.get('full', False)
+    sink = exports.StreamSink()
+    rows = exports.export_training_data(writer_class(sink), incremental=incremental, created_by=request.user)
+
+    def stream():
+        for _ in rows:
+            yield from sink.drain()
+        yield from sink.drain()
+
+    response = StreamingHttpResponse(stream(), content_type=writer_class.content_type)
+    filename = f"training-{timezone.now():%Y%m%d-%H%M%S}.{writer_class.extension}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
 # --- AIModelVersion CRUD ---
 class AIModelVersionListCreateView(generics.ListCreateAPIView):
     queryset = AIModelVersion.objects.all()
@@ -69,3 +100,27 @@ class AIModelVersionRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIV
     queryset = AIModelVersion.objects.all()
     serializer_class = AIModelVersionSerializer
     permission_classes = [permissions.IsAdminUser]
+
+# --- Result cache ---
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def result_cache_stats(request):
+    """Hits, misses and savings of the AI result cache"""
+    return Response(results.stats())
+
+# --- Similar users ---
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def similar_plans(request):
+    """Public plans that users with a body and goals like the current user's trained on"""
+    try:
+        limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+    except ValueError:
+        return Response({'limit': ['A whole number is required.']}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        plans = similarity.similar_plans(request.user, limit=limit)
+        refreshed_at = similarity.get_index().meta['refreshed_at']
+    except similarity.IndexUnavailable as exc:
+        return Response({'detail': str(exc)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    # Changes since then are not reflected until the next build_similarity_index run
+    return Response({'results': plans, 'index_refreshed_at': refreshed_at})
@@ -0,0 +1,34 @@
+"""
+Entry points of the process pools of ``ai_worker`` and
+``generate_recommendations``.
+
+Spawned processes import this module before Django is set up, so it must
+not import models at module level.
+"""
+import signal
+from multiprocessing.util import Finalize
+
+import django
+
+
+def init_process():
+    # Ctrl+C is for the parent, which lets the running requests finish
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    django.setup()
+
+    from ai_engine import usage
+
+    # Pool processes exit without running atexit handlers
+    Finalize(usage.counters, usage.counters.flush, exitpriority=10)
+
+
+def run(alias, pk, worker_id):
+    from ai_engine import jobs
+
+    return jobs.run(alias, pk, worker_id)
+
+
+def recommend(alias, user_ids, incremental):
+    from ai_engine import recommendations
+
+    return recommendations.recommend_chunk(alias, user_ids, incremental)
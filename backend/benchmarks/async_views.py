@@ -0,0 +1,193 @@
+"""
+Benchmark: sync DRF views vs the native async read views under uvicorn.
+
+Seeds a throwaway SQLite database with one user's history, serves this
+module with uvicorn (the synchronous versions in ``benchmarks/sync_views.py``
+under ``/sync/``, the routed async views under ``/async/``) and measures requests per second for each endpoint with a
+fixed number of concurrent clients.
+
+    pip install uvicorn
+    python benchmarks/async_views.py [--concurrency 32] [--duration 5]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fitness_project.settings')
+os.environ.setdefault('BENCHMARK_DB', os.path.join(tempfile.gettempdir(), 'fitness_async_views_benchmark.sqlite3'))
+
+import django
+from django.conf import settings
+
+django.setup()
+
+# No connection has been opened yet, so the database can still be swapped
+settings.DATABASES['default']['NAME'] = os.environ['BENCHMARK_DB']
+settings.ROOT_URLCONF = 'benchmarks.async_views'
+settings.ALLOWED_HOSTS = ['*']
+settings.DEBUG = False
+# Settings enable INFO logging for DEBUG; measure the views, not the console
+logging.disable(logging.INFO)
+
+from django.core.asgi import get_asgi_application
+from django.urls import path
+
+from benchmarks import sync_views
+from progress import views as progress_views
+from users import views as user_views
+from workouts import views as workout_views
+
+ENDPOINTS = {
+    'profile': (user_views.UserProfileView.as_view(), user_views.user_profile_async),
+    'workout-stats': (sync_views.get_user_workout_stats, workout_views.get_user_workout_stats_async),
+    'workout-history': (sync_views.get_user_workout_history, workout_views.get_user_workout_history_async),
+    'progress-stats': (sync_views.get_user_progress_stats, progress_views.get_user_progress_stats_async),
+    'workout-progress': (sync_views.get_workout_progress, progress_views.get_workout_progress_async),
+}
+
+urlpatterns = [
+    route
+    for name, (sync_view, async_view) in ENDPOINTS.items()
+    for route in (path(f'sync/{name}/', sync_view), path(f'async/{name}/', async_view))
+]
+
+application = get_asgi_application()
+
+
+def seed():
+    """Create the schema and one user with a realistic history; return an access token"""
+    import datetime
+    import random
+
+    from django.core.management import call_command
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    from progress.models import CompletedWorkout, ProgressEntry
+    from users.models import BodyComposition, BodyMeasurements, GoalMeasurements, User
+    from workouts.models import Exercise, ExerciseSet, WorkoutDay, WorkoutExercise, WorkoutPlan, WorkoutSession
+
+    if os.path.exists(settings.DATABASES['default']['NAME']):
+        os.remove(settings.DATABASES['default']['NAME'])
+    call_command('migrate', verbosity=0)
+
+    rng = random.Random(7)
+    user = User.objects.create_user(
+        email='bench@example.com', username='bench', password='bench-password',
+        height=180, weight=80, has_completed_onboarding=True,
+    )
+    BodyComposition.objects.create(user=user)
+    BodyMeasurements.objects.create(user=user)
+    GoalMeasurements.objects.create(user=user)
+
+    exercises = [
+        Exercise.objects.create(name=f'Exercise {i}', description='Benchmark exercise', muscle_group='chest')
+        for i in range(12)
+    ]
+    plan = WorkoutPlan.objects.create(name='Benchmark plan', created_by=user)
+    days = []
+    for number in range(1, 5):
+        day = WorkoutDay.objects.create(plan=plan, name=f'Day {number}', day_number=number)
+        for order, exercise in enumerate(rng.sample(exercises, 5)):
+            WorkoutExercise.objects.create(workout_day=day, exercise=exercise, sets=4, reps=10, order=order)
+        days.append(day)
+
+    today = datetime.date.today()
+    for i in range(60):
+        session = WorkoutSession.objects.create(
+            user=user, workout_day=days[i % len(days)], status='completed' if i % 5 else 'in_progress',
+            duration=rng.randint(30, 80),
+        )
+        ExerciseSet.objects.bulk_create([
+            ExerciseSet(session=session, exercise=rng.choice(exercises), set_number=n % 4 + 1,
+                        reps_completed=10, weight_used=rng.randint(20, 100))
+            for n in range(12)
+        ])
+        ProgressEntry.objects.create(user=user, date=today - datetime.timedelta(days=i),
+                                     weight=80 - i * 0.1, waist=85 - i * 0.05)
+        CompletedWorkout.objects.create(
+            user=user, workout_name=f'Workout {i}', workout_type=rng.choice(['strength', 'cardio', '']),
+            date=today - datetime.timedelta(days=i), duration=rng.randint(30, 80),
+            calories_burned=rng.randint(200, 600),
+        )
+
+    return str(RefreshToken.for_user(user).access_token)
+
+
+async def measure(url, token, concurrency, duration):
+    import httpx
+
+    headers = {'Authorization': f'Bearer {token}'}
+    completed = errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def client(http):
+        nonlocal completed, errors
+        while time.perf_counter() < deadline:
+            response = await http.get(url, headers=headers)
+            if response.status_code == 200:
+                completed += 1
+            else:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as http:
+        await http.get(url, headers=headers)  # warm caches
+        started = time.perf_counter()
+        await asyncio.gather(*(client(http) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return completed / elapsed, errors
+
+
+def wait_for_server(base_url, process, timeout=20):
+    import httpx
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit('uvicorn exited before it started serving')
+        try:
+            httpx.get(base_url)
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise SystemExit('uvicorn did not start')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    token = seed()
+    base_url = f'http://127.0.0.1:{args.port}'
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'benchmarks.async_views:application',
+         '--port', str(args.port), '--log-level', 'warning', '--no-access-log'],
+        cwd=BACKEND_DIR, env={**os.environ, 'PYTHONPATH': str(BACKEND_DIR)},
+    )
+    try:
+        wait_for_server(base_url, process)
+        print(f"{args.concurrency} concurrent clients, {args.duration:g}s per run")
+        print(f"{'endpoint':<18} {'sync req/s':>11} {'async req/s':>12} {'speedup':>8}")
+        for name in ENDPOINTS:
+            sync_rps, sync_errors = asyncio.run(measure(f'{base_url}/sync/{name}/', token, args.concurrency, args.duration))
+            async_rps, async_errors = asyncio.run(measure(f'{base_url}/async/{name}/', token, args.concurrency, args.duration))
+            note = f"  ({sync_errors + async_errors} errors)" if sync_errors or async_errors else ''
+            print(f"{name:<18} {sync_rps:>11.0f} {async_rps:>12.0f} {async_rps / sync_rps:>7.2f}x{note}")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark: JSON vs MessagePack vs CBOR on the heaviest endpoints.
+
+Seeds a temporary database like ``json_rendering.py`` and requests each
+endpoint in every format through the test client, reporting the body size
+(raw and gzipped, as most clients negotiate compression), the server time
+per request and the time to decode the body in Python (orjson, msgpack,
+cbor2; the mobile client's JavaScript decoders will differ in absolute
+terms). Decoded MessagePack/CBOR bodies are checked against the JSON one,
+allowing for decimals and timestamps arriving as native values.
+
+    python benchmarks/binary_formats.py [--sessions 200] [--plans 20] [--repeat 20]
+"""
+import argparse
+import datetime
+import gzip
+import os
+import sys
+import time
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+# Sets up Django and provides the same seed data
+from json_rendering import seed
+
+import cbor2
+import msgpack
+import orjson
+from django.conf import settings
+from django.test import Client
+from rest_framework_simplejwt.tokens import RefreshToken
+
+FORMATS = {
+    'json': ('application/json', orjson.loads),
+    'msgpack': ('application/msgpack', lambda body: msgpack.unpackb(body, timestamp=3)),
+    'cbor': ('application/cbor', cbor2.loads),
+}
+
+
+def comparable(value):
+    """Decoded binary values in the shape the JSON body has"""
+    if isinstance(value, dict):
+        return {key: comparable(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [comparable(item) for item in value]
+    if isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, (Decimal, float)) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+
+def json_comparable(value):
+    """The JSON body with decimal and timestamp strings parsed for comparison"""
+    if isinstance(value, dict):
+        return {key: json_comparable(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [json_comparable(item) for item in value]
+    if isinstance(value, str):
+        try:
+            return float(Decimal(value))
+        except ArithmeticError:
+            pass
+        if 'T' in value:
+            try:
+                return datetime.datetime.fromisoformat(value)
+            except ValueError:
+                pass
+    if isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sessions', type=int, default=200)
+    parser.add_argument('--plans', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    user = seed(args.sessions, args.plans)
+    settings.ALLOWED_HOSTS = ['*']
+    client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+    endpoints = {
+        'history': f'/api/workouts/history/?page_size={args.sessions}',
+        'sessions': '/api/workouts/sessions/',
+        'plans': '/api/workouts/plans/',
+        'stats': '/api/workouts/stats/',
+    }
+
+    print(f"best of {args.repeat}; server = request through the test client, decode = Python decoder")
+    print(f"{'endpoint':<9} {'format':<8} {'KiB':>7} {'gzip KiB':>9} {'server ms':>10} {'decode ms':>10}")
+    for name, url in endpoints.items():
+        reference = None
+        for format, (media_type, decode) in FORMATS.items():
+            server_ms, response = timed(lambda: client.get(url, HTTP_ACCEPT=media_type), args.repeat)
+            assert response.status_code == 200 and response['Content-Type'] == media_type, response
+            body = response.content
+            decode_ms, decoded = timed(lambda: decode(body), args.repeat)
+            if reference is None:
+                reference = json_comparable(decoded)
+            else:
+                assert json_comparable(comparable(decoded)) == reference, f'{name} {format} differs'
+            print(f"{name:<9} {format:<8} {len(body) / 1024:>7.1f} {len(gzip.compress(body)) / 1024:>9.1f} "
+                  f"{server_ms:>10.2f} {decode_ms:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark: serializing vs rendering the workout history and plan payloads.
+
+Builds the response data of the history endpoint (sessions with their sets)
+and the plan list (plans with days and exercises) from a temporary database,
+then times, per payload:
+
+- the serializer producing ``.data`` from loaded rows (unchanged by the
+  renderer),
+- DRF's stdlib ``JSONRenderer`` and ``FastJSONRenderer`` rendering it,
+- ``JSONParser`` and ``FastJSONParser`` parsing the result back,
+
+and checks both renderers produce identical bytes.
+
+    python benchmarks/json_rendering.py [--sessions 200] [--plans 20] [--repeat 20]
+"""
+import argparse
+import datetime
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fitness_project.settings')
+
+import django
+from django.conf import settings
+
+django.setup()
+
+import logging
+
+from django.core.management import call_command
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from fitness_project.parsers import FastJSONParser
+from fitness_project.renderers import FastJSONRenderer, orjson
+from users.models import User
+from workouts.models import Exercise, ExerciseSet, WorkoutDay, WorkoutExercise, WorkoutPlan, WorkoutSession
+from workouts.serializers import WorkoutPlanSerializer, WorkoutSessionSerializer
+
+logging.disable(logging.INFO)
+
+
+def seed(sessions, plans):
+    settings.DATABASES['default']['NAME'] = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+    call_command('migrate', verbosity=0)
+    rng = random.Random(7)
+    user = User.objects.create_user(email='bench@example.com', username='bench', password='x')
+    exercises = [
+        Exercise.objects.create(name=f'Exercise {i}', description='Benchmark exercise', muscle_group='chest')
+        for i in range(30)
+    ]
+    days = []
+    for p in range(plans):
+        plan = WorkoutPlan.objects.create(name=f'Plan {p}', description='Benchmark plan', created_by=user)
+        for number in range(1, 6):
+            day = WorkoutDay.objects.create(plan=plan, name=f'Day {number}', day_number=number)
+            WorkoutExercise.objects.bulk_create([
+                WorkoutExercise(workout_day=day, exercise=exercise, sets=4, reps=10, order=order,
+                                weight=rng.randint(20, 100))
+                for order, exercise in enumerate(rng.sample(exercises, 6))
+            ])
+            days.append(day)
+
+    started = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    for i in range(sessions):
+        session = WorkoutSession.objects.create(
+            user=user, workout_day=days[i % len(days)], status='completed', duration=rng.randint(30, 80),
+            started_at=started + datetime.timedelta(days=i), completed_at=started + datetime.timedelta(days=i, hours=1),
+        )
+        ExerciseSet.objects.bulk_create([
+            ExerciseSet(session=session, exercise=rng.choice(exercises), set_number=n % 4 + 1,
+                        reps_completed=10, weight_used=rng.randint(20, 100) + 0.25)
+            for n in range(12)
+        ])
+    return user
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, result
+
+
+def report(name, build, repeat):
+    serialize_ms, data = timed(build, repeat)
+    stdlib_ms, stdlib_bytes = timed(lambda: JSONRenderer().render(data), repeat)
+    fast_ms, fast_bytes = timed(lambda: FastJSONRenderer().render(data), repeat)
+    parse_ms, parsed = timed(lambda: JSONParser().parse(io.BytesIO(stdlib_bytes)), repeat)
+    fast_parse_ms, fast_parsed = timed(lambda: FastJSONParser().parse(io.BytesIO(stdlib_bytes)), repeat)
+    assert stdlib_bytes == fast_bytes, 'renderers disagree'
+    assert parsed == fast_parsed, 'parsers disagree'
+    print(f"{name:<8} {len(stdlib_bytes) / 1024:>7.0f}  {serialize_ms:>9.1f}  {stdlib_ms:>7.2f} {fast_ms:>7.2f} "
+          f"{stdlib_ms / fast_ms:>5.1f}x  {parse_ms:>7.2f} {fast_parse_ms:>7.2f} {parse_ms / fast_parse_ms:>5.1f}x  "
+          f"{(serialize_ms + stdlib_ms) / (serialize_ms + fast_ms):>5.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sessions', type=int, default=200)
+    parser.add_argument('--plans', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    if orjson is None:
+        sys.exit('orjson is not installed; FastJSONRenderer would fall back to the stdlib renderer')
+
+    user = seed(args.sessions, args.plans)
+    sessions = WorkoutSession.objects.filter(user=user).order_by('-created_at').prefetch_related(
+        'workout_day__exercises__exercise', 'exercise_sets__exercise',
+    )
+    plans = WorkoutPlan.objects.order_by('id').prefetch_related('schedule__exercises__exercise')
+
+    print(f"best of {args.repeat}, times in ms; total = serialize + render speedup")
+    print(f"{'payload':<8} {'KiB':>7}  {'serialize':>9}  {'render':>7} {'fast':>7} {'gain':>6}  "
+          f"{'parse':>7} {'fast':>7} {'gain':>6}  {'total':>6}")
+    # Loaded once, so the serializer column excludes the queries
+    sessions, plans = list(sessions), list(plans)
+    report('history', lambda: WorkoutSessionSerializer(sessions, many=True).data, args.repeat)
+    report('plans', lambda: WorkoutPlanSerializer(plans, many=True).data, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
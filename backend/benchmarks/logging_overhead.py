@@ -0,0 +1,92 @@
+"""
+Benchmark: cost of request/response payload logging on a hot path.
+
+Compares the previous eager f-string style against the lazy helpers in
+``fitness_project.request_logging`` for a representative workout session
+payload, with the logger disabled (production) and enabled (development).
+
+    python benchmarks/logging_overhead.py
+"""
+import io
+import logging
+import os
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fitness_project.settings')
+
+import django
+
+django.setup()
+
+from django.test import override_settings
+
+from fitness_project.request_logging import (
+    RequestContext, RequestContextFilter, bind_context, payload, unbind_context,
+)
+
+ITERATIONS = 20000
+
+
+def session_payload(sets=30):
+    return {
+        'id': 42,
+        'status': 'completed',
+        'duration': 55,
+        'notes': 'Felt strong today ' * 5,
+        'exercise_sets': [
+            {
+                'id': i, 'set_number': i % 4 + 1, 'reps_completed': 10,
+                'weight_used': '62.50', 'duration': None, 'rest_time': 90,
+                'exercise': {'id': 7, 'name': 'Bench Press', 'muscle_group': 'chest',
+                             'description': 'Lie on a flat bench and press the bar. ' * 3},
+            }
+            for i in range(sets)
+        ],
+    }
+
+
+def run(label, logger, data):
+    def eager():
+        logger.info(f"📦 Request data: {data}")
+        logger.info(f"✅ Exercise set created successfully: {data}")
+
+    def lazy():
+        logger.info("📦 Request data: %s", payload(data))
+        logger.info("✅ Exercise set created successfully: %s", payload(data))
+
+    eager_time = timeit.timeit(eager, number=ITERATIONS)
+    lazy_time = timeit.timeit(lazy, number=ITERATIONS)
+    print(f"{label:<40} eager {eager_time * 1e6 / ITERATIONS:9.2f} us/call   "
+          f"lazy {lazy_time * 1e6 / ITERATIONS:9.2f} us/call   "
+          f"speedup {eager_time / lazy_time:6.1f}x")
+
+
+def main():
+    data = session_payload()
+
+    disabled = logging.getLogger('benchmarks.disabled')
+    disabled.setLevel(logging.WARNING)
+    disabled.propagate = False
+    run('logger disabled (INFO dropped)', disabled, data)
+
+    enabled = logging.getLogger('benchmarks.enabled')
+    enabled.setLevel(logging.INFO)
+    enabled.propagate = False
+    handler = logging.StreamHandler(io.StringIO())
+    handler.addFilter(RequestContextFilter())
+    enabled.addHandler(handler)
+
+    for rate in (1.0, 0.01):
+        with override_settings(REQUEST_LOGGING={'PAYLOAD_SAMPLE_RATE': rate}):
+            token = bind_context(RequestContext('bench', sampled=rate >= 1.0))
+            try:
+                run(f'logger enabled, payload sampled={rate}', enabled, data)
+            finally:
+                unbind_context(token)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Demo: read replicas with read-your-writes stickiness on local SQLite files.
+
+Creates a primary and two file-copied replicas in a temporary directory,
+then drives the API in-process and reports which database served each
+request's queries:
+
+1. reads of an authenticated user are spread over the replicas;
+2. right after the user saves a workout, their reads go to the primary and
+   include the new workout even though the replicas are stale;
+3. once ``REPLICA_STICKY_SECONDS`` pass, reads return to the replicas, which
+   show the workout after ``sync_replicas``.
+
+    python benchmarks/read_replicas.py
+"""
+import collections
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fitness_project.settings')
+
+import django
+from django.conf import settings
+
+django.setup()
+
+TMP_DIR = tempfile.mkdtemp(prefix='fitness_replica_demo_')
+REPLICAS = ['replica1', 'replica2']
+# Updated in place: the default connection may already hold this dict
+settings.DATABASES['default']['NAME'] = os.path.join(TMP_DIR, 'default.sqlite3')
+for alias in REPLICAS:
+    settings.DATABASES[alias] = {
+        **settings.DATABASES['default'],
+        'NAME': os.path.join(TMP_DIR, f'{alias}.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+    }
+settings.DATABASE_REPLICAS = REPLICAS
+settings.REPLICA_STICKY_SECONDS = 1
+settings.ALLOWED_HOSTS = ['*']
+
+import logging
+
+from django.core.management import call_command
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from users.models import User
+
+logging.disable(logging.INFO)
+served = collections.Counter()
+
+
+def count_queries(sender, connection, **kwargs):
+    if getattr(connection, 'counting_queries', False):
+        return  # the wrapper outlives reconnects
+    connection.counting_queries = True
+
+    def wrapper(execute, sql, params, many, context):
+        if not sql.startswith('PRAGMA'):
+            served[connection.alias] += 1
+        return execute(sql, params, many, context)
+    connection.execute_wrappers.append(wrapper)
+
+
+connection_created.connect(count_queries)
+
+
+def request(client, method, path, **kwargs):
+    served.clear()
+    response = getattr(client, method)(path, content_type='application/json', **kwargs)
+    return response, dict(served)
+
+
+def main():
+    call_command('migrate', verbosity=0)
+    user = User.objects.create_user(email='replica@example.com', username='replica', password='x')
+    call_command('sync_replicas', verbosity=0, stdout=open(os.devnull, 'w'))
+    for alias in connections:
+        connections[alias].close()
+
+    client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+    progress_url = '/api/progress/workout-progress/'
+
+    print("1. Reads before any write")
+    for _ in range(4):
+        response, by_alias = request(client, 'get', progress_url)
+        print(f"   GET workout-progress -> {by_alias}, total_workouts={response.json()['total_workouts']}")
+
+    print("2. Save a workout, then read immediately")
+    response, by_alias = request(client, 'post', '/api/progress/save-workout/', data={
+        'workout_name': 'Push day', 'workout_type': 'strength', 'duration': 45,
+        'calories_burned': 320, 'date': '2024-05-01',
+    })
+    print(f"   POST save-workout -> {response.status_code} {by_alias}")
+    response, by_alias = request(client, 'get', progress_url)
+    print(f"   GET workout-progress -> {by_alias}, total_workouts={response.json()['total_workouts']}")
+
+    print(f"3. After {settings.REPLICA_STICKY_SECONDS}s stickiness")
+    time.sleep(settings.REPLICA_STICKY_SECONDS + 0.1)
+    response, by_alias = request(client, 'get', progress_url)
+    print(f"   GET workout-progress -> {by_alias}, total_workouts={response.json()['total_workouts']} (replica not synced)")
+    call_command('sync_replicas', verbosity=0, stdout=open(os.devnull, 'w'))
+    response, by_alias = request(client, 'get', progress_url)
+    print(f"   GET workout-progress -> {by_alias}, total_workouts={response.json()['total_workouts']} (after sync_replicas)")
+
+
+if __name__ == '__main__':
+    main()
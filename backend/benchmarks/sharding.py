@@ -0,0 +1,150 @@
+"""
+Demo: write throughput with user data sharded over N SQLite files.
+
+Worker processes log completed workouts for 64 users, each write in its own
+transaction as in the save views, with the data spread over 1, 2 and 4
+shard files by ``ShardRouter``. A single SQLite file admits one writer at a
+time across processes, so throughput should grow with the number of shards
+until the workers run out of CPU.
+
+Finally the data written with 2 shards is rebalanced onto 4 with
+``rebalance_shards``, checking that no row is lost and every user ends up on
+``shard_for_user()``.
+
+    python benchmarks/sharding.py [--processes 8] [--writes 300]
+"""
+import argparse
+import datetime
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fitness_project.settings')
+
+import django
+from django.conf import settings
+
+django.setup()
+
+import logging
+
+from django.core.management import call_command
+from django.db import connections, transaction
+
+from fitness_project.db.sharding import shard_for_user
+from progress.models import CompletedWorkout
+from users.models import User
+
+logging.disable(logging.INFO)
+USERS = 64
+
+
+def configure(directory, count):
+    """Point default and ``shard1..shard{count-1}`` at files in ``directory``"""
+    for alias in connections:
+        connections[alias].close()
+        if alias != 'default':
+            # Drop the cached wrapper, which keeps its old settings
+            del connections[alias]
+    # Updated in place: the default connection may already hold this dict
+    settings.DATABASES['default']['NAME'] = os.path.join(directory, 'default.sqlite3')
+    aliases = ['default']
+    for index in range(1, count):
+        alias = f'shard{index}'
+        settings.DATABASES[alias] = {
+            **settings.DATABASES['default'],
+            'NAME': os.path.join(directory, f'{alias}.sqlite3'),
+            'OPTIONS': {'pragmas': {'foreign_keys': 'OFF'}},
+        }
+        aliases.append(alias)
+    settings.DATABASE_SHARDS = aliases
+    return aliases
+
+
+def log_workouts(worker, processes, writes, user_ids):
+    for alias in connections:
+        connections[alias].close()
+    today = datetime.date.today()
+    for n in range(writes):
+        user_id = user_ids[(worker + n * processes) % len(user_ids)]
+        workout = CompletedWorkout(user_id=user_id, workout_name='Benchmark', date=today, duration=45)
+        with transaction.atomic(using=shard_for_user(user_id)):
+            workout.save()
+    for alias in connections:
+        connections[alias].close()
+
+
+def run(count, processes, writes):
+    directory = tempfile.mkdtemp(prefix=f'fitness_shards_{count}_')
+    aliases = configure(directory, count)
+    for alias in aliases:
+        call_command('migrate', database=alias, verbosity=0)
+    user_ids = [
+        User.objects.create_user(email=f'user{i}@example.com', username=f'user{i}', password='x').pk
+        for i in range(USERS)
+    ]
+    for alias in connections:
+        connections[alias].close()
+
+    context = multiprocessing.get_context('fork')
+    workers = [
+        context.Process(target=log_workouts, args=(worker, processes, writes, user_ids))
+        for worker in range(processes)
+    ]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    per_shard = {alias: CompletedWorkout.objects.using(alias).count() for alias in aliases}
+    return directory, user_ids, per_shard, sum(per_shard.values()) / elapsed
+
+
+def rebalance(directory, user_ids, total):
+    aliases = configure(directory, 4)
+    for alias in aliases[2:]:
+        call_command('migrate', database=alias, verbosity=0)
+    call_command('rebalance_shards', stdout=open(os.devnull, 'w'))
+
+    misplaced = sum(
+        CompletedWorkout.objects.using(alias).exclude(user_id__in=[
+            user_id for user_id in user_ids if shard_for_user(user_id) == alias
+        ]).count()
+        for alias in aliases
+    )
+    per_shard = {alias: CompletedWorkout.objects.using(alias).count() for alias in aliases}
+    print(f"rebalanced 2 -> 4 shards: {per_shard}, {sum(per_shard.values())}/{total} rows kept, "
+          f"{misplaced} misplaced")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--writes', type=int, default=300, help='writes per process')
+    parser.add_argument('--synchronous', default='NORMAL',
+                        help='PRAGMA synchronous; FULL makes every commit wait for fsync')
+    args = parser.parse_args()
+    settings.SQLITE_PRAGMAS = {**settings.SQLITE_PRAGMAS, 'synchronous': args.synchronous}
+
+    print(f"{args.processes} processes x {args.writes} transactions, {USERS} users, "
+          f"synchronous={args.synchronous}, {os.cpu_count()} CPU(s)")
+    print(f"{'shards':>6} {'writes/s':>9} {'scaling':>8}  rows per shard")
+    baseline = None
+    runs = {}
+    for count in (1, 2, 4):
+        runs[count] = directory, user_ids, per_shard, rate = run(count, args.processes, args.writes)
+        baseline = baseline or rate
+        print(f"{count:>6} {rate:>9.0f} {rate / baseline:>7.2f}x  {list(per_shard.values())}")
+
+    directory, user_ids, per_shard, _ = runs[2]
+    rebalance(directory, user_ids, sum(per_shard.values()))
+
+
+if __name__ == '__main__':
+    main()
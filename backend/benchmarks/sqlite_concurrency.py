@@ -0,0 +1,127 @@
+"""
+Benchmark: concurrent workout logging on stock vs tuned SQLite.
+
+Many threads log progress entries at once, half of them as a read-then-write
+``atomic()`` block like the save_* views, while a reader thread keeps
+querying. Runs against a fresh database file with the stock
+``django.db.backends.sqlite3`` engine and with ``fitness_project.db.sqlite3``
+and reports throughput, ``database is locked`` failures and reader latency.
+
+    python benchmarks/sqlite_concurrency.py [--threads 16] [--writes 200]
+"""
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fitness_project.settings')
+
+import django
+from django.conf import settings
+
+django.setup()
+
+TMP_DIR = tempfile.mkdtemp(prefix='fitness_sqlite_benchmark_')
+ENGINES = {
+    'stock': 'django.db.backends.sqlite3',
+    'tuned': 'fitness_project.db.sqlite3',
+}
+for alias, engine in ENGINES.items():
+    settings.DATABASES[alias] = {
+        **settings.DATABASES['default'],
+        'ENGINE': engine,
+        'NAME': os.path.join(TMP_DIR, f'{alias}.sqlite3'),
+    }
+
+from django.core.management import call_command
+from django.db import OperationalError, connections, transaction
+
+from django.db.models.signals import post_save
+
+from progress.models import ProgressEntry
+from users.models import User
+
+# The sync change log lives on default (the project database); measure the
+# entries alone
+post_save.disconnect(sender=ProgressEntry, dispatch_uid='sync_save_progress_entries')
+
+
+def log_entries(alias, user, writes, offset, failures):
+    for n in range(writes):
+        # progress entries are unique per user and date
+        date = datetime.date(2000, 1, 1) + datetime.timedelta(days=offset + n)
+        try:
+            if n % 2:
+                ProgressEntry.objects.using(alias).create(user=user, date=date, weight=80)
+            else:
+                with transaction.atomic(using=alias):
+                    latest = ProgressEntry.objects.using(alias).filter(user=user).order_by('-id').first()
+                    weight = (latest.weight if latest else 80) or 80
+                    ProgressEntry.objects.using(alias).create(user=user, date=date, weight=weight)
+        except OperationalError:
+            failures.append(offset + n)
+    connections[alias].close()
+
+
+def read_entries(alias, user, stop, latencies):
+    while not stop.is_set():
+        started = time.perf_counter()
+        ProgressEntry.objects.using(alias).filter(user=user).count()
+        latencies.append(time.perf_counter() - started)
+        time.sleep(0.001)
+    connections[alias].close()
+
+
+def run(alias, threads, writes):
+    call_command('migrate', database=alias, verbosity=0)
+    user = User.objects.db_manager(alias).create_user(email=f'{alias}@example.com', username=alias, password='x')
+    connections[alias].close()
+
+    failures, latencies, stop = [], [], threading.Event()
+    reader = threading.Thread(target=read_entries, args=(alias, user, stop, latencies))
+    writers = [
+        threading.Thread(target=log_entries, args=(alias, user, writes, i * writes, failures))
+        for i in range(threads)
+    ]
+    started = time.perf_counter()
+    reader.start()
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    reader.join()
+
+    committed = ProgressEntry.objects.using(alias).count()
+    latencies.sort()
+    return {
+        'committed': committed,
+        'failed': len(failures),
+        'writes_per_sec': committed / elapsed,
+        'read_p50_ms': latencies[len(latencies) // 2] * 1000 if latencies else 0,
+        'read_max_ms': latencies[-1] * 1000 if latencies else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--writes', type=int, default=200, help='writes per thread')
+    args = parser.parse_args()
+
+    print(f"{args.threads} threads x {args.writes} writes, database files in {TMP_DIR}")
+    print(f"{'engine':<7} {'committed':>9} {'locked':>7} {'writes/s':>9} {'read p50 ms':>12} {'read max ms':>12}")
+    for alias in ENGINES:
+        result = run(alias, args.threads, args.writes)
+        print(f"{alias:<7} {result['committed']:>9} {result['failed']:>7} {result['writes_per_sec']:>9.0f} "
+              f"{result['read_p50_ms']:>12.2f} {result['read_max_ms']:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+Synchronous DRF versions of the read endpoints now served by native async
+views, kept only as the "sync" side of ``benchmarks/async_views.py``.
+
+They are copies of the views the async ones replaced and are not routed by
+the project; do not import them from application code.
+"""
+import logging
+
+from django.db import models
+from rest_framework import permissions, status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+
+from fitness_project.request_logging import payload
+from progress.models import CompletedWorkout, ProgressEntry
+from progress.serializers import CompletedWorkoutSerializer
+from progress.views import _progress_stats
+from workouts.models import WorkoutSession
+from workouts.serializers import WorkoutSessionSerializer
+from workouts.views import _serialized_sessions
+
+logger = logging.getLogger(__name__)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def get_user_workout_stats(request):
+    """Get user's workout statistics"""
+    try:
+        user = request.user
+        total_sessions = WorkoutSession.objects.filter(user=user).count()
+        completed_sessions = WorkoutSession.objects.filter(user=user, status='completed').count()
+        total_workout_time = WorkoutSession.objects.filter(user=user, status='completed').aggregate(
+            total_time=models.Sum('duration')
+        )['total_time'] or 0
+        
+        # Get recent sessions
+        recent_sessions = _serialized_sessions(
+            WorkoutSession.objects.filter(user=user).order_by('-created_at')[:5], request
+        )
+        
+        stats = {
+            'total_sessions': total_sessions,
+            'completed_sessions': completed_sessions,
+            'total_workout_time': total_workout_time,
+            'completion_rate': (completed_sessions / total_sessions * 100) if total_sessions > 0 else 0,
+            'recent_sessions': WorkoutSessionSerializer(recent_sessions, many=True, context={'request': request}).data
+        }
+        
+        logger.info("📊 Workout stats retrieved for user %s: %s", user.email, payload(stats))
+        return Response(stats)
+        
+    except Exception as e:
+        logger.error("❌ Error getting workout stats: %s", e)
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def get_user_workout_history(request):
+    """Get user's workout history"""
+    try:
+        user = request.user
+        sessions = WorkoutSession.objects.filter(user=user).order_by('-created_at')
+        
+        # Pagination
+        page = int(request.query_params.get('page', 1))
+        page_size = int(request.query_params.get('page_size', 10))
+        start = (page - 1) * page_size
+        end = start + page_size
+        
+        paginated_sessions = _serialized_sessions(sessions[start:end], request)
+        
+        history = {
+            'sessions': WorkoutSessionSerializer(paginated_sessions, many=True, context={'request': request}).data,
+            'total_sessions': sessions.count(),
+            'page': page,
+            'page_size': page_size,
+            'has_next': end < sessions.count()
+        }
+        
+        logger.info("📚 Workout history retrieved for user %s", user.email)
+        return Response(history)
+        
+    except Exception as e:
+        logger.error("❌ Error getting workout history: %s", e)
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def get_user_progress_stats(request):
+    """Get user's progress statistics"""
+    try:
+        user = request.user
+        entries = ProgressEntry.objects.filter(user=user).order_by('-date')
+        
+        if not entries.exists():
+            return Response({
+                'message': 'No progress entries found',
+                'stats': {}
+            })
+        
+        # Get latest and earliest entries
+        latest_entry = entries.first()
+        earliest_entry = entries.last()
+        
+        stats = _progress_stats(latest_entry, earliest_entry, entries.count())
+        
+        logger.info("📊 Progress stats retrieved for user %s: %s", user.email, payload(stats))
+        return Response(stats)
+        
+    except Exception as e:
+        logger.error("❌ Error getting progress stats: %s", e)
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def get_workout_progress(request):
+    """Get user's workout progress history"""
+    try:
+        user = request.user
+        workouts = CompletedWorkout.objects.filter(user=user).order_by('-date')
+        
+        # Pagination
+        page = int(request.query_params.get('page', 1))
+        page_size = int(request.query_params.get('page_size', 10))
+        start = (page - 1) * page_size
+        end = start + page_size
+        
+        paginated_workouts = workouts[start:end]
+        
+        # Calculate stats
+        total_workouts = workouts.count()
+        total_duration = sum(workout.duration for workout in workouts if workout.duration)
+        total_calories = sum(workout.calories_burned for workout in workouts if workout.calories_burned)
+        
+        # Get workout types distribution
+        workout_types = {}
+        for workout in workouts:
+            workout_type = workout.workout_type or 'Other'
+            if workout_type in workout_types:
+                workout_types[workout_type] += 1
+            else:
+                workout_types[workout_type] = 1
+        
+        progress_data = {
+            'workouts': CompletedWorkoutSerializer(paginated_workouts, many=True, context={'request': request}).data,
+            'total_workouts': total_workouts,
+            'total_duration': total_duration,
+            'total_calories': total_calories,
+            'workout_types': workout_types,
+            'page': page,
+            'page_size': page_size,
+            'has_next': end < total_workouts
+        }
+        
+        logger.info("📊 Workout progress retrieved for user %s", user.email)
+        return Response(progress_data)
+        
+    except Exception as e:
+        logger.error("❌ Error getting workout progress: %s", e)
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
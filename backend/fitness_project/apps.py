@@ -0,0 +1,20 @@
+from django.apps import AppConfig, apps
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+
+
+class FitnessProjectConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'fitness_project'
+
+    def ready(self):
+        from fitness_project import checks  # noqa: F401
+        from fitness_project.cache.versions import VERSIONED_APPS, bump_for_instance
+        from fitness_project.db.sharding import purge_user_data
+
+        post_delete.connect(purge_user_data, sender=settings.AUTH_USER_MODEL, dispatch_uid='purge_user_shard')
+        for app_label in VERSIONED_APPS:
+            for model in apps.get_app_config(app_label).get_models():
+                for signal in (post_save, post_delete):
+                    signal.connect(bump_for_instance, sender=model,
+                                   dispatch_uid=f'cache_version_{model._meta.label}')
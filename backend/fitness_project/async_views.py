@@ -0,0 +1,142 @@
+"""
+Helpers for native async read views.
+
+DRF 3.14 views are synchronous, so under ASGI every request to them is
+handed to a worker thread. The hot read endpoints are instead written as
+plain Django ``async def`` views that use the async ORM (``aget``,
+``acount``, ``async for``) and are wrapped with ``async_api_view``, which
+reproduces what ``@api_view`` + ``IsAuthenticated`` gave them:
+
+- authentication through ``DEFAULT_AUTHENTICATION_CLASSES`` (using their
+  ``aauthenticate()`` when available, so a cached user is resolved without
+  leaving the event loop), with DRF's 401 body on failure, or the user a
+  batch sub-request was given (see ``fitness_project.batch``);
+- ``request.query_params``;
+- content negotiation: views return ``api_response(data)``, which is
+  rendered with the renderer ``DEFAULT_CONTENT_NEGOTIATION_CLASS`` picks
+  from ``DEFAULT_RENDERER_CLASSES`` (JSON, MessagePack, CBOR), so the output
+  is identical to the synchronous views. Like DRF's ``Response`` it keeps
+  the unrendered ``data``, which ``cache_per_user`` caches.
+
+Methods the async view does not handle (e.g. PUT on the profile) are passed
+to the existing synchronous view.
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from rest_framework import exceptions, status
+from rest_framework.settings import api_settings
+
+
+class DataResponse(HttpResponse):
+    """Response holding unrendered ``data`` until ``async_api_view`` renders it.
+
+    Not named ``render()``: Django calls that on every response having it,
+    through a thread, which is the hop async views avoid.
+    """
+
+    def __init__(self, data, status=status.HTTP_200_OK):
+        super().__init__(status=status)
+        self.data = data
+
+    def render_with(self, renderer, media_type, request):
+        self.content = renderer.render(self.data, media_type, {'request': request, 'response': self})
+        if renderer.charset:
+            self['Content-Type'] = f'{renderer.media_type}; charset={renderer.charset}'
+        else:
+            self['Content-Type'] = renderer.media_type
+        return self
+
+
+def api_response(data, status=status.HTTP_200_OK):
+    return DataResponse(data, status=status)
+
+
+async def aauthenticate(request):
+    """Return the authenticated user for ``request`` or None"""
+    for authentication_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        authenticator = authentication_class()
+        if hasattr(authenticator, 'aauthenticate'):
+            result = await authenticator.aauthenticate(request)
+        else:
+            result = await sync_to_async(authenticator.authenticate)(request)
+        if result is not None:
+            return result[0]
+    return None
+
+
+def _error_response(exc, request=None):
+    data = exc.detail if isinstance(exc.detail, dict) else {'detail': exc.detail}
+    response = api_response(data, status=exc.status_code)
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        # Same challenge DRF sends when the first authenticator provides one
+        authenticators = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+        if authenticators:
+            challenge = authenticators[0]().authenticate_header(request)
+            if challenge:
+                response['WWW-Authenticate'] = challenge
+    return response
+
+
+def _renderers():
+    # The browsable API can only render for a DRF view
+    return [renderer() for renderer in api_settings.DEFAULT_RENDERER_CLASSES if renderer.format != 'api']
+
+
+async def alist(queryset):
+    """Evaluate ``queryset`` (including its prefetches) without blocking the loop"""
+    return [obj async for obj in queryset]
+
+
+def async_api_view(methods=('GET',), fallback=None):
+    """Wrap an ``async def`` view to require an authenticated user.
+
+    Requests using other methods go to the synchronous ``fallback`` view when
+    one is given and get a 405 otherwise.
+    """
+    def decorator(view):
+        async def respond(request, *args, **kwargs):
+            if request.method not in methods:
+                return _error_response(exceptions.MethodNotAllowed(request.method))
+
+            # Sub-requests of /api/batch/ arrive authenticated, as with
+            # DRF's force_authenticate()
+            user = getattr(request, '_force_auth_user', None)
+            if user is None:
+                try:
+                    user = await aauthenticate(request)
+                except exceptions.APIException as exc:
+                    return _error_response(exc, request)
+            if user is None:
+                return _error_response(exceptions.NotAuthenticated(), request)
+
+            request.user = user
+            return await view(request, *args, **kwargs)
+
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods and fallback is not None:
+                return await sync_to_async(fallback)(request, *args, **kwargs)
+
+            request.query_params = request.GET
+            renderers = _renderers()
+            try:
+                renderer, media_type = api_settings.DEFAULT_CONTENT_NEGOTIATION_CLASS().select_renderer(
+                    request, renderers,
+                )
+            except exceptions.NotAcceptable as exc:
+                # Like DRF, report it in the first format
+                renderer, media_type = renderers[0], renderers[0].media_type
+                response = _error_response(exc, request)
+            else:
+                response = await respond(request, *args, **kwargs)
+            if isinstance(response, DataResponse):
+                response.render_with(renderer, media_type, request)
+            return response
+
+        # Token-authenticated like the DRF views; set directly because
+        # csrf_exempt() would hide that the wrapper is a coroutine function
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
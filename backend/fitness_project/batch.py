@@ -0,0 +1,234 @@
+"""
+``POST /api/batch/``: several API calls in one round trip.
+
+The body lists sub-requests, run in order against the normal URL routes::
+
+    {"atomic": true, "requests": [
+        {"id": "session", "method": "POST", "path": "/api/workouts/sessions/",
+         "body": {"status": "completed", "duration": 45}},
+        {"method": "POST", "path": "/api/workouts/sets/",
+         "body": {"session": "{{session.id}}", "exercise_id": "3", "reps_completed": 10}}
+    ]}
+
+and the response holds one ``{"id", "status", "body"}`` result per
+sub-request, in the same order.
+
+- ``{{name.field}}`` in a path, a query string, a header or a body value
+  refers to the response body of the earlier sub-request with that ``id``
+  (list items by index, e.g. ``{{plans.results.0.id}}``). A value that is
+  just a reference takes the referenced value as is, so ids stay numbers.
+  A sub-request whose reference points to a failed or missing result is
+  not run and gets a 424.
+- ``"atomic": true`` runs the batch in one transaction on ``default`` and
+  on the user's shard. The first sub-request answering 4xx/5xx rolls
+  everything back, and the remaining ones are not run (424).
+  ``"committed"`` in the response says whether the writes were kept.
+  Without it each sub-request stands alone, as if sent separately.
+
+Sub-requests run in-process, without the middleware. They skip
+authentication: they get the batch request's user, the way DRF's
+``force_authenticate`` works. Each has a JSON body and asks for JSON.
+Their response data is collected without rendering it. The batch response
+as a whole is then negotiated like any other (JSON, MessagePack, CBOR).
+Sub-requests share the batch request's context, so database routing sees
+a write in one of them and serves later reads in the same batch from the
+primary.
+"""
+import contextlib
+import io
+import json
+import logging
+import re
+from urllib.parse import urlsplit
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.http import HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+from rest_framework import permissions, serializers, status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from fitness_project.db.sharding import shard_for_user
+from fitness_project.renderers import dumps
+
+logger = logging.getLogger(__name__)
+
+REFERENCE = re.compile(r'\{\{\s*([\w-]+)((?:\.[\w-]+)*)\s*\}\}')
+
+# Request headers that describe the batch body rather than each sub-request
+_BATCH_HEADERS = ('CONTENT_TYPE', 'CONTENT_LENGTH', 'HTTP_ACCEPT', 'HTTP_IDEMPOTENCY_KEY')
+
+
+class SubRequestSerializer(serializers.Serializer):
+    id = serializers.RegexField(r'^[\w-]+$', max_length=64, required=False)
+    method = serializers.ChoiceField(choices=['GET', 'POST', 'PUT', 'PATCH', 'DELETE'])
+    path = serializers.RegexField(r'^/api/', max_length=2048)
+    headers = serializers.DictField(child=serializers.CharField(), required=False)
+    body = serializers.JSONField(required=False, encoder=JSONEncoder)
+
+
+class BatchSerializer(serializers.Serializer):
+    atomic = serializers.BooleanField(default=False)
+    requests = SubRequestSerializer(many=True, allow_empty=False)
+
+    def validate_requests(self, value):
+        limit = getattr(settings, 'BATCH_MAX_REQUESTS', 50)
+        if len(value) > limit:
+            raise serializers.ValidationError(f'At most {limit} requests per batch')
+        ids = [item['id'] for item in value if 'id' in item]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError('Request ids must be unique')
+        return value
+
+
+class Unresolved(Exception):
+    """A reference to a result that does not exist or failed"""
+
+
+def _lookup(results, name, path):
+    if name not in results:
+        raise Unresolved(f'No successful earlier result named {name!r}')
+    value = results[name]
+    for part in path.split('.')[1:] if path else []:
+        try:
+            value = value[int(part)] if isinstance(value, list) else value[part]
+        except (KeyError, IndexError, ValueError, TypeError):
+            raise Unresolved(f'{name}{path} is not in the result')
+    return value
+
+
+def substitute(value, results):
+    """``value`` with ``{{name.field}}`` references replaced from ``results``"""
+    if isinstance(value, dict):
+        return {key: substitute(item, results) for key, item in value.items()}
+    if isinstance(value, list):
+        return [substitute(item, results) for item in value]
+    if not isinstance(value, str) or '{{' not in value:
+        return value
+    match = REFERENCE.fullmatch(value)
+    if match:
+        return _lookup(results, *match.groups())
+    return REFERENCE.sub(lambda match: str(_lookup(results, *match.groups())), value)
+
+
+def _subrequest(request, method, path, headers, body):
+    parts = urlsplit(path)
+    sub = HttpRequest()
+    sub.method = method
+    sub.path = sub.path_info = parts.path
+    sub.META = {key: value for key, value in request.META.items() if key not in _BATCH_HEADERS}
+    for name, value in headers.items():
+        sub.META['HTTP_' + name.upper().replace('-', '_')] = value
+    sub.META.update(REQUEST_METHOD=method, PATH_INFO=parts.path, QUERY_STRING=parts.query,
+                    HTTP_ACCEPT='application/json')
+    sub.GET = QueryDict(parts.query)
+    sub.COOKIES = request.COOKIES
+
+    content = dumps(body) if body is not None else b''
+    if body is not None:
+        sub.META['CONTENT_TYPE'] = 'application/json'
+    sub.META['CONTENT_LENGTH'] = str(len(content))
+    sub._stream = io.BytesIO(content)
+    sub._read_started = False
+
+    # Authenticated once, for the whole batch
+    sub.user = request.user
+    sub._force_auth_user = request.user
+    sub._force_auth_token = request.auth
+    sub._dont_enforce_csrf_checks = True
+    return sub
+
+
+def _response_body(response):
+    # DRF's Response and api_response() keep their data; no need to render it
+    if hasattr(response, 'data'):
+        return response.data
+    if response.streaming or not response.content:
+        return None
+    if response.get('Content-Type', '').startswith('application/json'):
+        return json.loads(response.content)
+    return response.content.decode(response.charset, errors='replace')
+
+
+def _run(request, item, results):
+    try:
+        path = substitute(item['path'], results)
+        headers = substitute(item.get('headers', {}), results)
+        body = substitute(item['body'], results) if 'body' in item else None
+    except Unresolved as exc:
+        return status.HTTP_424_FAILED_DEPENDENCY, {'detail': str(exc)}
+
+    try:
+        match = resolve(urlsplit(path).path)
+    except Resolver404:
+        return status.HTTP_404_NOT_FOUND, {'detail': 'Not found.'}
+    if match.func is batch:
+        return status.HTTP_400_BAD_REQUEST, {'detail': 'Batches cannot be nested.'}
+
+    sub = _subrequest(request, item['method'], path, headers, body)
+    sub.resolver_match = match
+    if iscoroutinefunction(match.func):
+        response = async_to_sync(match.func)(sub, *match.args, **match.kwargs)
+    else:
+        response = match.func(sub, *match.args, **match.kwargs)
+    return response.status_code, _response_body(response)
+
+
+class _RollBack(Exception):
+    pass
+
+
+def _atomic(user):
+    """One transaction on ``default`` and one on the user's shard, if that is another database"""
+    stack = contextlib.ExitStack()
+    for alias in sorted({DEFAULT_DB_ALIAS, shard_for_user(user.pk)}):
+        stack.enter_context(transaction.atomic(using=alias))
+    return stack
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def batch(request):
+    """Run the sub-requests in ``request.data['requests']`` in order"""
+    serializer = BatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    atomic = serializer.validated_data['atomic']
+    items = serializer.validated_data['requests']
+
+    results = []
+    # Bodies of successful results by id, for references
+    named = {}
+
+    def run_all():
+        for item in items:
+            if atomic and results and results[-1]['status'] >= 400:
+                code, body = status.HTTP_424_FAILED_DEPENDENCY, {'detail': 'Not run: an earlier request failed.'}
+            else:
+                code, body = _run(request, item, named)
+            result = {'status': code, 'body': body}
+            if 'id' in item:
+                result = {'id': item['id'], **result}
+                if code < 400:
+                    named[item['id']] = body
+            results.append(result)
+        if atomic and any(result['status'] >= 400 for result in results):
+            raise _RollBack
+
+    data = {'results': results}
+    if atomic:
+        try:
+            with _atomic(request.user):
+                run_all()
+        except _RollBack:
+            data['committed'] = False
+        else:
+            data['committed'] = True
+    else:
+        run_all()
+
+    logger.info('Batch of %d requests for user %s: %s', len(items), request.user.pk,
+                ' '.join(str(result['status']) for result in results))
+    return Response(data)
@@ -0,0 +1,5 @@
+"""
+Project-wide cache layer: pluggable backends with counters (``backends``),
+namespaced per-user versions bumped by model signals (``versions``) and the
+``cache_per_user`` view helper (``views``).
+"""
@@ -0,0 +1,374 @@
+"""
+Cache backends with hit/miss/eviction counters.
+
+- ``LRUCache``: in-process, bounded by ``MAX_ENTRIES`` and ``MAX_BYTES``
+  (pickled size), least recently used entries evicted first.
+- ``FileCache``: Django's file-based cache with counters and an
+  ``incr()`` serialized by a lock file.
+- ``RespCache``: Redis protocol client without third-party dependencies, so
+  it runs against Redis or the ``resp_cache_server`` stand-in.
+
+Each backend has ``stats()``; ``fitness_project.cache.views.cache_stats``
+exposes them. ``is_process_local()`` tells whether other worker processes
+see a cache's entries.
+"""
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files import locks
+
+from .resp import INCR_EXISTING, RespClient
+
+
+class CacheStats:
+    """Thread-safe counters shared by the backends"""
+
+    FIELDS = ('hits', 'misses', 'sets', 'deletes', 'evictions', 'expirations')
+
+    def __init__(self, fields=FIELDS):
+        self._lock = threading.Lock()
+        self.fields = fields
+        self.reset()
+
+    def reset(self):
+        self.counts = dict.fromkeys(self.fields, 0)
+
+    def incr(self, field, amount=1):
+        with self._lock:
+            self.counts[field] += amount
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self.counts)
+        if 'hits' in counts:
+            lookups = counts['hits'] + counts['misses']
+            counts['hit_rate'] = counts['hits'] / lookups if lookups else None
+        return counts
+
+
+# Django creates a cache instance per thread; like LocMemCache, instances
+# share their entries and counters through this registry
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def _shared_state(key, factory):
+    with _shared_lock:
+        state = _shared.get(key)
+        if state is None:
+            state = _shared[key] = factory()
+        return state
+
+
+class _LRUState:
+
+    def __init__(self):
+        self.data = OrderedDict()  # key -> (expiry, pickled value)
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.counters = CacheStats()
+
+
+class LRUCache(BaseCache):
+    """Process-local LRU cache bounded by entry count and pickled bytes.
+
+    Every thread's instance for the same ``LOCATION`` shares one store, so
+    give each LRU alias its own ``LOCATION``.
+    """
+
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, name, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._max_bytes = options.get('MAX_BYTES', 64 * 1024 * 1024)
+        self._state = _shared_state(('lru', name), _LRUState)
+        self._data = self._state.data
+        self._lock = self._state.lock
+        self.counters = self._state.counters
+
+    def _expiry(self, timeout):
+        timeout = self.get_backend_timeout(timeout)
+        return float('inf') if timeout is None else timeout
+
+    def _live(self, key, now):
+        """Return the entry for ``key`` if present and not expired; caller holds the lock"""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            self._remove(key)
+            self.counters.incr('expirations')
+            return None
+        return entry
+
+    def _remove(self, key):
+        _, pickled = self._data.pop(key)
+        self._state.bytes -= len(pickled)
+
+    def _store(self, key, pickled, expiry):
+        if key in self._data:
+            self._remove(key)
+        self._data[key] = (expiry, pickled)
+        self._state.bytes += len(pickled)
+        while len(self._data) > self._max_entries or (self._state.bytes > self._max_bytes and len(self._data) > 1):
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+            self.counters.incr('evictions')
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        with self._lock:
+            if self._live(key, time.time()) is not None:
+                return False
+            self._store(key, pickled, self._expiry(timeout))
+        self.counters.incr('sets')
+        return True
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._lock:
+            entry = self._live(key, time.time())
+            if entry is None:
+                self.counters.incr('misses')
+                return default
+            self._data.move_to_end(key)
+        self.counters.incr('hits')
+        return pickle.loads(entry[1])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        with self._lock:
+            self._store(key, pickled, self._expiry(timeout))
+        self.counters.incr('sets')
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._lock:
+            entry = self._live(key, time.time())
+            if entry is None:
+                return False
+            self._data[key] = (self._expiry(timeout), entry[1])
+            self._data.move_to_end(key)
+            return True
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._lock:
+            entry = self._live(key, time.time())
+            if entry is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(entry[1]) + delta
+            self._store(key, pickle.dumps(value, self.pickle_protocol), entry[0])
+        return value
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._lock:
+            if key not in self._data:
+                return False
+            self._remove(key)
+        self.counters.incr('deletes')
+        return True
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._lock:
+            return self._live(key, time.time()) is not None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._state.bytes = 0
+
+    # Nothing here does I/O, so the async API does not need a thread
+    async def aget(self, key, default=None, version=None):
+        return self.get(key, default, version)
+
+    async def aget_many(self, keys, version=None):
+        return self.get_many(keys, version)
+
+    async def aset(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.set(key, value, timeout, version)
+
+    async def aadd(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.add(key, value, timeout, version)
+
+    def stats(self):
+        with self._lock:
+            size = {'entries': len(self._data), 'bytes': self._state.bytes}
+        return {
+            'backend': 'lru', **self.counters.snapshot(), **size,
+            'max_entries': self._max_entries, 'max_bytes': self._max_bytes,
+        }
+
+
+class FileCache(FileBasedCache):
+    """FileBasedCache that counts hits, misses and culled files"""
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self.counters = _shared_state(('file', self._dir), CacheStats)
+
+    def get(self, key, default=None, version=None):
+        missing = object()
+        value = super().get(key, missing, version)
+        if value is missing:
+            self.counters.incr('misses')
+            return default
+        self.counters.incr('hits')
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        super().set(key, value, timeout, version)
+        self.counters.incr('sets')
+
+    def delete(self, key, version=None):
+        deleted = super().delete(key, version)
+        if deleted:
+            self.counters.incr('deletes')
+        return deleted
+
+    def incr(self, key, delta=1, version=None):
+        # BaseCache.incr() is a get() then a set(); hold a lock file around
+        # them so concurrent increments from any process are not lost
+        self._createdir()
+        with open(os.path.join(self._dir, 'incr.lock'), 'ab') as lock_file:
+            locks.lock(lock_file, locks.LOCK_EX)
+            try:
+                return super().incr(key, delta, version)
+            finally:
+                locks.unlock(lock_file)
+
+    def _cull(self):
+        before = len(self._list_cache_files())
+        super()._cull()
+        culled = before - len(self._list_cache_files())
+        if culled > 0:
+            self.counters.incr('evictions', culled)
+
+    def stats(self):
+        return {'backend': 'file', **self.counters.snapshot(), 'entries': len(self._list_cache_files())}
+
+
+class RespCache(BaseCache):
+    """Cache on a Redis-protocol server at ``LOCATION`` (``host:port`` or ``host:port/db``)"""
+
+    def __init__(self, server, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        address, _, db = server.partition('/')
+        host, _, port = address.rpartition(':')
+        self._client = RespClient(host or '127.0.0.1', int(port or 6379), int(db or 0),
+                                  timeout=options.get('SOCKET_TIMEOUT', 1.0))
+        self.counters = _shared_state(('resp', server), CacheStats)
+
+    # Integers are stored as plain numbers so INCRBY works on them
+    @staticmethod
+    def _encode(value):
+        if type(value) is int:
+            return str(value).encode()
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _decode(raw):
+        if raw[:1] == b'\x80':
+            return pickle.loads(raw)
+        return int(raw)
+
+    def _expiry_args(self, timeout):
+        timeout = self.get_backend_timeout(timeout)
+        if timeout is None:
+            return []
+        return ['PX', max(1, int((timeout - time.time()) * 1000))]
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        added = self._client.call('SET', key, self._encode(value), *self._expiry_args(timeout), 'NX') is not None
+        if added:
+            self.counters.incr('sets')
+        return added
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        raw = self._client.call('GET', key)
+        if raw is None:
+            self.counters.incr('misses')
+            return default
+        self.counters.incr('hits')
+        return self._decode(raw)
+
+    def get_many(self, keys, version=None):
+        if not keys:
+            return {}
+        made = {self.make_and_validate_key(key, version=version): key for key in keys}
+        values = self._client.call('MGET', *made)
+        found = {made[key]: self._decode(raw) for key, raw in zip(made, values) if raw is not None}
+        self.counters.incr('hits', len(found))
+        self.counters.incr('misses', len(made) - len(found))
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._client.call('SET', key, self._encode(value), *self._expiry_args(timeout))
+        self.counters.incr('sets')
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        timeout = self.get_backend_timeout(timeout)
+        if timeout is None:
+            return bool(self._client.call('PERSIST', key)) or self.has_key(key, version=version)
+        return bool(self._client.call('PEXPIRE', key, max(1, int((timeout - time.time()) * 1000))))
+
+    def incr(self, key, delta=1, version=None):
+        made = self.make_and_validate_key(key, version=version)
+        # EXISTS then INCRBY could recreate a key deleted in between
+        value = self._client.call('EVAL', INCR_EXISTING, 1, made, delta)
+        if value is None:
+            raise ValueError("Key '%s' not found" % key)
+        return value
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        deleted = bool(self._client.call('DEL', key))
+        if deleted:
+            self.counters.incr('deletes')
+        return deleted
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return bool(self._client.call('EXISTS', key))
+
+    def clear(self):
+        self._client.call('FLUSHDB')
+
+    def close(self, **kwargs):
+        self._client.close()
+
+    def stats(self):
+        stats = {'backend': 'resp', **self.counters.snapshot()}
+        try:
+            info = self._client.info('stats')
+            stats['evictions'] = int(info.get('evicted_keys', 0))
+            stats['expirations'] = int(info.get('expired_keys', 0))
+            stats['entries'] = self._client.call('DBSIZE')
+        except OSError:
+            pass
+        return stats
+
+
+# Cache backends whose entries are only seen by the process that wrote them
+PROCESS_LOCAL_CACHES = (LRUCache, LocMemCache, DummyCache)
+
+
+def is_process_local(cache):
+    return isinstance(cache, PROCESS_LOCAL_CACHES)
@@ -0,0 +1,269 @@
+"""
+Minimal Redis protocol (RESP2) client, and an in-memory stand-in server.
+
+``RespClient`` keeps one socket per thread and speaks the subset of commands
+``RespCache`` needs. ``RespServer`` implements the same subset with LRU
+eviction past ``max_keys`` and Redis-style ``INFO stats`` counters, so the
+backend can be exercised without a Redis install:
+
+    python manage.py resp_cache_server
+"""
+import socket
+import socketserver
+import threading
+import time
+from collections import OrderedDict
+
+
+# INCRBY that leaves a missing key missing, as one atomic server-side step.
+# RespServer does not run Lua; it recognizes the scripts it is sent.
+INCR_EXISTING = (
+    "if redis.call('EXISTS', KEYS[1]) == 1 then "
+    "return redis.call('INCRBY', KEYS[1], ARGV[1]) end "
+    "return false"
+)
+
+
+class RespError(Exception):
+    """Error reply from the server"""
+
+
+def encode_command(*args):
+    parts = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+    return b''.join(parts)
+
+
+def read_reply(stream):
+    """Read one reply from a binary file object"""
+    line = stream.readline()
+    if not line:
+        raise ConnectionError('Connection closed by server')
+    kind, payload = line[:1], line[1:-2]
+    if kind == b'+':
+        return payload.decode()
+    if kind == b'-':
+        raise RespError(payload.decode())
+    if kind == b':':
+        return int(payload)
+    if kind == b'$':
+        length = int(payload)
+        if length < 0:
+            return None
+        return stream.read(length + 2)[:-2]
+    if kind == b'*':
+        length = int(payload)
+        if length < 0:
+            return None
+        return [read_reply(stream) for _ in range(length)]
+    raise RespError(f'Unexpected reply type {kind!r}')
+
+
+class RespClient:
+    """Blocking client with one connection per thread; reconnects once on a dropped socket"""
+
+    def __init__(self, host='127.0.0.1', port=6379, db=0, timeout=1.0):
+        self.host, self.port, self.db, self.timeout = host, port, db, timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        stream = sock.makefile('rb')
+        self._local.conn = sock, stream
+        if self.db:
+            self._send(sock, stream, ('SELECT', self.db))
+        return sock, stream
+
+    @staticmethod
+    def _send(sock, stream, args):
+        sock.sendall(encode_command(*args))
+        return read_reply(stream)
+
+    def call(self, *args):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            try:
+                return self._send(*conn, args)
+            except (ConnectionError, BrokenPipeError):
+                self.close()
+        return self._send(*self._connect(), args)
+
+    def info(self, section='stats'):
+        raw = self.call('INFO', section)
+        info = {}
+        for line in raw.decode().splitlines():
+            name, sep, value = line.partition(':')
+            if sep:
+                info[name] = value
+        return info
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.conn = None
+            conn[1].close()
+            conn[0].close()
+
+
+class _Store:
+    """One logical database: key -> (value, expiry in ms or None), in LRU order"""
+
+    def __init__(self, server):
+        self.server = server
+        self.data = OrderedDict()
+
+    def get(self, key):
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.time() * 1000:
+            del self.data[key]
+            self.server.stats['expired_keys'] += 1
+            return None
+        self.data.move_to_end(key)
+        return entry
+
+    def put(self, key, value, expiry):
+        self.data[key] = (value, expiry)
+        self.data.move_to_end(key)
+        while self.server.max_keys and len(self.data) > self.server.max_keys:
+            self.data.popitem(last=False)
+            self.server.stats['evicted_keys'] += 1
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        self.db = 0
+        while True:
+            try:
+                command = read_reply(self.rfile)
+            except (ConnectionError, OSError):
+                return
+            try:
+                reply = self.server.execute(self, [arg.decode() if i == 0 else arg
+                                                   for i, arg in enumerate(command)])
+            except RespError as e:
+                self.wfile.write(b'-%s\r\n' % str(e).encode())
+                continue
+            self.wfile.write(self.encode(reply))
+
+    @classmethod
+    def encode(cls, reply):
+        if reply is None:
+            return b'$-1\r\n'
+        if isinstance(reply, int):
+            return b':%d\r\n' % reply
+        if isinstance(reply, str):
+            return b'+%s\r\n' % reply.encode()
+        if isinstance(reply, bytes):
+            return b'$%d\r\n%s\r\n' % (len(reply), reply)
+        return b'*%d\r\n' % len(reply) + b''.join(cls.encode(item) for item in reply)
+
+
+class RespServer(socketserver.ThreadingTCPServer):
+    """In-memory stand-in for Redis supporting the commands ``RespCache`` uses"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=('127.0.0.1', 6379), max_keys=0):
+        super().__init__(address, _Handler)
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+        self.databases = {}
+        self.stats = {'keyspace_hits': 0, 'keyspace_misses': 0, 'evicted_keys': 0, 'expired_keys': 0}
+
+    def store(self, handler):
+        return self.databases.setdefault(handler.db, _Store(self))
+
+    def execute(self, handler, command):
+        name, args = command[0].upper(), command[1:]
+        method = getattr(self, f'cmd_{name.lower()}', None)
+        if method is None:
+            raise RespError(f"ERR unknown command '{name}'")
+        with self.lock:
+            return method(handler, self.store(handler), *args)
+
+    def cmd_ping(self, handler, store, *args):
+        return args[0] if args else 'PONG'
+
+    def cmd_select(self, handler, store, db):
+        handler.db = int(db)
+        return 'OK'
+
+    def cmd_get(self, handler, store, key):
+        entry = store.get(key)
+        self.stats['keyspace_hits' if entry else 'keyspace_misses'] += 1
+        return entry[0] if entry else None
+
+    def cmd_mget(self, handler, store, *keys):
+        return [self.cmd_get(handler, store, key) for key in keys]
+
+    def cmd_set(self, handler, store, key, value, *options):
+        options = [option.decode().upper() for option in options]
+        expiry = None
+        if 'PX' in options:
+            expiry = time.time() * 1000 + int(options[options.index('PX') + 1])
+        elif 'EX' in options:
+            expiry = time.time() * 1000 + int(options[options.index('EX') + 1]) * 1000
+        exists = store.get(key) is not None
+        if ('NX' in options and exists) or ('XX' in options and not exists):
+            return None
+        store.put(key, value, expiry)
+        return 'OK'
+
+    def cmd_del(self, handler, store, *keys):
+        deleted = [key for key in keys if store.get(key) is not None]
+        for key in deleted:
+            del store.data[key]
+        return len(deleted)
+
+    def cmd_exists(self, handler, store, *keys):
+        return sum(store.get(key) is not None for key in keys)
+
+    def cmd_incrby(self, handler, store, key, delta):
+        entry = store.get(key)
+        try:
+            value = int(entry[0] if entry else 0) + int(delta)
+        except ValueError:
+            raise RespError('ERR value is not an integer or out of range')
+        store.put(key, str(value).encode(), entry[1] if entry else None)
+        return value
+
+    def cmd_eval(self, handler, store, script, numkeys, *args):
+        keys, argv = args[:int(numkeys)], args[int(numkeys):]
+        if script.decode() == INCR_EXISTING:
+            if store.get(keys[0]) is None:
+                return None
+            return self.cmd_incrby(handler, store, keys[0], argv[0])
+        raise RespError('ERR only the scripts RespCache sends are supported')
+
+    def cmd_pexpire(self, handler, store, key, ms):
+        entry = store.get(key)
+        if entry is None:
+            return 0
+        store.data[key] = (entry[0], time.time() * 1000 + int(ms))
+        return 1
+
+    def cmd_persist(self, handler, store, key):
+        entry = store.get(key)
+        if entry is None or entry[1] is None:
+            return 0
+        store.data[key] = (entry[0], None)
+        return 1
+
+    def cmd_dbsize(self, handler, store):
+        return len(store.data)
+
+    def cmd_flushdb(self, handler, store):
+        store.data.clear()
+        return 'OK'
+
+    def cmd_info(self, handler, store, *section):
+        lines = ['# Stats'] + [f'{name}:{value}' for name, value in self.stats.items()]
+        return '\r\n'.join(lines).encode()
@@ -0,0 +1,88 @@
+"""
+Single-flight execution: concurrent calls with the same key share one run.
+
+The first caller (the leader) runs the function; callers arriving while it
+is in flight wait for its result (or exception) instead of repeating the
+work. Threads coordinate through ``do()``; coroutines on an event loop
+through ``ado()``, where the shared run is a task shielded from the
+cancellation of any one waiter (e.g. a client disconnecting). Like Go's
+``singleflight``, both return ``(result, joined)``: ``joined`` is True for
+callers that reused another caller's run, which must not hand out mutable
+results (such as a response object) a second time. Nothing is remembered
+once the run finishes: this coalesces bursts, caching is left to the caller.
+"""
+import asyncio
+import threading
+import weakref
+
+from .backends import CacheStats
+
+
+class _Call:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._tasks = weakref.WeakKeyDictionary()  # event loop -> {key: task}
+        self.counters = CacheStats(('leaders', 'followers'))
+
+    def in_flight(self, key):
+        with self._lock:
+            if key in self._calls:
+                return True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        return key in self._tasks.get(loop, {})
+
+    def do(self, key, fn):
+        """Run ``fn()`` once for concurrent ``do()`` calls with ``key``"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            self.counters.incr('followers')
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        self.counters.incr('leaders')
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def ado(self, key, fn):
+        """Await ``fn()`` once for concurrent ``ado()`` calls with ``key`` on this loop"""
+        loop = asyncio.get_running_loop()
+        tasks = self._tasks.setdefault(loop, {})
+        task = tasks.get(key)
+        joined = task is not None
+        if joined:
+            self.counters.incr('followers')
+        else:
+            self.counters.incr('leaders')
+            task = tasks[key] = loop.create_task(fn())
+            task.add_done_callback(lambda done: tasks.get(key) is done and tasks.pop(key))
+        return await asyncio.shield(task), joined
+
+
+flights = SingleFlight()
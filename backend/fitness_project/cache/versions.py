@@ -0,0 +1,123 @@
+"""
+Namespaced cache versions.
+
+Every namespace (the app label of the models a response is built from) has a
+global version plus one version per user. Cached responses store the
+versions they were computed under and only count as hits while both still
+match, so invalidating is a single ``set()`` instead of finding and deleting
+every dependent key.
+
+Versions are random tokens rather than counters: if a version key is
+evicted, a fresh random one is created and old entries can never match
+again, whereas a counter restarting at 0 could revive them.
+
+``bump_for_instance`` is connected to ``post_save``/``post_delete`` of every
+model in ``VERSIONED_APPS``. Rows owned by a user (``user_id``, the user
+itself, or a parent with ``user_id`` such as an exercise set's session)
+bump that user's version; shared rows (exercises, plans) bump the global
+one. ``QuerySet.update()`` and ``bulk_create()`` send no signals, so code
+using them has to call ``bump_user_version``/``bump_global_version``.
+"""
+import secrets
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+
+VERSIONED_APPS = ('users', 'workouts', 'progress')
+
+
+def get_api_cache():
+    return caches[getattr(settings, 'API_CACHE_ALIAS', 'default')]
+
+
+def global_version_key(namespace):
+    return f'cachever:{namespace}'
+
+
+def user_version_key(namespace, user_id):
+    return f'cachever:{namespace}:{user_id}'
+
+
+def version_keys(namespaces, user_id):
+    keys = []
+    for namespace in namespaces:
+        keys += [global_version_key(namespace), user_version_key(namespace, user_id)]
+    return keys
+
+
+def _new_version():
+    return secrets.token_hex(8)
+
+
+def resolve_versions(found, keys, cache=None):
+    """Versions for ``keys`` given a ``get_many()`` result, creating any that are missing.
+
+    Returns ``(versions, complete)``; ``complete`` is False when a version had
+    to be created, in which case no cached entry can be valid.
+    """
+    cache = cache or get_api_cache()
+    versions, complete = [], True
+    for key in keys:
+        version = found.get(key)
+        if version is None:
+            complete = False
+            cache.add(key, _new_version(), timeout=None)
+            version = cache.get(key)
+        versions.append(version)
+    return tuple(versions), complete
+
+
+def _bump(key):
+    get_api_cache().set(key, _new_version(), timeout=None)
+
+
+def bump_user_version(namespace, user_id, using=None):
+    """Invalidate ``user_id``'s entries of ``namespace`` now and when ``using`` commits.
+
+    ``using`` is the database the change was written to, e.g. a user shard.
+    """
+    key = user_version_key(namespace, user_id)
+    _bump(key)
+    # Bump again once committed so responses computed from the old rows
+    # mid-transaction are not kept
+    transaction.on_commit(lambda: _bump(key), using=using)
+
+
+def bump_global_version(namespace, using=None):
+    key = global_version_key(namespace)
+    _bump(key)
+    transaction.on_commit(lambda: _bump(key), using=using)
+
+
+def owner_id(instance):
+    """The id of the user owning ``instance``, or None for shared rows"""
+    if isinstance(instance, get_user_model()):
+        return instance.pk
+    if hasattr(instance, 'user_id'):
+        return instance.user_id
+    for field in instance._meta.concrete_fields:
+        if field.many_to_one and hasattr(field.related_model, 'user_id'):
+            try:
+                parent = getattr(instance, field.name)
+            except ObjectDoesNotExist:
+                continue
+            if parent is not None:
+                return parent.user_id
+    return None
+
+
+def bump_for_instance(sender, instance, **kwargs):
+    """``post_save``/``post_delete`` receiver for models of ``VERSIONED_APPS``"""
+    if kwargs.get('raw'):
+        return
+    namespace = sender._meta.app_label
+    user_id = owner_id(instance)
+    # Sharded rows commit with their shard's transaction
+    using = kwargs.get('using') or instance._state.db
+    if user_id is None:
+        bump_global_version(namespace, using)
+    else:
+        bump_user_version(namespace, user_id, using)
@@ -0,0 +1,214 @@
+"""
+Caching expensive responses per user.
+
+``cache_per_user(*namespaces)`` wraps a view (a DRF function view, below
+``@api_view``, or an ``async def`` view, below ``@async_api_view``) so that
+successful GET responses are cached for ``API_CACHE_TIMEOUT`` seconds,
+keyed by the view, the user, the URL arguments and the query string. The
+entry stores the data together with the namespace versions it was computed
+under; one ``get_many()`` fetches the entry and the current versions, and the
+entry is served only if they still match (see ``versions``). The data, not
+the rendered body, is cached, so content negotiation still applies; it goes
+through ``renderers.typed`` so a hit renders MessagePack and CBOR with the
+same types as a miss.
+
+Misses are computed through ``singleflight``: when the app reconnects and
+fires the same requests several times at once, one request per user, view,
+parameters and versions runs the view and the others reuse its data.
+
+``cache_stats`` (staff only) reports each cache's counters and the response
+hit rate of every cached view.
+"""
+import asyncio
+import contextvars
+import functools
+import hashlib
+import logging
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from rest_framework import permissions
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+
+from fitness_project.async_views import api_response
+from fitness_project.renderers import typed
+
+from .backends import CacheStats
+from .singleflight import flights
+from .versions import get_api_cache, resolve_versions, version_keys
+
+logger = logging.getLogger(__name__)
+
+view_stats = {}
+
+
+def entry_key(view_name, request, kwargs):
+    params = sorted(request.GET.lists())
+    digest = hashlib.blake2b(repr((sorted(kwargs.items()), params)).encode(), digest_size=12).hexdigest()
+    return f'response:{view_name}:{request.user.pk}:{digest}'
+
+
+def _cacheable(request):
+    return request.method == 'GET' and request.user.is_authenticated
+
+
+def _check(found, key, keys):
+    """``(versions or None, (data, fresh_until) or None)`` from a ``get_many()`` result"""
+    if not all(k in found for k in keys):
+        return None, None
+    versions = tuple(found[k] for k in keys)
+    entry = found.get(key)
+    if entry is not None and entry[0] == versions:
+        return versions, entry[1:]
+    return versions, None
+
+
+def _run_in_background(fn):
+    """Run ``fn`` in a thread that sees the caller's context (request, pinned shard)"""
+    def run():
+        try:
+            fn()
+        finally:
+            # Connections are per thread; this one is not reused
+            connections.close_all()
+    threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True).start()
+
+
+_revalidations = set()
+
+
+def cache_per_user(*namespaces, timeout=None, stale_while_revalidate=0, name=None):
+    """Cache a view's successful GET responses per user until a namespace version changes.
+
+    Concurrent misses for the same user, view and parameters are computed
+    once (``singleflight``). With ``stale_while_revalidate``, an entry older
+    than ``timeout`` but not invalidated is still served for that many
+    seconds while a single background run refreshes it.
+    """
+    def decorator(view):
+        view_name = name or f'{view.__module__}.{view.__qualname__}'
+        stats = view_stats.setdefault(view_name, CacheStats(('hits', 'misses', 'stale', 'coalesced', 'sets')))
+
+        def fresh_for():
+            return timeout if timeout is not None else getattr(settings, 'API_CACHE_TIMEOUT', 300)
+
+        def cacheable_entry(versions, response):
+            """``(value, timeout)`` to cache for ``response``, or None"""
+            if response.status_code != 200 or not hasattr(response, 'data'):
+                return None
+            stats.incr('sets')
+            fresh = fresh_for()
+            return (versions, typed(response.data), time.time() + fresh), fresh + stale_while_revalidate
+
+        if iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                if not _cacheable(request):
+                    return await view(request, *args, **kwargs)
+                cache = get_api_cache()
+                key = entry_key(view_name, request, kwargs)
+                keys = version_keys(namespaces, request.user.pk)
+                found = await cache.aget_many([key, *keys])
+                versions, entry = _check(found, key, keys)
+                if versions is None:
+                    versions, _ = await sync_to_async(resolve_versions)(found, keys, cache)
+                # Requests that saw a newer version never join an older run
+                flight = (key, versions)
+
+                async def compute():
+                    response = await view(request, *args, **kwargs)
+                    cacheable = cacheable_entry(versions, response)
+                    if cacheable is not None:
+                        await cache.aset(key, *cacheable)
+                    return response
+
+                async def revalidate():
+                    try:
+                        await flights.ado(flight, compute)
+                    except Exception:
+                        logger.exception("Revalidating %s failed", view_name)
+
+                if entry is not None:
+                    data, fresh_until = entry
+                    if time.time() < fresh_until:
+                        stats.incr('hits')
+                    else:
+                        stats.incr('stale')
+                        if not flights.in_flight(flight):
+                            task = asyncio.ensure_future(revalidate())
+                            _revalidations.add(task)
+                            task.add_done_callback(_revalidations.discard)
+                    return api_response(data)
+
+                stats.incr('misses')
+                response, joined = await flights.ado(flight, compute)
+                if joined:
+                    stats.incr('coalesced')
+                    return api_response(response.data, status=response.status_code)
+                return response
+        else:
+            @functools.wraps(view)
+            def wrapper(request, *args, **kwargs):
+                if not _cacheable(request):
+                    return view(request, *args, **kwargs)
+                cache = get_api_cache()
+                key = entry_key(view_name, request, kwargs)
+                keys = version_keys(namespaces, request.user.pk)
+                found = cache.get_many([key, *keys])
+                versions, entry = _check(found, key, keys)
+                if versions is None:
+                    versions, _ = resolve_versions(found, keys, cache)
+                flight = (key, versions)
+
+                def compute():
+                    response = view(request, *args, **kwargs)
+                    cacheable = cacheable_entry(versions, response)
+                    if cacheable is not None:
+                        cache.set(key, *cacheable)
+                    return response
+
+                def revalidate():
+                    try:
+                        flights.do(flight, compute)
+                    except Exception:
+                        logger.exception("Revalidating %s failed", view_name)
+
+                if entry is not None:
+                    data, fresh_until = entry
+                    if time.time() < fresh_until:
+                        stats.incr('hits')
+                    else:
+                        stats.incr('stale')
+                        if not flights.in_flight(flight):
+                            _run_in_background(revalidate)
+                    return Response(data)
+
+                stats.incr('misses')
+                response, joined = flights.do(flight, compute)
+                if joined:
+                    stats.incr('coalesced')
+                    return Response(response.data, status=response.status_code)
+                return response
+        return wrapper
+    return decorator
+
+
+def backend_stats(cache):
+    if hasattr(cache, 'stats'):
+        return cache.stats()
+    return {'backend': type(cache).__name__}
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def cache_stats(request):
+    """Counters of every configured cache and of each ``cache_per_user`` view"""
+    return Response({
+        'caches': {alias: backend_stats(caches[alias]) for alias in settings.CACHES},
+        'views': {view_name: stats.snapshot() for view_name, stats in view_stats.items()},
+    })
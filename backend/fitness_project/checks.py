@@ -0,0 +1,51 @@
+"""
+System checks for caches that every worker process has to share.
+
+Per-process caches (see ``fitness_project.cache.backends.is_process_local``)
+are fine with one worker; with more, state written by one worker is never
+seen by the others.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.core.checks import Error, register
+
+from fitness_project.cache.backends import is_process_local
+
+
+def shared_cache_errors(setting, alias, consequence, id):
+    """``[Error]`` if cache ``alias`` is per process while ``WORKER_PROCESSES`` > 1"""
+    workers = getattr(settings, 'WORKER_PROCESSES', 1)
+    if workers > 1 and is_process_local(caches[alias]):
+        return [Error(
+            f'{setting} is {alias!r}, a per-process cache, but WORKER_PROCESSES is {workers}: {consequence}.',
+            hint='Point it at a shared cache (FileCache or RespCache) in settings.CACHES.',
+            id=id,
+        )]
+    return []
+
+
+@register()
+def check_replica_sticky_cache_shared(app_configs, **kwargs):
+    if not getattr(settings, 'DATABASE_REPLICAS', []):
+        return []
+    return shared_cache_errors(
+        'REPLICA_STICKY_CACHE_ALIAS', getattr(settings, 'REPLICA_STICKY_CACHE_ALIAS', 'default'),
+        'a user who wrote through one worker can read stale replica data through another',
+        'fitness_project.E001',
+    )
+
+
+@register()
+def check_api_caches_shared(app_configs, **kwargs):
+    return [
+        *shared_cache_errors(
+            'API_CACHE_ALIAS', getattr(settings, 'API_CACHE_ALIAS', 'default'),
+            'a change made through one worker does not invalidate the responses the others cached',
+            'fitness_project.E002',
+        ),
+        *shared_cache_errors(
+            'IDEMPOTENCY_CACHE_ALIAS', getattr(settings, 'IDEMPOTENCY_CACHE_ALIAS', 'default'),
+            'a retry that reaches another worker runs the request again',
+            'fitness_project.E003',
+        ),
+    ]
@@ -0,0 +1,165 @@
+"""
+Database routers.
+
+``ShardRouter`` places sharded models on their user's shard; see
+``fitness_project.db.sharding``. It comes first and leaves every other
+model, and every model while only one shard is configured, to the next
+router.
+
+``ReplicaRouter`` sends writes to ``default`` and reads of authenticated
+requests to one of ``settings.DATABASE_REPLICAS``. After a user writes, their
+reads stay on ``default`` for ``REPLICA_STICKY_SECONDS`` (recorded in the
+``REPLICA_STICKY_CACHE_ALIAS`` cache, which ``check`` requires to be shared
+when there are several worker processes) to give read-your-writes
+consistency while the replicas catch up. Reads also stay on ``default``:
+
+- inside ``atomic()`` blocks on the primary;
+- for related objects of an instance loaded from the primary;
+- outside a request (management commands, workers) or before the user is
+  known, e.g. while the JWT user itself is being loaded.
+
+Locally a replica is a SQLite copy of the primary kept up to date with
+``python manage.py sync_replicas``.
+"""
+import random
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.functional import SimpleLazyObject, empty
+
+from fitness_project.db.sharding import get_shards, is_sharded, pinned_user_id, shard_for_user
+from fitness_project.request_logging import get_context
+
+
+def get_sticky_cache():
+    return caches[getattr(settings, 'REPLICA_STICKY_CACHE_ALIAS', 'default')]
+
+
+def _sticky_key(user_id):
+    return f'db:sticky:{user_id}'
+
+
+def _request_user(request):
+    """The authenticated user of ``request``, without triggering authentication"""
+    user = getattr(request, 'user', None)
+    if isinstance(user, SimpleLazyObject):
+        # Evaluating AuthenticationMiddleware's lazy user would query the
+        # database from inside the router
+        if user._wrapped is empty:
+            return None
+        user = user._wrapped
+    if user is None or not user.is_authenticated:
+        return None
+    return user
+
+
+def _current_request():
+    context = get_context()
+    return context.request if context is not None else None
+
+
+class ShardRouter:
+    """Route sharded models to the shard of the user who owns them"""
+
+    def _db_for_model(self, model, **hints):
+        # Unsharded, everything (including replica reads) is ReplicaRouter's
+        if not is_sharded(model) or len(get_shards()) == 1:
+            return None
+
+        instance = hints.get('instance')
+        if instance is not None:
+            if isinstance(instance, get_user_model()):
+                # Reverse relations, e.g. user.workout_sessions
+                return shard_for_user(instance.pk)
+            if is_sharded(type(instance)):
+                if instance._state.db is not None:
+                    return instance._state.db
+                if getattr(instance, 'user_id', None) is not None:
+                    return shard_for_user(instance.user_id)
+                # e.g. a new ExerciseSet whose session was loaded from a shard
+                for parent in instance._state.fields_cache.values():
+                    if parent is not None and is_sharded(type(parent)) and parent._state.db is not None:
+                        return parent._state.db
+
+        user_id = pinned_user_id()
+        if user_id is None:
+            user = _request_user(_current_request())
+            user_id = user.pk if user is not None else None
+        if user_id is not None:
+            return shard_for_user(user_id)
+        return None
+
+    db_for_read = _db_for_model
+    db_for_write = _db_for_model
+
+    def allow_relation(self, obj1, obj2, **hints):
+        sharded1, sharded2 = is_sharded(type(obj1)), is_sharded(type(obj2))
+        if sharded1 and sharded2:
+            return obj1._state.db == obj2._state.db
+        if sharded1 or sharded2:
+            # Shard rows point at global rows on default
+            return True
+        return None
+
+
+class ReplicaRouter:
+    """Primary for writes, replicas for reads, sticky to the primary after a write"""
+
+    @property
+    def replicas(self):
+        return getattr(settings, 'DATABASE_REPLICAS', [])
+
+    def db_for_read(self, model, **hints):
+        replicas = self.replicas
+        if not replicas or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db == DEFAULT_DB_ALIAS:
+            return DEFAULT_DB_ALIAS
+
+        request = _current_request()
+        user = _request_user(request)
+        if user is None:
+            return DEFAULT_DB_ALIAS
+
+        # Decided once per request, unless the request itself writes
+        alias = getattr(request, 'read_db_alias', None)
+        if alias is None:
+            sticky = get_sticky_cache().get(_sticky_key(user.pk)) is not None
+            alias = DEFAULT_DB_ALIAS if sticky else random.choice(replicas)
+            request.read_db_alias = alias
+        return alias
+
+    def _mark_written(self, user_id):
+        get_sticky_cache().set(_sticky_key(user_id), 1, getattr(settings, 'REPLICA_STICKY_SECONDS', 10))
+
+    def db_for_write(self, model, **hints):
+        if not self.replicas:
+            return DEFAULT_DB_ALIAS
+        request = _current_request()
+        user = _request_user(request)
+        if user is not None:
+            if not getattr(request, 'db_written', False):
+                request.db_written = True
+                request.read_db_alias = DEFAULT_DB_ALIAS
+                self._mark_written(user.pk)
+        elif request is None:
+            # Background writes on a user's behalf (e.g. AI results)
+            user_id = getattr(hints.get('instance'), 'user_id', None)
+            if user_id is not None:
+                self._mark_written(user_id)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *self.replicas}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema with the data
+        if db in self.replicas:
+            return False
+        return None
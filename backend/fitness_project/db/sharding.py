@@ -0,0 +1,170 @@
+"""
+Per-user sharding of workout, progress and AI records.
+
+Each user's rows of ``SHARDED_MODELS`` live on one database of
+``settings.DATABASE_SHARDS``, chosen by a jump consistent hash of the user id,
+so growing the list only moves about ``1/N`` of the users. Catalog and
+account tables (users, exercises, plans) stay on ``default``; with the
+default ``DATABASE_SHARDS = ['default']`` nothing is sharded.
+
+``ShardRouter`` (``fitness_project.db.routers``) finds the owning user from,
+in order: ``user_shard()`` in background code, the model instance being
+saved or followed (its ``user_id``, its database, or a cached parent's
+database) and the authenticated user of the current request. Queries over
+many users outside a request have to run once per shard with ``.using()``.
+
+Primary keys are unique per shard. Foreign keys from shard rows to global
+rows cannot be enforced by SQLite, so shards other than ``default`` run with
+``PRAGMA foreign_keys = OFF`` (set in their ``OPTIONS['pragmas']``); deleting
+a user purges their shard explicitly, but deleting a global row (an exercise,
+a workout day) does not cascade into other shards.
+"""
+import contextlib
+import contextvars
+import hashlib
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+# Model label -> lookup of the owning user, parents before children
+SHARDED_MODELS = {
+    'workouts.WorkoutSession': 'user',
+    'workouts.ExerciseSet': 'session__user',
+    'progress.CompletedWorkout': 'user',
+    'progress.ProgressEntry': 'user',
+    'progress.WorkoutProgress': 'user',
+    'progress.Goal': 'user',
+    'progress.Analytics': 'user',
+    'ai_engine.AIRequest': 'user',
+    'ai_engine.AIRecommendation': 'user',
+    'ai_engine.AITrainingData': 'user',
+}
+
+_pinned_user = contextvars.ContextVar('shard_user', default=None)
+
+
+def get_shards():
+    return getattr(settings, 'DATABASE_SHARDS', None) or [DEFAULT_DB_ALIAS]
+
+
+def is_sharded(model):
+    return model._meta.label in SHARDED_MODELS
+
+
+def sharded_models():
+    """``(model, owner lookup)`` pairs, parents first"""
+    return [(apps.get_model(label), owner) for label, owner in SHARDED_MODELS.items()]
+
+
+def jump_hash(key, buckets):
+    """Lamping & Veach jump consistent hash of a 64-bit ``key``"""
+    bucket, j = -1, 0
+    while j < buckets:
+        bucket = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_for_user(user_id, shards=None):
+    shards = shards or get_shards()
+    if len(shards) == 1:
+        return shards[0]
+    key = int.from_bytes(hashlib.blake2b(str(user_id).encode(), digest_size=8).digest(), 'little')
+    return shards[jump_hash(key, len(shards))]
+
+
+def pinned_user_id():
+    return _pinned_user.get()
+
+
+@contextlib.contextmanager
+def user_shard(user_id):
+    """Route sharded queries to ``user_id``'s shard, e.g. in commands and workers"""
+    token = _pinned_user.set(user_id)
+    try:
+        yield shard_for_user(user_id)
+    finally:
+        _pinned_user.reset(token)
+
+
+def _delete_user_rows(user_id, alias):
+    # Children first; a physical move, so no delete signals or cascades
+    for model, owner in reversed(sharded_models()):
+        model._base_manager.using(alias).filter(**{owner: user_id})._raw_delete(alias)
+
+
+def _record_move(user_id, target, new_ids):
+    from fitness_project.cache.versions import VERSIONED_APPS, bump_user_version
+    from sync.changes import collections, record_changes
+
+    # Nor save signals: clients drop the old ids and fetch the new ones
+    # (a new id equal to an old one ends up as a change)
+    for name, model, _ in collections():
+        ids = new_ids.get(model)
+        if ids:
+            record_changes(name, [(user_id, old_id) for old_id in ids], deleted=True)
+            record_changes(name, [(user_id, new_id) for new_id in ids.values()])
+
+    for namespace in VERSIONED_APPS:
+        bump_user_version(namespace, user_id, using=target)
+
+
+def move_user(user_id, source, target):
+    """Copy a user's sharded rows from ``source`` to ``target``, then delete them from ``source``.
+
+    Rows get new primary keys from ``target`` (foreign keys between moved rows
+    are remapped); timestamps and every other column are copied as is.
+    ``target`` commits first: if ``source`` then fails to commit, the copies
+    are deleted again, so the rows are never lost or left on both shards.
+    Once both have committed, the sync log gets a deletion for every old id
+    and a change for every new one, and the user's cached responses are
+    invalidated.
+    Returns the number of rows moved per model label.
+    """
+    moved = {}
+    new_ids = {}
+    copied = False
+    try:
+        with transaction.atomic(using=source):
+            with transaction.atomic(using=target):
+                for model, owner in sharded_models():
+                    fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+                    remapped = [
+                        (field, new_ids[field.related_model]) for field in fields
+                        if field.is_relation and field.related_model in new_ids
+                    ]
+                    ids = new_ids[model] = {}
+                    manager = model._base_manager
+                    for obj in manager.using(source).filter(**{owner: user_id}).order_by('pk').iterator():
+                        for field, mapping in remapped:
+                            value = getattr(obj, field.attname)
+                            if value is not None:
+                                setattr(obj, field.attname, mapping.get(value))
+                        # raw=True keeps auto_now/auto_now_add values instead of resetting them
+                        [(new_id,)] = manager.using(target)._insert(
+                            [obj], fields, returning_fields=[model._meta.pk], raw=True, using=target,
+                        )
+                        ids[obj.pk] = new_id
+                    moved[model._meta.label] = len(ids)
+                _delete_user_rows(user_id, source)
+            copied = True
+            # The sync log is on default, which may be neither shard
+            transaction.on_commit(lambda: _record_move(user_id, target, new_ids), using=source)
+    except Exception:
+        if copied:
+            with transaction.atomic(using=target):
+                for model, _ in reversed(sharded_models()):
+                    model._base_manager.using(target).filter(pk__in=new_ids[model].values())._raw_delete(target)
+        raise
+    return moved
+
+
+def purge_user_data(sender, instance, **kwargs):
+    """``post_delete`` receiver for the user model: ``CASCADE`` only reaches ``default``"""
+    shard = shard_for_user(instance.pk)
+    if shard == DEFAULT_DB_ALIAS:
+        return
+    with transaction.atomic(using=shard):
+        _delete_user_rows(instance.pk, shard)
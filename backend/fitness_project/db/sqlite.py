@@ -0,0 +1,139 @@
+"""
+SQLite connection tuning and write serialization.
+
+Stock ``sqlite3`` uses a rollback journal, so one writer blocks every reader,
+and concurrent writers fail with ``database is locked`` once the default
+timeout runs out. Connections opened through the
+``fitness_project.db.sqlite3`` engine are set up by ``configure_connection``
+(a ``connection_created`` receiver) with ``settings.SQLITE_PRAGMAS`` and the
+database's ``OPTIONS['pragmas']``: WAL journaling, so readers never wait for
+the writer, plus ``busy_timeout``, ``mmap_size``, ``cache_size`` and
+``temp_store``.
+
+WAL still allows a single writer per file. Within the process, writes are
+funneled through a FIFO ``WriteQueue`` per database file instead of racing
+for SQLite's lock:
+
+- an ``atomic()`` block begins a deferred transaction (``BEGIN``), so all
+  of its reads see one snapshot, and takes its turn at its first write,
+  keeping it until commit or rollback. Read-only blocks never wait. A write
+  whose snapshot is older than another connection's commit fails with
+  ``database is locked`` instead of overwriting a row the block read before
+  the change (a lost update); retry the whole block;
+- writes in autocommit mode take their turn for that one statement.
+
+Plain reads never touch the queue. A thread holding the turns of several
+databases takes them in ``write_order()`` (shards, then ``default``, since
+shard transactions record sync changes there); a turn taken out of that
+order waits at most ``busy_timeout`` and then fails with ``database is
+locked`` like SQLite, so two such threads cannot deadlock. ``busy_timeout``
+also covers contention with other processes.
+"""
+import collections
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    # Durable at checkpoints; a power loss can drop the last commits but
+    # never corrupts the database
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,  # ms
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -20000,  # negative is KiB, i.e. ~20 MB
+    'temp_store': 'MEMORY',
+}
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'CREATE', 'DROP', 'ALTER')
+
+
+def get_pragmas(connection=None):
+    """Defaults, then ``SQLITE_PRAGMAS``, then the database's ``OPTIONS['pragmas']``"""
+    pragmas = {**DEFAULT_PRAGMAS, **getattr(settings, 'SQLITE_PRAGMAS', {})}
+    if connection is not None:
+        pragmas.update(connection.settings_dict['OPTIONS'].get('pragmas', {}))
+    return pragmas
+
+
+def configure_connection(sender, connection, **kwargs):
+    """``connection_created`` receiver applying ``get_pragmas()``"""
+    with connection.cursor() as cursor:
+        for name, value in get_pragmas(connection).items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def write_order(alias):
+    """Sort key of the order a thread takes write turns in: shards, then ``default``"""
+    return (alias == DEFAULT_DB_ALIAS, alias)
+
+
+def is_write(sql):
+    return sql.lstrip()[:7].upper().startswith(WRITE_STATEMENTS)
+
+
+class WriteQueue:
+    """FIFO lock: writers are served strictly in arrival order"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._busy = False
+        self._waiters = collections.deque()
+        self.writes = 0
+        self.waited = 0
+        self.wait_time = 0.0
+
+    def acquire(self, timeout=None):
+        """Wait for the turn; False if ``timeout`` seconds passed first"""
+        with self._lock:
+            self.writes += 1
+            if not self._busy:
+                self._busy = True
+                return True
+            waiter = threading.Lock()
+            waiter.acquire()
+            self._waiters.append(waiter)
+            self.waited += 1
+        started = time.perf_counter()
+        # Released by the previous holder, which hands its turn straight over
+        acquired = waiter.acquire(timeout=-1 if timeout is None else timeout)
+        self.wait_time += time.perf_counter() - started
+        if not acquired:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    return False
+            # Handed over just after the timeout
+        return True
+
+    def release(self):
+        with self._lock:
+            if self._waiters:
+                self._waiters.popleft().release()
+            else:
+                self._busy = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'writes': self.writes,
+                'waited': self.waited,
+                'queued': len(self._waiters),
+                'wait_time': self.wait_time,
+            }
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_write_queue(name):
+    """The process-wide queue for the database file ``name``"""
+    name = str(name)
+    queue = _queues.get(name)
+    if queue is None:
+        with _queues_lock:
+            queue = _queues.setdefault(name, WriteQueue())
+    return queue
@@ -0,0 +1,97 @@
+"""
+SQLite backend with tuned connections and serialized writes.
+
+Use it as the ``ENGINE`` of a SQLite database; see ``fitness_project.db.sqlite``.
+"""
+import threading
+
+from django.db import OperationalError
+from django.db.backends.signals import connection_created
+from django.db.backends.sqlite3 import base
+
+from fitness_project.db.sqlite import configure_connection, get_pragmas, get_write_queue, is_write, write_order
+
+# Write turns the current thread holds, as write_order() values
+_held = threading.local()
+
+
+def _held_turns():
+    if not hasattr(_held, 'orders'):
+        _held.orders = []
+    return _held.orders
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.write_queue = get_write_queue(self.settings_dict['NAME'])
+        self.write_order = write_order(self.alias)
+        self.holds_write_turn = False
+        self.execute_wrappers.append(self._serialize_write)
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        # Applied by configure_connection, not a sqlite3.connect() argument
+        kwargs.pop('pragmas', None)
+        return kwargs
+
+    def enable_constraint_checking(self):
+        # Schema changes re-enable foreign keys afterwards; keep them off on
+        # databases configured that way (user shards)
+        if str(get_pragmas(self).get('foreign_keys', 'ON')).upper() in ('OFF', '0', 'FALSE'):
+            return
+        super().enable_constraint_checking()
+
+    def _take_write_turn(self):
+        held = _held_turns()
+        if any(order > self.write_order for order in held):
+            # Out of order: the holder of this turn may be waiting for one of
+            # ours, so wait no longer than SQLite itself would
+            timeout = int(get_pragmas(self).get('busy_timeout', 5000)) / 1000
+            if not self.write_queue.acquire(timeout=timeout):
+                raise OperationalError('database is locked')
+        else:
+            self.write_queue.acquire()
+        held.append(self.write_order)
+        self.holds_write_turn = True
+
+    def _give_write_turn(self):
+        if self.holds_write_turn:
+            self.holds_write_turn = False
+            _held_turns().remove(self.write_order)
+            self.write_queue.release()
+
+    def _serialize_write(self, execute, sql, params, many, context):
+        if self.holds_write_turn or not is_write(sql):
+            return execute(sql, params, many, context)
+        if self.in_atomic_block:
+            # atomic() began a deferred transaction, so its reads so far share
+            # one snapshot; its first write takes the turn until commit or
+            # rollback. If another connection committed since that snapshot,
+            # SQLite refuses the write ("database is locked") rather than let
+            # it overwrite a change the block never saw.
+            self._take_write_turn()
+            return execute(sql, params, many, context)
+        # Autocommit write: hold the turn for this statement only
+        self._take_write_turn()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self._give_write_turn()
+
+    def _set_autocommit(self, autocommit):
+        try:
+            super()._set_autocommit(autocommit)
+        finally:
+            # atomic() turns autocommit back on after its commit or rollback
+            if autocommit:
+                self._give_write_turn()
+
+    def _close(self):
+        try:
+            super()._close()
+        finally:
+            self._give_write_turn()
+
+
+connection_created.connect(configure_connection, sender=DatabaseWrapper, dispatch_uid='fitness_project.db.sqlite3')
@@ -0,0 +1,161 @@
+"""
+Sparse fieldsets and explicit expansion of nested relations for read
+responses, selected with two query parameters:
+
+- ``?fields=id,status,exercise_sets.weight_used`` renders only the listed
+  fields; a dotted name selects fields of a nested relation and implies its
+  expansion;
+- ``?expand=workout_day,workout_day.exercises`` embeds the listed nested
+  relations (and, for ``expandable_fields``, replaces a primary key with the
+  related object, as ``?fields=generated_plan.name`` also does).
+
+Without either parameter responses are unchanged: declared nested
+serializers are embedded in full, as existing clients expect. Once either
+parameter is present, only the relations it names are embedded, at every
+level, so ``?expand=exercise_sets`` renders sets without their exercise
+(``?expand=exercise_sets.exercise`` adds it). Unknown names are ignored.
+
+Serializers opt in with ``FieldsetMixin``; the fieldset comes from the
+``request`` in their context (or a ``fieldset`` entry) and only applies to
+output, never to the fields a request body is validated against. Views load
+just the relations that will render with ``with_relations()`` (or
+``FieldsetViewMixin`` for generic views), which derives the
+``prefetch_related`` lookups from the pruned serializer itself.
+"""
+from rest_framework import serializers
+
+_UNSET = object()
+
+
+def _names(value):
+    return [name.strip() for name in value.split(',') if name.strip()] if value else []
+
+
+class Fieldset:
+    """The requested ``fields`` (``None`` for all) and ``expand`` tree of one serializer level"""
+
+    __slots__ = ('fields', 'expand')
+
+    def __init__(self):
+        self.fields = None
+        self.expand = {}
+
+    @classmethod
+    def parse(cls, fields=None, expand=None):
+        root = cls()
+        for path in _names(expand):
+            node = root
+            for name in path.split('.'):
+                node = node.expand.setdefault(name, cls())
+        for path in _names(fields):
+            node = root
+            *parents, name = path.split('.')
+            for parent in parents:
+                node.select(parent)
+                node = node.expand.setdefault(parent, cls())
+            node.select(name)
+        return root
+
+    @classmethod
+    def from_request(cls, request):
+        """The request's fieldset, or ``None`` when it asks for neither parameter"""
+        if request is None:
+            return None
+        params = getattr(request, 'query_params', request.GET)
+        fields, expand = params.get('fields'), params.get('expand')
+        if fields is None and expand is None:
+            return None
+        return cls.parse(fields, expand)
+
+    def select(self, name):
+        if self.fields is None:
+            self.fields = set()
+        self.fields.add(name)
+
+    def includes(self, name):
+        return self.fields is None or name in self.fields or name in self.expand
+
+    def expands(self, name):
+        return name in self.expand or (self.fields is not None and name in self.fields)
+
+    def child(self, name):
+        return self.expand.get(name) or Fieldset()
+
+
+class FieldsetMixin:
+    """Serializer mixin applying the requested ``Fieldset`` to its output fields.
+
+    ``expandable_fields`` maps a field (usually a foreign key rendered as its
+    primary key) to the serializer class that renders the related object
+    when the field is expanded.
+    """
+
+    expandable_fields = {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fieldset = self._requested_fieldset()
+        if fieldset is None:
+            return fields
+
+        for name, field in list(fields.items()):
+            if field.write_only:
+                continue
+            if not fieldset.includes(name):
+                del fields[name]
+                continue
+            if name in self.expandable_fields:
+                # Listed in ?fields= alone, the primary key is what was asked for
+                if name not in fieldset.expand:
+                    continue
+                field = fields[name] = self.expandable_fields[name](read_only=True)
+            elif not isinstance(field, serializers.BaseSerializer):
+                continue
+            elif not fieldset.expands(name):
+                del fields[name]
+                continue
+            nested = field.child if isinstance(field, serializers.ListSerializer) else field
+            nested._fieldset = fieldset.child(name)
+        return fields
+
+    def _requested_fieldset(self):
+        fieldset = getattr(self, '_fieldset', _UNSET)
+        if fieldset is not _UNSET:
+            return fieldset
+        root = self.parent.parent if isinstance(self.parent, serializers.ListSerializer) else self.parent
+        # Nested under a serializer without the mixin: nothing says which level this is
+        if root is not None or hasattr(self.root, 'initial_data'):
+            return None
+        if 'fieldset' in self.context:
+            return self.context['fieldset']
+        return Fieldset.from_request(self.context.get('request'))
+
+
+def _relation_lookups(serializer, prefix=''):
+    for field in serializer.fields.values():
+        if field.write_only or not isinstance(field, serializers.BaseSerializer) or field.source == '*':
+            continue
+        lookup = prefix + '__'.join(field.source_attrs)
+        nested = field.child if isinstance(field, serializers.ListSerializer) else field
+        lookups = list(_relation_lookups(nested, lookup + '__'))
+        yield from lookups or [lookup]
+
+
+def relation_lookups(serializer_class, request):
+    """The related-object lookups ``serializer_class`` renders for ``request``"""
+    return list(_relation_lookups(serializer_class(context={'request': request})))
+
+
+def with_relations(queryset, serializer_class, request):
+    """``queryset`` prefetching the relations ``serializer_class`` renders for ``request``"""
+    lookups = relation_lookups(serializer_class, request)
+    return queryset.prefetch_related(*lookups) if lookups else queryset
+
+
+class FieldsetViewMixin:
+    """Generic view mixin prefetching the relations its serializer renders for the request"""
+
+    # Not get_queryset(), which views override to scope rows to the user;
+    # list() and get_object() both pass their queryset through here
+    def filter_queryset(self, queryset):
+        return with_relations(super().filter_queryset(queryset), self.get_serializer_class(), self.request)
@@ -0,0 +1,109 @@
+"""
+``Idempotency-Key`` support for write endpoints that clients retry.
+
+``idempotent`` wraps a DRF view (a function view, below ``@api_view``, or a
+view method through ``method_decorator``). A request that carries an
+``Idempotency-Key`` header runs the view once. Its response status and data
+are stored for ``IDEMPOTENCY_KEY_TTL`` seconds under (user, key), and a
+retry with the same key gets the stored response back, marked
+``Idempotent-Replayed: true``, without running the view or touching the
+database. Requests without the header are not affected. The data is stored
+through ``renderers.typed``, so a replay renders MessagePack and CBOR with
+the same types as the original response.
+
+- A retry that arrives while the first request is still running gets a 409.
+- Reusing a key for a different method, path or body gets a 422.
+- Server errors (5xx) are not stored, so the client can retry them.
+
+Entries live in the ``IDEMPOTENCY_CACHE_ALIAS`` cache. Like the token
+blacklist, it has to be shared between worker processes (FileCache,
+RespCache) to catch a retry that reaches another process.
+"""
+import functools
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http.request import RawPostDataException
+from rest_framework import status
+from rest_framework.response import Response
+
+from fitness_project.renderers import dumps, typed
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+_PENDING = 'pending'
+_DONE = 'done'
+
+
+def get_idempotency_cache():
+    return caches[getattr(settings, 'IDEMPOTENCY_CACHE_ALIAS', 'default')]
+
+
+def entry_key(user_id, key):
+    digest = hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+    return f'idempotency:{user_id}:{digest}'
+
+
+def fingerprint(request):
+    """Digest of what makes a retry the same request: method, path and body"""
+    try:
+        body = request.body
+    except RawPostDataException:
+        # The view's parser already consumed the stream
+        body = dumps(request.data)
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (request.method.encode(), request.path.encode(), body):
+        digest.update(part)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _error(message, code):
+    return Response({'error': message}, status=code)
+
+
+def idempotent(view):
+    """Replay the stored response for a repeated ``Idempotency-Key``"""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view(request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return _error(f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters', status.HTTP_400_BAD_REQUEST)
+
+        cache = get_idempotency_cache()
+        cache_key = entry_key(request.user.pk, key)
+        request_fingerprint = fingerprint(request)
+        lock_timeout = getattr(settings, 'IDEMPOTENCY_LOCK_TIMEOUT', 60)
+
+        if not cache.add(cache_key, (_PENDING, request_fingerprint), lock_timeout):
+            entry = cache.get(cache_key)
+            if entry is None:
+                # Expired between add() and get(); treat it as in progress
+                entry = (_PENDING, request_fingerprint)
+            if entry[1] != request_fingerprint:
+                return _error(f'{HEADER} was already used for a different request',
+                              status.HTTP_422_UNPROCESSABLE_ENTITY)
+            if entry[0] == _PENDING:
+                return _error(f'A request with this {HEADER} is still being processed', status.HTTP_409_CONFLICT)
+            _, _, code, data = entry
+            response = Response(data, status=code)
+            response['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = view(request, *args, **kwargs)
+        except BaseException:
+            cache.delete(cache_key)
+            raise
+        if response.status_code >= 500:
+            cache.delete(cache_key)
+        else:
+            ttl = getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+            cache.set(cache_key, (_DONE, request_fingerprint, response.status_code, typed(response.data)), ttl)
+        return response
+
+    return wrapper
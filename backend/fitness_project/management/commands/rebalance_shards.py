@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from fitness_project.db.sharding import get_shards, move_user, shard_for_user, sharded_models
+
+
+class Command(BaseCommand):
+    help = 'Move every user whose sharded rows are not on shard_for_user() to that shard'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report the users that would move')
+
+    def users_on(self, alias):
+        user_ids = set()
+        for model, owner in sharded_models():
+            if owner == 'user':
+                user_ids.update(model._base_manager.using(alias).values_list('user_id', flat=True).distinct())
+        return user_ids
+
+    def handle(self, *args, **options):
+        shards = get_shards()
+        moves = [
+            (user_id, source, shard_for_user(user_id, shards))
+            for source in shards
+            for user_id in sorted(self.users_on(source))
+            if shard_for_user(user_id, shards) != source
+        ]
+        self.stdout.write(f"{len(moves)} user(s) to move across {len(shards)} shard(s)")
+
+        for user_id, source, target in moves:
+            if options['dry_run']:
+                self.stdout.write(f"  user {user_id}: {source} -> {target}")
+                continue
+            moved = move_user(user_id, source, target)
+            self.stdout.write(f"  user {user_id}: {source} -> {target} ({sum(moved.values())} rows)")
+
+        if moves and not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS('Rebalance complete'))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from fitness_project.cache.resp import RespServer
+
+
+class Command(BaseCommand):
+    help = 'Run an in-memory Redis-protocol stand-in for the RespCache backend'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=6379)
+        parser.add_argument(
+            '--max-keys', type=int, default=0,
+            help='Evict least recently used keys beyond this many (0 = unbounded)',
+        )
+
+    def handle(self, *args, **options):
+        server = RespServer((options['host'], options['port']), max_keys=options['max_keys'])
+        self.stdout.write(f"Serving on {options['host']}:{options['port']}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,44 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database into every alias in DATABASE_REPLICAS'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Keep copying every INTERVAL seconds (simulates replication lag)',
+        )
+
+    def handle(self, *args, **options):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        if not replicas:
+            raise CommandError('DATABASE_REPLICAS is empty')
+        for alias in [DEFAULT_DB_ALIAS, *replicas]:
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError(f"'{alias}' is not a SQLite database; use the database's own replication")
+
+        while True:
+            started = time.perf_counter()
+            for alias in replicas:
+                self.copy(alias)
+            self.stdout.write(f"Synced {len(replicas)} replica(s) in {time.perf_counter() - started:.3f}s")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def copy(self, alias):
+        primary = connections[DEFAULT_DB_ALIAS]
+        primary.ensure_connection()
+        # The backup API copies a consistent snapshot and takes the replica's
+        # write lock, so readers of the replica never see a partial copy
+        replica = sqlite3.connect(str(connections[alias].settings_dict['NAME']))
+        try:
+            primary.connection.backup(replica)
+        finally:
+            replica.close()
@@ -0,0 +1,20 @@
+"""
+Content negotiation for the optional MessagePack and CBOR formats: while
+msgpack or cbor2 is not installed, their renderers and parsers are skipped
+as if they were not configured (406 / 415 instead of a server error).
+"""
+from rest_framework.negotiation import DefaultContentNegotiation
+
+
+def _available(classes):
+    return [item for item in classes if getattr(item, 'available', True)]
+
+
+class ContentNegotiation(DefaultContentNegotiation):
+    """DRF's negotiation, ignoring renderers and parsers whose optional library is not installed"""
+
+    def select_parser(self, request, parsers):
+        return super().select_parser(request, _available(parsers))
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return super().select_renderer(request, _available(renderers), format_suffix)
@@ -0,0 +1,67 @@
+"""
+Request parsers matching ``fitness_project.renderers``: JSON with orjson
+(falling back to DRF's ``JSONParser`` without it or for bodies not encoded
+as UTF-8), MessagePack and CBOR. Timestamps in binary bodies arrive as aware
+``datetime`` objects and decimals as numbers, both of which DRF's
+``DateTimeField`` and ``DecimalField`` accept.
+"""
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+
+from fitness_project.renderers import CBORRenderer, FastJSONRenderer, MessagePackRenderer
+
+try:
+    import orjson
+except ImportError:  # pure-Python fallback
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+
+class FastJSONParser(JSONParser):
+    """``JSONParser`` using orjson, which also rejects ``NaN`` like ``STRICT_JSON``"""
+
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+class MessagePackParser(BaseParser):
+    media_type = 'application/msgpack'
+    renderer_class = MessagePackRenderer
+    available = msgpack is not None
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), timestamp=3)
+        except ValueError as exc:
+            raise ParseError('MessagePack parse error - %s' % str(exc))
+
+
+class CBORParser(BaseParser):
+    media_type = 'application/cbor'
+    renderer_class = CBORRenderer
+    available = cbor2 is not None
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return cbor2.loads(stream.read())
+        except (ValueError, cbor2.CBORDecodeError) as exc:
+            raise ParseError('CBOR parse error - %s' % str(exc))
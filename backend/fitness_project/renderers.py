@@ -0,0 +1,276 @@
+"""
+API renderers: orjson for JSON, plus MessagePack and CBOR for clients that
+ask for them with ``Accept: application/msgpack`` or ``application/cbor``
+(or ``?format=msgpack|cbor``).
+
+``FastJSONRenderer`` produces the same bytes as DRF's compact
+``JSONRenderer`` (decimals as numbers, ``Z`` for UTC datetimes, ``\\u2028``
+and ``\\u2029`` escaped), encoding ``datetime``, ``date`` and ``UUID`` in C
+and everything else DRF knows (``Decimal``, lazy strings, querysets) through
+DRF's ``JSONEncoder.default``. Without orjson installed, or for output it
+cannot produce (indented responses for the browsable API, integers beyond
+64 bits), rendering falls back to DRF's stdlib implementation. One
+difference: orjson writes ``NaN`` and infinities as ``null`` where the
+stdlib renderer raises.
+
+The binary renderers encode decimals and timestamps natively rather than as
+the strings serializers produce for JSON: ``native_values()`` uses the
+serializer attached to ``serializer.data`` to turn ``DecimalField`` and
+``DateTimeField`` output back into ``Decimal`` and ``datetime``. Data that
+is cached or stored to be rendered again has to go through ``typed()``
+first, since pickling drops the serializer. MessagePack
+then writes whole decimals as integers, others as float64, and datetimes as
+its timestamp extension type; CBOR writes decimal fractions (tag 4) and
+epoch timestamps (tag 1). Calendar dates stay ISO strings, as do naive
+datetimes.
+
+msgpack and cbor2 are optional; ``ContentNegotiation`` skips the renderers
+and parsers whose library is missing (see ``available``).
+"""
+import datetime
+import decimal
+
+from rest_framework import serializers
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pure-Python fallback
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+_encoder = JSONEncoder()
+_stdlib_renderer = JSONRenderer()
+
+if orjson is not None:
+    OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+
+
+def dumps(data):
+    """Encode ``data`` as compact UTF-8 JSON bytes, like ``FastJSONRenderer``"""
+    if orjson is not None:
+        try:
+            ret = orjson.dumps(data, default=_encoder.default, option=OPTIONS)
+        except TypeError:
+            # orjson.JSONEncodeError; the stdlib encoder may still manage
+            pass
+        else:
+            if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+                ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+            return ret
+    return _stdlib_renderer.render(data)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """``JSONRenderer`` using orjson for compact output"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (orjson is None or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+DECIMAL = 'decimal'
+DATETIME = 'datetime'
+
+
+def field_types(serializer):
+    """``{field name: DECIMAL, DATETIME or (many, nested field types)}`` for ``serializer``'s output
+
+    Only the fields the binary renderers re-type are listed. The result is
+    plain data, so unlike the serializer it survives pickling (see ``typed``).
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    if not isinstance(serializer, serializers.Serializer):
+        return {}
+    types = {}
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if isinstance(field, serializers.DecimalField):
+            types[name] = DECIMAL
+        elif isinstance(field, serializers.DateTimeField):
+            types[name] = DATETIME
+        elif isinstance(field, serializers.BaseSerializer):
+            nested = field_types(field)
+            if nested:
+                types[name] = (isinstance(field, serializers.ListSerializer), nested)
+    return types
+
+
+def _to_decimal(value):
+    return decimal.Decimal(value) if isinstance(value, str) else value
+
+
+def _to_compact_number(value):
+    """Decimal string to an int when whole, else a float (exact for DecimalField's digit counts)"""
+    if isinstance(value, str):
+        number = float(value)
+        return int(number) if number.is_integer() else number
+    return value
+
+
+def _to_datetime(value):
+    if isinstance(value, str):
+        try:
+            parsed = datetime.datetime.fromisoformat(value)
+        except ValueError:
+            return value
+        # Naive values have no instant to encode as a timestamp
+        if parsed.tzinfo is not None:
+            return parsed
+    return value
+
+
+def _plan(types, to_number):
+    """``[(field name, converter)]`` applying ``field_types()`` output"""
+    plan = []
+    for name, kind in types.items():
+        if kind == DECIMAL:
+            plan.append((name, to_number))
+        elif kind == DATETIME:
+            plan.append((name, _to_datetime))
+        else:
+            many, nested = kind
+            plan.append((name, _Converter(nested, many, to_number)))
+    return plan
+
+
+class _Converter:
+    """Applies field types to serializer output, planned once per rendering"""
+
+    def __init__(self, types, many, to_number):
+        self.many = many
+        self.plan = _plan(types, to_number)
+
+    def __call__(self, value):
+        if value is None or not self.plan:
+            return value
+
+        def convert(item):
+            if not isinstance(item, dict):
+                return item
+            # A copy: the same data may still be rendered as JSON for another request
+            item = dict(item)
+            for name, to_native in self.plan:
+                if name in item:
+                    item[name] = to_native(item[name])
+            return item
+
+        if self.many:
+            return [convert(item) for item in value]
+        return convert(value)
+
+
+class TypedList(list):
+    """Serializer output (``many=True``) that keeps its ``field_types`` when pickled"""
+
+    def __init__(self, data, field_types):
+        super().__init__(data)
+        self.field_types = field_types
+
+    def __reduce__(self):
+        return TypedList, (list(self), self.field_types)
+
+
+class TypedDict(dict):
+    """Serializer output that keeps its ``field_types`` when pickled"""
+
+    def __init__(self, data, field_types):
+        super().__init__(data)
+        self.field_types = field_types
+
+    def __reduce__(self):
+        return TypedDict, (dict(self), self.field_types)
+
+
+def typed(data):
+    """Return ``data`` with each serializer's output replaced by a ``TypedList`` or ``TypedDict``.
+
+    DRF drops ``.serializer`` when its output is pickled; use this on data
+    that is cached or stored and rendered again later, so ``native_values()``
+    types it the same way.
+    """
+    serializer = getattr(data, 'serializer', None)
+    if serializer is not None:
+        if isinstance(data, list):
+            return TypedList(data, field_types(serializer))
+        return TypedDict(data, field_types(serializer))
+    if hasattr(data, 'field_types'):
+        return data
+    if isinstance(data, dict):
+        return {key: typed(value) for key, value in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [typed(item) for item in data]
+    return data
+
+
+def native_values(data, to_number=_to_decimal):
+    """Return ``data`` with serializer-produced decimal and datetime strings made native again.
+
+    Decimals become ``to_number(string)``, ``Decimal`` by default.
+    """
+    serializer = getattr(data, 'serializer', None)
+    if serializer is not None:
+        return _Converter(field_types(serializer), isinstance(data, list), to_number)(data)
+    types = getattr(data, 'field_types', None)
+    if types is not None:
+        return _Converter(types, isinstance(data, list), to_number)(data)
+    if isinstance(data, dict):
+        return {key: native_values(value, to_number) for key, value in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [native_values(item, to_number) for item in data]
+    return data
+
+
+def _compact_default(obj):
+    if isinstance(obj, decimal.Decimal):
+        return int(obj) if obj == obj.to_integral_value() else float(obj)
+    if isinstance(obj, datetime.date) and not isinstance(obj, datetime.datetime):
+        return obj.isoformat()
+    return _encoder.default(obj)
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    available = msgpack is not None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(native_values(data, _to_compact_number), default=_compact_default, datetime=True)
+
+
+def _cbor_default(encoder, obj):
+    encoder.encode(_encoder.default(obj))
+
+
+class CBORRenderer(BaseRenderer):
+    media_type = 'application/cbor'
+    format = 'cbor'
+    charset = None
+    render_style = 'binary'
+    available = cbor2 is not None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return cbor2.dumps(native_values(data), default=_cbor_default, datetime_as_timestamp=True,
+                           timezone=datetime.timezone.utc)
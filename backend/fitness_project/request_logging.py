@@ -0,0 +1,248 @@
+"""
+Request-scoped, lazy logging helpers.
+
+Views keep using the standard ``logging`` module with %-style arguments.
+This module supplies the pieces that make those calls cheap and useful:
+
+- ``RequestContextMiddleware`` binds a request id, the resolved route and the
+  request (for the authenticated user id) to the current context.
+- ``RequestContextFilter`` copies that context onto every log record.
+- ``payload()`` and ``headers()`` wrap request/response bodies so they are only
+  rendered when a handler actually emits the record, only for sampled
+  requests, with secrets redacted and output truncated.
+- ``StructuredFormatter`` renders records as one JSON object per line.
+
+Configured through ``settings.REQUEST_LOGGING``.
+"""
+import contextvars
+import json
+import logging
+import random
+import uuid
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+DEFAULTS = {
+    # Fraction of requests whose payloads are rendered in the logs
+    'PAYLOAD_SAMPLE_RATE': 1.0,
+    # Rendered payloads are truncated to this many characters
+    'PAYLOAD_MAX_CHARS': 2048,
+    'REQUEST_ID_HEADER': 'X-Request-ID',
+    'REDACTED_HEADERS': ['authorization', 'cookie'],
+    'REDACTED_FIELDS': ['password', 'confirm_password', 'id_token', 'access', 'refresh', 'tokens'],
+}
+
+_current = contextvars.ContextVar('request_logging_context', default=None)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'REQUEST_LOGGING', {})}
+
+
+class RequestContext:
+    """Per-request logging context"""
+    __slots__ = ('request_id', 'request', 'route', 'sampled')
+
+    def __init__(self, request_id, request=None, route=None, sampled=True):
+        self.request_id = request_id
+        self.request = request
+        self.route = route
+        self.sampled = sampled
+
+    @property
+    def user_id(self):
+        # DRF authenticates inside the view and writes the user back onto the
+        # underlying HttpRequest, so this is read when the record is emitted
+        user = getattr(self.request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return user.pk
+        return None
+
+
+def get_context():
+    return _current.get()
+
+
+def bind_context(context):
+    """Bind a context for code running outside a request (commands, workers)"""
+    return _current.set(context)
+
+
+def unbind_context(token):
+    _current.reset(token)
+
+
+class RequestContextMiddleware:
+    """Bind request id, route and user to the logging context of each request"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            # Under ASGI stay on the event loop so async views are not pushed
+            # onto a thread
+            markcoroutinefunction(self)
+
+    def _bind(self, request):
+        config = get_config()
+        header = config['REQUEST_ID_HEADER']
+        request_id = request.headers.get(header) or uuid.uuid4().hex
+        sampled = random.random() < config['PAYLOAD_SAMPLE_RATE']
+        request.request_id = request_id
+        return header, _current.set(RequestContext(request_id, request, request.path, sampled))
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        header, token = self._bind(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        response[header] = request.request_id
+        return response
+
+    async def __acall__(self, request):
+        header, token = self._bind(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        response[header] = request.request_id
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        context = _current.get()
+        if context is not None and request.resolver_match is not None:
+            context.route = request.resolver_match.route
+        return None
+
+
+class RequestContextFilter(logging.Filter):
+    """Attach the current request context to every log record"""
+
+    def filter(self, record):
+        context = _current.get()
+        if context is None:
+            record.request_id = '-'
+            record.user_id = None
+            record.route = '-'
+        else:
+            record.request_id = context.request_id
+            record.user_id = context.user_id
+            record.route = context.route
+        return True
+
+
+def _render(value, redacted, parts, budget):
+    """Append a repr of ``value`` to ``parts``, stopping once ``budget`` chars are used"""
+    if isinstance(value, dict):
+        parts.append('{')
+        budget -= 1
+        for index, (key, item) in enumerate(value.items()):
+            if budget <= 0:
+                break
+            text = f"{', ' if index else ''}{key!r}: "
+            parts.append(text)
+            budget -= len(text)
+            if key in redacted:
+                parts.append("'***'")
+                budget -= 5
+            else:
+                budget = _render(item, redacted, parts, budget)
+        parts.append('}')
+        return budget - 1
+    if isinstance(value, (list, tuple)):
+        parts.append('[')
+        budget -= 1
+        for index, item in enumerate(value):
+            if budget <= 0:
+                break
+            if index:
+                parts.append(', ')
+                budget -= 2
+            budget = _render(item, redacted, parts, budget)
+        parts.append(']')
+        return budget - 1
+    text = repr(value)
+    parts.append(text)
+    return budget - len(text)
+
+
+class LazyPayload:
+    """Defers rendering of a payload until a handler formats the record"""
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def render(self, config, limit):
+        parts = []
+        _render(self.value, set(config['REDACTED_FIELDS']), parts, limit + 1)
+        return ''.join(parts)
+
+    def __str__(self):
+        context = _current.get()
+        if context is not None and not context.sampled:
+            return '<unsampled>'
+        config = get_config()
+        limit = config['PAYLOAD_MAX_CHARS']
+        text = self.render(config, limit)
+        if len(text) > limit:
+            text = f"{text[:limit]}...<truncated>"
+        return text
+
+    __repr__ = __str__
+
+
+class LazyHeaders(LazyPayload):
+    __slots__ = ()
+
+    def render(self, config, limit):
+        redacted = set(config['REDACTED_HEADERS'])
+        return str({
+            key: '***' if key.lower() in redacted else value
+            for key, value in self.value.headers.items()
+        })
+
+
+def payload(value):
+    """Wrap request/response data for logging as a %-style argument"""
+    return LazyPayload(value)
+
+
+def headers(request):
+    """Wrap request headers for logging as a %-style argument"""
+    return LazyHeaders(request)
+
+
+def fields(**values):
+    """Structured fields for ``extra=``, e.g. ``logger.info('Saved', extra=fields(set_id=1))``"""
+    return {'fields': values}
+
+
+class StructuredFormatter(logging.Formatter):
+    """Format records as single-line JSON including the request context"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', '-'),
+            'user_id': getattr(record, 'user_id', None),
+            'route': getattr(record, 'route', '-'),
+        }
+        extra = getattr(record, 'fields', None)
+        if extra:
+            entry['fields'] = {
+                key: str(value) if isinstance(value, LazyPayload) else value
+                for key, value in extra.items()
+            }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from corsheaders.defaults import default_headers
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -46,14 +49,17 @@ INSTALLED_APPS = [
     'django_extensions',
     
     # Local apps
+    'fitness_project',
     'users',
     'workouts',
     'progress',
     'ai_engine',
+    'sync',
 ]
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'fitness_project.request_logging.RequestContextMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -88,11 +94,78 @@ WSGI_APPLICATION = 'fitness_project.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # django.db.backends.sqlite3 with WAL, tuned pragmas and an in-process
+        # write queue (see fitness_project/db/sqlite.py)
+        'ENGINE': 'fitness_project.db.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
     }
 }
 
+# Overrides for fitness_project.db.sqlite.DEFAULT_PRAGMAS
+SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,
+}
+
+# Read replicas (fitness_project/db/routers.py). Locally, add SQLite copies of
+# the primary and refresh them with `python manage.py sync_replicas --interval 5`:
+#   DATABASES['replica1'] = {**DATABASES['default'], 'NAME': BASE_DIR / 'db.replica1.sqlite3',
+#                            'TEST': {'MIRROR': 'default'}}
+#   DATABASE_REPLICAS = ['replica1']
+DATABASE_REPLICAS = []
+# Reads stay on the primary this long after a user's last write, recorded in
+# this cache; with several worker processes it must be a shared backend
+REPLICA_STICKY_SECONDS = 10
+REPLICA_STICKY_CACHE_ALIAS = 'default'
+
+# User shards for workout, progress and AI records (fitness_project/db/sharding.py).
+# Shards other than default cannot enforce foreign keys to users on default:
+#   DATABASES['shard1'] = {**DATABASES['default'], 'NAME': BASE_DIR / 'db.shard1.sqlite3',
+#                          'OPTIONS': {'pragmas': {'foreign_keys': 'OFF'}}}
+#   DATABASE_SHARDS = ['default', 'shard1']
+# then run `python manage.py migrate --database=shard1` and `python manage.py rebalance_shards`.
+DATABASE_SHARDS = ['default']
+
+DATABASE_ROUTERS = [
+    'fitness_project.db.routers.ShardRouter',
+    'fitness_project.db.routers.ReplicaRouter',
+]
+
+# Cache (fitness_project/cache). The LRU cache is per process; with several
+# worker processes use a shared backend so invalidations reach all of them:
+#   'BACKEND': 'fitness_project.cache.backends.FileCache', 'LOCATION': BASE_DIR / 'cache'
+#   'BACKEND': 'fitness_project.cache.backends.RespCache', 'LOCATION': '127.0.0.1:6379/0'
+# (`python manage.py resp_cache_server` runs a local stand-in for Redis).
+CACHES = {
+    'default': {
+        'BACKEND': 'fitness_project.cache.backends.LRUCache',
+        'LOCATION': 'default',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'MAX_BYTES': 64 * 1024 * 1024,
+        },
+    },
+}
+
+# Responses of views wrapped with cache_per_user live this many seconds at
+# most; model changes invalidate them immediately, in every worker process
+# only if the alias is a shared backend (`check` fails otherwise)
+API_CACHE_ALIAS = 'default'
+API_CACHE_TIMEOUT = 300
+
+# Sub-requests accepted by POST /api/batch/ (fitness_project/batch.py)
+BATCH_MAX_REQUESTS = 50
+
+# Changes, or snapshot objects, returned per /api/sync/changes/ response (sync/views.py)
+SYNC_PAGE_SIZE = 500
+
+# Responses to requests with an Idempotency-Key header are replayed for this
+# long (fitness_project/idempotency.py); `check` fails unless it is a shared
+# cache with several worker processes
+IDEMPOTENCY_CACHE_ALIAS = 'default'
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+# A retry arriving sooner while the first request still runs gets a 409
+IDEMPOTENCY_LOCK_TIMEOUT = 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -141,7 +214,7 @@ AUTH_USER_MODEL = 'users.User'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -151,6 +224,24 @@ REST_FRAMEWORK = {
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
+    # orjson-backed JSON (fitness_project/renderers.py); same output as DRF's,
+    # falling back to it when orjson is not installed. MessagePack and CBOR
+    # are served on Accept: application/msgpack / application/cbor when
+    # msgpack / cbor2 are installed
+    'DEFAULT_RENDERER_CLASSES': (
+        'fitness_project.renderers.FastJSONRenderer',
+        'fitness_project.renderers.MessagePackRenderer',
+        'fitness_project.renderers.CBORRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'fitness_project.parsers.FastJSONParser',
+        'fitness_project.parsers.MessagePackParser',
+        'fitness_project.parsers.CBORParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS': 'fitness_project.negotiation.ContentNegotiation',
 }
 
 # JWT Settings
@@ -160,11 +251,175 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
+    # Tokens carry a hash of the password so a password change revokes them
+    'CHECK_REVOKE_TOKEN': True,
+}
+
+# Worker processes serving the API (gunicorn and uvicorn read WEB_CONCURRENCY).
+# With more than one, `check` fails if the token blacklist is kept per process.
+WORKER_PROCESSES = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+# Rotated refresh tokens are blacklisted by JTI until they expire, in memory.
+# With several worker processes use users.token_blacklist.CacheTokenBlacklist
+# with OPTIONS {'alias': 'token_blacklist'} and a CACHES entry of that name on
+# a shared backend that never evicts live keys (a RespCache on a server without
+# max_keys, or a FileCache with a MAX_ENTRIES above the rotations per
+# REFRESH_TOKEN_LIFETIME); `check` fails if the alias is also used elsewhere.
+TOKEN_BLACKLIST = {
+    'BACKEND': 'users.token_blacklist.InMemoryTokenBlacklist',
+    'OPTIONS': {
+        'buckets': 24,
+        'bucket_capacity': 50000,
+        'error_rate': 0.01,
+    },
+}
+
+# Authenticated users are cached per process for this many seconds;
+# saving or deleting a user invalidates the entry immediately
+AUTH_USER_CACHE_ALIAS = 'default'
+AUTH_USER_CACHE_TTL = 60
+
+# Request logging
+REQUEST_LOGGING = {
+    'PAYLOAD_SAMPLE_RATE': 1.0 if DEBUG else 0.01,
+    'PAYLOAD_MAX_CHARS': 2048,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_context': {
+            '()': 'fitness_project.request_logging.RequestContextFilter',
+        },
+    },
+    'formatters': {
+        'verbose': {
+            'format': '%(asctime)s %(levelname)s %(name)s [%(request_id)s user=%(user_id)s %(route)s] %(message)s',
+        },
+        'structured': {
+            '()': 'fitness_project.request_logging.StructuredFormatter',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'filters': ['request_context'],
+            'formatter': 'verbose' if DEBUG else 'structured',
+        },
+    },
+    'loggers': {
+        app: {
+            'handlers': ['console'],
+            'level': 'INFO' if DEBUG else 'WARNING',
+        }
+        for app in ['users', 'workouts', 'progress', 'ai_engine', 'fitness_project']
+    },
+}
+
+# AI request job queue, processed by `python manage.py ai_worker`; see ai_engine.jobs
+AI_QUEUE = {
+    'CONCURRENCY': 4,
+    'POOL': 'thread',  # or 'process' for CPU-bound handlers
+    'USER_CONCURRENCY': 1,
+    'MAX_ATTEMPTS': 3,
+    'RETRY_BACKOFF': 30,  # seconds, doubled on every retry
+    'RETRY_BACKOFF_MAX': 3600,
+    'LEASE_SECONDS': 300,
+    'PRIORITIES': {
+        'exercise_suggestion': 20,
+        'recommendation': 10,
+        'workout_plan': 10,
+        'progress_analysis': 0,
+    },
+    'HANDLERS': {},
+}
+
+# Identical AI requests (same type, prompt and profile bucket) reuse a result
+# for this long (ai_engine/results.py); use a shared cache with several workers
+AI_RESULT_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': 7 * 24 * 60 * 60,
+    'REQUEST_TYPES': ['workout_plan', 'exercise_suggestion'],
+    'BUCKETS': {'age': 5, 'height': 5, 'weight': 5},
+}
+
+# AIModelVersion usage counters are summed in memory and written every
+# FLUSH_INTERVAL seconds (ai_engine/usage.py)
+AI_USAGE = {
+    'FLUSH_INTERVAL': 10,
+}
+
+# Batch recommendation engine, run with `python manage.py generate_recommendations
+# [--incremental]` (ai_engine/recommendations.py)
+AI_RECOMMENDATIONS = {
+    'WINDOW_DAYS': 28,
+    'MIN_SCORE': 0.5,
+    'PER_USER': 3,
+    'FEEDBACK_WEIGHT': 0.3,
+    'CHUNK_SIZE': 500,
+    'PROCESSES': 1,
+}
+
+# AITrainingData exports (ai_engine/exports.py): rows per batch and gzip level
+AI_TRAINING_EXPORT = {
+    'BATCH_SIZE': 5000,
+    'COMPRESSION_LEVEL': 6,
+}
+
+# "Users like me" index (ai_engine/similarity.py), refreshed with
+# `python manage.py build_similarity_index [--full]`
+AI_SIMILARITY = {
+    'PATH': BASE_DIR / 'similarity_index',
+    'NEIGHBOURS': 20,
+    'MIN_FEATURES': 3,
+    'BALL_TREE_MIN_USERS': 100_000,
+    'REBUILD_FRACTION': 0.2,
+    'RELOAD_INTERVAL': 30,
+}
+
+# Exercise substitution graph (workouts/substitutions.py), kept per muscle
+# group in the ALIAS cache, which may be per process. Blocks are keyed on
+# versions in VERSION_ALIAS; `check` fails unless that is a shared cache
+# with several worker processes
+EXERCISE_SUBSTITUTIONS = {
+    'ALIAS': 'default',
+    'VERSION_ALIAS': 'default',
+    'TIMEOUT': 24 * 60 * 60,
+    'MAX_ALTERNATIVES': 10,
+    'MIN_WEIGHT': 0.2,
+    'WEIGHTS': {'text': 0.5, 'equipment': 0.25, 'difficulty': 0.25},
+}
+
+# Calorie estimates of sessions and completed workouts (workouts/calories.py);
+# after changing the MET tables run `python manage.py calculate_calories --all`
+CALORIE_ESTIMATION = {
+    'DEFAULT_MET': 5.0,
+    'REST_MET': 1.5,
+    'SECONDS_PER_REP': 3,
+    'DEFAULT_REST': 60,
+    'LOAD_FACTOR': 0.2,
+    'MAX_MINUTES': 240,
+    'DEFAULT_WEIGHT': 70,
+}
+
+# Google Sign-In
+GOOGLE_OAUTH2_CLIENT_ID = '876432031351-h5hmbv4qj96aci5ngcrfqa4kdvef24s2.apps.googleusercontent.com'
+GOOGLE_OAUTH2_CERTS_URL = 'https://www.googleapis.com/oauth2/v1/certs'
+# Signing certificates are cached for the Cache-Control max-age Google sends
+GOOGLE_CERT_CACHE = {
+    'refresh_ahead': 60,
+    'stale_if_error': 3600,
+    'failure_threshold': 3,
+    'cooldown': 30,
+    'timeout': 5,
 }
 
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True  # For development only
 CORS_ALLOW_CREDENTIALS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
+CORS_EXPOSE_HEADERS = ['idempotent-replayed']
 
 # Media files
 MEDIA_URL = '/media/'
@@ -0,0 +1,971 @@
+import asyncio
+import io
+import logging
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.db import OperationalError, connection, connections, transaction
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from fitness_project import request_logging
+from fitness_project.cache.backends import FileCache, LRUCache, RespCache
+from fitness_project.cache.resp import RespServer
+from fitness_project.cache.singleflight import SingleFlight, flights
+from fitness_project.cache.views import cache_per_user, view_stats
+from fitness_project.checks import check_api_caches_shared, check_replica_sticky_cache_shared
+
+from fitness_project.cache.versions import bump_for_instance, get_api_cache, user_version_key
+from fitness_project.db.routers import ReplicaRouter, _sticky_key, get_sticky_cache
+from fitness_project.db.sharding import move_user, shard_for_user, sharded_models, user_shard
+from fitness_project.db.sqlite import WriteQueue, write_order
+from fitness_project.db.sqlite3.base import _held_turns
+from fitness_project.fieldsets import Fieldset, relation_lookups
+from fitness_project.idempotency import get_idempotency_cache, idempotent
+from ai_engine.models import AIRequest
+from ai_engine.serializers import AIRequestSerializer
+from progress.models import CompletedWorkout, ProgressEntry
+from sync.models import Change
+from workouts.models import Exercise, ExerciseSet, WorkoutDay, WorkoutExercise, WorkoutPlan, WorkoutSession
+from workouts.serializers import WorkoutSessionSerializer
+from users.models import User
+
+
+class WriteQueueTests(TransactionTestCase):
+    def make_user(self, name):
+        return User.objects.create_user(username=name, email=f'{name}@example.com', password='correct horse battery')
+
+    def run_in_thread(self, target, timeout=5):
+        thread = threading.Thread(target=target)
+        thread.start()
+        thread.join(timeout)
+        return not thread.is_alive()
+
+    def test_acquire_times_out(self):
+        queue = WriteQueue()
+        self.assertTrue(queue.acquire())
+        self.assertFalse(queue.acquire(timeout=0.05))
+        queue.release()
+        # The timed-out waiter left the queue, so the turn is free again
+        self.assertTrue(queue.acquire(timeout=0.05))
+
+    def test_read_only_atomic_block_does_not_wait_for_writers(self):
+        self.make_user('reader')
+        counts = []
+
+        def read():
+            with transaction.atomic():
+                counts.append(User.objects.count())
+
+        # Another writer holds the turn
+        connection.write_queue.acquire()
+        try:
+            self.assertTrue(self.run_in_thread(read))
+        finally:
+            connection.write_queue.release()
+        self.assertEqual(counts, [1])
+
+    def test_turn_is_taken_at_first_write_and_held_until_commit(self):
+        with transaction.atomic():
+            User.objects.count()
+            self.assertFalse(connection.holds_write_turn)
+            self.make_user('writer')
+            self.assertTrue(connection.holds_write_turn)
+        self.assertFalse(connection.holds_write_turn)
+        self.assertEqual(_held_turns(), [])
+
+    def test_savepoints_opened_before_the_first_write(self):
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    self.make_user('discarded')
+                    raise ValueError
+            except ValueError:
+                pass
+            with transaction.atomic():
+                User.objects.count()
+            self.make_user('kept')
+        self.assertEqual(list(User.objects.values_list('username', flat=True)), ['kept'])
+
+    @override_settings(SQLITE_PRAGMAS={'busy_timeout': 100})
+    def test_out_of_order_turn_fails_instead_of_deadlocking(self):
+        # This thread holds default's turn and writes to a shard, while the
+        # shard's turn is held by a thread that may be waiting for default
+        with mock.patch.object(connection, 'write_order', write_order('shard1')):
+            connection.write_queue.acquire()
+            _held_turns().append(write_order('default'))
+            try:
+                with self.assertRaisesMessage(OperationalError, 'database is locked'):
+                    self.make_user('blocked')
+            finally:
+                _held_turns().remove(write_order('default'))
+                connection.write_queue.release()
+        self.assertFalse(User.objects.exists())
+
+
+class SnapshotIsolationTests(SimpleTestCase):
+    """atomic() on a WAL database file, which the in-memory test database is not"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        connections.settings['isolation'] = {**connection.settings_dict, 'NAME': f'{directory.name}/isolation.sqlite3'}
+        self.addCleanup(connections.settings.pop, 'isolation')
+        self.addCleanup(self.close)
+        with connections['isolation'].cursor() as cursor:
+            cursor.execute('CREATE TABLE counter (id INTEGER PRIMARY KEY, value INTEGER)')
+            cursor.execute('INSERT INTO counter VALUES (1, 0)')
+
+    def close(self):
+        connections['isolation'].close()
+        del connections['isolation']
+
+    def read(self):
+        with connections['isolation'].cursor() as cursor:
+            cursor.execute('SELECT value FROM counter WHERE id = 1')
+            return cursor.fetchone()[0]
+
+    def increment_in_thread(self):
+        def increment():
+            try:
+                with connections['isolation'].cursor() as cursor:
+                    cursor.execute('UPDATE counter SET value = value + 1 WHERE id = 1')
+            finally:
+                connections['isolation'].close()
+
+        thread = threading.Thread(target=increment)
+        thread.start()
+        thread.join(5)
+
+    def test_reads_in_atomic_share_a_snapshot(self):
+        with transaction.atomic(using='isolation'):
+            before = self.read()
+            self.increment_in_thread()
+            self.assertEqual(self.read(), before)
+        self.assertEqual(self.read(), before + 1)
+
+    def test_write_after_a_concurrent_commit_is_refused(self):
+        with self.assertRaisesMessage(OperationalError, 'database is locked'):
+            with transaction.atomic(using='isolation'):
+                value = self.read()
+                self.increment_in_thread()
+                with connections['isolation'].cursor() as cursor:
+                    cursor.execute('UPDATE counter SET value = %s WHERE id = 1', [value + 10])
+        # The concurrent increment was not overwritten, and the turn was given back
+        self.assertEqual(self.read(), 1)
+        self.assertFalse(connections['isolation'].holds_write_turn)
+
+    def test_write_without_earlier_reads_waits_for_its_turn(self):
+        with transaction.atomic(using='isolation'):
+            self.increment_in_thread()
+            with connections['isolation'].cursor() as cursor:
+                cursor.execute('UPDATE counter SET value = value + 1 WHERE id = 1')
+        self.assertEqual(self.read(), 2)
+
+
+class CacheVersionTests(TestCase):
+    def setUp(self):
+        get_api_cache().clear()
+        self.user = User.objects.create_user(username='lee', email='lee@example.com', password='correct horse battery')
+
+    def test_save_bumps_again_when_its_database_commits(self):
+        key = user_version_key('progress', self.user.pk)
+        with self.captureOnCommitCallbacks(using='default') as callbacks:
+            ProgressEntry.objects.create(user=self.user, date='2026-01-01', weight=80)
+            bumped = get_api_cache().get(key)
+            self.assertIsNotNone(bumped)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_api_cache().get(key), bumped)
+
+    def test_commit_callback_uses_the_writing_database(self):
+        entry = ProgressEntry(user=self.user, date='2026-01-01')
+        with mock.patch('fitness_project.cache.versions.transaction.on_commit') as on_commit:
+            bump_for_instance(ProgressEntry, entry, using='shard1')
+        on_commit.assert_called_once_with(mock.ANY, using='shard1')
+
+
+class RequestLoggingTests(SimpleTestCase):
+    def logged(self, value, sample=0.0):
+        """Render ``value`` the way a handler would inside a request"""
+        rendered = []
+
+        def view(request):
+            rendered.append(str(value(request) if callable(value) else value))
+            return HttpResponse()
+
+        middleware = request_logging.RequestContextMiddleware(view)
+        request = RequestFactory().post('/', HTTP_AUTHORIZATION='Bearer secret', HTTP_X_REQUEST_ID='req-1')
+        with mock.patch.object(request_logging.random, 'random', return_value=sample):
+            response = middleware(request)
+        self.assertEqual(response['X-Request-ID'], 'req-1')
+        return rendered[0]
+
+    @override_settings(REQUEST_LOGGING={'PAYLOAD_SAMPLE_RATE': 0.5})
+    def test_unsampled_requests_skip_payloads(self):
+        body = request_logging.payload({'email': 'lee@example.com'})
+        self.assertEqual(self.logged(body, sample=0.7), '<unsampled>')
+        self.assertEqual(self.logged(body, sample=0.2), "{'email': 'lee@example.com'}")
+
+    def test_redacts_secret_fields_and_headers(self):
+        body = request_logging.payload({
+            'email': 'lee@example.com',
+            'password': 'hunter22',
+            'tokens': {'access': 'a', 'refresh': 'r'},
+            'sets': [{'refresh': 'nested'}],
+        })
+        text = self.logged(body)
+        self.assertEqual(text, "{'email': 'lee@example.com', 'password': '***', 'tokens': '***', 'sets': [{'refresh': '***'}]}")
+        text = self.logged(request_logging.headers)
+        self.assertIn("'Authorization': '***'", text)
+        self.assertIn("'X-Request-Id': 'req-1'", text)
+        self.assertNotIn('secret', text)
+
+    @override_settings(REQUEST_LOGGING={'PAYLOAD_MAX_CHARS': 20})
+    def test_truncates_long_payloads(self):
+        rows = list(range(100000))
+        with mock.patch.object(request_logging, '_render', wraps=request_logging._render) as render:
+            text = self.logged(request_logging.payload({'rows': rows}))
+        self.assertEqual(text, "{'rows': [0, 1, 2, 3...<truncated>")
+        # Rendering stops once the budget is spent instead of walking every row
+        self.assertLess(render.call_count, 20)
+
+    def test_disabled_level_renders_nothing(self):
+        logger = logging.getLogger('fitness_project.tests.quiet')
+        logger.setLevel(logging.WARNING)
+        request = RequestFactory().get('/')
+        with mock.patch.object(request_logging.LazyPayload, 'render') as render:
+            logger.debug('Body %s headers %s', request_logging.payload({'a': 1}), request_logging.headers(request))
+            logger.info('Body %s', request_logging.payload({'a': 1}))
+        render.assert_not_called()
+        with mock.patch.object(request_logging.LazyPayload, 'render', return_value='{}') as render:
+            with self.assertLogs(logger, logging.WARNING):
+                logger.warning('Body %s', request_logging.payload({'a': 1}))
+        render.assert_called_once()
+
+    def test_filter_copies_request_context(self):
+        record = logging.LogRecord('x', logging.INFO, __file__, 1, 'msg', None, None)
+        request_logging.RequestContextFilter().filter(record)
+        self.assertEqual((record.request_id, record.user_id, record.route), ('-', None, '-'))
+        token = request_logging.bind_context(request_logging.RequestContext('job-7', route='jobs'))
+        try:
+            request_logging.RequestContextFilter().filter(record)
+        finally:
+            request_logging.unbind_context(token)
+        self.assertEqual((record.request_id, record.user_id, record.route), ('job-7', None, 'jobs'))
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        get_sticky_cache().clear()
+        self.router = ReplicaRouter()
+        self.user = User(pk=7, username='kai')
+
+    def in_request(self, user=None):
+        """Bind a new request by ``user`` (default: the test user) to the logging context"""
+        request = RequestFactory().get('/')
+        request.user = user or self.user
+        token = request_logging.bind_context(request_logging.RequestContext('req', request))
+        self.addCleanup(request_logging.unbind_context, token)
+        return request
+
+    def test_reads_go_to_a_replica(self):
+        self.in_request()
+        self.assertEqual(self.router.db_for_read(ProgressEntry), 'replica1')
+
+    def test_reads_outside_a_request_stay_on_the_primary(self):
+        self.assertEqual(self.router.db_for_read(ProgressEntry), 'default')
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.in_request()
+            self.assertEqual(self.router.db_for_read(ProgressEntry), 'default')
+
+    def test_writes_go_to_the_primary_and_pin_later_reads(self):
+        request = self.in_request()
+        self.assertEqual(self.router.db_for_read(ProgressEntry), 'replica1')
+        self.assertEqual(self.router.db_for_write(ProgressEntry), 'default')
+        # The rest of the request reads its own write
+        self.assertEqual(request.read_db_alias, 'default')
+        self.assertEqual(self.router.db_for_read(ProgressEntry), 'default')
+        # So do the user's next requests until the marker expires
+        self.in_request()
+        self.assertEqual(self.router.db_for_read(ProgressEntry), 'default')
+        self.in_request(User(pk=8, username='ari'))
+        self.assertEqual(self.router.db_for_read(ProgressEntry), 'replica1')
+        get_sticky_cache().delete(_sticky_key(self.user.pk))
+        self.in_request()
+        self.assertEqual(self.router.db_for_read(ProgressEntry), 'replica1')
+
+    def test_background_write_pins_the_owner(self):
+        entry = ProgressEntry(user_id=self.user.pk)
+        self.assertEqual(self.router.db_for_write(ProgressEntry, instance=entry), 'default')
+        self.in_request()
+        self.assertEqual(self.router.db_for_read(ProgressEntry), 'default')
+
+    def test_related_reads_of_primary_instances_stay_on_the_primary(self):
+        self.in_request()
+        entry = ProgressEntry(user_id=self.user.pk)
+        entry._state.db = 'default'
+        self.assertEqual(self.router.db_for_read(User, instance=entry), 'default')
+
+    def test_sticky_marker_uses_its_cache_alias(self):
+        with tempfile.TemporaryDirectory() as location:
+            caches = {
+                'default': {'BACKEND': 'fitness_project.cache.backends.LRUCache'},
+                'sticky': {'BACKEND': 'fitness_project.cache.backends.FileCache', 'LOCATION': location},
+            }
+            with override_settings(CACHES=caches, REPLICA_STICKY_CACHE_ALIAS='sticky', WORKER_PROCESSES=4):
+                self.in_request()
+                self.router.db_for_write(ProgressEntry)
+                self.assertIsNotNone(get_sticky_cache().get(_sticky_key(self.user.pk)))
+                self.assertEqual(check_replica_sticky_cache_shared(None), [])
+                with override_settings(REPLICA_STICKY_CACHE_ALIAS='default'):
+                    errors = check_replica_sticky_cache_shared(None)
+        self.assertEqual([error.id for error in errors], ['fitness_project.E001'])
+
+
+@override_settings(DATABASE_SHARDS=['default', 'shard1'])
+class ShardingTests(TransactionTestCase):
+    """Sharding across the test database and a second SQLite file, ``shard1``"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.TemporaryDirectory()
+        connections.settings['shard1'] = {
+            **connection.settings_dict,
+            'NAME': f'{cls.directory.name}/shard1.sqlite3',
+            'OPTIONS': {'pragmas': {'foreign_keys': 'OFF'}},
+        }
+        call_command('migrate', database='shard1', verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['shard1'].close()
+        del connections['shard1']
+        connections.settings.pop('shard1')
+        cls.directory.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        get_api_cache().clear()
+        self.exercise = Exercise.objects.create(name='Squat', description='Back squat', muscle_group='legs')
+        self.addCleanup(self.clear_shard)
+
+    def clear_shard(self):
+        for model, _ in reversed(sharded_models()):
+            model._base_manager.using('shard1').all()._raw_delete('shard1')
+
+    def make_user(self, shard):
+        """A new user whose rows belong on ``shard``"""
+        while True:
+            count = User.objects.count()
+            user = User.objects.create_user(username=f'user{count}', email=f'user{count}@example.com', password='x')
+            if shard_for_user(user.pk) == shard:
+                return user
+
+    def log_workout(self, user, using):
+        session = WorkoutSession(user=user)
+        session.save(using=using)
+        ExerciseSet(session=session, exercise=self.exercise, set_number=1, reps_completed=5).save(using=using)
+        CompletedWorkout(user=user, workout_name='Legs', date='2026-01-05', duration=40).save(using=using)
+        return session
+
+    def rows(self, model, user, using):
+        owner = dict((m, o) for m, o in sharded_models())[model]
+        return model._base_manager.using(using).filter(**{owner: user.pk})
+
+    def test_rows_are_routed_to_their_users_shard(self):
+        remote, local = self.make_user('shard1'), self.make_user('default')
+        for user in (remote, local):
+            ProgressEntry(user=user, date='2026-01-05', weight=80).save()
+        self.assertEqual(ProgressEntry.objects.using('shard1').get().user_id, remote.pk)
+        self.assertEqual(ProgressEntry.objects.using('default').get().user_id, local.pk)
+        with user_shard(remote.pk) as shard:
+            self.assertEqual(shard, 'shard1')
+            self.assertEqual(ProgressEntry.objects.get().user_id, remote.pk)
+        # Reverse relations follow the user
+        self.assertEqual(remote.progress_entries.get().weight, 80)
+
+    def test_move_user_copies_remaps_and_logs(self):
+        user = self.make_user('shard1')
+        old_session = self.log_workout(user, 'default')
+        version_key = user_version_key('workouts', user.pk)
+        version = get_api_cache().get(version_key)
+        last_change = Change.objects.order_by('-id').values_list('id', flat=True).first()
+
+        moved = move_user(user.pk, 'default', 'shard1')
+
+        self.assertEqual(moved['workouts.WorkoutSession'], 1)
+        self.assertEqual(moved['workouts.ExerciseSet'], 1)
+        self.assertFalse(self.rows(WorkoutSession, user, 'default').exists())
+        session = self.rows(WorkoutSession, user, 'shard1').get()
+        self.assertEqual(self.rows(ExerciseSet, user, 'shard1').get().session_id, session.pk)
+        self.assertEqual(session.created_at, old_session.created_at)
+        logged = set(Change.objects.filter(id__gt=last_change, collection='sessions')
+                     .values_list('object_id', 'deleted'))
+        # A new id equal to the old one is logged as a change only
+        expected = {(session.pk, False)} | ({(old_session.pk, True)} if old_session.pk != session.pk else set())
+        self.assertEqual(logged, expected)
+        self.assertNotEqual(get_api_cache().get(version_key), version)
+
+    def assert_failed_move_changes_nothing(self, source, target):
+        user = self.make_user(target)
+        self.log_workout(user, source)
+        last_change = Change.objects.order_by('-id').values_list('id', flat=True).first()
+        with mock.patch.object(connections['shard1'], 'commit', side_effect=OperationalError('disk I/O error')):
+            with self.assertRaises(OperationalError):
+                move_user(user.pk, source, target)
+        self.assertEqual(self.rows(ExerciseSet, user, source).count(), 1)
+        self.assertFalse(self.rows(WorkoutSession, user, target).exists())
+        self.assertFalse(self.rows(ExerciseSet, user, target).exists())
+        self.assertFalse(Change.objects.filter(id__gt=last_change).exists())
+
+    def test_failed_target_commit_keeps_rows_and_logs_nothing(self):
+        self.assert_failed_move_changes_nothing('default', 'shard1')
+
+    def test_failed_source_commit_removes_the_copies(self):
+        # The target committed first, so its copies are deleted again
+        self.assert_failed_move_changes_nothing('shard1', 'default')
+
+    def test_deleting_a_user_purges_their_shard(self):
+        user, other = self.make_user('shard1'), self.make_user('shard1')
+        self.log_workout(user, 'shard1')
+        self.log_workout(other, 'shard1')
+        user.delete()
+        for model, _ in sharded_models():
+            self.assertFalse(self.rows(model, user, 'shard1').exists())
+        self.assertEqual(self.rows(ExerciseSet, other, 'shard1').count(), 1)
+
+    def test_rebalance_moves_users_onto_their_shard(self):
+        misplaced, placed = self.make_user('shard1'), self.make_user('default')
+        self.log_workout(misplaced, 'default')
+        self.log_workout(placed, 'default')
+        out = io.StringIO()
+        call_command('rebalance_shards', '--dry-run', stdout=out)
+        self.assertIn(f'user {misplaced.pk}: default -> shard1', out.getvalue())
+        self.assertTrue(self.rows(WorkoutSession, misplaced, 'default').exists())
+        call_command('rebalance_shards', stdout=io.StringIO())
+        self.assertEqual(self.rows(CompletedWorkout, misplaced, 'shard1').count(), 1)
+        self.assertFalse(self.rows(CompletedWorkout, misplaced, 'default').exists())
+        self.assertEqual(self.rows(CompletedWorkout, placed, 'default').count(), 1)
+
+
+class CacheBackendTests:
+    """Behaviour every backend shares; subclasses set ``self.cache``"""
+
+    def test_set_get_and_delete(self):
+        self.cache.set('plan', {'days': [1, 2]})
+        self.cache.set('count', 3)
+        self.assertEqual(self.cache.get('plan'), {'days': [1, 2]})
+        self.assertEqual(self.cache.get_many(['plan', 'count', 'missing']), {'plan': {'days': [1, 2]}, 'count': 3})
+        self.assertTrue(self.cache.delete('plan'))
+        self.assertFalse(self.cache.delete('plan'))
+        self.assertEqual(self.cache.get('plan', 'gone'), 'gone')
+        self.assertEqual(self.cache.stats()['hits'], 3)
+
+    def test_add_only_sets_missing_keys(self):
+        self.assertTrue(self.cache.add('lock', 'first'))
+        self.assertFalse(self.cache.add('lock', 'second'))
+        self.assertEqual(self.cache.get('lock'), 'first')
+
+    def test_entries_expire(self):
+        self.cache.set('short', 1, timeout=0.05)
+        self.cache.set('long', 1, timeout=60)
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get('short'))
+        self.assertEqual(self.cache.get('long'), 1)
+        self.assertTrue(self.cache.touch('long', timeout=None))
+        self.assertTrue(self.cache.has_key('long'))
+
+    def test_incr_leaves_missing_keys_missing(self):
+        with self.assertRaises(ValueError):
+            self.cache.incr('version')
+        self.assertFalse(self.cache.has_key('version'))
+        self.cache.set('version', 1)
+        self.assertEqual(self.cache.incr('version'), 2)
+        self.assertEqual(self.cache.decr('version', 5), -3)
+
+    def test_concurrent_increments_are_not_lost(self):
+        self.cache.set('counter', 0)
+        errors = []
+
+        def increment():
+            try:
+                for _ in range(50):
+                    self.cache.incr('counter')
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=increment) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(errors, [])
+        self.assertEqual(self.cache.get('counter'), 400)
+
+    def test_clear(self):
+        self.cache.set_many({'a': 1, 'b': 2})
+        self.cache.clear()
+        self.assertEqual(self.cache.get_many(['a', 'b']), {})
+
+
+class LRUCacheTests(CacheBackendTests, SimpleTestCase):
+    def setUp(self):
+        self.cache = LRUCache('lru-tests', {'OPTIONS': {'MAX_ENTRIES': 3}})
+        self.cache.clear()
+        self.cache.counters.reset()
+
+    def test_threads_share_entries(self):
+        self.cache.set('shared', 1)
+        other = []
+        thread = threading.Thread(target=lambda: other.append(LRUCache('lru-tests', {}).get('shared')))
+        thread.start()
+        thread.join(5)
+        self.assertEqual(other, [1])
+
+    def test_evicts_least_recently_used(self):
+        for key in 'abc':
+            self.cache.set(key, key)
+        self.cache.get('a')
+        self.cache.set('d', 'd')
+        self.assertEqual(sorted(self.cache.get_many('abcd')), ['a', 'c', 'd'])
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+
+class FileCacheTests(CacheBackendTests, SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = FileCache(directory.name, {})
+
+
+class RespCacheTests(CacheBackendTests, SimpleTestCase):
+    """Against the bundled stand-in server on an ephemeral port"""
+
+    def setUp(self):
+        self.server = RespServer(('127.0.0.1', 0), max_keys=0)
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        host, port = self.server.server_address
+        self.cache = RespCache(f'{host}:{port}/1', {'OPTIONS': {'SOCKET_TIMEOUT': 5}})
+        self.addCleanup(self.cache.close)
+
+    def test_databases_are_separate(self):
+        host, port = self.server.server_address
+        other = RespCache(f'{host}:{port}/2', {})
+        self.addCleanup(other.close)
+        self.cache.set('shared', 1)
+        self.assertIsNone(other.get('shared'))
+
+    def test_server_evicts_past_max_keys(self):
+        self.server.max_keys = 2
+        for key in 'abc':
+            self.cache.set(key, key)
+        self.assertEqual(sorted(self.cache.get_many('abc')), ['b', 'c'])
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+    def run_check(self, workers, **aliases):
+        with tempfile.TemporaryDirectory() as location:
+            caches = {
+                'default': {'BACKEND': 'fitness_project.cache.backends.LRUCache'},
+                'shared': {'BACKEND': 'fitness_project.cache.backends.FileCache', 'LOCATION': location},
+            }
+            with override_settings(CACHES=caches, WORKER_PROCESSES=workers, **aliases):
+                return [error.id for error in check_api_caches_shared(None)]
+
+    def test_one_worker_may_use_process_local_caches(self):
+        self.assertEqual(self.run_check(1), [])
+
+    def test_several_workers_need_shared_caches(self):
+        self.assertEqual(self.run_check(4), ['fitness_project.E002', 'fitness_project.E003'])
+        self.assertEqual(self.run_check(4, API_CACHE_ALIAS='shared'), ['fitness_project.E003'])
+        self.assertEqual(self.run_check(4, API_CACHE_ALIAS='shared', IDEMPOTENCY_CACHE_ALIAS='shared'), [])
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('Timed out waiting')
+        time.sleep(0.005)
+
+
+class CachePerUserTests(SimpleTestCase):
+    def setUp(self):
+        get_api_cache().clear()
+        self.user = User(pk=4242, username='dana')
+        self.calls = []
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def make_view(self, name, block=lambda calls: True, **options):
+        @api_view(['GET'])
+        @cache_per_user('progress', name=name, **options)
+        def view(request):
+            self.calls.append(threading.get_ident())
+            count = len(self.calls)
+            if block(count):
+                self.release.wait(5)
+            return Response({'run': count})
+
+        self.addCleanup(view_stats.pop, name, None)
+        return view
+
+    def get(self, view):
+        request = APIRequestFactory().get('/stats/')
+        force_authenticate(request, user=self.user)
+        return view(request)
+
+    def test_concurrent_misses_run_the_view_once(self):
+        view = self.make_view('tests.singleflight')
+        followers = flights.counters.snapshot()['followers']
+        responses = []
+        threads = [threading.Thread(target=lambda: responses.append(self.get(view))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        # Four requests are waiting on the first one's run
+        wait_until(lambda: flights.counters.snapshot()['followers'] - followers == 4)
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual([response.data for response in responses], [{'run': 1}] * 5)
+        # Followers get their own response objects
+        self.assertEqual(len({id(response) for response in responses}), 5)
+        stats = view_stats['tests.singleflight'].snapshot()
+        self.assertEqual((stats['misses'], stats['coalesced'], stats['sets']), (5, 4, 1))
+        self.assertEqual(self.get(view).data, {'run': 1})
+        self.assertEqual(len(self.calls), 1)
+
+    def test_stale_entry_is_served_while_one_refresh_runs(self):
+        # Only the refreshes block
+        view = self.make_view('tests.swr', block=lambda count: count > 1, timeout=0.05, stale_while_revalidate=60)
+        self.assertEqual(self.get(view).data, {'run': 1})
+        time.sleep(0.1)
+        for _ in range(3):
+            self.assertEqual(self.get(view).data, {'run': 1})
+        wait_until(lambda: len(self.calls) == 2)
+        refresher = self.calls[1]
+        self.assertNotEqual(refresher, threading.get_ident())
+        self.release.set()
+        wait_until(lambda: view_stats['tests.swr'].snapshot()['sets'] == 2)
+        self.assertEqual(self.get(view).data, {'run': 2})
+        self.assertEqual(len(self.calls), 2)
+        stats = view_stats['tests.swr'].snapshot()
+        self.assertEqual((stats['misses'], stats['stale'], stats['hits']), (1, 3, 1))
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_coroutines_share_one_run(self):
+        group = SingleFlight()
+        runs = []
+
+        async def fetch():
+            runs.append(1)
+            await asyncio.sleep(0.01)
+            return len(runs)
+
+        async def main():
+            return await asyncio.gather(*(group.ado('key', fetch) for _ in range(4)))
+
+        results = asyncio.run(main())
+        self.assertEqual(results, [(1, False), (1, True), (1, True), (1, True)])
+        # Nothing is remembered once the run finishes
+        self.assertEqual(asyncio.run(main())[0], (2, False))
+
+    def test_errors_reach_every_waiter(self):
+        group = SingleFlight()
+        started, release = threading.Event(), threading.Event()
+        errors = []
+
+        def fail():
+            started.set()
+            release.wait(5)
+            raise ValueError('boom')
+
+        def call():
+            try:
+                group.do('key', fail)
+            except ValueError as e:
+                errors.append(e)
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=call)
+        follower.start()
+        wait_until(lambda: group.counters.snapshot()['followers'] == 1)
+        release.set()
+        leader.join(5)
+        follower.join(5)
+        self.assertEqual(len(errors), 2)
+        self.assertIs(errors[0], errors[1])
+        self.assertFalse(group.in_flight('key'))
+
+
+class FieldsetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='rio', email='rio@example.com', password='correct horse battery')
+        exercise = Exercise.objects.create(name='Bench press', description='Flat bench', muscle_group='chest')
+        self.plan = WorkoutPlan.objects.create(name='Push', description='Push days', created_by=self.user)
+        day = WorkoutDay.objects.create(plan=self.plan, name='Day 1', day_number=1)
+        WorkoutExercise.objects.create(workout_day=day, exercise=exercise, sets=3, reps='8', order=1)
+        self.session = WorkoutSession.objects.create(user=self.user, workout_day=day, status='completed')
+        ExerciseSet.objects.create(session=self.session, exercise=exercise, set_number=1, reps_completed=8,
+                                   weight_used='60.00')
+        self.headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.user).access_token}',
+            'HTTP_HOST': 'localhost',
+        }
+
+    def render(self, serializer_class, instance, fields=None, expand=None):
+        return serializer_class(instance, context={'fieldset': Fieldset.parse(fields, expand)}).data
+
+    def test_parse(self):
+        fieldset = Fieldset.parse('id, status,exercise_sets.weight_used', 'workout_day.exercises')
+        self.assertEqual(fieldset.fields, {'id', 'status', 'exercise_sets'})
+        self.assertEqual(set(fieldset.expand), {'exercise_sets', 'workout_day'})
+        self.assertEqual(fieldset.expand['exercise_sets'].fields, {'weight_used'})
+        self.assertIsNone(fieldset.child('workout_day').fields)
+        self.assertIn('exercises', fieldset.child('workout_day').expand)
+        self.assertIsNone(Fieldset.from_request(RequestFactory().get('/')))
+        self.assertIsNotNone(Fieldset.from_request(RequestFactory().get('/?expand=')))
+
+    def test_fields_prune_output(self):
+        self.assertEqual(set(self.render(WorkoutSessionSerializer, self.session, 'id,status')), {'id', 'status'})
+        data = self.render(WorkoutSessionSerializer, self.session, 'id,exercise_sets.weight_used')
+        self.assertEqual(data['exercise_sets'], [{'weight_used': '60.00'}])
+
+    def test_only_named_relations_are_embedded(self):
+        full = WorkoutSessionSerializer(self.session).data
+        self.assertIn('exercise', full['exercise_sets'][0])
+        self.assertEqual(full['workout_day']['exercises'][0]['exercise']['name'], 'Bench press')
+        data = self.render(WorkoutSessionSerializer, self.session, expand='exercise_sets')
+        self.assertNotIn('workout_day', data)
+        self.assertNotIn('exercise', data['exercise_sets'][0])
+        self.assertEqual(data['status'], 'completed')
+        data = self.render(WorkoutSessionSerializer, self.session, expand='exercise_sets.exercise')
+        self.assertEqual(data['exercise_sets'][0]['exercise']['name'], 'Bench press')
+
+    def test_expandable_fields_replace_the_primary_key(self):
+        request = AIRequest.objects.create(user=self.user, request_type='workout_plan', prompt='Plan',
+                                           generated_plan=self.plan)
+        self.assertEqual(AIRequestSerializer(request).data['generated_plan'], self.plan.pk)
+        self.assertEqual(self.render(AIRequestSerializer, request, 'id,generated_plan')['generated_plan'], self.plan.pk)
+        expanded = self.render(AIRequestSerializer, request, expand='generated_plan')['generated_plan']
+        self.assertEqual(expanded['name'], 'Push')
+        # Expanded alone, the plan's own relations are not
+        self.assertNotIn('schedule', expanded)
+        data = self.render(AIRequestSerializer, request, 'generated_plan.name')
+        self.assertEqual(data, {'generated_plan': {'name': 'Push'}})
+        response = self.client.get(f'/api/ai/requests/{request.pk}/?expand=generated_plan', **self.headers)
+        self.assertEqual(response.json()['generated_plan']['name'], 'Push')
+
+    def test_relation_lookups_follow_the_fieldset(self):
+        def lookups(query=''):
+            request = RequestFactory().get(f'/{query}')
+            return relation_lookups(WorkoutSessionSerializer, request)
+
+        self.assertEqual(lookups(), ['workout_day__exercises__exercise', 'exercise_sets__exercise'])
+        self.assertEqual(lookups('?fields=id,status'), [])
+        self.assertEqual(lookups('?expand=exercise_sets'), ['exercise_sets'])
+        self.assertEqual(lookups('?fields=workout_day.name'), ['workout_day'])
+
+    def test_sparse_list_runs_fewer_queries(self):
+        # Authenticate once so the user lookup is cached
+        self.client.get('/api/workouts/sessions/', **self.headers)
+        with CaptureQueriesContext(connection) as full:
+            response = self.client.get('/api/workouts/sessions/', **self.headers)
+        self.assertEqual(response.json()['results'][0]['exercise_sets'][0]['exercise']['name'], 'Bench press')
+        # The page count and the sessions, with no prefetches
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/workouts/sessions/?fields=id,status', **self.headers)
+        self.assertEqual(response.json()['results'], [{'id': self.session.pk, 'status': 'completed'}])
+        self.assertGreater(len(full), 2)
+
+    def test_fields_do_not_change_input_validation(self):
+        invalid = self.client.post('/api/workouts/sessions/?fields=id', {'status': 'sleeping'},
+                                   content_type='application/json', **self.headers)
+        self.assertEqual(invalid.status_code, 400)
+        self.assertIn('status', invalid.json())
+        created = self.client.post('/api/workouts/sessions/?fields=id', {'status': 'in_progress', 'notes': 'Easy'},
+                                   content_type='application/json', **self.headers)
+        self.assertEqual(created.status_code, 201)
+        # A serializer bound to input ignores the fieldset entirely
+        self.assertEqual(created.json()['notes'], 'Easy')
+        self.assertEqual(WorkoutSession.objects.get(pk=created.json()['id']).notes, 'Easy')
+
+
+class BatchTests(TestCase):
+    def setUp(self):
+        get_api_cache().clear()
+        self.user = User.objects.create_user(username='kit', email='kit@example.com', password='correct horse battery')
+        self.exercise = Exercise.objects.create(name='Row', description='Pull to the ribs', muscle_group='back')
+        self.headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.user).access_token}',
+            'HTTP_HOST': 'localhost',
+        }
+
+    def batch(self, requests, **options):
+        response = self.client.post('/api/batch/', {'requests': requests, **options},
+                                    content_type='application/json', **self.headers)
+        return response.status_code, response.json()
+
+    def session(self, **body):
+        return {'id': 'session', 'method': 'POST', 'path': '/api/workouts/sessions/',
+                'body': {'status': 'completed', 'duration': 45, **body}}
+
+    def add_set(self, **body):
+        return {'method': 'POST', 'path': '/api/workouts/sets/',
+                'body': {'session': '{{session.id}}', 'exercise_id': str(self.exercise.pk), 'set_number': 1,
+                         'reps_completed': 10, **body}}
+
+    def test_references_are_substituted(self):
+        code, data = self.batch([
+            self.session(),
+            self.add_set(notes='Set for session {{session.id}}'),
+            {'method': 'GET', 'path': '/api/workouts/sessions/{{session.id}}/?fields=id,status'},
+        ])
+        self.assertEqual(code, 200)
+        self.assertEqual([result['status'] for result in data['results']], [201, 201, 200])
+        session_id = data['results'][0]['body']['id']
+        exercise_set = data['results'][1]['body']
+        # A whole-value reference keeps the number; inside a string it is formatted
+        self.assertEqual(exercise_set['session'], session_id)
+        self.assertEqual(exercise_set['notes'], f'Set for session {session_id}')
+        self.assertEqual(data['results'][2]['body'], {'id': session_id, 'status': 'completed'})
+        self.assertNotIn('committed', data)
+
+    def test_reference_to_a_failed_or_missing_result_is_not_run(self):
+        code, data = self.batch([
+            self.session(status='sleeping'),
+            self.add_set(),
+            {'method': 'GET', 'path': '/api/workouts/sessions/{{nothing.id}}/'},
+            {'method': 'GET', 'path': '/api/workouts/sessions/'},
+        ])
+        self.assertEqual(code, 200)
+        self.assertEqual([result['status'] for result in data['results']], [400, 424, 424, 200])
+        self.assertEqual(data['results'][0]['id'], 'session')
+        self.assertIn('nothing', data['results'][2]['body']['detail'])
+        self.assertFalse(ExerciseSet.objects.exists())
+
+    def test_atomic_batch_rolls_back_on_failure(self):
+        code, data = self.batch([self.session(), self.add_set(reps_completed='many'), self.add_set()], atomic=True)
+        self.assertEqual(code, 200)
+        self.assertEqual([result['status'] for result in data['results']], [201, 400, 424])
+        self.assertIs(data['committed'], False)
+        self.assertFalse(WorkoutSession.objects.exists())
+
+        code, data = self.batch([self.session(), self.add_set()], atomic=True)
+        self.assertIs(data['committed'], True)
+        self.assertEqual(ExerciseSet.objects.get().session_id, data['results'][0]['body']['id'])
+
+    @override_settings(BATCH_MAX_REQUESTS=2)
+    def test_batch_size_is_limited(self):
+        listing = {'method': 'GET', 'path': '/api/workouts/sessions/'}
+        code, data = self.batch([listing] * 3)
+        self.assertEqual(code, 400)
+        self.assertIn('requests', data)
+        self.assertEqual(self.batch([listing] * 2)[0], 200)
+
+    def test_invalid_sub_requests(self):
+        code, data = self.batch([{'method': 'TRACE', 'path': '/api/workouts/sessions/'}])
+        self.assertEqual(code, 400)
+        code, data = self.batch([{'method': 'GET', 'path': '/admin/'}])
+        self.assertEqual(code, 400)
+        code, data = self.batch([
+            {'method': 'GET', 'path': '/api/no-such-thing/'},
+            {'method': 'DELETE', 'path': '/api/workouts/history/'},
+            {'method': 'POST', 'path': '/api/batch/', 'body': {'requests': []}},
+        ])
+        self.assertEqual(code, 200)
+        self.assertEqual([result['status'] for result in data['results']], [404, 405, 400])
+
+    def test_async_view(self):
+        WorkoutSession.objects.create(user=self.user, status='completed', duration=30)
+        code, data = self.batch([{'method': 'GET', 'path': '/api/workouts/history/?page_size=5'}])
+        self.assertEqual(code, 200)
+        result = data['results'][0]
+        self.assertEqual(result['status'], 200)
+        self.assertEqual(result['body']['total_sessions'], 1)
+        self.assertEqual(result['body']['page_size'], 5)
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        get_idempotency_cache().clear()
+        self.user = User.objects.create_user(username='lee', email='lee@example.com', password='correct horse battery')
+        self.factory = APIRequestFactory()
+        self.runs = []
+        self.inner = None
+
+        @api_view(['POST'])
+        @idempotent
+        def view(request):
+            self.runs.append(request.data)
+            if self.inner:
+                # A retry that arrives while this request is still running
+                self.inner_response = self.send(*self.inner)
+            if request.data.get('fail'):
+                return Response({'error': 'Down'}, status=503)
+            return Response({'saved': len(self.runs)}, status=201)
+
+        self.view = view
+
+    def send(self, data, key='workout-1', path='/api/progress/save-workout/'):
+        request = self.factory.post(path, data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+        force_authenticate(request, self.user)
+        return self.view(request)
+
+    def test_retry_replays_the_first_response(self):
+        first = self.send({'duration': 45})
+        replay = self.send({'duration': 45})
+        self.assertEqual((replay.status_code, replay.data), (201, {'saved': 1}))
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertNotIn('Idempotent-Replayed', first)
+        self.assertEqual(len(self.runs), 1)
+        # Keys are per user: another key runs the view again
+        self.assertEqual(self.send({'duration': 45}, key='workout-2').data, {'saved': 2})
+
+    def test_retry_while_in_flight_gets_409(self):
+        self.inner = ({'duration': 45},)
+        self.assertEqual(self.send({'duration': 45}).status_code, 201)
+        self.assertEqual(self.inner_response.status_code, 409)
+        self.assertEqual(len(self.runs), 1)
+        # Once the first request finished, the retry gets its response
+        self.inner = None
+        self.assertEqual(self.send({'duration': 45}).data, {'saved': 1})
+
+    def test_reused_key_for_another_request_gets_422(self):
+        self.send({'duration': 45})
+        self.assertEqual(self.send({'duration': 50}).status_code, 422)
+        self.assertEqual(self.send({'duration': 45}, path='/api/progress/goals/save/').status_code, 422)
+        # Still 422 while the first request is running
+        self.inner = ({'duration': 50}, 'workout-2')
+        self.send({'duration': 45}, key='workout-2')
+        self.assertEqual(self.inner_response.status_code, 422)
+        self.assertEqual(len(self.runs), 2)
+
+    def test_server_errors_are_not_stored(self):
+        self.assertEqual(self.send({'fail': True}).status_code, 503)
+        self.assertEqual(self.send({'fail': True}).status_code, 503)
+        self.assertEqual(len(self.runs), 2)
+
+    def test_key_length(self):
+        self.assertEqual(self.send({'duration': 45}, key='k' * 256).status_code, 400)
+        self.assertEqual(self.runs, [])
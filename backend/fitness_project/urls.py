@@ -19,6 +19,8 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.views.generic import TemplateView
+from fitness_project.batch import batch
+from fitness_project.cache.views import cache_stats
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -28,5 +30,8 @@ urlpatterns = [
     path('api/workouts/', include('workouts.urls')),
     path('api/progress/', include('progress.urls')),
     path('api/ai/', include('ai_engine.urls')),
+    path('api/sync/', include('sync.urls')),
+    path('api/batch/', batch, name='batch'),
+    path('api/cache/stats/', cache_stats, name='cache-stats'),
 
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
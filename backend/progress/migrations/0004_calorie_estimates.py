@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('progress', '0003_completedworkout'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='completedworkout',
+            name='calories_version',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+    ]
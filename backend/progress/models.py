@@ -14,7 +14,8 @@ class CompletedWorkout(models.Model):
     duration = models.PositiveIntegerField()  # in minutes
     
     # Performance metrics
-    calories_burned = models.PositiveIntegerField(default=0)
+    calories_burned = models.PositiveIntegerField(default=0)  # estimated by workouts.calories
+    calories_version = models.PositiveSmallIntegerField(null=True, blank=True)
     exercises_completed = models.PositiveIntegerField(default=0)
     
     # Optional details
@@ -1,32 +1,33 @@
 from rest_framework import serializers
+from fitness_project.fieldsets import FieldsetMixin
 from .models import ProgressEntry, WorkoutProgress, Goal, Analytics, CompletedWorkout
 
-class ProgressEntrySerializer(serializers.ModelSerializer):
+class ProgressEntrySerializer(FieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = ProgressEntry
         fields = '__all__'
         read_only_fields = ['id', 'created_at', 'updated_at', 'user']
 
-class WorkoutProgressSerializer(serializers.ModelSerializer):
+class WorkoutProgressSerializer(FieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = WorkoutProgress
         fields = '__all__'
         read_only_fields = ['id', 'created_at', 'updated_at', 'user']
 
-class GoalSerializer(serializers.ModelSerializer):
+class GoalSerializer(FieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Goal
         fields = '__all__'
         read_only_fields = ['id', 'created_at', 'updated_at', 'user']
 
-class AnalyticsSerializer(serializers.ModelSerializer):
+class AnalyticsSerializer(FieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Analytics
         fields = '__all__'
         read_only_fields = ['id', 'created_at', 'updated_at', 'user']
 
-class CompletedWorkoutSerializer(serializers.ModelSerializer):
+class CompletedWorkoutSerializer(FieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = CompletedWorkout
         fields = '__all__'
-        read_only_fields = ['id', 'created_at', 'updated_at', 'user']
\ No newline at end of file
+        read_only_fields = ['id', 'created_at', 'updated_at', 'user', 'calories_burned', 'calories_version']
\ No newline at end of file
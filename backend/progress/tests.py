@@ -1,3 +1,49 @@
+import msgpack
 from django.test import TestCase
+from rest_framework_simplejwt.tokens import RefreshToken
 
-# Create your tests here.
+from fitness_project.cache.versions import get_api_cache
+from fitness_project.idempotency import get_idempotency_cache
+from users.models import User
+
+from .models import ProgressEntry
+
+
+def unpack(response):
+    return msgpack.unpackb(response.content, timestamp=3)
+
+
+class BinaryReplayTests(TestCase):
+    def setUp(self):
+        get_api_cache().clear()
+        get_idempotency_cache().clear()
+        self.user = User.objects.create_user(username='sam', email='sam@example.com', password='correct horse battery')
+        self.headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.user).access_token}',
+            'HTTP_HOST': 'localhost',
+            'HTTP_ACCEPT': 'application/msgpack',
+        }
+
+    def test_cached_history_keeps_native_types(self):
+        ProgressEntry.objects.create(user=self.user, date='2026-01-05', weight='78.00', waist='84.5')
+        miss = unpack(self.client.get('/api/progress/history/', **self.headers))
+        hit = unpack(self.client.get('/api/progress/history/', **self.headers))
+        self.assertEqual(hit, miss)
+        entry = hit['entries'][0]
+        self.assertEqual(entry['weight'], 78)
+        self.assertEqual(entry['waist'], 84.5)
+        self.assertNotIsInstance(entry['created_at'], str)
+
+    def test_idempotent_replay_keeps_native_types(self):
+        workout = {'workout_name': 'Intervals', 'date': '2026-01-05', 'duration': 45}
+
+        def save():
+            return self.client.post('/api/progress/save-workout/', workout, content_type='application/json',
+                                    HTTP_IDEMPOTENCY_KEY='intervals-1', **self.headers)
+
+        first = save()
+        replay = save()
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(unpack(replay), unpack(first))
+        saved = unpack(replay)['workout_progress'][0]
+        self.assertNotIsInstance(saved['created_at'], str)
@@ -23,12 +23,12 @@ urlpatterns = [
     # Additional endpoints
     path('save-entry/', views.save_progress_entry, name='save-progress-entry'),
     path('history/', views.get_user_progress_history, name='progress-history'),
-    path('stats/', views.get_user_progress_stats, name='progress-stats'),
+    path('stats/', views.get_user_progress_stats_async, name='progress-stats'),
     path('save-goal/', views.save_goal, name='save-goal'),
     
     # Completed Workouts
     path('completed-workouts/', views.CompletedWorkoutListCreateView.as_view(), name='completed-workout-list-create'),
     path('completed-workouts/<int:pk>/', views.CompletedWorkoutRetrieveUpdateDestroyView.as_view(), name='completed-workout-detail'),
     path('save-workout/', views.save_completed_workout, name='save-completed-workout'),
-    path('workout-progress/', views.get_workout_progress, name='workout-progress'),
+    path('workout-progress/', views.get_workout_progress_async, name='workout-progress'),
 ]
\ No newline at end of file
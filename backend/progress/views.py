@@ -1,3 +1,5 @@
+import asyncio
+import logging
 from django.shortcuts import render
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
@@ -6,6 +8,13 @@ from .models import ProgressEntry, WorkoutProgress, Goal, Analytics, CompletedWo
 from .serializers import ProgressEntrySerializer, WorkoutProgressSerializer, GoalSerializer, AnalyticsSerializer, CompletedWorkoutSerializer
 from users.models import User
 from django.db import models
+from fitness_project.async_views import alist, api_response, async_api_view
+from fitness_project.cache.views import cache_per_user
+from fitness_project.idempotency import idempotent
+from fitness_project.request_logging import payload, headers
+from workouts import calories
+
+logger = logging.getLogger(__name__)
 
 # Create your views here.
 
@@ -22,11 +31,9 @@ class ProgressEntryListCreateView(generics.ListCreateAPIView):
     
     def get(self, request, *args, **kwargs):
         """GET method with debugging"""
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.info(f"Progress entries GET request from user: {request.user}")
-        logger.info(f"Request headers: {dict(request.headers)}")
-        logger.info(f"User authenticated: {request.user.is_authenticated}")
+        logger.info("Progress entries GET request from user: %s", request.user)
+        logger.info("Request headers: %s", headers(request))
+        logger.info("User authenticated: %s", request.user.is_authenticated)
         
         return super().get(request, *args, **kwargs)
 
@@ -92,6 +99,15 @@ class AnalyticsRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
         return Analytics.objects.filter(user=self.request.user)
 
 # --- CompletedWorkout CRUD ---
+def _estimated_calories(user, data, instance=None):
+    """``calories_burned`` and ``calories_version`` of a completed workout saved with ``data``"""
+    workout_type = data.get('workout_type', getattr(instance, 'workout_type', ''))
+    duration = data.get('duration', getattr(instance, 'duration', 0))
+    return {
+        'calories_burned': calories.workout_calories(user.pk, workout_type, duration),
+        'calories_version': calories.FORMULA_VERSION,
+    }
+
 class CompletedWorkoutListCreateView(generics.ListCreateAPIView):
     serializer_class = CompletedWorkoutSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -100,7 +116,7 @@ class CompletedWorkoutListCreateView(generics.ListCreateAPIView):
         return CompletedWorkout.objects.filter(user=self.request.user)
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        serializer.save(user=self.request.user, **_estimated_calories(self.request.user, serializer.validated_data))
 
 class CompletedWorkoutRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = CompletedWorkoutSerializer
@@ -109,21 +125,21 @@ class CompletedWorkoutRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAP
     def get_queryset(self):
         return CompletedWorkout.objects.filter(user=self.request.user)
 
+    def perform_update(self, serializer):
+        serializer.save(**_estimated_calories(self.request.user, serializer.validated_data, serializer.instance))
+
 # --- Additional API endpoints for better data management ---
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def save_progress_entry(request):
     """Save progress entry with measurements and body composition"""
-    import logging
-    logger = logging.getLogger(__name__)
-    
     try:
         user = request.user
         data = request.data
         
-        logger.info(f"💾 Saving progress entry for user {user.email}")
-        logger.info(f"📦 Progress data: {data}")
+        logger.info("💾 Saving progress entry for user %s", user.email)
+        logger.info("📦 Progress data: %s", payload(data))
         
         # Create or update progress entry
         progress_entry, created = ProgressEntry.objects.get_or_create(
@@ -155,23 +171,21 @@ def save_progress_entry(request):
                     setattr(progress_entry, field, value)
             progress_entry.save()
         
-        logger.info(f"✅ Progress entry saved successfully: {progress_entry.id}")
+        logger.info("✅ Progress entry saved successfully: %s", progress_entry.id)
         return Response({
             'message': 'Progress entry saved successfully',
             'entry_id': progress_entry.id
         })
         
     except Exception as e:
-        logger.error(f"❌ Error saving progress entry: {str(e)}")
+        logger.error("❌ Error saving progress entry: %s", e)
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
+@cache_per_user('progress')
 def get_user_progress_history(request):
     """Get user's progress history"""
-    import logging
-    logger = logging.getLogger(__name__)
-    
     try:
         user = request.user
         entries = ProgressEntry.objects.filter(user=user).order_by('-date')
@@ -185,87 +199,88 @@ def get_user_progress_history(request):
         paginated_entries = entries[start:end]
         
         history = {
-            'entries': ProgressEntrySerializer(paginated_entries, many=True).data,
+            'entries': ProgressEntrySerializer(paginated_entries, many=True, context={'request': request}).data,
             'total_entries': entries.count(),
             'page': page,
             'page_size': page_size,
             'has_next': end < entries.count()
         }
         
-        logger.info(f"📚 Progress history retrieved for user {user.email}")
+        logger.info("📚 Progress history retrieved for user %s", user.email)
         return Response(history)
         
     except Exception as e:
-        logger.error(f"❌ Error getting progress history: {str(e)}")
+        logger.error("❌ Error getting progress history: %s", e)
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-@api_view(['GET'])
-@permission_classes([permissions.IsAuthenticated])
-def get_user_progress_stats(request):
-    """Get user's progress statistics"""
-    import logging
-    logger = logging.getLogger(__name__)
+def _progress_stats(latest_entry, earliest_entry, total_entries):
+    """Changes between the user's earliest and latest progress entries"""
+    # Calculate weight change
+    weight_change = None
+    if latest_entry.weight and earliest_entry.weight:
+        weight_change = float(latest_entry.weight) - float(earliest_entry.weight)
     
+    # Calculate measurement changes
+    measurement_changes = {}
+    if latest_entry and earliest_entry:
+        measurements = ['chest', 'neck', 'waist', 'left_arm', 'right_arm', 'left_thigh', 'right_thigh', 'shoulders', 'hips', 'calves']
+        for measurement in measurements:
+            latest_val = getattr(latest_entry, measurement)
+            earliest_val = getattr(earliest_entry, measurement)
+            if latest_val and earliest_val:
+                measurement_changes[measurement] = float(latest_val) - float(earliest_val)
+    
+    return {
+        'total_entries': total_entries,
+        'latest_entry_date': latest_entry.date if latest_entry else None,
+        'earliest_entry_date': earliest_entry.date if earliest_entry else None,
+        'weight_change': weight_change,
+        'measurement_changes': measurement_changes,
+        'current_weight': float(latest_entry.weight) if latest_entry and latest_entry.weight else None,
+        'current_body_fat': float(latest_entry.body_fat) if latest_entry and latest_entry.body_fat else None,
+        'current_bmi': float(latest_entry.bmi) if latest_entry and latest_entry.bmi else None,
+    }
+
+@async_api_view(['GET'])
+@cache_per_user('progress')
+async def get_user_progress_stats_async(request):
+    """Get user's progress statistics"""
     try:
         user = request.user
-        entries = ProgressEntry.objects.filter(user=user).order_by('-date')
-        
-        if not entries.exists():
-            return Response({
+        entries = ProgressEntry.objects.filter(user=user)
+
+        total_entries, latest_entry, earliest_entry = await asyncio.gather(
+            entries.acount(),
+            entries.order_by('-date').afirst(),
+            entries.order_by('date').afirst(),
+        )
+
+        if not total_entries:
+            return api_response({
                 'message': 'No progress entries found',
                 'stats': {}
             })
-        
-        # Get latest and earliest entries
-        latest_entry = entries.first()
-        earliest_entry = entries.last()
-        
-        # Calculate weight change
-        weight_change = None
-        if latest_entry.weight and earliest_entry.weight:
-            weight_change = float(latest_entry.weight) - float(earliest_entry.weight)
-        
-        # Calculate measurement changes
-        measurement_changes = {}
-        if latest_entry and earliest_entry:
-            measurements = ['chest', 'neck', 'waist', 'left_arm', 'right_arm', 'left_thigh', 'right_thigh', 'shoulders', 'hips', 'calves']
-            for measurement in measurements:
-                latest_val = getattr(latest_entry, measurement)
-                earliest_val = getattr(earliest_entry, measurement)
-                if latest_val and earliest_val:
-                    measurement_changes[measurement] = float(latest_val) - float(earliest_val)
-        
-        stats = {
-            'total_entries': entries.count(),
-            'latest_entry_date': latest_entry.date if latest_entry else None,
-            'earliest_entry_date': earliest_entry.date if earliest_entry else None,
-            'weight_change': weight_change,
-            'measurement_changes': measurement_changes,
-            'current_weight': float(latest_entry.weight) if latest_entry and latest_entry.weight else None,
-            'current_body_fat': float(latest_entry.body_fat) if latest_entry and latest_entry.body_fat else None,
-            'current_bmi': float(latest_entry.bmi) if latest_entry and latest_entry.bmi else None,
-        }
-        
-        logger.info(f"📊 Progress stats retrieved for user {user.email}: {stats}")
-        return Response(stats)
-        
+
+        stats = _progress_stats(latest_entry, earliest_entry, total_entries)
+
+        logger.info("📊 Progress stats retrieved for user %s: %s", user.email, payload(stats))
+        return api_response(stats)
+
     except Exception as e:
-        logger.error(f"❌ Error getting progress stats: {str(e)}")
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        logger.error("❌ Error getting progress stats: %s", e)
+        return api_response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
+@idempotent
 def save_goal(request):
     """Save user goal"""
-    import logging
-    logger = logging.getLogger(__name__)
-    
     try:
         user = request.user
         data = request.data
         
-        logger.info(f"🎯 Saving goal for user {user.email}")
-        logger.info(f"📦 Goal data: {data}")
+        logger.info("🎯 Saving goal for user %s", user.email)
+        logger.info("📦 Goal data: %s", payload(data))
         
         goal = Goal.objects.create(
             user=user,
@@ -278,38 +293,36 @@ def save_goal(request):
             progress_percentage=data.get('progress_percentage', 0)
         )
         
-        logger.info(f"✅ Goal saved successfully: {goal.id}")
+        logger.info("✅ Goal saved successfully: %s", goal.id)
         return Response({
             'message': 'Goal saved successfully',
             'goal_id': goal.id
         })
         
     except Exception as e:
-        logger.error(f"❌ Error saving goal: {str(e)}")
+        logger.error("❌ Error saving goal: %s", e)
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
+@idempotent
 def save_completed_workout(request):
     """Save completed workout data"""
-    import logging
-    logger = logging.getLogger(__name__)
-    
     try:
         user = request.user
         data = request.data
         
-        logger.info(f"💪 Saving completed workout for user {user.email}")
-        logger.info(f"📦 Workout data: {data}")
+        logger.info("💪 Saving completed workout for user %s", user.email)
+        logger.info("📦 Workout data: %s", payload(data))
         
-        # Create the completed workout
+        # Create the completed workout; calories are estimated rather than taken from the client
         completed_workout = CompletedWorkout.objects.create(
             user=user,
             workout_name=data.get('workout_name'),
             workout_type=data.get('workout_type', ''),
             date=data.get('date'),
             duration=data.get('duration', 0),
-            calories_burned=data.get('calories_burned', 0),
+            **_estimated_calories(user, data),
             exercises_completed=data.get('exercises_completed', 0),
             notes=data.get('notes', ''),
             rating=data.get('rating')
@@ -318,7 +331,7 @@ def save_completed_workout(request):
         # Get all completed workouts for the user
         user_workouts = CompletedWorkout.objects.filter(user=user).order_by('-date')
         
-        logger.info(f"✅ Completed workout saved successfully: {completed_workout.id}")
+        logger.info("✅ Completed workout saved successfully: %s", completed_workout.id)
         return Response({
             'message': 'Workout saved successfully',
             'workout_id': completed_workout.id,
@@ -327,56 +340,54 @@ def save_completed_workout(request):
         })
         
     except Exception as e:
-        logger.error(f"❌ Error saving completed workout: {str(e)}")
+        logger.error("❌ Error saving completed workout: %s", e)
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-@api_view(['GET'])
-@permission_classes([permissions.IsAuthenticated])
-def get_workout_progress(request):
-    """Get user's workout progress history"""
-    import logging
-    logger = logging.getLogger(__name__)
-    
+@async_api_view(['GET'])
+@cache_per_user('progress', stale_while_revalidate=60)
+async def get_workout_progress_async(request):
+    """Get user's workout progress history; totals and type counts are aggregated in the database"""
     try:
         user = request.user
-        workouts = CompletedWorkout.objects.filter(user=user).order_by('-date')
-        
+        workouts = CompletedWorkout.objects.filter(user=user)
+
         # Pagination
         page = int(request.query_params.get('page', 1))
         page_size = int(request.query_params.get('page_size', 10))
         start = (page - 1) * page_size
         end = start + page_size
-        
-        paginated_workouts = workouts[start:end]
-        
-        # Calculate stats
-        total_workouts = workouts.count()
-        total_duration = sum(workout.duration for workout in workouts if workout.duration)
-        total_calories = sum(workout.calories_burned for workout in workouts if workout.calories_burned)
-        
+
+        totals, type_counts, paginated_workouts = await asyncio.gather(
+            workouts.aaggregate(
+                total_workouts=models.Count('id'),
+                total_duration=models.Sum('duration'),
+                total_calories=models.Sum('calories_burned'),
+            ),
+            alist(workouts.order_by().values_list('workout_type').annotate(count=models.Count('id'))),
+            alist(workouts.order_by('-date')[start:end]),
+        )
+        total_workouts = totals['total_workouts']
+
         # Get workout types distribution
         workout_types = {}
-        for workout in workouts:
-            workout_type = workout.workout_type or 'Other'
-            if workout_type in workout_types:
-                workout_types[workout_type] += 1
-            else:
-                workout_types[workout_type] = 1
-        
+        for workout_type, count in type_counts:
+            workout_type = workout_type or 'Other'
+            workout_types[workout_type] = workout_types.get(workout_type, 0) + count
+
         progress_data = {
-            'workouts': CompletedWorkoutSerializer(paginated_workouts, many=True).data,
+            'workouts': CompletedWorkoutSerializer(paginated_workouts, many=True, context={'request': request}).data,
             'total_workouts': total_workouts,
-            'total_duration': total_duration,
-            'total_calories': total_calories,
+            'total_duration': totals['total_duration'] or 0,
+            'total_calories': totals['total_calories'] or 0,
             'workout_types': workout_types,
             'page': page,
             'page_size': page_size,
             'has_next': end < total_workouts
         }
-        
-        logger.info(f"📊 Workout progress retrieved for user {user.email}")
-        return Response(progress_data)
-        
+
+        logger.info("📊 Workout progress retrieved for user %s", user.email)
+        return api_response(progress_data)
+
     except Exception as e:
-        logger.error(f"❌ Error getting workout progress: {str(e)}")
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        logger.error("❌ Error getting workout progress: %s", e)
+        return api_response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,118 @@
+"""
+The change log behind ``/api/sync/changes/``.
+
+Saving or deleting an object of a synced model records a ``Change`` for the
+user who owns it, as one upsert into that object's row. The log therefore
+holds one row per object, and deleted objects keep theirs as a tombstone.
+On conflict the row moves to the id its insert drew (``SET id =
+excluded.id``), so every change gets a new autoincrement ``id``, and the
+feed uses that id as its cursor. SQLite serializes writers, so ids are
+assigned in commit order and a client never skips a change by syncing past
+it.
+
+Like cache invalidation (``fitness_project.cache.versions``), this relies
+on model signals: ``QuerySet.update()``, ``bulk_create()`` and raw deletes
+must call ``record_change()`` or ``record_changes()`` themselves, as
+``rebalance_shards`` does for the rows it moves to new ids.
+
+The log stays on ``default``. For users on another shard, a change to a
+session, set or progress row is written outside that shard's transaction.
+A change whose object no longer exists is served as a deletion.
+"""
+from django.apps import apps
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import connections, router, transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.utils import timezone
+
+from .models import Change
+
+# Collection name -> (model label, lookup of the owning user), parents first
+COLLECTIONS = {
+    'plans': ('workouts.WorkoutPlan', 'created_by'),
+    'days': ('workouts.WorkoutDay', 'plan__created_by'),
+    'workout_exercises': ('workouts.WorkoutExercise', 'workout_day__plan__created_by'),
+    'sessions': ('workouts.WorkoutSession', 'user'),
+    'sets': ('workouts.ExerciseSet', 'session__user'),
+    'progress_entries': ('progress.ProgressEntry', 'user'),
+    'completed_workouts': ('progress.CompletedWorkout', 'user'),
+    'goals': ('progress.Goal', 'user'),
+    'recommendations': ('ai_engine.AIRecommendation', 'user'),
+}
+
+
+def collections():
+    """``(name, model, owner lookup)`` for every synced collection, parents first"""
+    return [(name, apps.get_model(label), owner) for name, (label, owner) in COLLECTIONS.items()]
+
+
+def owner_id(instance, owner):
+    """The id of the user ``owner`` leads to from ``instance``, or None"""
+    *parents, field = owner.split('__')
+    obj = instance
+    try:
+        for parent in parents:
+            obj = getattr(obj, parent)
+            if obj is None:
+                return None
+    except ObjectDoesNotExist:
+        return None
+    return getattr(obj, f'{field}_id')
+
+
+# Django's bulk_create(update_conflicts=True) cannot update the primary key
+UPSERT = (
+    'INSERT INTO {table} (user_id, collection, object_id, deleted, changed_at) VALUES (%s, %s, %s, %s, %s) '
+    'ON CONFLICT (user_id, collection, object_id) '
+    'DO UPDATE SET id = excluded.id, deleted = excluded.deleted, changed_at = excluded.changed_at'
+)
+
+
+def _upsert(using, collection, objects, deleted):
+    connection = connections[using]
+    changed_at = connection.ops.adapt_datetimefield_value(timezone.now())
+    sql = UPSERT.format(table=connection.ops.quote_name(Change._meta.db_table))
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            (user_id, collection, object_id, deleted, changed_at) for user_id, object_id in objects
+        ])
+
+
+def record_change(user_id, collection, object_id, deleted=False):
+    """Make ``object_id`` the newest change of ``collection`` for ``user_id``"""
+    _upsert(router.db_for_write(Change), collection, [(user_id, object_id)], deleted)
+
+
+def record_changes(collection, objects, deleted=False):
+    """``record_change()`` for many ``(user_id, object_id)`` pairs, e.g. after ``bulk_create()``"""
+    using = router.db_for_write(Change)
+    with transaction.atomic(using=using):
+        _upsert(using, collection, objects, deleted)
+
+
+def _receivers(collection, owner):
+    def record_save(sender, instance, raw=False, **kwargs):
+        if raw:
+            return
+        user_id = owner_id(instance, owner)
+        if user_id is not None:
+            record_change(user_id, collection, instance.pk)
+
+    def remember_owner(sender, instance, **kwargs):
+        # Resolved before the delete, while the parents are still there
+        instance._sync_owner_id = owner_id(instance, owner)
+
+    def record_delete(sender, instance, **kwargs):
+        user_id = getattr(instance, '_sync_owner_id', None)
+        if user_id is not None:
+            record_change(user_id, collection, instance.pk, deleted=True)
+
+    return record_save, remember_owner, record_delete
+
+
+def connect_signals():
+    for name, model, owner in collections():
+        record_save, remember_owner, record_delete = _receivers(name, owner)
+        post_save.connect(record_save, sender=model, weak=False, dispatch_uid=f'sync_save_{name}')
+        pre_delete.connect(remember_owner, sender=model, weak=False, dispatch_uid=f'sync_owner_{name}')
+        post_delete.connect(record_delete, sender=model, weak=False, dispatch_uid=f'sync_delete_{name}')
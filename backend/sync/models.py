@@ -0,0 +1,28 @@
+from django.db import models
+from users.models import User
+
+class Change(models.Model):
+    """The latest change to one synced object of a user; ``id`` is the sync cursor"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sync_changes')
+    
+    # A key of sync.changes.COLLECTIONS and the object's primary key
+    collection = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    
+    # Tombstone: the object was deleted
+    deleted = models.BooleanField(default=False)
+    
+    changed_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        action = 'deleted' if self.deleted else 'changed'
+        return f"{self.user_id} - {self.collection} {self.object_id} {action}"
+    
+    class Meta:
+        db_table = 'sync_changes'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'collection', 'object_id'], name='unique_sync_change'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'id'], name='sync_change_user_cursor'),
+        ]
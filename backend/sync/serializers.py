@@ -0,0 +1,12 @@
+import functools
+from rest_framework import serializers
+
+@functools.lru_cache(maxsize=None)
+def flat_serializer(model):
+    """A ModelSerializer for every field of ``model``, with relations as primary keys.
+
+    Synced objects reference each other by id instead of being embedded,
+    since each collection is synced separately.
+    """
+    meta = type('Meta', (), {'model': model, 'fields': '__all__'})
+    return type(f'Flat{model.__name__}Serializer', (serializers.ModelSerializer,), {'Meta': meta})
@@ -0,0 +1,80 @@
+from django.test import TestCase, override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from progress.models import Goal, ProgressEntry
+from users.models import User
+
+from .changes import record_change, record_changes
+from .models import Change
+
+
+class ChangeLogTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='noa', email='noa@example.com', password='correct horse battery')
+
+    def log(self):
+        return list(Change.objects.filter(user=self.user).order_by('id').values_list('collection', 'object_id', 'deleted'))
+
+    def test_recording_again_moves_the_change_past_newer_ones(self):
+        record_change(self.user.pk, 'goals', 1)
+        record_change(self.user.pk, 'goals', 2)
+        first = Change.objects.get(collection='goals', object_id=1)
+        with self.assertNumQueries(1):
+            record_change(self.user.pk, 'goals', 1, deleted=True)
+        self.assertEqual(self.log(), [('goals', 2, False), ('goals', 1, True)])
+        moved = Change.objects.get(collection='goals', object_id=1)
+        self.assertGreater(moved.id, Change.objects.get(collection='goals', object_id=2).id)
+        self.assertGreaterEqual(moved.changed_at, first.changed_at)
+
+    def test_record_changes_upserts_each_pair(self):
+        record_change(self.user.pk, 'sets', 5)
+        record_changes('sets', [(self.user.pk, 6), (self.user.pk, 5)])
+        self.assertEqual(self.log(), [('sets', 6, False), ('sets', 5, False)])
+
+
+@override_settings(SYNC_PAGE_SIZE=2)
+class SnapshotPagingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='ines', email='ines@example.com', password='correct horse battery')
+        self.headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.user).access_token}',
+            'HTTP_HOST': 'localhost',
+        }
+        self.entries = [
+            ProgressEntry.objects.create(user=self.user, date=f'2026-01-0{day}').pk for day in range(1, 4)
+        ]
+        self.goals = [
+            Goal.objects.create(user=self.user, title=title, description='', goal_type='weight',
+                                target_date='2026-06-01').pk
+            for title in ('Cut', 'Bulk')
+        ]
+
+    def get(self, since=None):
+        response = self.client.get('/api/sync/changes/', {'since': since} if since else {}, **self.headers)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_snapshot_pages_hand_over_to_deltas(self):
+        pages = [self.get()]
+        while pages[-1]['has_more']:
+            pages.append(self.get(pages[-1]['cursor']))
+        self.assertEqual([page['full'] for page in pages], [True, False, False])
+        upserted = {}
+        for page in pages:
+            self.assertLessEqual(sum(len(c['upserted']) for c in page['changes'].values()), 2)
+            for name, change in page['changes'].items():
+                upserted.setdefault(name, []).extend(obj['id'] for obj in change['upserted'])
+        self.assertEqual(upserted['progress_entries'], self.entries)
+        self.assertEqual(upserted['goals'], self.goals)
+        # The last cursor is the change-log watermark read by the first page
+        watermark = pages[-1]['cursor']
+        self.assertEqual(int(watermark), Change.objects.filter(user=self.user).latest('id').id)
+
+        Goal.objects.filter(pk=self.goals[0]).delete()
+        delta = self.get(watermark)
+        self.assertEqual(delta['changes'], {'goals': {'upserted': [], 'deleted': [self.goals[0]]}})
+
+    def test_malformed_cursors_are_rejected(self):
+        for cursor in ('-1', 'abc', '3:goals', '3:unknown:1', '3:goals:x'):
+            response = self.client.get('/api/sync/changes/', {'since': cursor}, **self.headers)
+            self.assertEqual(response.status_code, 400, cursor)
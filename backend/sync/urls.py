@@ -0,0 +1,8 @@
+from django.urls import path
+from . import views
+
+app_name = 'sync'
+
+urlpatterns = [
+    path('changes/', views.get_changes, name='changes'),
+]
@@ -0,0 +1,120 @@
+import logging
+from django.conf import settings
+from django.db import models
+from rest_framework import permissions, status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+from .changes import COLLECTIONS, collections
+from .models import Change
+from .serializers import flat_serializer
+
+logger = logging.getLogger(__name__)
+
+def _serialize(model, objects):
+    return flat_serializer(model)(objects, many=True).data
+
+def _snapshot(user, limit, start=None):
+    """A page of every synced object of ``user``, at most ``limit``: the cursor, changes and whether more follow
+
+    Collections are paged in order by pk. ``start`` is ``(watermark, collection,
+    pk)`` from the cursor of the previous page; after the last page, the cursor
+    is the watermark and the client continues with deltas from there.
+    """
+    if start is None:
+        # Read before the objects: a change landing in between is sent again
+        # by the next delta rather than lost
+        watermark = Change.objects.filter(user=user).aggregate(cursor=models.Max('id'))['cursor'] or 0
+        collection, after = None, 0
+    else:
+        watermark, collection, after = start
+    entries = collections()
+    if collection is not None:
+        entries = entries[[name for name, _, _ in entries].index(collection):]
+
+    changes = {}
+    for name, model, owner in entries:
+        if limit == 0:
+            return f'{watermark}:{name}:{after}', changes, True
+        objects = list(model.objects.filter(pk__gt=after, **{owner: user}).order_by('pk')[:limit + 1])
+        has_more = len(objects) > limit
+        objects = objects[:limit]
+        changes[name] = {'upserted': _serialize(model, objects), 'deleted': []}
+        if has_more:
+            return f'{watermark}:{name}:{objects[-1].pk}', changes, True
+        limit -= len(objects)
+        after = 0
+    return str(watermark), changes, False
+
+def _parse_cursor(value):
+    """``(since, snapshot position or None)`` from a cursor this endpoint returned"""
+    since, _, position = value.partition(':')
+    since = int(since)
+    if since < 0:
+        raise ValueError(value)
+    if not position:
+        return since, None
+    collection, after = position.rsplit(':', 1)
+    if collection not in COLLECTIONS:
+        raise ValueError(value)
+    return since, (since, collection, int(after))
+
+def _delta(user, since, limit):
+    """Changes of ``user`` after ``since``, at most ``limit``, and whether more follow"""
+    rows = list(
+        Change.objects.filter(user=user, id__gt=since).order_by('id')
+        .values_list('id', 'collection', 'object_id', 'deleted')[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    cursor = rows[-1][0] if rows else since
+
+    changed, deleted = {}, {}
+    for _, collection, object_id, is_deleted in rows:
+        (deleted if is_deleted else changed).setdefault(collection, []).append(object_id)
+
+    changes = {}
+    for name, model, owner in collections():
+        ids = changed.get(name, [])
+        gone = deleted.get(name, [])
+        if ids:
+            # Scoped to the owner again, and anything missing counts as deleted
+            objects = list(model.objects.filter(pk__in=ids, **{owner: user}).order_by('pk'))
+            found = {obj.pk for obj in objects}
+            gone = gone + [object_id for object_id in ids if object_id not in found]
+        else:
+            objects = []
+        if objects or gone:
+            changes[name] = {'upserted': _serialize(model, objects), 'deleted': sorted(gone)}
+    return cursor, changes, has_more
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def get_changes(request):
+    """Objects of the user changed since the ``since`` cursor, or all of them without one
+
+    Both are paged by ``SYNC_PAGE_SIZE``: while ``has_more`` is true, the
+    client asks again with the returned cursor. ``full`` marks the first page
+    of a snapshot, where the client starts over.
+    """
+    user = request.user
+    since = request.query_params.get('since')
+    limit = getattr(settings, 'SYNC_PAGE_SIZE', 500)
+
+    if not since:
+        cursor, changes, has_more = _snapshot(user, limit)
+        logger.info("🔄 Full sync for user %s, first page up to cursor %s", user.email, cursor)
+        return Response({'cursor': cursor, 'full': True, 'has_more': has_more, 'changes': changes})
+
+    try:
+        since, position = _parse_cursor(since)
+    except ValueError:
+        return Response({'since': ['Must be a cursor returned by this endpoint.']}, status=status.HTTP_400_BAD_REQUEST)
+
+    if position is not None:
+        cursor, changes, has_more = _snapshot(user, limit, position)
+        logger.info("🔄 Full sync for user %s continued from cursor %s", user.email, cursor)
+        return Response({'cursor': cursor, 'full': False, 'has_more': has_more, 'changes': changes})
+
+    cursor, changes, has_more = _delta(user, since, limit)
+    logger.info("🔄 Delta sync for user %s from cursor %s to %s", user.email, since, cursor)
+    return Response({'cursor': str(cursor), 'full': False, 'has_more': has_more, 'changes': changes})
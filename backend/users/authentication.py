@@ -0,0 +1,124 @@
+"""
+JWT authentication that resolves the user from a short-lived cache.
+
+The stock ``JWTAuthentication`` runs a ``User`` SELECT on every request.
+Here the user is cached for ``AUTH_USER_CACHE_TTL`` seconds under a
+per-user version: saving or deleting a user (which covers deactivation and
+password changes) bumps the version and drops the entry, so a stale user is
+never served after the change is committed.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+def get_user_cache():
+    return caches[getattr(settings, 'AUTH_USER_CACHE_ALIAS', 'default')]
+
+
+def _entry_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def _version_key(user_id):
+    return f'auth:user:{user_id}:version'
+
+
+def invalidate_cached_user(user_id):
+    """Bump the user's cache version and drop the cached entry"""
+    cache = get_user_cache()
+    version_key = _version_key(user_id)
+    cache.add(version_key, 0, timeout=None)
+    try:
+        cache.incr(version_key)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(version_key, 1, timeout=None)
+    cache.delete(_entry_key(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication with a version-invalidated user cache"""
+
+    def _keys(self, validated_token):
+        """Return ``(user_id, entry key, version key)``"""
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+        return user_id, _entry_key(user_id), _version_key(user_id)
+
+    def _cached_user(self, cached, entry_key, version_key):
+        """Return ``(version, cached user or None)`` from a ``get_many()`` result"""
+        version = cached.get(version_key, 0)
+        entry = cached.get(entry_key)
+        if entry is not None and entry[0] == version:
+            return version, entry[1]
+        return version, None
+
+    def _lookup(self, validated_token):
+        """Return ``(user_id, version, cached user or None)``"""
+        user_id, entry_key, version_key = self._keys(validated_token)
+        cached = get_user_cache().get_many([entry_key, version_key])
+        return (user_id, *self._cached_user(cached, entry_key, version_key))
+
+    async def _alookup(self, validated_token):
+        user_id, entry_key, version_key = self._keys(validated_token)
+        cached = await get_user_cache().aget_many([entry_key, version_key])
+        return (user_id, *self._cached_user(cached, entry_key, version_key))
+
+    def _store(self, user_id, version, user):
+        # Stored under the version read *before* the query, so a concurrent
+        # invalidation makes this entry unusable rather than stale
+        get_user_cache().set(_entry_key(user_id), (version, user), getattr(settings, 'AUTH_USER_CACHE_TTL', 60))
+
+    async def _astore(self, user_id, version, user):
+        await get_user_cache().aset(_entry_key(user_id), (version, user), getattr(settings, 'AUTH_USER_CACHE_TTL', 60))
+
+    def _check(self, user, validated_token):
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+        return user
+
+    def get_user(self, validated_token):
+        user_id, version, user = self._lookup(validated_token)
+        if user is None:
+            try:
+                user = self.user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            self._store(user_id, version, user)
+        return self._check(user, validated_token)
+
+    async def aget_user(self, validated_token):
+        user_id, version, user = await self._alookup(validated_token)
+        if user is None:
+            try:
+                user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            await self._astore(user_id, version, user)
+        return self._check(user, validated_token)
+
+    async def aauthenticate(self, request):
+        """``authenticate()`` for async views, using the cache's async API"""
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
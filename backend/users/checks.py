@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+from .token_blacklist import CacheTokenBlacklist, get_token_blacklist
+
+
+def _other_cache_aliases():
+    """Cache aliases that other features fill with evictable entries"""
+    return {
+        'API_CACHE_ALIAS': getattr(settings, 'API_CACHE_ALIAS', 'default'),
+        'IDEMPOTENCY_CACHE_ALIAS': getattr(settings, 'IDEMPOTENCY_CACHE_ALIAS', 'default'),
+        'AUTH_USER_CACHE_ALIAS': getattr(settings, 'AUTH_USER_CACHE_ALIAS', 'default'),
+        "AI_RESULT_CACHE['ALIAS']": getattr(settings, 'AI_RESULT_CACHE', {}).get('ALIAS', 'default'),
+        "EXERCISE_SUBSTITUTIONS['ALIAS']": getattr(settings, 'EXERCISE_SUBSTITUTIONS', {}).get('ALIAS', 'default'),
+    }
+
+
+@register()
+def check_token_blacklist_shared(app_configs, **kwargs):
+    """A per-process blacklist only rejects rotated tokens in the process that rotated them"""
+    workers = getattr(settings, 'WORKER_PROCESSES', 1)
+    blacklist = get_token_blacklist()
+    if workers > 1 and blacklist.process_local:
+        return [Error(
+            f'The token blacklist ({type(blacklist).__name__}) is per process, but '
+            f'WORKER_PROCESSES is {workers}: a rotated refresh token can be replayed against another worker.',
+            hint='Use users.token_blacklist.CacheTokenBlacklist on a shared cache '
+                 '(FileCache or RespCache) in settings.TOKEN_BLACKLIST.',
+            id='users.E001',
+        )]
+    return []
+
+
+@register()
+def check_token_blacklist_durable(app_configs, **kwargs):
+    """A blacklisted JTI that is evicted or cleared before it expires can be replayed"""
+    blacklist = get_token_blacklist()
+    if not isinstance(blacklist, CacheTokenBlacklist):
+        return []
+    shared = [name for name, alias in _other_cache_aliases().items() if alias == blacklist.alias]
+    if not blacklist.process_local and not shared:
+        return []
+    reason = (f'is also used by {", ".join(shared)}' if shared
+              else 'is an in-process cache that evicts under pressure')
+    return [Error(
+        f'The token blacklist cache {blacklist.alias!r} {reason}: an evicted JTI lets a rotated '
+        f'refresh token be replayed.',
+        hint='Give CacheTokenBlacklist a dedicated alias on a shared backend that does not evict '
+             'live keys, or use users.token_blacklist.InMemoryTokenBlacklist with one worker process.',
+        id='users.E002',
+    )]
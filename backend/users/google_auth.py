@@ -0,0 +1,179 @@
+"""
+Google ID token verification with cached signing certificates.
+
+``id_token.verify_oauth2_token`` downloads Google's certificates on every
+call. ``GoogleCertCache`` keeps them for the ``max-age`` the certs endpoint
+advertises in ``Cache-Control``:
+
+- shortly before expiry a single background thread refreshes them while
+  callers keep using the current set;
+- callers that find the cache expired share one fetch (single flight);
+- after ``failure_threshold`` consecutive failed fetches a circuit breaker
+  stops calling the endpoint for ``cooldown`` seconds, serving the last good
+  certificates for up to ``stale_if_error`` seconds past their expiry.
+
+The endpoint is ``settings.GOOGLE_OAUTH2_CERTS_URL``, so tests and local
+development can point it at a stand-in key server.
+"""
+import json
+import logging
+import re
+import threading
+import time
+
+import requests as http
+from django.conf import settings
+from google.auth import jwt
+from google.auth.transport import requests as google_requests
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+GOOGLE_OAUTH2_CERTS_URL = 'https://www.googleapis.com/oauth2/v1/certs'
+
+_MAX_AGE = re.compile(r'max-age=(\d+)')
+
+
+class CertificateFetchError(Exception):
+    """Google's signing certificates could not be obtained"""
+
+
+class GoogleCertCache:
+    """Process-wide cache of Google's ``{key id: x509 certificate}`` mapping"""
+
+    def __init__(self, certs_url=GOOGLE_OAUTH2_CERTS_URL, default_max_age=300, refresh_ahead=60,
+                 min_refresh_interval=60, stale_if_error=3600, failure_threshold=3, cooldown=30,
+                 timeout=5):
+        self.certs_url = certs_url
+        self.default_max_age = default_max_age
+        self.refresh_ahead = refresh_ahead
+        self.min_refresh_interval = min_refresh_interval
+        self.stale_if_error = stale_if_error
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.timeout = timeout
+
+        self._certs = None
+        self._expires_at = 0
+        self._fetched_at = 0
+        self._generation = 0
+        self._failures = 0
+        self._open_until = 0
+        self._refreshing = False
+        self._state_lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        # Keep-alive session shared by every fetch
+        self._request = google_requests.Request(http.Session())
+
+    def _fetch(self):
+        response = self._request(self.certs_url, method='GET', timeout=self.timeout)
+        if response.status != 200:
+            raise CertificateFetchError(f"Certificate endpoint returned {response.status}")
+        certs = json.loads(response.data.decode('utf-8'))
+        match = _MAX_AGE.search(response.headers.get('cache-control', ''))
+        max_age = int(match.group(1)) if match else self.default_max_age
+        return certs, max_age
+
+    def _refresh(self, generation):
+        """Fetch the certificates unless another caller already replaced ``generation``"""
+        with self._fetch_lock:
+            if self._generation != generation:
+                return
+            now = time.monotonic()
+            if now < self._open_until:
+                raise CertificateFetchError("Certificate endpoint circuit is open")
+            try:
+                certs, max_age = self._fetch()
+            except Exception as e:
+                self._failures += 1
+                if self._failures >= self.failure_threshold:
+                    self._open_until = now + self.cooldown
+                    logger.warning("Google certificate fetch failed %s times, pausing for %ss",
+                                   self._failures, self.cooldown)
+                raise CertificateFetchError(str(e)) from e
+            self._failures = 0
+            self._certs = certs
+            self._fetched_at = now
+            self._expires_at = now + max_age
+            self._generation += 1
+
+    def _refresh_in_background(self, generation):
+        with self._state_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self._refresh(generation)
+            except CertificateFetchError as e:
+                logger.warning("Background Google certificate refresh failed: %s", e)
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name='google-certs-refresh', daemon=True).start()
+
+    def get_certs(self, force=False):
+        """Return the current certificates, fetching them only when needed.
+
+        ``force`` refetches (at most once per ``min_refresh_interval``) when a
+        token names a key id the cached set does not know about yet.
+        """
+        generation, certs, expires_at = self._generation, self._certs, self._expires_at
+        now = time.monotonic()
+
+        if certs is not None:
+            if force:
+                if now - self._fetched_at < self.min_refresh_interval:
+                    return certs
+            elif now < expires_at - self.refresh_ahead:
+                return certs
+            elif now < expires_at:
+                self._refresh_in_background(generation)
+                return certs
+
+        try:
+            self._refresh(generation)
+        except CertificateFetchError:
+            if certs is not None and now < expires_at + self.stale_if_error:
+                return certs
+            raise
+        return self._certs
+
+
+_cert_cache = None
+_cert_cache_lock = threading.Lock()
+
+
+def get_google_cert_cache():
+    global _cert_cache
+    if _cert_cache is None:
+        with _cert_cache_lock:
+            if _cert_cache is None:
+                _cert_cache = GoogleCertCache(
+                    certs_url=getattr(settings, 'GOOGLE_OAUTH2_CERTS_URL', GOOGLE_OAUTH2_CERTS_URL),
+                    **getattr(settings, 'GOOGLE_CERT_CACHE', {}),
+                )
+    return _cert_cache
+
+
+def verify_google_id_token(token, audience=None, clock_skew_in_seconds=0):
+    """Drop-in for ``id_token.verify_oauth2_token`` using the cached certificates.
+
+    Raises ``ValueError`` for invalid tokens and ``CertificateFetchError``
+    when no usable certificates are available.
+    """
+    cache = get_google_cert_cache()
+    certs = cache.get_certs()
+
+    key_id = jwt.decode_header(token).get('kid')
+    if key_id is not None and key_id not in certs:
+        # Google rotated its keys before our cached set expired
+        certs = cache.get_certs(force=True)
+
+    idinfo = jwt.decode(token, certs=certs, audience=audience, clock_skew_in_seconds=clock_skew_in_seconds)
+
+    if idinfo.get('iss') not in GOOGLE_ISSUERS:
+        raise ValueError(f"Wrong issuer. 'iss' should be one of the following: {GOOGLE_ISSUERS}")
+
+    return idinfo
@@ -1,8 +1,14 @@
 from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
 from django.contrib.auth import authenticate
+from django.utils.translation import gettext_lazy as _
+from fitness_project.fieldsets import FieldsetMixin
+from .token_blacklist import get_token_blacklist
 from .models import User, BodyComposition, BodyMeasurements, GoalMeasurements
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(FieldsetMixin, serializers.ModelSerializer):
     """Serializer for User model with frontend field mapping"""
     # Frontend field names (camelCase)
     fitnessGoal = serializers.CharField(source='fitness_goal', required=False)
@@ -73,7 +79,7 @@ class UserLoginSerializer(serializers.Serializer):
         
         return attrs
 
-class BodyCompositionSerializer(serializers.ModelSerializer):
+class BodyCompositionSerializer(FieldsetMixin, serializers.ModelSerializer):
     """Serializer for BodyComposition model with frontend field mapping"""
     # Frontend field names (camelCase)
     bodyFat = serializers.DecimalField(source='body_fat', max_digits=4, decimal_places=1, required=False)
@@ -96,7 +102,7 @@ class BodyCompositionSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
 
-class BodyMeasurementsSerializer(serializers.ModelSerializer):
+class BodyMeasurementsSerializer(FieldsetMixin, serializers.ModelSerializer):
     """Serializer for BodyMeasurements model with frontend field mapping"""
     # Frontend field names (matching actual usage)
     leftarm = serializers.DecimalField(source='left_arm', max_digits=4, decimal_places=1, required=False)
@@ -113,7 +119,7 @@ class BodyMeasurementsSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
 
-class GoalMeasurementsSerializer(serializers.ModelSerializer):
+class GoalMeasurementsSerializer(FieldsetMixin, serializers.ModelSerializer):
     """Serializer for GoalMeasurements model with frontend field mapping"""
     # Frontend field names (matching actual usage)
     leftarm = serializers.DecimalField(source='left_arm', max_digits=4, decimal_places=1, required=False)
@@ -131,7 +137,7 @@ class GoalMeasurementsSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
 
-class UserCompleteProfileSerializer(serializers.ModelSerializer):
+class UserCompleteProfileSerializer(FieldsetMixin, serializers.ModelSerializer):
     """Complete user profile with related data and frontend field mapping"""
     # Frontend field names (camelCase)
     fitnessGoal = serializers.CharField(source='fitness_goal', required=False)
@@ -161,4 +167,65 @@ class OnboardingStepSerializer(serializers.Serializer):
         valid_steps = ['profile', 'goals', 'body_composition', 'body_model', 'specific_goals']
         if value not in valid_steps:
             raise serializers.ValidationError(f"Invalid step. Must be one of: {valid_steps}")
-        return value
\ No newline at end of file
+        return value
+
+class OnboardingGoalsSerializer(serializers.ModelSerializer):
+    """Serializer for the goals onboarding step, limited to the fields that step updates"""
+    fitnessGoal = serializers.CharField(source='fitness_goal', required=False)
+    specificGoal = serializers.CharField(source='specific_goal', required=False)
+    
+    class Meta:
+        model = User
+        fields = ['fitnessGoal', 'specificGoal']
+
+class OnboardingCommitSerializer(serializers.Serializer):
+    """Serializer for committing every onboarding step in a single request"""
+    profile = UserProfileSerializer(required=False)
+    goals = OnboardingGoalsSerializer(required=False)
+    body_composition = BodyCompositionSerializer(required=False)
+    body_model = BodyMeasurementsSerializer(required=False)
+    specific_goals = GoalMeasurementsSerializer(required=False)
+    complete = serializers.BooleanField(default=True)
+    
+    def to_internal_value(self, data):
+        # Match update_onboarding_step: null values leave the stored value unchanged
+        if isinstance(data, dict):
+            data = {
+                key: {k: v for k, v in value.items() if v is not None} if isinstance(value, dict) else value
+                for key, value in data.items()
+            }
+        return super().to_internal_value(data)
+    
+    def validate(self, attrs):
+        steps = ['profile', 'goals', 'body_composition', 'body_model', 'specific_goals']
+        if not any(attrs.get(step) for step in steps) and not attrs.get('complete'):
+            raise serializers.ValidationError(f"At least one of {steps} must be provided")
+        return attrs
+
+class RotatingTokenRefreshSerializer(TokenRefreshSerializer):
+    """Token refresh that rejects rotated refresh tokens via the JTI blacklist"""
+    
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        jti = refresh[api_settings.JTI_CLAIM]
+        blacklist = get_token_blacklist()
+        
+        data = {'access': str(refresh.access_token)}
+        
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                # add() is check-and-set, so two concurrent refreshes of the
+                # same token cannot both succeed
+                if not blacklist.add(jti, refresh['exp']):
+                    raise InvalidToken(_('Token is blacklisted'))
+            elif blacklist.contains(jti, refresh['exp']):
+                raise InvalidToken(_('Token is blacklisted'))
+            
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+        elif blacklist.contains(jti, refresh['exp']):
+            raise InvalidToken(_('Token is blacklisted'))
+        
+        return data
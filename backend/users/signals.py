@@ -0,0 +1,15 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .authentication import invalidate_cached_user
+from .models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_cache(sender, instance, **kwargs):
+    """Drop the cached auth user on save (covers deactivation and password changes) and delete"""
+    invalidate_cached_user(instance.pk)
+    # Invalidate again once committed so readers that loaded the old row
+    # mid-transaction cannot keep it cached
+    transaction.on_commit(lambda: invalidate_cached_user(instance.pk))
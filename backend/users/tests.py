@@ -1,3 +1,451 @@
-from django.test import TestCase
+import json
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import rsa
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.client import RequestFactory
+from google.auth import crypt, jwt
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import google_auth, token_blacklist
+from .authentication import CachedJWTAuthentication, _entry_key, _version_key, get_user_cache
+from .checks import check_token_blacklist_durable, check_token_blacklist_shared
+from .google_auth import CertificateFetchError, GoogleCertCache, verify_google_id_token
+from .models import BodyComposition, User
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        get_user_cache().clear()
+        self.user = User.objects.create_user(
+            username='alex', email='alex@example.com', password='correct horse battery'
+        )
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+        self.auth = CachedJWTAuthentication()
+
+    def authenticate(self, token=None):
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token or self.token}')
+        user, _ = self.auth.authenticate(request)
+        return user
+
+    def test_warm_cache_runs_no_queries(self):
+        with self.assertNumQueries(1):
+            self.authenticate()
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+        self.assertEqual(user.pk, self.user.pk)
+
+    def test_async_path_uses_async_cache_api(self):
+        cache = get_user_cache()
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        with mock.patch.object(self.auth, '_lookup') as lookup, mock.patch.object(self.auth, '_store') as store, \
+                mock.patch.object(cache, 'aget_many', wraps=cache.aget_many) as aget_many, \
+                mock.patch.object(cache, 'aset', wraps=cache.aset) as aset:
+            cold, _ = async_to_sync(self.auth.aauthenticate)(request)
+            with self.assertNumQueries(0):
+                warm, _ = async_to_sync(self.auth.aauthenticate)(request)
+        self.assertEqual((cold.pk, warm.pk), (self.user.pk, self.user.pk))
+        lookup.assert_not_called()
+        store.assert_not_called()
+        self.assertEqual((aget_many.await_count, aset.await_count), (2, 1))
+
+    def test_save_drops_cached_user(self):
+        self.authenticate()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.first_name = 'Alexandra'
+            self.user.save()
+        with self.assertNumQueries(1):
+            user = self.authenticate()
+        self.assertEqual(user.first_name, 'Alexandra')
+
+    def test_deactivated_user_is_rejected(self):
+        self.authenticate()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        with self.assertRaises(AuthenticationFailed) as raised:
+            self.authenticate()
+        self.assertEqual(raised.exception.detail['code'], 'user_inactive')
+
+    def test_password_change_revokes_token(self):
+        self.authenticate()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password('another horse battery')
+            self.user.save()
+        with self.assertRaises(AuthenticationFailed) as raised:
+            self.authenticate()
+        self.assertEqual(raised.exception.detail['code'], 'password_changed')
+        # Tokens issued after the change are accepted
+        self.assertEqual(self.authenticate(str(RefreshToken.for_user(self.user).access_token)).pk, self.user.pk)
+
+    def test_deleted_user_is_rejected(self):
+        self.authenticate()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        with self.assertRaises(AuthenticationFailed) as raised:
+            self.authenticate()
+        self.assertEqual(raised.exception.detail['code'], 'user_not_found')
+
+    def test_signals_invalidate_again_on_commit(self):
+        self.authenticate()
+        cache = get_user_cache()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.user.is_active = False
+            self.user.save()
+            # The save dropped the entry right away
+            self.assertIsNone(cache.get(_entry_key(self.user.pk)))
+            # A reader that loaded the old row before the commit caches it
+            # under the version it saw
+            stale = User.objects.get(pk=self.user.pk)
+            stale.is_active = True
+            self.auth._store(self.user.pk, cache.get(_version_key(self.user.pk)), stale)
+            self.assertTrue(self.authenticate().is_active)
+        self.assertTrue(callbacks)
+        for callback in callbacks:
+            callback()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+
+
+class TokenBlacklistCheckTests(SimpleTestCase):
+    def run_check(self, workers, backend, **options):
+        config = {'BACKEND': f'users.token_blacklist.{backend}', 'OPTIONS': options}
+        with mock.patch.object(token_blacklist, '_blacklist', None), \
+                override_settings(WORKER_PROCESSES=workers, TOKEN_BLACKLIST=config):
+            return [
+                error.id
+                for check in (check_token_blacklist_shared, check_token_blacklist_durable)
+                for error in check(None)
+            ]
+
+    def test_single_process_may_keep_the_blacklist_in_memory(self):
+        self.assertEqual(self.run_check(1, 'InMemoryTokenBlacklist'), [])
+
+    def test_process_local_blacklist_fails_with_several_workers(self):
+        self.assertEqual(self.run_check(4, 'InMemoryTokenBlacklist'), ['users.E001'])
+        # The default cache is an in-process LRU cache
+        self.assertEqual(self.run_check(4, 'CacheTokenBlacklist', alias='default'), ['users.E001', 'users.E002'])
+
+    def test_evicting_or_shared_alias_fails(self):
+        with tempfile.TemporaryDirectory() as location:
+            caches = {
+                'default': {'BACKEND': 'fitness_project.cache.backends.FileCache', 'LOCATION': location},
+            }
+            with override_settings(CACHES=caches):
+                self.assertEqual(self.run_check(1, 'CacheTokenBlacklist', alias='default'), ['users.E002'])
+
+    def test_shared_cache_passes_with_several_workers(self):
+        with tempfile.TemporaryDirectory() as location:
+            caches = {
+                'default': {'BACKEND': 'fitness_project.cache.backends.LRUCache'},
+                'shared': {'BACKEND': 'fitness_project.cache.backends.FileCache', 'LOCATION': location},
+            }
+            with override_settings(CACHES=caches):
+                self.assertEqual(self.run_check(4, 'CacheTokenBlacklist', alias='shared'), [])
+
+
+class InMemoryTokenBlacklistTests(SimpleTestCase):
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = token_blacklist.BloomFilter(1000, error_rate=0.01)
+        members = [token_blacklist._hash(f'member-{i}'.encode()) for i in range(1000)]
+        for hashes in members:
+            bloom.add(hashes)
+        self.assertTrue(all(bloom.might_contain(hashes) for hashes in members))
+        false_positives = sum(bloom.might_contain(token_blacklist._hash(f'other-{i}'.encode())) for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_add_is_check_and_set(self):
+        blacklist = token_blacklist.InMemoryTokenBlacklist(lifetime=3600)
+        exp = time.time() + 600
+        self.assertFalse(blacklist.contains('ab' * 16, exp))
+        self.assertTrue(blacklist.add('ab' * 16, exp))
+        self.assertFalse(blacklist.add('ab' * 16, exp))
+        self.assertTrue(blacklist.contains('ab' * 16, exp))
+        # Already expired tokens need no entry
+        self.assertTrue(blacklist.add('cd' * 16, time.time() - 1))
+        self.assertEqual(blacklist.stats()['entries'], 1)
+
+    def test_expired_buckets_are_pruned(self):
+        blacklist = token_blacklist.InMemoryTokenBlacklist(lifetime=3600, buckets=4)
+        now = 1_000_000_000
+        with mock.patch.object(token_blacklist.time, 'time', return_value=now):
+            blacklist.add('01' * 16, now + 100)
+            blacklist.add('02' * 16, now + 3000)
+        self.assertEqual(blacklist.stats()['buckets'], 2)
+        # Once the first bucket's window has passed, the next add() drops it
+        later = (int((now + 100) // blacklist.bucket_width) + 1) * blacklist.bucket_width
+        with mock.patch.object(token_blacklist.time, 'time', return_value=later):
+            blacklist.add('03' * 16, now + 3000)
+        stats = blacklist.stats()
+        self.assertEqual((stats['buckets'], stats['entries']), (1, 2))
+        self.assertFalse(blacklist.contains('01' * 16, now + 100))
+        self.assertTrue(blacklist.contains('02' * 16, now + 3000))
+
+
+class TokenRefreshTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(token_blacklist, '_blacklist', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(username='pat', email='pat@example.com', password='correct horse battery')
+        self.refresh_token = str(RefreshToken.for_user(self.user))
+
+    def refresh(self, token):
+        return self.client.post('/api/auth/token/refresh/', {'refresh': token},
+                                content_type='application/json', HTTP_HOST='localhost')
+
+    def test_rotated_token_cannot_be_replayed(self):
+        first = self.refresh(self.refresh_token)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(self.refresh(self.refresh_token).status_code, 401)
+        # The rotated-in token still works once
+        self.assertEqual(self.refresh(first.json()['refresh']).status_code, 200)
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'fitness_project.cache.backends.LRUCache', 'OPTIONS': {'MAX_ENTRIES': 10}},
+    })
+    def test_replay_is_rejected_under_cache_pressure(self):
+        self.assertEqual(self.refresh(self.refresh_token).status_code, 200)
+        cache = caches['default']
+        for i in range(100):
+            cache.set(f'filler:{i}', i)
+        cache.clear()
+        self.assertEqual(self.refresh(self.refresh_token).status_code, 401)
+
+
+class KeyServer:
+    """Local stand-in for Google's certificate endpoint, counting fetches"""
+
+    def __init__(self):
+        self.keys = {}
+        self.status = 200
+        self.max_age = 3600
+        self.delay = 0
+        self.fetches = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.fetches += 1
+                time.sleep(server.delay)
+                body = json.dumps(server.keys).encode()
+                self.send_response(server.status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Cache-Control', f'public, max-age={server.max_age}')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.httpd.server_port}/oauth2/v1/certs'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class GoogleCertCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.signers, cls.public_keys = {}, {}
+        for key_id in ('first', 'second'):
+            public_key, private_key = rsa.newkeys(1024)
+            cls.signers[key_id] = crypt.RSASigner.from_string(private_key.save_pkcs1(), key_id=key_id)
+            cls.public_keys[key_id] = public_key.save_pkcs1().decode()
+
+    def setUp(self):
+        self.server = KeyServer()
+        self.addCleanup(self.server.close)
+        self.server.keys = {'first': self.public_keys['first']}
+        # verify_google_id_token() and google_login use a fresh process-wide cache
+        patcher = mock.patch.object(google_auth, '_cert_cache', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_cache(self, **options):
+        return GoogleCertCache(certs_url=self.server.url, **options)
+
+    def make_token(self, key_id='first'):
+        now = int(time.time())
+        return jwt.encode(self.signers[key_id], {
+            'iss': 'https://accounts.google.com',
+            'aud': settings.GOOGLE_OAUTH2_CLIENT_ID,
+            'sub': '1234567890',
+            'email': 'sam@example.com',
+            'iat': now,
+            'exp': now + 600,
+        }).decode()
+
+    def test_concurrent_cold_start_fetches_once(self):
+        cache = self.make_cache()
+        self.server.delay = 0.2
+        barrier = threading.Barrier(8)
+        results = []
+
+        def login():
+            barrier.wait()
+            results.append(cache.get_certs())
+
+        threads = [threading.Thread(target=login) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.server.fetches, 1)
+        self.assertEqual(results, [{'first': self.public_keys['first']}] * 8)
+
+    def test_warm_login_fetches_nothing(self):
+        with override_settings(GOOGLE_OAUTH2_CERTS_URL=self.server.url):
+            self.assertEqual(verify_google_id_token(self.make_token(), settings.GOOGLE_OAUTH2_CLIENT_ID)['sub'], '1234567890')
+            self.assertEqual(self.server.fetches, 1)
+            for _ in range(5):
+                verify_google_id_token(self.make_token(), settings.GOOGLE_OAUTH2_CLIENT_ID)
+        self.assertEqual(self.server.fetches, 1)
+
+    def test_unknown_key_id_forces_refresh(self):
+        cache_options = {'min_refresh_interval': 0}
+        with override_settings(GOOGLE_OAUTH2_CERTS_URL=self.server.url, GOOGLE_CERT_CACHE=cache_options):
+            verify_google_id_token(self.make_token('first'), settings.GOOGLE_OAUTH2_CLIENT_ID)
+            # Google rotates its keys before the cached set expires
+            self.server.keys = {key_id: self.public_keys[key_id] for key_id in ('first', 'second')}
+            idinfo = verify_google_id_token(self.make_token('second'), settings.GOOGLE_OAUTH2_CLIENT_ID)
+        self.assertEqual(idinfo['email'], 'sam@example.com')
+        self.assertEqual(self.server.fetches, 2)
+
+    def test_unknown_key_id_refreshes_at_most_once_per_interval(self):
+        with override_settings(GOOGLE_OAUTH2_CERTS_URL=self.server.url):
+            verify_google_id_token(self.make_token('first'), settings.GOOGLE_OAUTH2_CLIENT_ID)
+            for _ in range(3):
+                with self.assertRaises(ValueError):
+                    verify_google_id_token(self.make_token('second'), settings.GOOGLE_OAUTH2_CLIENT_ID)
+        self.assertEqual(self.server.fetches, 1)
+
+    def test_circuit_opens_after_consecutive_failures(self):
+        cache = self.make_cache(failure_threshold=2, cooldown=60)
+        self.server.status = 500
+        with self.assertLogs('users.google_auth', 'WARNING'):
+            for _ in range(2):
+                with self.assertRaises(CertificateFetchError):
+                    cache.get_certs()
+        with self.assertRaisesMessage(CertificateFetchError, 'circuit is open'):
+            cache.get_certs()
+        self.assertEqual(self.server.fetches, 2)
+
+    def test_expired_certificates_are_served_stale_if_error(self):
+        self.server.max_age = 0
+        cache = self.make_cache(refresh_ahead=0, stale_if_error=3600, failure_threshold=1, cooldown=60)
+        certs = cache.get_certs()
+        self.server.status = 500
+        with self.assertLogs('users.google_auth', 'WARNING'):
+            self.assertEqual(cache.get_certs(), certs)
+        # The circuit is open now; the stale set is still served without a fetch
+        self.assertEqual(cache.get_certs(), certs)
+        self.assertEqual(self.server.fetches, 2)
+
+    def test_stale_certificates_expire(self):
+        self.server.max_age = 0
+        cache = self.make_cache(refresh_ahead=0, stale_if_error=0)
+        cache.get_certs()
+        self.server.status = 500
+        with self.assertRaises(CertificateFetchError):
+            cache.get_certs()
+
+    def test_google_login_returns_503_without_certificates(self):
+        self.server.status = 503
+        with override_settings(GOOGLE_OAUTH2_CERTS_URL=self.server.url), self.assertLogs('users.views'):
+            response = self.client.post(
+                '/api/auth/google-login/', {'id_token': self.make_token()},
+                content_type='application/json', HTTP_HOST='localhost',
+            )
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json(), {'error': 'Google login is temporarily unavailable'})
+        self.assertFalse(User.objects.filter(email='sam@example.com').exists())
+
+
+class UserProfileTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='kim', email='kim@example.com', password='correct horse battery')
+        BodyComposition.objects.create(user=self.user, composition_image='body_compositions/kim.png')
+        self.headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.user).access_token}',
+            'HTTP_HOST': 'localhost',
+        }
+
+    def test_async_profile_matches_sync_view(self):
+        async_profile = self.client.get('/api/auth/profile/', **self.headers).json()
+        # PUT goes to the synchronous UserProfileView
+        sync_profile = self.client.put('/api/auth/profile/', {}, content_type='application/json', **self.headers).json()
+        self.assertEqual(
+            async_profile['bodyComposition']['composition_image'],
+            'http://localhost/media/body_compositions/kim.png',
+        )
+        # Apart from the PUT touching updated_at
+        async_profile.pop('updated_at'), sync_profile.pop('updated_at')
+        self.assertEqual(async_profile, sync_profile)
+
+
+class OnboardingCommitTests(TestCase):
+    def setUp(self):
+        get_user_cache().clear()
+        self.user = User.objects.create_user(username='lee', email='lee@example.com', password='correct horse battery')
+        self.headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.user).access_token}',
+            'HTTP_HOST': 'localhost',
+        }
+
+    def commit(self, payload):
+        return self.client.post('/api/auth/onboarding/commit/', payload, content_type='application/json', **self.headers)
+
+    def test_commits_every_step(self):
+        response = self.commit({
+            'profile': {'height': 180, 'gender': 'male'},
+            'goals': {'fitnessGoal': 'gain_weight', 'specificGoal': 'build_muscle'},
+            'body_composition': {'bodyFat': '18.5'},
+        })
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.height, self.user.fitness_goal), (180, 'gain_weight'))
+        self.assertTrue(self.user.has_completed_onboarding)
+        self.assertEqual(str(self.user.body_composition.body_fat), '18.5')
+
+    def test_goals_step_only_updates_goal_fields(self):
+        self.commit({'goals': {'fitnessGoal': 'maintain', 'height': 150, 'hasCompletedOnboarding': False}})
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.fitness_goal, 'maintain')
+        self.assertIsNone(self.user.height)
+        self.assertTrue(self.user.has_completed_onboarding)
+
+    def test_invalid_step_writes_nothing(self):
+        response = self.commit({
+            'profile': {'height': 180},
+            'goals': {'fitnessGoal': 'gain_weight'},
+            'body_composition': {'bodyFat': 'lots'},
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('body_composition', response.json())
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.height, self.user.fitness_goal), (None, None))
+        self.assertFalse(self.user.has_completed_onboarding)
+
+    def test_failed_write_rolls_back_earlier_steps(self):
+        with mock.patch.object(BodyComposition.objects, 'update_or_create', side_effect=RuntimeError('disk full')):
+            with self.assertRaises(RuntimeError):
+                self.commit({'profile': {'height': 180}, 'body_composition': {'bodyFat': '18.5'}})
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.height)
+        self.assertFalse(self.user.has_completed_onboarding)
+        self.assertFalse(BodyComposition.objects.filter(user=self.user).exists())
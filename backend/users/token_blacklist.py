@@ -0,0 +1,171 @@
+"""
+Refresh-token blacklist backends.
+
+``ROTATE_REFRESH_TOKENS`` issues a new refresh token on every refresh, so the
+old one has to be rejected from then on. Instead of simplejwt's
+``token_blacklist`` app (one INSERT plus one SELECT per refresh) the JTIs of
+rotated tokens are kept in expiring sets:
+
+- ``InMemoryTokenBlacklist`` buckets JTIs by their ``exp``, which is fixed
+  for a given JTI, so a lookup only visits one bucket. Each bucket has a
+  Bloom filter in front of the exact set, so the common "not blacklisted"
+  answer never touches the set, and whole buckets are dropped once every
+  token in them has expired. Storage is bounded by the number of rotations
+  within ``REFRESH_TOKEN_LIFETIME``. State is per process. This is the
+  default.
+- ``CacheTokenBlacklist`` stores one key per JTI in a Django cache with a
+  timeout equal to the token's remaining lifetime, for deployments with
+  several worker processes sharing a cache. An evicted or cleared key lets
+  the rotated token be replayed, so the cache has to be a dedicated alias
+  that does not evict before expiry.
+
+Select the backend with ``settings.TOKEN_BLACKLIST``. A backend whose state
+is per process (``process_local``) lets a rotated token be replayed against
+another worker, so ``check`` fails when one is used with more than one of
+``settings.WORKER_PROCESSES``. It also fails when ``CacheTokenBlacklist``
+uses an in-process cache or an alias that other features fill.
+"""
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework_simplejwt.settings import api_settings
+
+from fitness_project.cache.backends import is_process_local
+
+DEFAULT_BACKEND = 'users.token_blacklist.InMemoryTokenBlacklist'
+
+
+def _hash(key):
+    digest = hashlib.blake2b(key, digest_size=16).digest()
+    # Second hash is forced odd so it is never a multiple of the filter size
+    return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter using double hashing over a bytearray"""
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(1, capacity)
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def add(self, hashes):
+        h1, h2 = hashes
+        for i in range(self.hash_count):
+            position = (h1 + i * h2) % self.size
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def might_contain(self, hashes):
+        h1, h2 = hashes
+        bits, size = self.bits, self.size
+        for i in range(self.hash_count):
+            position = (h1 + i * h2) % size
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class InMemoryTokenBlacklist:
+    """Expiring JTI sets bucketed by token expiry, each fronted by a Bloom filter"""
+
+    process_local = True
+
+    def __init__(self, lifetime=None, buckets=24, bucket_capacity=50000, error_rate=0.01):
+        lifetime = lifetime or api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()
+        self.bucket_width = max(1, math.ceil(lifetime / buckets))
+        self.bucket_capacity = bucket_capacity
+        self.error_rate = error_rate
+        self._buckets = {}  # bucket index -> (BloomFilter, set of JTI bytes)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(jti):
+        # simplejwt JTIs are uuid4 hex; store them as 16 raw bytes
+        try:
+            return bytes.fromhex(jti)
+        except ValueError:
+            return jti.encode()
+
+    def _contains(self, index, key):
+        bucket = self._buckets.get(index)
+        return bucket is not None and bucket[0].might_contain(_hash(key)) and key in bucket[1]
+
+    def _prune(self, now):
+        expired = [index for index in self._buckets if (index + 1) * self.bucket_width <= now]
+        for index in expired:
+            del self._buckets[index]
+
+    def add(self, jti, exp):
+        """Blacklist ``jti`` until ``exp``. Returns False if it was already blacklisted."""
+        now = time.time()
+        if exp <= now:
+            return True
+        key = self._key(jti)
+        index = int(exp // self.bucket_width)
+        with self._lock:
+            self._prune(now)
+            if self._contains(index, key):
+                return False
+            bucket = self._buckets.get(index)
+            if bucket is None:
+                bucket = self._buckets[index] = (BloomFilter(self.bucket_capacity, self.error_rate), set())
+            bucket[0].add(_hash(key))
+            bucket[1].add(key)
+        return True
+
+    def contains(self, jti, exp):
+        # A JTI is always stored under its own token's exp; dict.get() is
+        # atomic, so lookups do not take the lock
+        return self._contains(int(exp // self.bucket_width), self._key(jti))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'buckets': len(self._buckets),
+                'entries': sum(len(members) for _, members in self._buckets.values()),
+                'bloom_bytes': sum(len(bloom.bits) for bloom, _ in self._buckets.values()),
+            }
+
+
+class CacheTokenBlacklist:
+    """One cache key per blacklisted JTI, expiring with the token"""
+
+    def __init__(self, alias='default', key_prefix='jwt:blacklist:'):
+        self.alias = alias
+        self.cache = caches[alias]
+        self.key_prefix = key_prefix
+
+    @property
+    def process_local(self):
+        return is_process_local(self.cache)
+
+    def add(self, jti, exp):
+        timeout = math.ceil(exp - time.time())
+        if timeout <= 0:
+            return True
+        return self.cache.add(f'{self.key_prefix}{jti}', 1, timeout)
+
+    def contains(self, jti, exp):
+        return self.cache.get(f'{self.key_prefix}{jti}') is not None
+
+
+_blacklist = None
+_blacklist_lock = threading.Lock()
+
+
+def get_token_blacklist():
+    """Return the process-wide blacklist configured by ``settings.TOKEN_BLACKLIST``"""
+    global _blacklist
+    if _blacklist is None:
+        with _blacklist_lock:
+            if _blacklist is None:
+                config = getattr(settings, 'TOKEN_BLACKLIST', {})
+                backend = import_string(config.get('BACKEND', DEFAULT_BACKEND))
+                _blacklist = backend(**config.get('OPTIONS', {}))
+    return _blacklist
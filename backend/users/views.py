@@ -1,44 +1,49 @@
+import logging
 from rest_framework import status, generics, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenRefreshView
 from django.contrib.auth import authenticate
 from django.db import transaction
-from google.auth.transport import requests
-from google.oauth2 import id_token
 from django.conf import settings
 from datetime import datetime
+from fitness_project.async_views import api_response, async_api_view
+from fitness_project.cache.views import cache_per_user
+from fitness_project.fieldsets import relation_lookups
+from fitness_project.request_logging import payload, headers
+from .google_auth import verify_google_id_token, CertificateFetchError
 from .models import User, BodyComposition, BodyMeasurements, GoalMeasurements
 from .serializers import (
     UserSerializer, UserProfileSerializer, UserRegistrationSerializer,
     UserLoginSerializer, BodyCompositionSerializer, BodyMeasurementsSerializer,
-    GoalMeasurementsSerializer, UserCompleteProfileSerializer, OnboardingStepSerializer
+    GoalMeasurementsSerializer, UserCompleteProfileSerializer, OnboardingStepSerializer,
+    OnboardingCommitSerializer, RotatingTokenRefreshSerializer
 )
 
+logger = logging.getLogger(__name__)
+
 class UserRegistrationView(generics.CreateAPIView):
     """User registration endpoint"""
     serializer_class = UserRegistrationSerializer
     permission_classes = [permissions.AllowAny]
     
     def create(self, request, *args, **kwargs):
-        import logging
-        logger = logging.getLogger(__name__)
-        
-        logger.info(f"Registration request received: {request.data}")
+        logger.info("Registration request received: %s", payload(request.data))
         
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = serializer.save()
         
-        logger.info(f"User registered successfully: {user.email}")
+        logger.info("User registered successfully: %s", user.email)
         
         # Generate tokens
         refresh = RefreshToken.for_user(user)
         
         # Get user data with serializer
         user_data = UserSerializer(user).data
-        logger.info(f"User data being sent to frontend: {user_data}")
-        logger.info(f"hasCompletedOnboarding value: {user_data.get('hasCompletedOnboarding')}")
+        logger.info("User data being sent to frontend: %s", payload(user_data))
+        logger.info("hasCompletedOnboarding value: %s", user_data.get('hasCompletedOnboarding'))
         
         response_data = {
             'user': user_data,
@@ -49,8 +54,8 @@ class UserRegistrationView(generics.CreateAPIView):
             'message': 'User registered successfully'
         }
         
-        logger.info(f"Registration successful for user: {user.email}")
-        logger.info(f"Full response data: {response_data}")
+        logger.info("Registration successful for user: %s", user.email)
+        logger.info("Full response data: %s", payload(response_data))
         return Response(response_data, status=status.HTTP_201_CREATED)
 
     def get(self, request, *args, **kwargs):
@@ -74,23 +79,20 @@ class UserLoginView(generics.GenericAPIView):
     permission_classes = [permissions.AllowAny]
     
     def post(self, request):
-        import logging
-        logger = logging.getLogger(__name__)
-        
-        logger.info(f"Login request received: {request.data}")
+        logger.info("Login request received: %s", payload(request.data))
         
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
         user = serializer.validated_data['user']
-        logger.info(f"User authenticated successfully: {user.email}")
+        logger.info("User authenticated successfully: %s", user.email)
         
         refresh = RefreshToken.for_user(user)
         
         # Get user data with serializer
         user_data = UserSerializer(user).data
-        logger.info(f"User data being sent to frontend: {user_data}")
-        logger.info(f"hasCompletedOnboarding value: {user_data.get('hasCompletedOnboarding')}")
+        logger.info("User data being sent to frontend: %s", payload(user_data))
+        logger.info("hasCompletedOnboarding value: %s", user_data.get('hasCompletedOnboarding'))
         
         response_data = {
             'user': user_data,
@@ -101,8 +103,8 @@ class UserLoginView(generics.GenericAPIView):
             'message': 'Login successful'
         }
         
-        logger.info(f"Login successful for user: {user.email}")
-        logger.info(f"Full response data: {response_data}")
+        logger.info("Login successful for user: %s", user.email)
+        logger.info("Full response data: %s", payload(response_data))
         return Response(response_data)
 
     def get(self, request):
@@ -117,6 +119,10 @@ class UserLoginView(generics.GenericAPIView):
             }
         })
 
+class RotatingTokenRefreshView(TokenRefreshView):
+    """Refresh endpoint that blacklists the rotated refresh token"""
+    serializer_class = RotatingTokenRefreshSerializer
+
 class UserProfileView(generics.RetrieveUpdateAPIView):
     """User profile management"""
     serializer_class = UserCompleteProfileSerializer
@@ -127,12 +133,9 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
     
     def get(self, request, *args, **kwargs):
         """GET method to retrieve user profile"""
-        import logging
-        logger = logging.getLogger(__name__)
-        
-        logger.info(f"Profile GET request from user: {request.user}")
-        logger.info(f"Request headers: {dict(request.headers)}")
-        logger.info(f"User authenticated: {request.user.is_authenticated}")
+        logger.info("Profile GET request from user: %s", request.user)
+        logger.info("Request headers: %s", headers(request))
+        logger.info("User authenticated: %s", request.user.is_authenticated)
         
         user = self.get_object()
         serializer = self.get_serializer(user)
@@ -140,11 +143,8 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
     
     def put(self, request, *args, **kwargs):
         """PUT method to update user profile"""
-        import logging
-        logger = logging.getLogger(__name__)
-        
-        logger.info(f"Profile PUT request from user: {request.user}")
-        logger.info(f"Request data: {request.data}")
+        logger.info("Profile PUT request from user: %s", request.user)
+        logger.info("Request data: %s", payload(request.data))
         
         user = self.get_object()
         serializer = self.get_serializer(user, data=request.data, partial=True)
@@ -156,6 +156,20 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
         """PATCH method to partially update user profile"""
         return self.put(request, *args, **kwargs)
 
+@async_api_view(['GET'], fallback=UserProfileView.as_view())
+@cache_per_user('users')
+async def user_profile_async(request):
+    """Async UserProfileView GET; PUT/PATCH go to UserProfileView"""
+    logger.info("Profile GET request from user: %s", request.user)
+    logger.info("Request headers: %s", headers(request))
+
+    # The one-to-one relations that will render come back in the same query
+    # (select_related() without arguments would follow every foreign key)
+    lookups = relation_lookups(UserCompleteProfileSerializer, request)
+    users = User.objects.select_related(*lookups) if lookups else User.objects
+    user = await users.aget(pk=request.user.pk)
+    return api_response(UserCompleteProfileSerializer(user, context={'request': request}).data)
+
 class UserProfileUpdateView(generics.UpdateAPIView):
     """Update user profile during onboarding"""
     serializer_class = UserProfileSerializer
@@ -165,12 +179,9 @@ class UserProfileUpdateView(generics.UpdateAPIView):
         return self.request.user
     
     def update(self, request, *args, **kwargs):
-        import logging
-        logger = logging.getLogger(__name__)
-        
         user = self.get_object()
-        logger.info(f"Updating profile for user: {user.email}")
-        logger.info(f"Request data: {request.data}")
+        logger.info("Updating profile for user: %s", user.email)
+        logger.info("Request data: %s", payload(request.data))
         
         # Handle field mapping from frontend to backend
         update_data = {}
@@ -189,7 +200,7 @@ class UserProfileUpdateView(generics.UpdateAPIView):
             if frontend_field in request.data and request.data[frontend_field] is not None:
                 update_data[backend_field] = request.data[frontend_field]
         
-        logger.info(f"Mapped update data: {update_data}")
+        logger.info("Mapped update data: %s", payload(update_data))
         
         serializer = self.get_serializer(user, data=update_data, partial=True)
         serializer.is_valid(raise_exception=True)
@@ -197,7 +208,7 @@ class UserProfileUpdateView(generics.UpdateAPIView):
         # Update user profile directly in database
         user = serializer.save()
         
-        logger.info(f"Profile updated successfully for user: {user.email}")
+        logger.info("Profile updated successfully for user: %s", user.email)
         
         return Response({
             'user': UserSerializer(user).data,
@@ -231,9 +242,6 @@ def update_onboarding_step(request):
     if not request.user.is_authenticated:
         return Response({'error': 'Authentication required'}, status=status.HTTP_401_UNAUTHORIZED)
     
-    import logging
-    logger = logging.getLogger(__name__)
-    
     serializer = OnboardingStepSerializer(data=request.data)
     serializer.is_valid(raise_exception=True)
     
@@ -241,8 +249,8 @@ def update_onboarding_step(request):
     data = serializer.validated_data['data']
     user = request.user
     
-    logger.info(f"Processing onboarding step '{step}' for user {user.email}")
-    logger.info(f"Step data: {data}")
+    logger.info("Processing onboarding step '%s' for user %s", step, user.email)
+    logger.info("Step data: %s", payload(data))
     
     # Save data directly to database
     try:
@@ -259,7 +267,7 @@ def update_onboarding_step(request):
             if 'fitness_level' in data and data['fitness_level'] is not None:
                 user.fitness_level = data['fitness_level']
             user.save()
-            logger.info(f"Profile data saved directly for user {user.email}")
+            logger.info("Profile data saved directly for user %s", user.email)
             
         elif step == 'goals':
             # Update fitness goals
@@ -268,7 +276,7 @@ def update_onboarding_step(request):
             if 'specificGoal' in data and data['specificGoal'] is not None:
                 user.specific_goal = data['specificGoal']
             user.save()
-            logger.info(f"Goals data saved directly for user {user.email}")
+            logger.info("Goals data saved directly for user %s", user.email)
             
         elif step == 'body_composition':
             # Update body composition data
@@ -295,9 +303,9 @@ def update_onboarding_step(request):
             
             if updated_fields:
                 body_comp.save()
-                logger.info(f"Body composition data saved directly for user {user.email}. Updated fields: {updated_fields}")
+                logger.info("Body composition data saved directly for user %s. Updated fields: %s", user.email, updated_fields)
             else:
-                logger.info(f"No body composition data to update for user {user.email}")
+                logger.info("No body composition data to update for user %s", user.email)
             
         elif step == 'body_model':
             # Update body measurements for 3D model
@@ -323,9 +331,9 @@ def update_onboarding_step(request):
             
             if updated_fields:
                 measurements.save()
-                logger.info(f"Body measurements saved directly for user {user.email}. Updated fields: {updated_fields}")
+                logger.info("Body measurements saved directly for user %s. Updated fields: %s", user.email, updated_fields)
             else:
-                logger.info(f"No body measurements to update for user {user.email}")
+                logger.info("No body measurements to update for user %s", user.email)
             
         elif step == 'specific_goals':
             # Update specific goal measurements
@@ -352,14 +360,14 @@ def update_onboarding_step(request):
             
             if updated_fields:
                 goals.save()
-                logger.info(f"Goal measurements saved directly for user {user.email}. Updated fields: {updated_fields}")
+                logger.info("Goal measurements saved directly for user %s. Updated fields: %s", user.email, updated_fields)
             else:
-                logger.info(f"No goal measurements to update for user {user.email}")
+                logger.info("No goal measurements to update for user %s", user.email)
         
-        logger.info(f"Step '{step}' processed successfully for user {user.email}")
+        logger.info("Step '%s' processed successfully for user %s", step, user.email)
         
     except Exception as e:
-        logger.error(f"Error processing step '{step}' for user {user.email}: {str(e)}")
+        logger.error("Error processing step '%s' for user %s: %s", step, user.email, e)
         return Response({
             'error': f'Error processing step: {str(e)}'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -399,12 +407,9 @@ def update_body_composition(request):
     if not request.user.is_authenticated:
         return Response({'error': 'Authentication required'}, status=status.HTTP_401_UNAUTHORIZED)
     
-    import logging
-    logger = logging.getLogger(__name__)
-    
     user = request.user
-    logger.info(f"Updating body composition for user {user.email}")
-    logger.info(f"Request data: {request.data}")
+    logger.info("Updating body composition for user %s", user.email)
+    logger.info("Request data: %s", payload(request.data))
     
     composition, created = BodyComposition.objects.get_or_create(user=user)
     
@@ -431,9 +436,9 @@ def update_body_composition(request):
     
     if updated_fields:
         composition.save()
-        logger.info(f"Body composition saved for user {user.email}. Updated fields: {updated_fields}")
+        logger.info("Body composition saved for user %s. Updated fields: %s", user.email, updated_fields)
     else:
-        logger.info(f"No body composition data to update for user {user.email}")
+        logger.info("No body composition data to update for user %s", user.email)
     
     return Response({
         'bodyComposition': BodyCompositionSerializer(composition).data,
@@ -468,12 +473,9 @@ def update_body_measurements(request):
     if not request.user.is_authenticated:
         return Response({'error': 'Authentication required'}, status=status.HTTP_401_UNAUTHORIZED)
     
-    import logging
-    logger = logging.getLogger(__name__)
-    
     user = request.user
-    logger.info(f"Updating body measurements for user {user.email}")
-    logger.info(f"Request data: {request.data}")
+    logger.info("Updating body measurements for user %s", user.email)
+    logger.info("Request data: %s", payload(request.data))
     
     measurements, created = BodyMeasurements.objects.get_or_create(user=user)
     
@@ -499,9 +501,9 @@ def update_body_measurements(request):
     
     if updated_fields:
         measurements.save()
-        logger.info(f"Body measurements saved for user {user.email}. Updated fields: {updated_fields}")
+        logger.info("Body measurements saved for user %s. Updated fields: %s", user.email, updated_fields)
     else:
-        logger.info(f"No body measurements to update for user {user.email}")
+        logger.info("No body measurements to update for user %s", user.email)
     
     return Response({
         'currentMeasurements': BodyMeasurementsSerializer(measurements).data,
@@ -537,12 +539,9 @@ def update_goal_measurements(request):
     if not request.user.is_authenticated:
         return Response({'error': 'Authentication required'}, status=status.HTTP_401_UNAUTHORIZED)
     
-    import logging
-    logger = logging.getLogger(__name__)
-    
     user = request.user
-    logger.info(f"Updating goal measurements for user {user.email}")
-    logger.info(f"Request data: {request.data}")
+    logger.info("Updating goal measurements for user %s", user.email)
+    logger.info("Request data: %s", payload(request.data))
     
     goals, created = GoalMeasurements.objects.get_or_create(user=user)
     
@@ -569,9 +568,9 @@ def update_goal_measurements(request):
     
     if updated_fields:
         goals.save()
-        logger.info(f"Goal measurements saved for user {user.email}. Updated fields: {updated_fields}")
+        logger.info("Goal measurements saved for user %s. Updated fields: %s", user.email, updated_fields)
     else:
-        logger.info(f"No goal measurements to update for user {user.email}")
+        logger.info("No goal measurements to update for user %s", user.email)
     
     return Response({
         'goalMeasurements': GoalMeasurementsSerializer(goals).data,
@@ -584,7 +583,7 @@ def update_goal_measurements(request):
 def get_user_profile(request):
     """Get complete user profile with all related data"""
     user = request.user
-    serializer = UserCompleteProfileSerializer(user)
+    serializer = UserCompleteProfileSerializer(user, context={'request': request})
     return Response(serializer.data)
 
 @api_view(['GET', 'POST'])
@@ -612,6 +611,43 @@ def complete_onboarding(request):
         'user': UserSerializer(user).data
     })
 
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def commit_onboarding(request):
+    """Save every onboarding step and complete onboarding in a single transaction"""
+    serializer = OnboardingCommitSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    data = serializer.validated_data
+    user = request.user
+    
+    # profile and goals both live on the users table, so they share one write
+    user_fields = {**data.get('profile', {}), **data.get('goals', {})}
+    if data['complete']:
+        user_fields['has_completed_onboarding'] = True
+    
+    related_steps = [
+        (BodyComposition, 'body_composition'),
+        (BodyMeasurements, 'body_model'),
+        (GoalMeasurements, 'specific_goals'),
+    ]
+    
+    with transaction.atomic():
+        if user_fields:
+            User.objects.update_or_create(pk=user.pk, defaults=user_fields)
+        for model, step in related_steps:
+            if data.get(step):
+                model.objects.update_or_create(user=user, defaults=data[step])
+    
+    logger.info("Onboarding committed for user %s", user.email)
+    
+    user = User.objects.select_related(
+        'body_composition', 'current_measurements', 'goal_measurements'
+    ).get(pk=user.pk)
+    return Response({
+        'message': 'Onboarding data committed successfully',
+        'user': UserCompleteProfileSerializer(user).data
+    })
+
 
 
 @api_view(['GET'])
@@ -719,12 +755,9 @@ def health_check(request):
 @permission_classes([permissions.AllowAny])
 def google_login(request):
     """Handle Google OAuth login"""
-    import logging
-    logger = logging.getLogger(__name__)
-    
-    logger.info(f"Google login request received: {request.method}")
-    logger.info(f"Request headers: {dict(request.headers)}")
-    logger.info(f"Request data: {request.data}")
+    logger.info("Google login request received: %s", request.method)
+    logger.info("Request headers: %s", headers(request))
+    logger.info("Request data: %s", payload(request.data))
     
     if request.method == 'GET':
         logger.info("Google login GET request - returning debug info")
@@ -740,7 +773,7 @@ def google_login(request):
     try:
         logger.info("Processing Google login POST request")
         id_token_data = request.data.get('id_token')
-        logger.info(f"ID token received: {id_token_data[:50] if id_token_data else 'None'}...")
+        logger.info("ID token received: %s...", id_token_data[:50] if id_token_data else 'None')
         
         if not id_token_data:
             logger.error("No ID token provided")
@@ -750,12 +783,8 @@ def google_login(request):
         
         # Verify the Google ID token
         logger.info("Verifying Google ID token...")
-        idinfo = id_token.verify_oauth2_token(
-            id_token_data, 
-            requests.Request(), 
-            '876432031351-h5hmbv4qj96aci5ngcrfqa4kdvef24s2.apps.googleusercontent.com'
-        )
-        logger.info(f"Token verified successfully. User info: {idinfo}")
+        idinfo = verify_google_id_token(id_token_data, settings.GOOGLE_OAUTH2_CLIENT_ID)
+        logger.info("Token verified successfully. User info: %s", payload(idinfo))
         
         # Extract user information
         google_id = idinfo['sub']
@@ -764,7 +793,7 @@ def google_login(request):
         first_name = idinfo.get('given_name', '')
         last_name = idinfo.get('family_name', '')
         
-        logger.info(f"Extracted user info - Email: {email}, Name: {name}")
+        logger.info("Extracted user info - Email: %s, Name: %s", email, name)
         
         # Check if user exists, create if not
         user, created = User.objects.get_or_create(
@@ -777,7 +806,7 @@ def google_login(request):
             }
         )
         
-        logger.info(f"User {'created' if created else 'found'}: {user.email}")
+        logger.info("User %s: %s", 'created' if created else 'found', user.email)
         
         # Generate tokens
         refresh = RefreshToken.for_user(user)
@@ -785,8 +814,8 @@ def google_login(request):
         
         # Get user data with serializer
         user_data = UserSerializer(user).data
-        logger.info(f"User data being sent to frontend: {user_data}")
-        logger.info(f"hasCompletedOnboarding value: {user_data.get('hasCompletedOnboarding')}")
+        logger.info("User data being sent to frontend: %s", payload(user_data))
+        logger.info("hasCompletedOnboarding value: %s", user_data.get('hasCompletedOnboarding'))
         
         response_data = {
             'user': user_data,
@@ -798,17 +827,22 @@ def google_login(request):
             'is_new_user': created
         }
         
-        logger.info(f"Google login successful for user: {user.email}")
-        logger.info(f"Full response data: {response_data}")
+        logger.info("Google login successful for user: %s", user.email)
+        logger.info("Full response data: %s", payload(response_data))
         return Response(response_data)
         
     except ValueError as e:
-        logger.error(f"Invalid ID token error: {str(e)}")
+        logger.error("Invalid ID token error: %s", e)
         return Response({
             'error': 'Invalid ID token'
         }, status=status.HTTP_400_BAD_REQUEST)
+    except CertificateFetchError as e:
+        logger.error("Google certificates unavailable: %s", e)
+        return Response({
+            'error': 'Google login is temporarily unavailable'
+        }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
     except Exception as e:
-        logger.error(f"Google login failed with exception: {str(e)}")
+        logger.error("Google login failed with exception: %s", e)
         return Response({
             'error': f'Google login failed: {str(e)}'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class WorkoutsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'workouts'
+
+    def ready(self):
+        from . import checks  # noqa: F401
+        from .substitutions import connect_signals
+        connect_signals()
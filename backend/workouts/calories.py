@@ -0,0 +1,236 @@
+"""
+Server-side calorie estimates.
+
+Energy is counted in METs, multiples of the user's resting expenditure. One
+MET-minute is ``BodyComposition.bmr / 1440`` kcal when the BMR is known,
+otherwise ``3.5 * weight / 200`` kcal (the ACSM equation, with
+``DEFAULT_WEIGHT`` for users without a weight).
+
+A completed ``WorkoutSession`` is estimated from its ``ExerciseSet`` rows:
+
+- a set lasts its ``duration``, or ``reps * SECONDS_PER_REP``, plus its
+  ``rest_time`` (``DEFAULT_REST`` if unknown). Like the Compendium values
+  they come from, ``MUSCLE_GROUP_METS`` average over work and rest, so the
+  whole set counts at the MET of its exercise's muscle group, raised by
+  ``LOAD_FACTOR`` per body weight lifted (``weight_used / weight``, up to
+  ``MAX_LOAD``);
+- session time beyond its sets counts at ``REST_MET``, and a session without
+  sets counts its whole ``duration`` at ``DEFAULT_MET``. Durations are
+  capped at ``MAX_MINUTES``.
+
+All sets of a batch of sessions are computed at once as arrays, with NumPy
+when it is installed and in pure Python otherwise, with the same results.
+A ``CompletedWorkout`` has no sets, so it is ``duration`` minutes at the MET
+of its ``workout_type`` (``WORKOUT_TYPE_METS``).
+
+The views estimate a session when it is completed and again when its sets
+change, and a completed workout when it is saved; ``calories_burned`` sent
+by clients is ignored. Each estimate records ``FORMULA_VERSION``, and
+``python manage.py calculate_calories`` recomputes the rows estimated with
+another version (or none), so backfilling history and rolling out new
+formulas is one command. Bump ``FORMULA_VERSION`` when the formulas or the
+tables below change; after changing the tables in settings, run the command
+with ``--all``. Configured through ``settings.CALORIE_ESTIMATION``.
+"""
+from django.conf import settings
+
+from fitness_project.cache.versions import bump_user_version
+from progress.models import CompletedWorkout
+from sync.changes import record_changes
+from users.models import BodyComposition, User
+from .models import Exercise, ExerciseSet, WorkoutSession
+
+try:
+    import numpy as np
+except ImportError:  # pure-Python fallback
+    np = None
+
+FORMULA_VERSION = 1
+
+DEFAULTS = {
+    # Compendium of Physical Activities: resistance training 3.5-6, circuits and cardio higher
+    'MUSCLE_GROUP_METS': {
+        'chest': 5.0,
+        'back': 5.0,
+        'shoulders': 4.5,
+        'arms': 3.5,
+        'legs': 6.0,
+        'core': 3.8,
+        'cardio': 8.0,
+        'full_body': 6.5,
+    },
+    'WORKOUT_TYPE_METS': {
+        'strength': 5.0,
+        'cardio': 7.0,
+        'hiit': 8.0,
+        'running': 9.8,
+        'cycling': 7.5,
+        'walking': 3.5,
+        'swimming': 7.0,
+        'yoga': 2.5,
+        'stretching': 2.3,
+    },
+    'DEFAULT_MET': 5.0,
+    # Session time not covered by sets: warm-up, transitions, standing around
+    'REST_MET': 1.5,
+    'SECONDS_PER_REP': 3,
+    'DEFAULT_REST': 60,
+    'LOAD_FACTOR': 0.2,
+    'MAX_LOAD': 2.0,
+    'MAX_MINUTES': 240,
+    'DEFAULT_WEIGHT': 70,
+    # Sessions or workouts estimated together by calculate_calories
+    'CHUNK_SIZE': 500,
+}
+
+
+def get_config():
+    config = {**DEFAULTS, **getattr(settings, 'CALORIE_ESTIMATION', {})}
+    for table in ('MUSCLE_GROUP_METS', 'WORKOUT_TYPE_METS'):
+        config[table] = {**DEFAULTS[table], **config[table]}
+    return config
+
+
+def met_minute(weight, bmr, config):
+    """kcal one MET-minute costs a user of ``weight`` kg and ``bmr`` kcal/day"""
+    if bmr:
+        return bmr / 1440
+    return 3.5 * float(weight or config['DEFAULT_WEIGHT']) / 200
+
+
+def user_profiles(user_ids, config=None):
+    """``{user id: (body weight in kg, kcal per MET-minute)}``"""
+    config = config or get_config()
+    bmrs = dict(BodyComposition.objects.filter(user_id__in=user_ids, bmr__isnull=False)
+                .values_list('user_id', 'bmr'))
+    return {
+        pk: (float(weight or config['DEFAULT_WEIGHT']), met_minute(weight, bmrs.get(pk), config))
+        for pk, weight in User.objects.filter(pk__in=user_ids).values_list('pk', 'weight')
+    }
+
+
+def set_calories(index, count, mets, active, rest, loads, rates, config):
+    """Per-session sums of the calories and seconds of sets.
+
+    ``index[i]`` is the session (0 to ``count - 1``) of set ``i``, and the
+    other sequences hold each set's MET, active and rest seconds, load (kg
+    lifted per kg of body weight) and kcal per MET-minute. Returns
+    ``(calories, seconds)``, two lists of ``count`` numbers.
+    """
+    if np is not None:
+        index = np.asarray(index, dtype=np.int64)
+        active = np.asarray(active, dtype=float)
+        rest = np.asarray(rest, dtype=float)
+        intensity = np.asarray(mets, dtype=float) * (
+            1 + config['LOAD_FACTOR'] * np.minimum(np.asarray(loads, dtype=float), config['MAX_LOAD'])
+        )
+        kcal = np.asarray(rates, dtype=float) * intensity * (active + rest) / 60
+        return (np.bincount(index, weights=kcal, minlength=count).tolist(),
+                np.bincount(index, weights=active + rest, minlength=count).tolist())
+
+    calories, seconds = [0.0] * count, [0.0] * count
+    for session, met, active_s, rest_s, load, rate in zip(index, mets, active, rest, loads, rates):
+        intensity = met * (1 + config['LOAD_FACTOR'] * min(load, config['MAX_LOAD']))
+        calories[session] += rate * intensity * (active_s + rest_s) / 60
+        seconds[session] += active_s + rest_s
+    return calories, seconds
+
+
+def estimate_sessions(alias, session_ids, config=None):
+    """``{session id: (user id, old calories, new calories)}`` of ``session_ids`` on shard ``alias``"""
+    config = config or get_config()
+    sessions = list(WorkoutSession.objects.using(alias).filter(pk__in=session_ids)
+                    .values_list('pk', 'user_id', 'duration', 'calories_burned'))
+    position = {pk: row for row, (pk, *_) in enumerate(sessions)}
+    sets = list(ExerciseSet.objects.using(alias).filter(session_id__in=position).values_list(
+        'session_id', 'exercise_id', 'reps_completed', 'weight_used', 'duration', 'rest_time',
+    ))
+    # Exercises and users stay on default
+    groups = dict(Exercise.objects.filter(pk__in={row[1] for row in sets}).values_list('pk', 'muscle_group'))
+    profiles = user_profiles({user_id for _, user_id, _, _ in sessions}, config)
+    fallback = (float(config['DEFAULT_WEIGHT']), met_minute(None, None, config))
+    session_profiles = [profiles.get(user_id, fallback) for _, user_id, _, _ in sessions]
+
+    index, mets, active, rest, loads, rates = [], [], [], [], [], []
+    for session_id, exercise_id, reps, weight_used, duration, rest_time in sets:
+        row = position[session_id]
+        body_weight, rate = session_profiles[row]
+        index.append(row)
+        mets.append(config['MUSCLE_GROUP_METS'].get(groups.get(exercise_id), config['DEFAULT_MET']))
+        active.append(duration if duration is not None else (reps or 0) * config['SECONDS_PER_REP'])
+        rest.append(rest_time if rest_time is not None else config['DEFAULT_REST'])
+        loads.append(float(weight_used or 0) / body_weight)
+        rates.append(rate)
+    calories, seconds = set_calories(index, len(sessions), mets, active, rest, loads, rates, config)
+
+    has_sets = set(index)
+    estimates = {}
+    for row, (pk, user_id, duration, old) in enumerate(sessions):
+        rate = session_profiles[row][1]
+        minutes = min(duration or 0, config['MAX_MINUTES'])
+        if row in has_sets:
+            extra = max(0.0, minutes * 60 - seconds[row]) / 60
+            total = calories[row] + rate * config['REST_MET'] * extra
+        else:
+            total = rate * config['DEFAULT_MET'] * minutes
+        estimates[pk] = (user_id, old, round(total))
+    return estimates
+
+
+def update_sessions(alias, session_ids, config=None):
+    """Estimate ``session_ids`` on shard ``alias`` and save the results; returns ``estimate_sessions()``"""
+    estimates = estimate_sessions(alias, session_ids, config)
+    WorkoutSession.objects.using(alias).bulk_update(
+        [WorkoutSession(pk=pk, calories_burned=new, calories_version=FORMULA_VERSION)
+         for pk, (_, _, new) in estimates.items()],
+        ['calories_burned', 'calories_version'],
+    )
+    # bulk_update() sends no signals
+    changed = [(user_id, pk) for pk, (user_id, old, new) in estimates.items() if old != new]
+    _changed(alias, 'sessions', 'workouts', changed)
+    return estimates
+
+
+def update_session(session):
+    """Estimate ``session`` if it is completed, updating the instance as well"""
+    if session.status != 'completed':
+        return
+    estimates = update_sessions(session._state.db, [session.pk])
+    if session.pk in estimates:
+        session.calories_burned = estimates[session.pk][2]
+        session.calories_version = FORMULA_VERSION
+
+
+def workout_calories(user_id, workout_type, duration, config=None, profile=None):
+    """kcal of ``duration`` minutes of a ``CompletedWorkout`` of ``workout_type``"""
+    config = config or get_config()
+    if profile is None:
+        profile = user_profiles([user_id], config).get(user_id)
+    rate = profile[1] if profile else met_minute(None, None, config)
+    met = config['WORKOUT_TYPE_METS'].get((workout_type or '').strip().casefold(), config['DEFAULT_MET'])
+    return round(rate * met * min(int(duration or 0), config['MAX_MINUTES']))
+
+
+def update_completed_workouts(alias, workout_ids, config=None):
+    """Estimate the ``CompletedWorkout`` rows ``workout_ids`` on shard ``alias``; returns how many changed"""
+    config = config or get_config()
+    rows = list(CompletedWorkout.objects.using(alias).filter(pk__in=workout_ids)
+                .values_list('pk', 'user_id', 'workout_type', 'duration', 'calories_burned'))
+    profiles = user_profiles({row[1] for row in rows}, config)
+    updates, changed = [], []
+    for pk, user_id, workout_type, duration, old in rows:
+        new = workout_calories(user_id, workout_type, duration, config, profiles.get(user_id))
+        updates.append(CompletedWorkout(pk=pk, calories_burned=new, calories_version=FORMULA_VERSION))
+        if new != old:
+            changed.append((user_id, pk))
+    CompletedWorkout.objects.using(alias).bulk_update(updates, ['calories_burned', 'calories_version'])
+    _changed(alias, 'completed_workouts', 'progress', changed)
+    return len(changed)
+
+
+def _changed(alias, collection, namespace, objects):
+    if not objects:
+        return
+    record_changes(collection, objects)
+    for user_id in {user_id for user_id, _ in objects}:
+        bump_user_version(namespace, user_id, using=alias)
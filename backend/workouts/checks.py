@@ -0,0 +1,14 @@
+from django.core.checks import register
+
+from fitness_project.checks import shared_cache_errors
+
+from .substitutions import get_config
+
+
+@register()
+def check_substitution_versions_shared(app_configs, **kwargs):
+    return shared_cache_errors(
+        "EXERCISE_SUBSTITUTIONS['VERSION_ALIAS']", get_config()['VERSION_ALIAS'],
+        'an exercise changed through one worker leaves stale alternatives in the others',
+        'workouts.E001',
+    )
@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from fitness_project.db.sharding import get_shards
+from progress.models import CompletedWorkout
+from workouts import calories
+from workouts.models import WorkoutSession
+
+
+class Command(BaseCommand):
+    help = 'Estimate calories of completed sessions and workouts not yet estimated with the current formulas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Recompute every row, e.g. after changing CALORIE_ESTIMATION tables')
+        parser.add_argument('--chunk-size', type=int, default=calories.get_config()['CHUNK_SIZE'],
+                            help='Rows estimated and written together')
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Only this user id (repeatable)')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        config = calories.get_config()
+        size = max(1, options['chunk_size'])
+        sessions = workouts = changed = 0
+
+        for alias in get_shards():
+            rows = {
+                'sessions': WorkoutSession.objects.using(alias).filter(status='completed'),
+                'workouts': CompletedWorkout.objects.using(alias).all(),
+            }
+            for name, queryset in rows.items():
+                if not options['all']:
+                    queryset = queryset.exclude(calories_version=calories.FORMULA_VERSION)
+                if options['users']:
+                    queryset = queryset.filter(user_id__in=options['users'])
+                ids = list(queryset.order_by('pk').values_list('pk', flat=True))
+                for start in range(0, len(ids), size):
+                    chunk = ids[start:start + size]
+                    if name == 'sessions':
+                        estimates = calories.update_sessions(alias, chunk, config)
+                        changed += sum(old != new for _, old, new in estimates.values())
+                        sessions += len(chunk)
+                    else:
+                        changed += calories.update_completed_workouts(alias, chunk, config)
+                        workouts += len(chunk)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Estimated {sessions} session(s) and {workouts} completed workout(s), {changed} changed, '
+            f'with formula version {calories.FORMULA_VERSION} in {time.perf_counter() - started:.2f}s'
+        ))
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workouts', '0002_alter_workoutsession_workout_day'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workoutsession',
+            name='calories_burned',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='workoutsession',
+            name='calories_version',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -157,6 +157,10 @@ class WorkoutSession(models.Model):
     # Notes
     notes = models.TextField(blank=True)
     rating = models.PositiveIntegerField(null=True, blank=True)
+
+    # Estimated from the sets by workouts.calories
+    calories_burned = models.PositiveIntegerField(null=True, blank=True)
+    calories_version = models.PositiveSmallIntegerField(null=True, blank=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
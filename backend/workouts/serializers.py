@@ -1,12 +1,17 @@
+import logging
 from rest_framework import serializers
+from fitness_project.fieldsets import FieldsetMixin
+from fitness_project.request_logging import payload
 from .models import Exercise, WorkoutPlan, WorkoutDay, WorkoutExercise, WorkoutSession, ExerciseSet
 
-class ExerciseSerializer(serializers.ModelSerializer):
+logger = logging.getLogger(__name__)
+
+class ExerciseSerializer(FieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Exercise
         fields = '__all__'
 
-class WorkoutExerciseSerializer(serializers.ModelSerializer):
+class WorkoutExerciseSerializer(FieldsetMixin, serializers.ModelSerializer):
     exercise = ExerciseSerializer(read_only=True)
     exercise_id = serializers.PrimaryKeyRelatedField(queryset=Exercise.objects.all(), source='exercise', write_only=True)
 
@@ -17,7 +22,7 @@ class WorkoutExerciseSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'created_at', 'updated_at', 'exercise']
 
-class WorkoutDaySerializer(serializers.ModelSerializer):
+class WorkoutDaySerializer(FieldsetMixin, serializers.ModelSerializer):
     exercises = WorkoutExerciseSerializer(many=True, read_only=True)
 
     class Meta:
@@ -27,7 +32,7 @@ class WorkoutDaySerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'created_at', 'updated_at', 'exercises']
 
-class WorkoutPlanSerializer(serializers.ModelSerializer):
+class WorkoutPlanSerializer(FieldsetMixin, serializers.ModelSerializer):
     schedule = WorkoutDaySerializer(many=True, read_only=True)
 
     class Meta:
@@ -37,7 +42,7 @@ class WorkoutPlanSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'created_at', 'updated_at', 'schedule']
 
-class ExerciseSetSerializer(serializers.ModelSerializer):
+class ExerciseSetSerializer(FieldsetMixin, serializers.ModelSerializer):
     exercise = ExerciseSerializer(read_only=True)
     exercise_id = serializers.CharField(write_only=True, required=True)
 
@@ -49,19 +54,16 @@ class ExerciseSetSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'exercise']
 
     def validate(self, attrs):
-        import logging
-        logger = logging.getLogger(__name__)
-        
-        logger.info(f"🔍 Validating exercise set data: {attrs}")
+        logger.info("🔍 Validating exercise set data: %s", payload(attrs))
         
         # Add default values for required fields if not provided
         if 'set_number' not in attrs:
             attrs['set_number'] = 1
-            logger.info(f"📝 Setting default set_number: 1")
+            logger.info("📝 Setting default set_number: 1")
         
         if 'reps_completed' not in attrs:
             attrs['reps_completed'] = 0
-            logger.info(f"📝 Setting default reps_completed: 0")
+            logger.info("📝 Setting default reps_completed: 0")
         
         # Handle exercise_id - get or create exercise
         from .models import Exercise
@@ -73,37 +75,37 @@ class ExerciseSetSerializer(serializers.ModelSerializer):
                 try:
                     # First try as integer ID
                     exercise = Exercise.objects.get(id=int(exercise_id))
-                    logger.info(f"📝 Found exercise by ID: {exercise.name}")
+                    logger.info("📝 Found exercise by ID: %s", exercise.name)
                 except (ValueError, Exercise.DoesNotExist):
                     # If that fails, try to get by name
-                    logger.info(f"🔍 Looking for exercise by name: {exercise_id}")
+                    logger.info("🔍 Looking for exercise by name: %s", exercise_id)
                     exercise = Exercise.objects.filter(name__icontains=exercise_id).first()
                     
                     # If still not found, create a default exercise
                     if not exercise:
-                        logger.info(f"📝 Creating new exercise with name: Exercise {exercise_id}")
+                        logger.info("📝 Creating new exercise with name: Exercise %s", exercise_id)
                         exercise = Exercise.objects.create(
                             name=f"Exercise {exercise_id}",
                             description="Auto-created exercise",
                             muscle_group="other"
                         )
-                        logger.info(f"✅ Created new exercise: {exercise.name} with ID: {exercise.id}")
+                        logger.info("✅ Created new exercise: %s with ID: %s", exercise.name, exercise.id)
                     else:
-                        logger.info(f"📝 Found exercise by name: {exercise.name}")
+                        logger.info("📝 Found exercise by name: %s", exercise.name)
                 
                 attrs['exercise'] = exercise
-                logger.info(f"📝 Using exercise: {exercise.name} (ID: {exercise.id})")
+                logger.info("📝 Using exercise: %s (ID: %s)", exercise.name, exercise.id)
             except Exception as e:
-                logger.error(f"❌ Error processing exercise_id: {str(e)}")
+                logger.error("❌ Error processing exercise_id: %s", e)
                 raise serializers.ValidationError({"exercise_id": [f"Invalid exercise ID: {str(e)}"]})  
         else:
-            logger.error(f"❌ Missing exercise_id in request data")
+            logger.error("❌ Missing exercise_id in request data")
             raise serializers.ValidationError({"exercise_id": ["This field is required."]})  
         
-        logger.info(f"✅ Exercise set validation passed: {attrs}")
+        logger.info("✅ Exercise set validation passed: %s", payload(attrs))
         return attrs
 
-class WorkoutSessionSerializer(serializers.ModelSerializer):
+class WorkoutSessionSerializer(FieldsetMixin, serializers.ModelSerializer):
     workout_day = WorkoutDaySerializer(read_only=True)
     workout_day_id = serializers.PrimaryKeyRelatedField(
         queryset=WorkoutDay.objects.all(), 
@@ -116,32 +118,29 @@ class WorkoutSessionSerializer(serializers.ModelSerializer):
     class Meta:
         model = WorkoutSession
         fields = [
-            'id', 'user', 'workout_day', 'workout_day_id', 'status', 'started_at', 'completed_at', 'duration', 'total_exercises', 'completed_exercises', 'notes', 'rating', 'created_at', 'updated_at', 'exercise_sets'
+            'id', 'user', 'workout_day', 'workout_day_id', 'status', 'started_at', 'completed_at', 'duration', 'total_exercises', 'completed_exercises', 'notes', 'rating', 'calories_burned', 'created_at', 'updated_at', 'exercise_sets'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at', 'workout_day', 'exercise_sets', 'user']
+        read_only_fields = ['id', 'created_at', 'updated_at', 'workout_day', 'exercise_sets', 'user', 'calories_burned']
 
     def validate(self, attrs):
-        import logging
-        logger = logging.getLogger(__name__)
-        
-        logger.info(f"🔍 Validating workout session data: {attrs}")
+        logger.info("🔍 Validating workout session data: %s", payload(attrs))
         
         # Add default values for required fields if not provided
         if 'status' not in attrs:
             attrs['status'] = 'not_started'
-            logger.info(f"📝 Setting default status: not_started")
+            logger.info("📝 Setting default status: not_started")
         
         if 'total_exercises' not in attrs:
             attrs['total_exercises'] = 0
-            logger.info(f"📝 Setting default total_exercises: 0")
+            logger.info("📝 Setting default total_exercises: 0")
         
         if 'completed_exercises' not in attrs:
             attrs['completed_exercises'] = 0
-            logger.info(f"📝 Setting default completed_exercises: 0")
+            logger.info("📝 Setting default completed_exercises: 0")
         
         # If no workout_day_id is provided, that's okay - it's optional now
         if 'workout_day' not in attrs:
-            logger.info(f"📝 No workout day provided - this is optional")
+            logger.info("📝 No workout day provided - this is optional")
         
-        logger.info(f"✅ Workout session validation passed: {attrs}")
+        logger.info("✅ Workout session validation passed: %s", payload(attrs))
         return attrs
\ No newline at end of file
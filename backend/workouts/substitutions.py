@@ -0,0 +1,252 @@
+"""
+Exercise substitution graph.
+
+Every exercise has an edge to the exercises of its ``muscle_group`` with the
+same or an adjacent ``difficulty_level``, weighted by ``WEIGHTS``:
+
+- ``text``: cosine similarity of the TF-IDF vectors of ``description`` and
+  ``instructions``;
+- ``equipment``: for an alternative that needs no equipment the exercise
+  did not (bodyweight fits everything), 0.5 plus half the share of the
+  exercise's items it uses; otherwise the Jaccard similarity of their
+  ``equipment_needed`` items;
+- ``difficulty``: 1 for the same level, 0.5 for an adjacent one.
+
+Each exercise keeps its best ``MAX_ALTERNATIVES`` edges of at least
+``MIN_WEIGHT``. Edges never leave a muscle group, and term frequencies are
+counted within the group, so the graph is built and stored per group. A
+group is stored as compact adjacency arrays (sorted exercise ids, row
+offsets, target positions and float32 weights) in the ``ALIAS`` cache, and
+``alternatives()`` reads one entry and slices one row.
+
+Blocks are keyed on their group's version, a random token kept in the
+``VERSION_ALIAS`` cache. Saving or deleting an exercise replaces the
+versions of its old and new groups once the transaction commits, and the
+next lookup in any process rebuilds just those. ``ALIAS`` may therefore be
+a per-process cache, but ``VERSION_ALIAS`` has to be shared by all worker
+processes (``check`` fails otherwise). ``bulk_create()`` and ``update()``
+send no signals, so code using them calls ``invalidate()``.
+
+Served by ``GET /api/workouts/exercises/<pk>/alternatives/``. Configured
+through ``settings.EXERCISE_SUBSTITUTIONS``.
+"""
+import math
+import re
+import secrets
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from .models import Exercise
+
+DEFAULTS = {
+    'ALIAS': 'default',
+    'VERSION_ALIAS': 'default',
+    'TIMEOUT': 24 * 60 * 60,
+    'MAX_ALTERNATIVES': 10,
+    'MIN_WEIGHT': 0.2,
+    'WEIGHTS': {'text': 0.5, 'equipment': 0.25, 'difficulty': 0.25},
+}
+
+LEVELS = {'beginner': 0, 'intermediate': 1, 'advanced': 2}
+
+# equipment_needed values meaning no equipment
+BODYWEIGHT = {'', 'none', 'bodyweight', 'body weight', 'no equipment', 'mat', 'floor'}
+
+STOP_WORDS = frozenset(
+    'the and for with your you from into onto then back keep while this that are not but its'
+    ' each one two three over under until through both all any can should will'.split()
+)
+
+_WORDS = re.compile(r'[a-z]{3,}')
+_EQUIPMENT_SEPARATORS = re.compile(r'\s*(?:,|/|;|&|\+|\band\b|\bor\b)\s*')
+
+
+def get_config():
+    config = {**DEFAULTS, **getattr(settings, 'EXERCISE_SUBSTITUTIONS', {})}
+    config['WEIGHTS'] = {**DEFAULTS['WEIGHTS'], **config['WEIGHTS']}
+    return config
+
+
+def get_graph_cache():
+    return caches[get_config()['ALIAS']]
+
+
+def get_version_cache():
+    return caches[get_config()['VERSION_ALIAS']]
+
+
+def version_key(muscle_group):
+    return f'workouts:substitutions:version:{muscle_group}'
+
+
+def block_key(muscle_group, version):
+    return f'workouts:substitutions:{muscle_group}:{version}'
+
+
+def group_version(muscle_group):
+    """The current version of ``muscle_group``'s block, created if missing"""
+    cache = get_version_cache()
+    key = version_key(muscle_group)
+    version = cache.get(key)
+    if version is None:
+        # Random, so an evicted version never matches an old block again
+        cache.add(key, secrets.token_hex(8), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def equipment_items(text):
+    """The set of items in ``equipment_needed``, singular and lowercased; empty for bodyweight"""
+    items = set()
+    for item in _EQUIPMENT_SEPARATORS.split(text.casefold().strip()):
+        item = ' '.join(item.split())
+        if item in BODYWEIGHT:
+            continue
+        items.add(item[:-1] if item.endswith('s') and not item.endswith('ss') else item)
+    return items
+
+
+def equipment_similarity(needed, alternative):
+    if alternative <= needed:
+        return 0.5 + 0.5 * len(alternative) / len(needed) if needed else 1.0
+    return len(needed & alternative) / len(needed | alternative)
+
+
+def _terms(exercise):
+    words = _WORDS.findall(f'{exercise.description} {exercise.instructions}'.casefold())
+    return Counter(word for word in words if word not in STOP_WORDS)
+
+
+def _tfidf(documents):
+    """Unit-length TF-IDF vectors (term -> weight) of the group's term counts"""
+    frequency = Counter(term for terms in documents for term in terms)
+    count = len(documents)
+    vectors = []
+    for terms in documents:
+        vector = {term: (1 + math.log(n)) * (math.log((1 + count) / (1 + frequency[term])) + 1)
+                  for term, n in terms.items()}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+        vectors.append({term: weight / norm for term, weight in vector.items()})
+    return vectors
+
+
+def _cosine(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(weight * b.get(term, 0.0) for term, weight in a.items())
+
+
+class SubstitutionBlock:
+    """The adjacency arrays of one muscle group.
+
+    Row ``i`` (exercise ``ids[i]``) has the alternatives at positions
+    ``targets[offsets[i]:offsets[i + 1]]`` with ``weights`` at the same
+    indexes, best first.
+    """
+
+    __slots__ = ('ids', 'offsets', 'targets', 'weights')
+
+    def __init__(self, ids, offsets, targets, weights):
+        self.ids, self.offsets, self.targets, self.weights = ids, offsets, targets, weights
+
+    def alternatives(self, exercise_id):
+        """``(exercise id, weight)`` pairs of ``exercise_id``, best first"""
+        row = bisect_left(self.ids, exercise_id)
+        if row == len(self.ids) or self.ids[row] != exercise_id:
+            return []
+        start, end = self.offsets[row], self.offsets[row + 1]
+        return [(self.ids[target], weight)
+                for target, weight in zip(self.targets[start:end], self.weights[start:end])]
+
+
+def build_block(muscle_group, config=None):
+    """The substitution graph of ``muscle_group``'s exercises"""
+    config = config or get_config()
+    weights = config['WEIGHTS']
+    exercises = list(
+        Exercise.objects.filter(muscle_group=muscle_group).order_by('pk')
+        .only('pk', 'description', 'instructions', 'equipment_needed', 'difficulty_level')
+    )
+    vectors = _tfidf([_terms(exercise) for exercise in exercises])
+    equipment = [equipment_items(exercise.equipment_needed) for exercise in exercises]
+    levels = [LEVELS.get(exercise.difficulty_level, 0) for exercise in exercises]
+
+    offsets, targets, edge_weights = array('I', [0]), array('I'), array('f')
+    for row in range(len(exercises)):
+        edges = []
+        for other in range(len(exercises)):
+            distance = abs(levels[row] - levels[other])
+            if other == row or distance > 1:
+                continue
+            weight = (
+                weights['text'] * _cosine(vectors[row], vectors[other])
+                + weights['equipment'] * equipment_similarity(equipment[row], equipment[other])
+                + weights['difficulty'] * (1 - distance / 2)
+            )
+            if weight >= config['MIN_WEIGHT']:
+                edges.append((weight, other))
+        edges.sort(key=lambda edge: (-edge[0], edge[1]))
+        for weight, other in edges[:config['MAX_ALTERNATIVES']]:
+            targets.append(other)
+            edge_weights.append(weight)
+        offsets.append(len(targets))
+    return SubstitutionBlock(array('q', (exercise.pk for exercise in exercises)), offsets, targets, edge_weights)
+
+
+def get_block(muscle_group):
+    """``muscle_group``'s block from the cache, built and stored on a miss"""
+    config = get_config()
+    cache = get_graph_cache()
+    key = block_key(muscle_group, group_version(muscle_group))
+    block = cache.get(key)
+    if block is None:
+        block = build_block(muscle_group, config)
+        cache.set(key, block, config['TIMEOUT'])
+    return block
+
+
+def alternatives(exercise, limit=None):
+    """The exercises that can replace ``exercise`` as ``(exercise id, weight)``, best first"""
+    found = get_block(exercise.muscle_group).alternatives(exercise.pk)
+    return found[:limit] if limit is not None else found
+
+
+def _replace_versions(muscle_groups):
+    versions = get_version_cache()
+    keys = {version_key(group): group for group in muscle_groups}
+    old = versions.get_many(list(keys))
+    versions.set_many({key: secrets.token_hex(8) for key in keys}, timeout=None)
+    # Other processes miss on the new versions; this one can free its copies now
+    get_graph_cache().delete_many([block_key(keys[key], version) for key, version in old.items()])
+
+
+def invalidate(muscle_groups):
+    """Give ``muscle_groups`` new versions once the current transaction commits"""
+    groups = {group for group in muscle_groups if group}
+    if groups:
+        transaction.on_commit(lambda: _replace_versions(groups))
+
+
+def remember_group(sender, instance, raw=False, **kwargs):
+    """``pre_save`` receiver: the group an exercise moves out of needs rebuilding too"""
+    if instance.pk is not None and not raw:
+        instance._substitution_group = (
+            Exercise.objects.filter(pk=instance.pk).values_list('muscle_group', flat=True).first()
+        )
+
+
+def exercise_changed(sender, instance, **kwargs):
+    """``post_save``/``post_delete`` receiver for ``Exercise``"""
+    invalidate([instance.muscle_group, getattr(instance, '_substitution_group', None)])
+
+
+def connect_signals():
+    pre_save.connect(remember_group, sender=Exercise, dispatch_uid='substitutions_remember_group')
+    post_save.connect(exercise_changed, sender=Exercise, dispatch_uid='substitutions_save')
+    post_delete.connect(exercise_changed, sender=Exercise, dispatch_uid='substitutions_delete')
@@ -1,3 +1,198 @@
-from django.test import TestCase
+import datetime
+import random
+import tempfile
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import msgpack
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from fitness_project.cache.versions import get_api_cache
+from sync.models import Change
+from users.models import User
+
+from . import calories, substitutions
+from .checks import check_substitution_versions_shared
+from .models import Exercise, ExerciseSet, WorkoutSession
+
+
+class WorkoutHistoryCacheTests(TestCase):
+    def setUp(self):
+        get_api_cache().clear()
+        self.user = User.objects.create_user(username='ria', email='ria@example.com', password='correct horse battery')
+        self.headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.user).access_token}',
+            'HTTP_HOST': 'localhost',
+            'HTTP_ACCEPT': 'application/msgpack',
+        }
+
+    def test_cached_history_keeps_native_types(self):
+        started = datetime.datetime(2026, 1, 5, 7, 30, tzinfo=datetime.timezone.utc)
+        WorkoutSession.objects.create(user=self.user, status='completed', started_at=started, duration=40)
+
+        def history():
+            return msgpack.unpackb(self.client.get('/api/workouts/history/', **self.headers).content, timestamp=3)
+
+        miss, hit = history(), history()
+        self.assertEqual(hit, miss)
+        self.assertEqual(hit['sessions'][0]['started_at'], started)
+
+
+class SubstitutionGraphTests(TestCase):
+    def setUp(self):
+        substitutions.get_graph_cache().clear()
+        self.push_up = self.make('Push-up', 'chest', 'Lower your chest to the floor and press back up', 'none')
+        self.bench = self.make('Bench press', 'chest', 'Lower the bar to your chest and press it up', 'barbell, bench')
+        self.incline = self.make('Incline dumbbell press', 'chest', 'Press dumbbells up from an incline bench',
+                                 'dumbbells, bench')
+        self.squat = self.make('Squat', 'legs', 'Sit back and stand up', 'none')
+
+    def make(self, name, group, description, equipment, level='beginner'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Exercise.objects.create(name=name, description=description, muscle_group=group,
+                                           equipment_needed=equipment, difficulty_level=level)
+
+    def ids(self, exercise):
+        return [pk for pk, _ in substitutions.alternatives(exercise)]
+
+    def test_alternatives_stay_in_the_group_and_are_cached(self):
+        # Bodyweight fits everything, so the push-up beats a press needing other equipment
+        self.assertEqual(self.ids(self.bench), [self.push_up.pk, self.incline.pk])
+        self.assertEqual(self.ids(self.squat), [])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.ids(self.bench), [self.push_up.pk, self.incline.pk])
+
+    def test_saving_an_exercise_rebuilds_its_group(self):
+        self.ids(self.bench)
+        dips = self.make('Dips', 'chest', 'Lower your chest between the bars and press back up', 'parallel bars')
+        self.assertIn(dips.pk, self.ids(self.push_up))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            dips.difficulty_level = 'advanced'
+            dips.save()
+        self.assertNotIn(dips.pk, self.ids(self.push_up))
+
+    def test_moving_an_exercise_rebuilds_both_groups(self):
+        self.ids(self.bench), self.ids(self.squat)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.push_up.muscle_group = 'legs'
+            self.push_up.save()
+        self.assertNotIn(self.push_up.pk, self.ids(self.bench))
+        self.assertEqual(self.ids(self.squat), [self.push_up.pk])
+
+    def test_deleting_an_exercise_rebuilds_its_group(self):
+        self.ids(self.bench)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.incline.delete()
+        self.assertEqual(self.ids(self.bench), [self.push_up.pk])
+
+    def test_blocks_are_dropped_only_on_commit(self):
+        self.ids(self.bench)
+        with self.captureOnCommitCallbacks() as callbacks:
+            Exercise.objects.filter(pk=self.incline.pk).update(muscle_group='back')
+            substitutions.invalidate(['chest', 'back'])
+            # Still the old block until the transaction commits
+            self.assertIn(self.incline.pk, self.ids(self.bench))
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.ids(self.bench), [self.push_up.pk])
+
+
+    def test_versions_invalidate_the_blocks_of_every_process(self):
+        lru = 'fitness_project.cache.backends.LRUCache'
+        # Two workers' own block caches; the version cache stands in for a shared one
+        caches = {name: {'BACKEND': lru, 'LOCATION': name} for name in ('default', 'worker1', 'worker2', 'versions')}
+
+        def worker(alias):
+            return override_settings(EXERCISE_SUBSTITUTIONS={'ALIAS': alias, 'VERSION_ALIAS': 'versions'})
+
+        with override_settings(CACHES=caches):
+            for alias in ('worker1', 'worker2'):
+                with worker(alias):
+                    self.assertIn(self.incline.pk, self.ids(self.bench))
+            with worker('worker1'), self.captureOnCommitCallbacks(execute=True):
+                self.incline.delete()
+            with worker('worker2'):
+                self.assertEqual(self.ids(self.bench), [self.push_up.pk])
+
+
+class SubstitutionCheckTests(SimpleTestCase):
+    def run_check(self, workers, alias):
+        with tempfile.TemporaryDirectory() as location:
+            caches = {
+                'default': {'BACKEND': 'fitness_project.cache.backends.LRUCache'},
+                'shared': {'BACKEND': 'fitness_project.cache.backends.FileCache', 'LOCATION': location},
+            }
+            with override_settings(CACHES=caches, WORKER_PROCESSES=workers,
+                                   EXERCISE_SUBSTITUTIONS={'VERSION_ALIAS': alias}):
+                return [error.id for error in check_substitution_versions_shared(None)]
+
+    def test_several_workers_need_shared_versions(self):
+        self.assertEqual(self.run_check(1, 'default'), [])
+        self.assertEqual(self.run_check(4, 'default'), ['workouts.E001'])
+        self.assertEqual(self.run_check(4, 'shared'), [])
+
+
+class CalorieEstimateTests(TestCase):
+    def setUp(self):
+        self.config = calories.get_config()
+        # No BMR: 3.5 * 80 / 200 = 1.4 kcal per MET-minute
+        self.user = User.objects.create_user(username='tom', email='tom@example.com', password='correct horse battery',
+                                             weight=Decimal('80'))
+        squat = Exercise.objects.create(name='Squat', description='Sit back and stand up', muscle_group='legs')
+        self.session = WorkoutSession.objects.create(user=self.user, status='completed', duration=30)
+        # Legs are 6 METs: 40 kg on 80 kg raises that by 0.2 * 0.5, over 30 s of reps and 90 s of rest
+        ExerciseSet.objects.create(session=self.session, exercise=squat, set_number=1, reps_completed=10,
+                                   weight_used=Decimal('40'), rest_time=90)
+        # 60 s timed, with the default 60 s of rest, unloaded
+        ExerciseSet.objects.create(session=self.session, exercise=squat, set_number=2, reps_completed=0, duration=60)
+        self.empty = WorkoutSession.objects.create(user=self.user, status='completed', duration=20)
+
+    def estimate(self):
+        estimates = calories.estimate_sessions('default', [self.session.pk, self.empty.pk], self.config)
+        return {pk: new for pk, (_, _, new) in estimates.items()}
+
+    def random_sets(self, count, sessions):
+        rng = random.Random(7)
+        return (
+            [rng.randrange(sessions) for _ in range(count)], sessions,
+            [rng.choice([3.5, 5.0, 6.0, 8.0]) for _ in range(count)],
+            [rng.randrange(0, 120) for _ in range(count)], [rng.randrange(0, 180) for _ in range(count)],
+            [rng.uniform(0, 3) for _ in range(count)], [rng.uniform(1, 2) for _ in range(count)],
+        )
+
+    def test_fallback_estimates(self):
+        with mock.patch.object(calories, 'np', None):
+            estimates = self.estimate()
+        # Sets: 1.4 * 6.6 * 2 + 1.4 * 6 * 2 = 35.28 kcal in 4 minutes; 26 more minutes at 1.5 METs
+        self.assertEqual(estimates[self.session.pk], round(35.28 + 1.4 * 1.5 * 26))
+        # No sets: 20 minutes at the default 5 METs
+        self.assertEqual(estimates[self.empty.pk], round(1.4 * 5.0 * 20))
+
+    @skipUnless(calories.np, 'NumPy is not installed')
+    def test_numpy_matches_fallback(self):
+        sets = self.random_sets(1000, 40)
+        with mock.patch.object(calories, 'np', None):
+            expected = calories.set_calories(*sets, self.config)
+        actual = calories.set_calories(*sets, self.config)
+        for got, want in zip(actual, expected):
+            self.assertEqual(len(got), len(want))
+            for a, b in zip(got, want):
+                self.assertAlmostEqual(a, b, places=6)
+        with mock.patch.object(calories, 'np', None):
+            fallback = self.estimate()
+        self.assertEqual(self.estimate(), fallback)
+
+    def test_update_records_only_changed_sessions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            calories.update_sessions('default', [self.session.pk, self.empty.pk])
+        self.session.refresh_from_db()
+        self.assertEqual((self.session.calories_burned, self.session.calories_version),
+                         (90, calories.FORMULA_VERSION))
+        changes = Change.objects.filter(user=self.user, collection='sessions')
+        moved = dict(changes.values_list('object_id', 'id'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            calories.update_sessions('default', [self.session.pk, self.empty.pk])
+        self.assertEqual(dict(changes.values_list('object_id', 'id')), moved)
@@ -7,6 +7,7 @@ urlpatterns = [
     # Exercises
     path('exercises/', views.ExerciseListCreateView.as_view(), name='exercise-list-create'),
     path('exercises/<int:pk>/', views.ExerciseRetrieveUpdateDestroyView.as_view(), name='exercise-detail'),
+    path('exercises/<int:pk>/alternatives/', views.exercise_alternatives, name='exercise-alternatives'),
 
     # Workout Plans
     path('plans/', views.WorkoutPlanListCreateView.as_view(), name='plan-list-create'),
@@ -26,7 +27,7 @@ urlpatterns = [
     path('sets/<int:pk>/', views.ExerciseSetRetrieveUpdateDestroyView.as_view(), name='set-detail'),
 
     # Additional endpoints
-    path('stats/', views.get_user_workout_stats, name='workout-stats'),
+    path('stats/', views.get_user_workout_stats_async, name='workout-stats'),
     path('progress/', views.save_workout_progress, name='save-progress'),
-    path('history/', views.get_user_workout_history, name='workout-history'),
+    path('history/', views.get_user_workout_history_async, name='workout-history'),
 ] 
\ No newline at end of file
@@ -1,4 +1,7 @@
-from django.shortcuts import render
+import asyncio
+import logging
+from django.shortcuts import get_object_or_404, render
+from django.utils.decorators import method_decorator
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
@@ -9,6 +12,14 @@ from .serializers import (
 )
 from users.models import User
 from django.db import models
+from fitness_project.async_views import alist, api_response, async_api_view
+from fitness_project.cache.views import cache_per_user
+from fitness_project.fieldsets import FieldsetViewMixin, with_relations
+from fitness_project.idempotency import idempotent
+from fitness_project.request_logging import payload
+from . import calories, substitutions
+
+logger = logging.getLogger(__name__)
 
 # Create your views here.
 
@@ -23,8 +34,27 @@ class ExerciseRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = ExerciseSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def exercise_alternatives(request, pk):
+    """Exercises that can replace exercise ``pk``, best first, from the substitution graph"""
+    exercise = get_object_or_404(Exercise.objects.only('pk', 'muscle_group'), pk=pk)
+    try:
+        limit = min(max(int(request.query_params.get('limit', 5)), 1), 50)
+    except ValueError:
+        return Response({'limit': ['A whole number is required.']}, status=status.HTTP_400_BAD_REQUEST)
+    found = substitutions.alternatives(exercise, limit)
+    rows = Exercise.objects.in_bulk([exercise_id for exercise_id, _ in found])
+    return Response({
+        'exercise': exercise.pk,
+        'alternatives': [
+            {**ExerciseSerializer(rows[exercise_id]).data, 'score': round(weight, 4)}
+            for exercise_id, weight in found if exercise_id in rows
+        ],
+    })
+
 # --- Workout Plan CRUD ---
-class WorkoutPlanListCreateView(generics.ListCreateAPIView):
+class WorkoutPlanListCreateView(FieldsetViewMixin, generics.ListCreateAPIView):
     queryset = WorkoutPlan.objects.all().order_by('id')
     serializer_class = WorkoutPlanSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -32,13 +62,13 @@ class WorkoutPlanListCreateView(generics.ListCreateAPIView):
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
-class WorkoutPlanRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class WorkoutPlanRetrieveUpdateDestroyView(FieldsetViewMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = WorkoutPlan.objects.all().order_by('id')
     serializer_class = WorkoutPlanSerializer
     permission_classes = [permissions.IsAuthenticated]
 
 # --- User-specific Workout Plans ---
-class UserWorkoutPlansView(generics.ListAPIView):
+class UserWorkoutPlansView(FieldsetViewMixin, generics.ListAPIView):
     serializer_class = WorkoutPlanSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -46,57 +76,57 @@ class UserWorkoutPlansView(generics.ListAPIView):
         return WorkoutPlan.objects.filter(created_by=self.request.user).order_by('id')
 
 # --- Workout Day CRUD ---
-class WorkoutDayListCreateView(generics.ListCreateAPIView):
+class WorkoutDayListCreateView(FieldsetViewMixin, generics.ListCreateAPIView):
     queryset = WorkoutDay.objects.all()
     serializer_class = WorkoutDaySerializer
     permission_classes = [permissions.IsAuthenticated]
 
-class WorkoutDayRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class WorkoutDayRetrieveUpdateDestroyView(FieldsetViewMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = WorkoutDay.objects.all()
     serializer_class = WorkoutDaySerializer
     permission_classes = [permissions.IsAuthenticated]
 
 # --- Workout Session CRUD ---
-class WorkoutSessionListCreateView(generics.ListCreateAPIView):
+class WorkoutSessionListCreateView(FieldsetViewMixin, generics.ListCreateAPIView):
     serializer_class = WorkoutSessionSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         return WorkoutSession.objects.filter(user=self.request.user)
 
+    @method_decorator(idempotent)
     def create(self, request, *args, **kwargs):
-        import logging
-        logger = logging.getLogger(__name__)
-        
-        logger.info(f"🏋️ Workout session creation request received")
-        logger.info(f"👤 User: {request.user.email}")
-        logger.info(f"📦 Request data: {request.data}")
+        logger.info("🏋️ Workout session creation request received")
+        logger.info("👤 User: %s", request.user.email)
+        logger.info("📦 Request data: %s", payload(request.data))
         
         try:
             response = super().create(request, *args, **kwargs)
-            logger.info(f"✅ Workout session created successfully: {response.data}")
+            logger.info("✅ Workout session created successfully: %s", payload(response.data))
             return response
         except Exception as e:
-            logger.error(f"❌ Workout session creation failed: {str(e)}")
+            logger.error("❌ Workout session creation failed: %s", e)
             raise
 
     def perform_create(self, serializer):
-        import logging
-        logger = logging.getLogger(__name__)
-        
-        logger.info(f"💾 Saving workout session...")
+        logger.info("💾 Saving workout session...")
         serializer.save(user=self.request.user)
-        logger.info(f"✅ Workout session saved successfully")
+        calories.update_session(serializer.instance)
+        logger.info("✅ Workout session saved successfully")
 
-class WorkoutSessionRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class WorkoutSessionRetrieveUpdateDestroyView(FieldsetViewMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = WorkoutSessionSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         return WorkoutSession.objects.filter(user=self.request.user)
 
+    def perform_update(self, serializer):
+        serializer.save()
+        calories.update_session(serializer.instance)
+
 # --- ExerciseSet CRUD ---
-class ExerciseSetListCreateView(generics.ListCreateAPIView):
+class ExerciseSetListCreateView(FieldsetViewMixin, generics.ListCreateAPIView):
     serializer_class = ExerciseSetSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -104,16 +134,13 @@ class ExerciseSetListCreateView(generics.ListCreateAPIView):
         return ExerciseSet.objects.filter(session__user=self.request.user)
 
     def create(self, request, *args, **kwargs):
-        import logging
-        logger = logging.getLogger(__name__)
-        
-        logger.info(f"💪 Exercise set creation request received")
-        logger.info(f"👤 User: {request.user.email}")
-        logger.info(f"📦 Request data: {request.data}")
+        logger.info("💪 Exercise set creation request received")
+        logger.info("👤 User: %s", request.user.email)
+        logger.info("📦 Request data: %s", payload(request.data))
         
         # Validate that exercise_id is provided
         if 'exercise_id' not in request.data or not request.data['exercise_id']:
-            logger.error(f"❌ Missing exercise_id in request data")
+            logger.error("❌ Missing exercise_id in request data")
             return Response(
                 {"exercise_id": ["This field may not be null or empty."]},
                 status=status.HTTP_400_BAD_REQUEST
@@ -121,75 +148,87 @@ class ExerciseSetListCreateView(generics.ListCreateAPIView):
         
         try:
             response = super().create(request, *args, **kwargs)
-            logger.info(f"✅ Exercise set created successfully: {response.data}")
+            logger.info("✅ Exercise set created successfully: %s", payload(response.data))
             return response
         except Exception as e:
-            logger.error(f"❌ Exercise set creation failed: {str(e)}")
+            logger.error("❌ Exercise set creation failed: %s", e)
             raise
 
     def perform_create(self, serializer):
-        import logging
-        logger = logging.getLogger(__name__)
-        
-        logger.info(f"💾 Saving exercise set...")
+        logger.info("💾 Saving exercise set...")
         serializer.save()
-        logger.info(f"✅ Exercise set saved successfully")
+        # Sets added to a completed session change its estimate
+        calories.update_session(serializer.instance.session)
+        logger.info("✅ Exercise set saved successfully")
 
-class ExerciseSetRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class ExerciseSetRetrieveUpdateDestroyView(FieldsetViewMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = ExerciseSetSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         return ExerciseSet.objects.filter(session__user=self.request.user)
 
+    def perform_update(self, serializer):
+        serializer.save()
+        calories.update_session(serializer.instance.session)
+
+    def perform_destroy(self, instance):
+        session = instance.session
+        instance.delete()
+        calories.update_session(session)
+
 # --- Additional API endpoints for better data management ---
 
-@api_view(['GET'])
-@permission_classes([permissions.IsAuthenticated])
-def get_user_workout_stats(request):
-    """Get user's workout statistics"""
-    import logging
-    logger = logging.getLogger(__name__)
-    
+def _serialized_sessions(sessions, request):
+    """Prefetch what WorkoutSessionSerializer renders for ``sessions`` given ?fields=/?expand="""
+    # Prefetched rather than joined: sessions may live on a user shard while
+    # workout days are always on the default database
+    return with_relations(sessions, WorkoutSessionSerializer, request)
+
+@async_api_view(['GET'])
+@cache_per_user('workouts', stale_while_revalidate=60)
+async def get_user_workout_stats_async(request):
+    """Get user's workout statistics: one aggregate query plus the recent sessions"""
     try:
         user = request.user
-        total_sessions = WorkoutSession.objects.filter(user=user).count()
-        completed_sessions = WorkoutSession.objects.filter(user=user, status='completed').count()
-        total_workout_time = WorkoutSession.objects.filter(user=user, status='completed').aggregate(
-            total_time=models.Sum('duration')
-        )['total_time'] or 0
-        
-        # Get recent sessions
-        recent_sessions = WorkoutSession.objects.filter(user=user).order_by('-created_at')[:5]
-        
+        sessions = WorkoutSession.objects.filter(user=user)
+        completed = models.Q(status='completed')
+        totals, recent_sessions = await asyncio.gather(
+            sessions.aaggregate(
+                total_sessions=models.Count('id'),
+                completed_sessions=models.Count('id', filter=completed),
+                total_time=models.Sum('duration', filter=completed),
+            ),
+            alist(_serialized_sessions(sessions.order_by('-created_at')[:5], request)),
+        )
+        total_sessions = totals['total_sessions']
+        completed_sessions = totals['completed_sessions']
+
         stats = {
             'total_sessions': total_sessions,
             'completed_sessions': completed_sessions,
-            'total_workout_time': total_workout_time,
+            'total_workout_time': totals['total_time'] or 0,
             'completion_rate': (completed_sessions / total_sessions * 100) if total_sessions > 0 else 0,
-            'recent_sessions': WorkoutSessionSerializer(recent_sessions, many=True).data
+            'recent_sessions': WorkoutSessionSerializer(recent_sessions, many=True, context={'request': request}).data
         }
-        
-        logger.info(f"📊 Workout stats retrieved for user {user.email}: {stats}")
-        return Response(stats)
-        
+
+        logger.info("📊 Workout stats retrieved for user %s: %s", user.email, payload(stats))
+        return api_response(stats)
+
     except Exception as e:
-        logger.error(f"❌ Error getting workout stats: {str(e)}")
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        logger.error("❌ Error getting workout stats: %s", e)
+        return api_response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def save_workout_progress(request):
     """Save workout progress data"""
-    import logging
-    logger = logging.getLogger(__name__)
-    
     try:
         user = request.user
         data = request.data
         
-        logger.info(f"💾 Saving workout progress for user {user.email}")
-        logger.info(f"📦 Progress data: {data}")
+        logger.info("💾 Saving workout progress for user %s", user.email)
+        logger.info("📦 Progress data: %s", payload(data))
         
         # Create or update workout session
         session_data = data.get('session', {})
@@ -228,28 +267,28 @@ def save_workout_progress(request):
                     try:
                         # First try as integer ID
                         exercise = Exercise.objects.get(id=int(exercise_id))
-                        logger.info(f"📝 Found exercise by ID: {exercise.name}")
+                        logger.info("📝 Found exercise by ID: %s", exercise.name)
                     except (ValueError, Exercise.DoesNotExist):
                         # If that fails, try to get by name
-                        logger.info(f"🔍 Looking for exercise by name: {exercise_id}")
+                        logger.info("🔍 Looking for exercise by name: %s", exercise_id)
                         exercise = Exercise.objects.filter(name__icontains=exercise_id).first()
                         
                         # If still not found, create a default exercise
                         if not exercise:
-                            logger.info(f"📝 Creating new exercise with name: Exercise {exercise_id}")
+                            logger.info("📝 Creating new exercise with name: Exercise %s", exercise_id)
                             exercise = Exercise.objects.create(
                                 name=f"Exercise {exercise_id}",
                                 description="Auto-created exercise",
                                 muscle_group="other"
                             )
-                            logger.info(f"✅ Created new exercise: {exercise.name} with ID: {exercise.id}")
+                            logger.info("✅ Created new exercise: %s with ID: %s", exercise.name, exercise.id)
                         else:
-                            logger.info(f"📝 Found exercise by name: {exercise.name}")
+                            logger.info("📝 Found exercise by name: %s", exercise.name)
                 except Exception as e:
-                    logger.error(f"❌ Error processing exercise_id: {str(e)}")
+                    logger.error("❌ Error processing exercise_id: %s", e)
                     continue  # Skip this set if exercise can't be found or created
             else:
-                logger.error(f"❌ Missing exercise_id in set data")
+                logger.error("❌ Missing exercise_id in set data")
                 continue  # Skip this set
             
             # Check if the exercise set already exists
@@ -274,43 +313,44 @@ def save_workout_progress(request):
                         setattr(exercise_set, field, value)
                 exercise_set.save()
         
-        logger.info(f"✅ Workout progress saved successfully")
+        calories.update_session(session)
+        logger.info("✅ Workout progress saved successfully")
         return Response({'message': 'Workout progress saved successfully', 'session_id': session.id})
         
     except Exception as e:
-        logger.error(f"❌ Error saving workout progress: {str(e)}")
+        logger.error("❌ Error saving workout progress: %s", e)
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-@api_view(['GET'])
-@permission_classes([permissions.IsAuthenticated])
-def get_user_workout_history(request):
+@async_api_view(['GET'])
+@cache_per_user('workouts')
+async def get_user_workout_history_async(request):
     """Get user's workout history"""
-    import logging
-    logger = logging.getLogger(__name__)
-    
     try:
         user = request.user
         sessions = WorkoutSession.objects.filter(user=user).order_by('-created_at')
-        
+
         # Pagination
         page = int(request.query_params.get('page', 1))
         page_size = int(request.query_params.get('page_size', 10))
         start = (page - 1) * page_size
         end = start + page_size
-        
-        paginated_sessions = sessions[start:end]
-        
+
+        total_sessions, paginated_sessions = await asyncio.gather(
+            sessions.acount(),
+            alist(_serialized_sessions(sessions[start:end], request)),
+        )
+
         history = {
-            'sessions': WorkoutSessionSerializer(paginated_sessions, many=True).data,
-            'total_sessions': sessions.count(),
+            'sessions': WorkoutSessionSerializer(paginated_sessions, many=True, context={'request': request}).data,
+            'total_sessions': total_sessions,
             'page': page,
             'page_size': page_size,
-            'has_next': end < sessions.count()
+            'has_next': end < total_sessions
         }
-        
-        logger.info(f"📚 Workout history retrieved for user {user.email}")
-        return Response(history)
-        
+
+        logger.info("📚 Workout history retrieved for user %s", user.email)
+        return api_response(history)
+
     except Exception as e:
-        logger.error(f"❌ Error getting workout history: {str(e)}")
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        logger.error("❌ Error getting workout history: %s", e)
+        return api_response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -15,6 +15,7 @@ export const AUTH_ENDPOINTS = {
   PROFILE_COMPLETE: `${API_BASE_URL}/auth/profile/complete/`,
   ONBOARDING_STEP: `${API_BASE_URL}/auth/onboarding/step/`,
   ONBOARDING_COMPLETE: `${API_BASE_URL}/auth/onboarding/complete/`,
+  ONBOARDING_COMMIT: `${API_BASE_URL}/auth/onboarding/commit/`,
   BODY_COMPOSITION: `${API_BASE_URL}/auth/body-composition/`,
   MEASUREMENTS: `${API_BASE_URL}/auth/measurements/`,
   GOAL_MEASUREMENTS: `${API_BASE_URL}/auth/goal-measurements/`,
@@ -58,6 +59,14 @@ export const AI_ENDPOINTS = {
   MODELS: `${API_BASE_URL}/ai/models/`,
 };
 
+// Sync endpoints
+export const SYNC_ENDPOINTS = {
+  CHANGES: `${API_BASE_URL}/sync/changes/`,
+};
+
+// Several API calls in one request
+export const BATCH_ENDPOINT = `${API_BASE_URL}/batch/`;
+
 // API Headers helper
 export const getAuthHeaders = async (): Promise<Record<string, string>> => {
   try {
@@ -1,5 +1,5 @@
 import AsyncStorage from '@react-native-async-storage/async-storage';
-import { AUTH_ENDPOINTS, WORKOUT_ENDPOINTS, PROGRESS_ENDPOINTS, AI_ENDPOINTS, API_BASE_URL } from '@/constants/api';
+import { AUTH_ENDPOINTS, WORKOUT_ENDPOINTS, PROGRESS_ENDPOINTS, AI_ENDPOINTS, SYNC_ENDPOINTS, BATCH_ENDPOINT, API_BASE_URL } from '@/constants/api';
 
 // Get authentication headers with proper token retrieval
 const getAuthHeaders = async () => {
@@ -46,7 +46,7 @@ const getAuthHeaders = async () => {
 };
 
 // Token refresh function
-const refreshAccessToken = async () => {
+const requestAccessToken = async () => {
   try {
     console.log('🔄 Attempting to refresh access token...');
     const refreshToken = await AsyncStorage.getItem('refreshToken');
@@ -86,12 +86,57 @@ const refreshAccessToken = async () => {
   }
 };
 
+// Concurrent 401s share one refresh: the server blacklists a refresh token
+// once it is rotated, so a second refresh with the same token would be
+// rejected and log the user out
+let refreshInFlight: Promise<string> | null = null;
+
+const refreshAccessToken = () => {
+  if (!refreshInFlight) {
+    refreshInFlight = requestAccessToken().finally(() => {
+      refreshInFlight = null;
+    });
+  }
+  return refreshInFlight;
+};
+
+// Random key identifying one logical POST across its retries
+export const newIdempotencyKey = () =>
+  `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}-${Math.random().toString(36).slice(2)}`;
+
+const IDEMPOTENT_RETRIES = 2;
+const IDEMPOTENT_RETRY_DELAY_MS = 500;
+
+// fetch(), sending a POST that carries an Idempotency-Key again when the
+// network drops it or the server is still running the first attempt (409).
+// The key stays the same, so the server saves at most once.
+const fetchIdempotent = async (url: string, config: RequestInit) => {
+  const headers = config.headers as Record<string, string>;
+  const retries = headers['Idempotency-Key'] ? IDEMPOTENT_RETRIES : 0;
+  for (let attempt = 0; ; attempt++) {
+    try {
+      const response = await fetch(url, config);
+      if (response.status !== 409 || attempt >= retries) {
+        return response;
+      }
+      console.log('🔄 Request still in progress on the server, retrying...');
+    } catch (error) {
+      if (attempt >= retries) {
+        throw error;
+      }
+      console.log('🔄 Network error, retrying with the same Idempotency-Key...');
+    }
+    await new Promise(resolve => setTimeout(resolve, IDEMPOTENT_RETRY_DELAY_MS * (attempt + 1)));
+  }
+};
+
 // Generic API request function with token refresh
 const apiRequest = async (
   url: string,
   method: 'GET' | 'POST' | 'PUT' | 'PATCH' | 'DELETE' = 'GET',
   data?: any,
-  requireAuth: boolean = true
+  requireAuth: boolean = true,
+  idempotencyKey?: string
 ) => {
   let headers: Record<string, string>;
   
@@ -102,6 +147,13 @@ const apiRequest = async (
     headers = { 'Content-Type': 'application/json' };
   }
   
+  // Created once per call: every retry below reuses these headers, so the
+  // server replays the first response instead of saving twice. Callers
+  // retrying a whole action pass the key they used the first time.
+  if (method === 'POST') {
+    headers['Idempotency-Key'] = idempotencyKey || newIdempotencyKey();
+  }
+  
   const config: RequestInit = {
     method,
     headers,
@@ -116,7 +168,7 @@ const apiRequest = async (
       body: data 
     });
     
-    const response = await fetch(url, config);
+    const response = await fetchIdempotent(url, config);
     
     console.log('📥 Response status:', response.status);
     
@@ -127,7 +179,7 @@ const apiRequest = async (
         // Retry the request with new token
         headers.Authorization = `Bearer ${newAccessToken}`;
         const retryConfig = { ...config, headers };
-        const retryResponse = await fetch(url, retryConfig);
+        const retryResponse = await fetchIdempotent(url, retryConfig);
         
         if (!retryResponse.ok) {
           const errorData = await retryResponse.json().catch(() => ({}));
@@ -236,6 +288,11 @@ export const authAPI = {
     return apiRequest(AUTH_ENDPOINTS.ONBOARDING_COMPLETE, 'POST', data);
   },
   
+  // Saves every onboarding step in one request: { profile, goals, body_composition, body_model, specific_goals }
+  commitOnboarding: async (data: any) => {
+    return apiRequest(AUTH_ENDPOINTS.ONBOARDING_COMMIT, 'POST', data);
+  },
+  
   updateBodyComposition: async (data: any) => {
     return apiRequest(AUTH_ENDPOINTS.BODY_COMPOSITION, 'POST', data);
   },
@@ -316,8 +373,8 @@ export const workoutAPI = {
   },
   
   // Create workout session
-  createSession: async (data: any) => {
-    return apiRequest(WORKOUT_ENDPOINTS.SESSIONS, 'POST', data);
+  createSession: async (data: any, idempotencyKey?: string) => {
+    return apiRequest(WORKOUT_ENDPOINTS.SESSIONS, 'POST', data, true, idempotencyKey);
   },
   
   // Update workout session
@@ -353,8 +410,8 @@ export const progressAPI = {
   },
 
   // Save completed workout
-  saveCompletedWorkout: async (data: any) => {
-    return apiRequest(PROGRESS_ENDPOINTS.SAVE_WORKOUT, 'POST', data);
+  saveCompletedWorkout: async (data: any, idempotencyKey?: string) => {
+    return apiRequest(PROGRESS_ENDPOINTS.SAVE_WORKOUT, 'POST', data, true, idempotencyKey);
   },
 
   // Get completed workouts
@@ -372,8 +429,8 @@ export const progressAPI = {
   },
   
   // Save goal
-  saveGoal: async (data: any) => {
-    return apiRequest(PROGRESS_ENDPOINTS.SAVE_GOAL, 'POST', data);
+  saveGoal: async (data: any, idempotencyKey?: string) => {
+    return apiRequest(PROGRESS_ENDPOINTS.SAVE_GOAL, 'POST', data, true, idempotencyKey);
   },
   
   // Get goals
@@ -406,10 +463,33 @@ export const aiAPI = {
   },
 };
 
+// Sync API: without a cursor, returns every plan, day, workout exercise, session, set,
+// progress entry, completed workout, goal and recommendation, a page at a time (the first
+// page has full: true); with the cursor of the previous response, the next snapshot page or
+// only what changed since (upserted objects and deleted ids per collection). Keep calling
+// with the new cursor while has_more is true.
+export const syncAPI = {
+  getChanges: async (since?: string) => {
+    const url = since ? `${SYNC_ENDPOINTS.CHANGES}?${new URLSearchParams({ since })}` : SYNC_ENDPOINTS.CHANGES;
+    return apiRequest(url, 'GET');
+  },
+};
+
+// Batch API: runs { id?, method, path, body? } sub-requests in order in one round trip.
+// "{{id.field}}" in a later path or body refers to an earlier result, e.g. "{{session.id}}";
+// with atomic, the first failure rolls every write back. Resolves to { results, committed? }.
+export const batchAPI = {
+  run: async (requests: any[], atomic: boolean = false) => {
+    return apiRequest(BATCH_ENDPOINT, 'POST', { requests, atomic });
+  },
+};
+
 // Export the main API service
 export const apiService = {
   auth: authAPI,
   workout: workoutAPI,
   progress: progressAPI,
   ai: aiAPI,
+  sync: syncAPI,
+  batch: batchAPI,
 };
\ No newline at end of file